@@ -19,6 +19,7 @@ from openassessment.assessment.models import (
 )
 from openassessment.assessment.worker import training as training_tasks
 from openassessment.assessment.worker import grading as grading_tasks
+from openassessment.assessment.worker.lanes import LANE_TRAINING, queue_for_lane
 
 
 logger = logging.getLogger(__name__)
@@ -145,7 +146,7 @@ def on_init(submission_uuid, rubric=None, algorithm_id=None):
     # once the classifiers have been trained.
     if workflow.classifier_set is not None:
         try:
-            grading_tasks.grade_essay.apply_async(args=[workflow.uuid])
+            grading_tasks.schedule_grading(workflow)
             logger.info((
                 u"Scheduled grading task for AI grading workflow with UUID {workflow_uuid} "
                 u"(submission UUID = {sub_uuid}, algorithm ID = {algorithm_id})"
@@ -290,7 +291,9 @@ def train_classifiers(rubric_dict, examples, course_id, item_id, algorithm_id):
 
     # Schedule the task, parametrized by the workflow UUID
     try:
-        training_tasks.train_classifiers.apply_async(args=[workflow.uuid])
+        training_tasks.train_classifiers.apply_async(
+            args=[workflow.uuid], queue=queue_for_lane(LANE_TRAINING)
+        )
     except ANTICIPATED_CELERY_ERRORS as ex:
         msg = (
             u"An unexpected error occurred while scheduling incomplete training workflows with"
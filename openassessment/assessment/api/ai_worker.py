@@ -34,8 +34,10 @@ def get_grading_task_params(grading_workflow_uuid):
         dict with keys:
             * essay_text (unicode): The text of the essay submission.
             * classifier_set (dict): Maps criterion names to serialized classifiers.
+            * classifier_set_id (int): The primary key of the classifier set.
             * valid_scores (dict): Maps criterion names to a list of valid scores for that criterion.
             * algorithm_id (unicode): ID of the algorithm used to perform training.
+            * scheduled_at (datetime): When the workflow was scheduled.
 
     Raises:
         AIGradingRequestError
@@ -72,8 +74,10 @@ def get_grading_task_params(grading_workflow_uuid):
         return {
             'essay_text': workflow.essay_text,
             'classifier_set': workflow.classifier_set.classifier_data_by_criterion,
+            'classifier_set_id': workflow.classifier_set_id,
             'algorithm_id': workflow.algorithm_id,
             'valid_scores': workflow.classifier_set.valid_scores_by_criterion,
+            'scheduled_at': workflow.scheduled_at,
         }
     except (
         DatabaseError, ClassifierSerializeError, IncompleteClassifierSet,
@@ -150,6 +154,149 @@ def create_assessment(grading_workflow_uuid, criterion_scores):
     assessment_complete_signal.send(sender=None, submission_uuid=workflow.submission_uuid)
 
 
+@dog_stats_api.timed('openassessment.assessment.ai.get_grading_batch_params')
+def get_grading_batch_params(grading_workflow_uuids):
+    """
+    Retrieve the essays, classifier set, and algorithm ID
+    for a batch of grading workflows that share a classifier set.
+
+    Workflows that are already complete (or that don't exist) are skipped,
+    so the classifiers are loaded only if there's something left to grade.
+
+    Args:
+        grading_workflow_uuids (list of str): The UUIDs of the grading workflows.
+
+    Returns:
+        dict with keys:
+            * essays (dict): Maps the UUIDs of incomplete workflows to the text of their essay submissions.
+            * classifier_set (dict): Maps criterion names to serialized classifiers.
+            * classifier_set_id (int): The primary key of the classifier set.
+            * valid_scores (dict): Maps criterion names to a list of valid scores for that criterion.
+            * algorithm_id (unicode): ID of the algorithm used to perform training.
+            * scheduled_at (dict): Maps the UUIDs of incomplete workflows to when they were scheduled.
+        If every workflow is complete, `essays` and `scheduled_at` are empty and the other values are None.
+
+    Raises:
+        AIGradingRequestError
+        AIGradingInternalError
+
+    """
+    try:
+        workflows = list(
+            AIGradingWorkflow.objects.filter(
+                uuid__in=grading_workflow_uuids, completed_at__isnull=True
+            ).select_related('classifier_set')
+        )
+    except DatabaseError as ex:
+        msg = (
+            u"An unexpected error occurred while retrieving the "
+            u"AI grading workflows with uuids {uuids}: {ex}"
+        ).format(uuids=grading_workflow_uuids, ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+    if not workflows:
+        return {
+            'essays': {},
+            'classifier_set': None,
+            'classifier_set_id': None,
+            'algorithm_id': None,
+            'valid_scores': None,
+            'scheduled_at': {},
+        }
+
+    # Every workflow in the batch must be graded using the same classifiers,
+    # since the point of batching is to load the classifiers once.
+    classifier_set_ids = set(workflow.classifier_set_id for workflow in workflows)
+    algorithm_ids = set(workflow.algorithm_id for workflow in workflows)
+    if None in classifier_set_ids:
+        msg = (
+            u"One or more AI grading workflows with UUIDs {} have no classifier set, "
+            u"but were scheduled for grading"
+        ).format(grading_workflow_uuids)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+    if len(classifier_set_ids) > 1 or len(algorithm_ids) > 1:
+        msg = (
+            u"AI grading workflows with UUIDs {} must share a classifier set "
+            u"and algorithm to be graded as a batch"
+        ).format(grading_workflow_uuids)
+        raise AIGradingRequestError(msg)
+
+    classifier_set = workflows[0].classifier_set
+    try:
+        return {
+            'essays': {workflow.uuid: workflow.essay_text for workflow in workflows},
+            'classifier_set': classifier_set.classifier_data_by_criterion,
+            'classifier_set_id': classifier_set.pk,
+            'algorithm_id': workflows[0].algorithm_id,
+            'valid_scores': classifier_set.valid_scores_by_criterion,
+            'scheduled_at': {workflow.uuid: workflow.scheduled_at for workflow in workflows},
+        }
+    except (
+        DatabaseError, ClassifierSerializeError, IncompleteClassifierSet,
+        ValueError, IOError, HTTPException
+    ) as ex:
+        msg = (
+            u"An unexpected error occurred while retrieving "
+            u"classifiers for the grading workflows with UUIDs {uuids}: {ex}"
+        ).format(uuids=grading_workflow_uuids, ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+
+@dog_stats_api.timed('openassessment.assessment.ai.create_assessments')
+def create_assessments(scores_by_workflow):
+    """
+    Create AI assessments for a batch of grading workflows
+    (complete the AI grading tasks).
+
+    Workflows that are already complete are skipped.
+
+    Args:
+        scores_by_workflow (dict): Maps grading workflow UUIDs to dictionaries
+            mapping criteria names to integer scores.
+
+    Returns:
+        None
+
+    Raises:
+        AIGradingInternalError
+
+    """
+    try:
+        workflows = list(
+            AIGradingWorkflow.objects.filter(
+                uuid__in=scores_by_workflow.keys(), completed_at__isnull=True
+            ).select_related('rubric')
+        )
+
+        # Share rubric models between workflows, so we build each rubric's index only once.
+        rubrics = {}
+        for workflow in workflows:
+            workflow.rubric = rubrics.setdefault(workflow.rubric_id, workflow.rubric)
+
+        AIGradingWorkflow.complete_many(workflows, scores_by_workflow)
+    except DatabaseError as ex:
+        msg = (
+            u"An unexpected error occurred while creating assessments "
+            u"for AI grading workflows with uuids {uuids}: {ex}"
+        ).format(uuids=scores_by_workflow.keys(), ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+    logger.info(
+        u"Created assessments for {num} AI grading workflows (UUIDs {uuids})".format(
+            num=len(workflows), uuids=[workflow.uuid for workflow in workflows]
+        )
+    )
+
+    # Fire a signal for each submission to update the workflow API
+    from openassessment.assessment.signals import assessment_complete_signal
+    for workflow in workflows:
+        assessment_complete_signal.send(sender=None, submission_uuid=workflow.submission_uuid)
+
+
 @dog_stats_api.timed('openassessment.assessment.ai.get_training_task_params')
 def get_training_task_params(training_workflow_uuid):
     """
@@ -165,6 +312,7 @@ def get_training_task_params(training_workflow_uuid):
             * course_id (unicode): The course ID that the training task is associated with.
             * item_id (unicode): Identifies the item that the AI will be training to grade.
             * algorithm_id (unicode): The ID of the algorithm to use for training.
+            * scheduled_at (datetime): When the workflow was scheduled.
 
     Raises:
         AITrainingRequestError
@@ -212,7 +360,8 @@ def get_training_task_params(training_workflow_uuid):
             'training_examples': returned_examples,
             'algorithm_id': workflow.algorithm_id,
             'course_id': workflow.course_id,
-            'item_id': workflow.item_id
+            'item_id': workflow.item_id,
+            'scheduled_at': workflow.scheduled_at,
         }
     except AITrainingWorkflow.DoesNotExist:
         msg = (
@@ -0,0 +1,375 @@
+"""
+Binary container format for trained classifiers.
+
+Classifiers used to be stored as JSON, which forces algorithms to
+base64-encode binary data (such as pickled objects), making it 33% larger,
+and which must be read into memory in full before it can be parsed.
+
+The container format stores the JSON-serializable parts of a classifier
+in a small manifest and binary data (wrapped in `BinaryData`) as separate,
+optionally compressed, blobs:
+
+    +--------------------------------------------------------------+
+    | header: magic (8 bytes), version (1 byte), flags (1 byte),   |
+    |         reserved (2 bytes), manifest length (4 bytes)        |
+    +--------------------------------------------------------------+
+    | manifest: UTF-8 JSON, zlib-compressed if the flag is set     |
+    |   {"data": <classifier with blob references>,                |
+    |    "blobs": [[stored length, length, compressed], ...]}      |
+    +--------------------------------------------------------------+
+    | blob 0 | blob 1 | ...                                        |
+    +--------------------------------------------------------------+
+
+Readers consume the container sequentially, so it can be streamed from
+any storage backend or read from a memory-mapped local file.  Classifiers
+stored as JSON (before this format existed) are read transparently.
+"""
+import json
+import mmap
+import struct
+import zlib
+from StringIO import StringIO
+from tempfile import SpooledTemporaryFile
+from django.conf import settings
+
+
+# The first byte is not valid JSON, so containers can't be mistaken for JSON classifiers.
+MAGIC = "\x89ORA2CLF"
+FORMAT_VERSION = 1
+
+# Header flags
+FLAG_COMPRESSED_MANIFEST = 0x01
+
+HEADER = struct.Struct('>8sBBxxI')
+
+# Key used to mark references to binary blobs in the manifest
+BLOB_KEY = u"__ora2_blob__"
+
+# By default, use zlib's default compression level.
+# A compression level of 0 stores blobs uncompressed.
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# Size of the chunks used to copy and decompress blobs
+CHUNK_SIZE = 64 * 1024
+
+# Keep up to this many bytes of compressed blobs in memory while writing,
+# then spill to a temporary file.
+MAX_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+class BinaryData(str):
+    """
+    Binary data (for example, a pickled object) in a classifier.
+
+    Algorithms wrap byte strings in `BinaryData` to store them as raw blobs
+    instead of base64-encoded JSON strings.  Classifiers read from the
+    container format contain `BinaryData` wherever the original did.
+    """
+    pass
+
+
+class InvalidClassifierFormat(ValueError):
+    """
+    The classifier data is corrupt or uses an unsupported format version.
+    """
+    pass
+
+
+def compression_level():
+    """
+    The zlib compression level used for new classifiers.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_AI_CLASSIFIER_COMPRESSION_LEVEL', DEFAULT_COMPRESSION_LEVEL)
+
+
+def write_classifier(data, output, level=None):
+    """
+    Write a classifier to a file using the container format.
+
+    Args:
+        data (JSON-serializable): The classifier.  May contain `BinaryData` values.
+        output (file-like): The file to write to.
+
+    Keyword Arguments:
+        level (int): The zlib compression level (0-9).
+            If not specified, use the `ORA2_AI_CLASSIFIER_COMPRESSION_LEVEL` setting.
+
+    Returns:
+        int: The number of bytes written.
+
+    Raises:
+        TypeError: The classifier is not JSON-serializable.
+        ValueError: The classifier is not JSON-serializable.
+
+    """
+    if level is None:
+        level = compression_level()
+
+    blobs = []
+    manifest_data = _extract_blobs(data, blobs)
+
+    # Compress the blobs into a spooled buffer so we know their sizes
+    # before writing the manifest, without holding large classifiers in memory.
+    blob_info = []
+    with SpooledTemporaryFile(max_size=MAX_SPOOL_SIZE) as spool:
+        for blob in blobs:
+            stored = zlib.compress(blob, level) if level > 0 else blob
+            compressed = len(stored) < len(blob)
+            if not compressed:
+                stored = blob
+            spool.write(stored)
+            blob_info.append([len(stored), len(blob), compressed])
+            del stored
+
+        manifest = json.dumps({u"data": manifest_data, u"blobs": blob_info})
+        flags = 0
+        if level > 0:
+            manifest = zlib.compress(manifest, level)
+            flags |= FLAG_COMPRESSED_MANIFEST
+
+        output.write(HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(manifest)))
+        output.write(manifest)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            output.write(chunk)
+
+    return HEADER.size + len(manifest) + sum(info[0] for info in blob_info)
+
+
+def read_classifier(source):
+    """
+    Read a classifier from a file.
+
+    Supports both the container format and classifiers stored as JSON.
+
+    Args:
+        source (file-like): The file to read from.  Must support `read()`
+            (for example, a Django `File`, a `StringIO`, or an `mmap`).
+
+    Returns:
+        JSON-serializable, possibly containing `BinaryData` values.
+
+    Raises:
+        InvalidClassifierFormat
+        ValueError: The data is neither a container nor valid JSON.
+        IOError
+
+    """
+    header = source.read(HEADER.size)
+    if not header.startswith(MAGIC):
+        # Classifiers written before the container format existed are stored as JSON
+        return json.loads(header + source.read())
+
+    if len(header) < HEADER.size:
+        raise InvalidClassifierFormat(u"Classifier header is truncated.")
+
+    __, version, flags, manifest_length = HEADER.unpack(header)
+    if version != FORMAT_VERSION:
+        raise InvalidClassifierFormat(
+            u"Unsupported classifier format version {version}".format(version=version)
+        )
+
+    manifest = _read_exactly(source, manifest_length)
+    try:
+        if flags & FLAG_COMPRESSED_MANIFEST:
+            manifest = zlib.decompress(manifest)
+        manifest = json.loads(manifest)
+    except zlib.error as ex:
+        raise InvalidClassifierFormat(u"Could not decompress classifier manifest: {ex}".format(ex=ex))
+
+    blobs = [
+        _read_blob(source, stored_length, length, compressed)
+        for stored_length, length, compressed in manifest[u"blobs"]
+    ]
+    return _insert_blobs(manifest[u"data"], blobs)
+
+
+def read_classifier_file(path):
+    """
+    Read a classifier from a local file, memory-mapping the file
+    so that its contents aren't copied into a read buffer.
+
+    Args:
+        path (unicode): The path to the file.
+
+    Returns:
+        JSON-serializable, possibly containing `BinaryData` values.
+
+    Raises:
+        InvalidClassifierFormat
+        ValueError
+        IOError
+
+    """
+    with open(path, 'rb') as classifier_file:
+        try:
+            mapped = mmap.mmap(classifier_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # Empty files can't be memory-mapped.
+            return read_classifier(classifier_file)
+        try:
+            if mapped[:len(MAGIC)] != MAGIC:
+                return json.loads(mapped[:])
+            return read_classifier(mapped)
+        finally:
+            mapped.close()
+
+
+def dumps(data, level=None):
+    """
+    Serialize a classifier to a string using the container format.
+
+    Args:
+        data (JSON-serializable): The classifier.  May contain `BinaryData` values.
+
+    Keyword Arguments:
+        level (int): The zlib compression level (0-9).
+
+    Returns:
+        str
+
+    """
+    output = StringIO()
+    write_classifier(data, output, level=level)
+    return output.getvalue()
+
+
+def loads(serialized):
+    """
+    Deserialize a classifier from a string.
+
+    Args:
+        serialized (str): A container or a JSON-encoded classifier.
+
+    Returns:
+        JSON-serializable, possibly containing `BinaryData` values.
+
+    """
+    return read_classifier(StringIO(serialized))
+
+
+def approximate_size(data):
+    """
+    Estimate the size of a classifier in bytes, without encoding its binary data.
+
+    Args:
+        data (JSON-serializable): The classifier.  May contain `BinaryData` values.
+
+    Returns:
+        int
+
+    """
+    blobs = []
+    manifest_data = _extract_blobs(data, blobs)
+    return len(json.dumps(manifest_data)) + sum(len(blob) for blob in blobs)
+
+
+def _extract_blobs(data, blobs):
+    """
+    Replace `BinaryData` values with references to blobs.
+
+    Args:
+        data (JSON-serializable): The classifier data.
+        blobs (list): Binary data is appended to this list.
+
+    Returns:
+        JSON-serializable
+
+    Raises:
+        ValueError: The data uses the reserved blob reference key.
+
+    """
+    if isinstance(data, BinaryData):
+        blobs.append(data)
+        return {BLOB_KEY: len(blobs) - 1}
+    elif isinstance(data, dict):
+        if BLOB_KEY in data:
+            raise ValueError(u"Classifier data cannot contain the key {key}".format(key=BLOB_KEY))
+        return {key: _extract_blobs(value, blobs) for key, value in data.iteritems()}
+    elif isinstance(data, (list, tuple)):
+        return [_extract_blobs(value, blobs) for value in data]
+    else:
+        return data
+
+
+def _insert_blobs(data, blobs):
+    """
+    Replace blob references with `BinaryData` values.
+
+    Args:
+        data (JSON-serializable): The manifest data.
+        blobs (list of BinaryData): The blobs, in the order they were stored.
+
+    Returns:
+        JSON-serializable
+
+    Raises:
+        InvalidClassifierFormat
+
+    """
+    if isinstance(data, dict):
+        if BLOB_KEY in data:
+            try:
+                return blobs[data[BLOB_KEY]]
+            except (IndexError, TypeError):
+                raise InvalidClassifierFormat(u"Invalid blob reference in classifier manifest.")
+        return {key: _insert_blobs(value, blobs) for key, value in data.iteritems()}
+    elif isinstance(data, list):
+        return [_insert_blobs(value, blobs) for value in data]
+    else:
+        return data
+
+
+def _read_blob(source, stored_length, length, compressed):
+    """
+    Read (and decompress) a blob in chunks.
+
+    Returns:
+        BinaryData
+
+    Raises:
+        InvalidClassifierFormat
+
+    """
+    if not compressed:
+        return BinaryData(_read_exactly(source, stored_length))
+
+    decompressor = zlib.decompressobj()
+    chunks = []
+    remaining = stored_length
+    try:
+        while remaining > 0:
+            chunk = source.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise InvalidClassifierFormat(u"Classifier blob is truncated.")
+            remaining -= len(chunk)
+            chunks.append(decompressor.decompress(chunk))
+        chunks.append(decompressor.flush())
+    except zlib.error as ex:
+        raise InvalidClassifierFormat(u"Could not decompress classifier blob: {ex}".format(ex=ex))
+
+    blob = BinaryData("".join(chunks))
+    if len(blob) != length:
+        raise InvalidClassifierFormat(u"Classifier blob has an unexpected length.")
+    return blob
+
+
+def _read_exactly(source, length):
+    """
+    Read exactly `length` bytes.
+
+    Raises:
+        InvalidClassifierFormat
+
+    """
+    data = source.read(length)
+    if len(data) != length:
+        raise InvalidClassifierFormat(u"Classifier data is truncated.")
+    return data
@@ -0,0 +1,265 @@
+"""
+On-disk store for downloaded classifier data, shared by the worker processes on a host.
+
+Classifiers are stored in the binary classifier format, one file per classifier set.
+Files are written atomically (to a temporary file, then renamed),
+so readers never see partially written classifiers.  Reads memory-map the file,
+so processes on the same host share the operating system's page cache.
+
+The store has a byte budget: when it is exceeded, the least recently
+used files (by access time) are removed.  Since file systems are often mounted
+with `noatime` or `relatime`, the store updates access times itself on each read.
+"""
+import errno
+import logging
+import os
+import tempfile
+import time
+from django.conf import settings
+from dogapi import dog_stats_api
+from openassessment.assessment import classifier_format
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_DIRECTORY = u"/tmp/ora2_classifier_store"
+
+# By default, keep up to 2GB of classifiers on disk.
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Suffix of the files in the store.
+# Temporary files don't use this suffix, so eviction skips them.
+FILE_SUFFIX = u".v{version}.clf".format(version=classifier_format.FORMAT_VERSION)
+TEMP_PREFIX = u".tmp-"
+
+
+class ClassifierFileStore(object):
+    """
+    Byte-bounded, LRU file store for classifier data.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        """
+        Configure the store.  The directory is created on the first write.
+
+        Keyword Arguments:
+            directory (unicode): The directory containing the classifier files.
+                If not specified, use the `ORA2_CLASSIFIERS_FILE_STORE_DIR` setting.
+            max_bytes (int): The maximum total size of the classifier files.
+                If not specified, use the `ORA2_CLASSIFIERS_FILE_STORE_MAX_BYTES` setting.
+
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+
+    @property
+    def directory(self):
+        """
+        The directory containing the classifier files.
+
+        Returns:
+            unicode
+
+        """
+        if self._directory is not None:
+            return self._directory
+        return getattr(settings, 'ORA2_CLASSIFIERS_FILE_STORE_DIR', DEFAULT_DIRECTORY)
+
+    @property
+    def max_bytes(self):
+        """
+        The maximum total size of the classifier files.
+
+        Returns:
+            int
+
+        """
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'ORA2_CLASSIFIERS_FILE_STORE_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+    def path(self, key):
+        """
+        The path of the file for a key.
+
+        Args:
+            key (int or unicode): The key, such as a classifier set primary key.
+
+        Returns:
+            unicode
+
+        """
+        return os.path.join(self.directory, u"{key}{suffix}".format(key=key, suffix=FILE_SUFFIX))
+
+    def get(self, key):
+        """
+        Read classifier data from the store, marking it as recently used.
+
+        Args:
+            key (int or unicode): The key, such as a classifier set primary key.
+
+        Returns:
+            The classifier data, or None if the store doesn't contain the key.
+
+        """
+        path = self.path(key)
+        try:
+            data = classifier_format.read_classifier_file(path)
+        except (IOError, OSError) as ex:
+            if ex.errno != errno.ENOENT:
+                logger.exception(u"Could not read classifier data from {path}".format(path=path))
+            dog_stats_api.increment('openassessment.assessment.classifier_store.miss')
+            return None
+        except ValueError:
+            logger.exception(u"Removing invalid classifier data in {path}".format(path=path))
+            self.delete(key)
+            dog_stats_api.increment('openassessment.assessment.classifier_store.miss')
+            return None
+
+        self._touch(path)
+        dog_stats_api.increment('openassessment.assessment.classifier_store.hit')
+        return data
+
+    def set(self, key, data):
+        """
+        Write classifier data to the store atomically,
+        then evict the least recently used files if the store exceeds its budget.
+        Classifier data larger than the budget is not stored.
+
+        Args:
+            key (int or unicode): The key, such as a classifier set primary key.
+            data (JSON-serializable): The classifier data, possibly containing `BinaryData`.
+
+        Returns:
+            bool: True if the data was stored.
+
+        """
+        directory = self.directory
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                logger.exception(u"Could not create the classifier store in {dir}".format(dir=directory))
+                return False
+
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=directory, prefix=TEMP_PREFIX, delete=False) as temp_file:
+                temp_path = temp_file.name
+                size = classifier_format.write_classifier(data, temp_file)
+            if size > self.max_bytes:
+                os.remove(temp_path)
+                return False
+            os.rename(temp_path, self.path(key))
+        except (IOError, OSError):
+            logger.exception(u"Could not write classifier data for {key}".format(key=key))
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        self._evict()
+        return True
+
+    def delete(self, key):
+        """
+        Remove classifier data from the store.
+
+        Args:
+            key (int or unicode): The key, such as a classifier set primary key.
+
+        Returns:
+            None
+
+        """
+        self._remove(self.path(key))
+
+    def clear(self):
+        """
+        Remove all classifier data from the store.
+
+        Returns:
+            None
+
+        """
+        for path, __ in self._files():
+            self._remove(path)
+
+    def total_bytes(self):
+        """
+        The total size of the classifier files.
+
+        Returns:
+            int
+
+        """
+        return sum(stat.st_size for __, stat in self._files())
+
+    def _files(self):
+        """
+        List the classifier files in the store.
+
+        Returns:
+            list of `(path, stat)` tuples
+
+        """
+        directory = self.directory
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+
+        files = []
+        for name in names:
+            if not name.endswith(FILE_SUFFIX):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                files.append((path, os.stat(path)))
+            except OSError:
+                # Another process removed the file
+                continue
+        return files
+
+    def _evict(self):
+        """
+        Remove the least recently used files until the store is within its budget.
+
+        Returns:
+            None
+
+        """
+        files = self._files()
+        total_bytes = sum(stat.st_size for __, stat in files)
+        max_bytes = self.max_bytes
+        if total_bytes <= max_bytes:
+            return
+
+        for path, stat in sorted(files, key=lambda (__, stat): stat.st_atime):
+            if total_bytes <= max_bytes:
+                break
+            self._remove(path)
+            total_bytes -= stat.st_size
+            dog_stats_api.increment('openassessment.assessment.classifier_store.evict')
+
+    @staticmethod
+    def _touch(path):
+        """
+        Mark a file as recently used by updating its access time.
+        """
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path):
+        """
+        Remove a file, ignoring files that another process already removed.
+        """
+        try:
+            os.remove(path)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
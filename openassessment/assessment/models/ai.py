@@ -2,16 +2,19 @@
 Database models for AI assessment.
 """
 from uuid import uuid4
-import json
 import logging
+from tempfile import SpooledTemporaryFile
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.core.cache import cache, get_cache
+from django.core.files.base import File
+from django.core.cache import get_cache
 from django.db import models, transaction, DatabaseError
 from django.utils.timezone import now
 from django_extensions.db.fields import UUIDField
 from dogapi import dog_stats_api
 from submissions import api as sub_api
+from openassessment.cache import CacheNamespace
+from openassessment.assessment import classifier_format
+from openassessment.assessment.classifier_store import ClassifierFileStore
 from .base import Rubric, Criterion, Assessment, AssessmentPart
 from .training import TrainingExample
 
@@ -31,14 +34,31 @@ CLASSIFIERS_CACHE_IN_MEM = getattr(
     )
 )
 
-CLASSIFIERS_CACHE_IN_FILE = getattr(
-    settings, 'ORA2_CLASSIFIERS_CACHE_IN_FILE',
-    get_cache(
-        'django.core.cache.backends.filebased.FileBasedCache',
-        LOCATION='/tmp/ora2_classifier_cache'
-    )
+# Classifier data, keyed by classifier set ID.
+# If the format of the classifier data changes, bump the version of the namespace.
+CLASSIFIER_DATA_MEM_CACHE = CacheNamespace(
+    u"classifier_set.classifier_data.memory", backend=CLASSIFIERS_CACHE_IN_MEM
 )
 
+# Keep downloaded classifier data on disk, shared by the worker processes on a host.
+# Settings control the directory and the byte budget (see `ClassifierFileStore`).
+CLASSIFIERS_FILE_STORE = ClassifierFileStore()
+
+# Valid scores for each criterion, keyed by classifier set ID.
+VALID_SCORES_CACHE = CacheNamespace(u"classifier_set.valid_scores")
+
+# The most recent classifier set for a rubric, algorithm, course, and item
+# (see `AIClassifierSet.most_recent_classifier_set`).  Keys include the
+# generations below, so completing training invalidates every affected entry.
+MOST_RECENT_CLASSIFIER_SET_CACHE = CacheNamespace(u"classifier_set.most_recent")
+
+# Generation tokens, keyed by `(algorithm_id, rubric content hash)`
+# and by `(algorithm_id, course_id, item_id)`.
+CLASSIFIER_SET_GENERATION_CACHE = CacheNamespace(u"classifier_set.generation")
+
+# Cached in place of None when no classifier set is available
+NO_CLASSIFIER_SET = False
+
 
 def essay_text_from_submission(submission):
     """
@@ -143,11 +163,42 @@ class AIClassifierSet(models.Model):
     item_id = models.CharField(max_length=128, db_index=True)
 
     @classmethod
-    @transaction.commit_on_success
     def create_classifier_set(cls, classifiers_dict, rubric, algorithm_id, course_id, item_id):
         """
         Create a set of classifiers.
 
+        Once the classifier set is committed, cached results of
+        `most_recent_classifier_set` that it could change are invalidated,
+        so grading workflows started from then on use the new classifiers.
+
+        Args:
+            classifiers_dict (dict): Mapping of criterion names to
+                JSON-serializable classifiers.
+            rubric (Rubric): The rubric model.
+            algorithm_id (unicode): The ID of the algorithm used to train the classifiers.
+            course_id (unicode): The ID of the course that the classifier is going to be grading
+            item_id (unicode): The item within the course that the classifier is trained to grade.
+
+        Returns:
+            AIClassifierSet
+
+        Raises:
+            ClassifierSerializeError
+            ClassifierUploadError
+            InvalidRubricSelection
+            DatabaseError
+
+        """
+        classifier_set = cls._create_classifier_set(classifiers_dict, rubric, algorithm_id, course_id, item_id)
+        cls.invalidate_most_recent_classifier_sets(rubric, algorithm_id, course_id, item_id)
+        return classifier_set
+
+    @classmethod
+    @transaction.commit_on_success
+    def _create_classifier_set(cls, classifiers_dict, rubric, algorithm_id, course_id, item_id):
+        """
+        Create a set of classifiers in a single transaction.
+
         Args:
             classifiers_dict (dict): Mapping of criterion names to
                 JSON-serializable classifiers.
@@ -202,24 +253,30 @@ class AIClassifierSet(models.Model):
                 criterion=rubric_index.find_criterion(criterion_name)
             )
 
-            # Serialize the classifier data and upload
-            try:
-                contents = ContentFile(json.dumps(classifier_data))
-            except (TypeError, ValueError, UnicodeDecodeError) as ex:
-                msg = (
-                    u"Could not serialize classifier data as JSON: {ex}"
-                ).format(ex=ex)
-                raise ClassifierSerializeError(msg)
-
-            filename = uuid4().hex
-            try:
-                classifier.classifier_data.save(filename, contents)
-            except Exception as ex:
-                full_filename = upload_to_path(classifier, filename)
-                msg = (
-                    u"Could not upload classifier data to {filename}: {ex}"
-                ).format(filename=full_filename, ex=ex)
-                raise ClassifierUploadError(msg)
+            # Serialize the classifier data and upload.
+            # Large classifiers spill to a temporary file instead of being held in memory.
+            with SpooledTemporaryFile(max_size=classifier_format.MAX_SPOOL_SIZE) as spool:
+                try:
+                    size = classifier_format.write_classifier(classifier_data, spool)
+                except (TypeError, ValueError, UnicodeDecodeError) as ex:
+                    msg = (
+                        u"Could not serialize classifier data: {ex}"
+                    ).format(ex=ex)
+                    raise ClassifierSerializeError(msg)
+
+                spool.seek(0)
+                contents = File(spool)
+                contents.size = size
+
+                filename = uuid4().hex
+                try:
+                    classifier.classifier_data.save(filename, contents)
+                except Exception as ex:
+                    full_filename = upload_to_path(classifier, filename)
+                    msg = (
+                        u"Could not upload classifier data to {filename}: {ex}"
+                    ).format(filename=full_filename, ex=ex)
+                    raise ClassifierUploadError(msg)
 
         return classifier_set
 
@@ -248,6 +305,90 @@ class AIClassifierSet(models.Model):
         Case #4: Someone will need to schedule training; however, we will still accept
             student submissions and grade them once training completes.
 
+        The result is cached until training completes for the same
+        rubric and algorithm or the same course, item, and algorithm
+        (see `invalidate_most_recent_classifier_sets`), so repeated lookups
+        don't query the database.
+
+        Args:
+            rubric (Rubric): The rubric associated with the classifier set.
+            algorithm_id (unicode): The algorithm used to create the classifier set.
+            course_id (unicode): The course identifier for the current problem.
+            item_id (unicode): The item identifier for the current problem.
+
+        Returns:
+            ClassifierSet or None
+
+        Raises:
+            DatabaseError
+
+        """
+        cache_key = (rubric.content_hash, algorithm_id, course_id, item_id) + cls._generations(
+            rubric.content_hash, algorithm_id, course_id, item_id
+        )
+        classifier_set = MOST_RECENT_CLASSIFIER_SET_CACHE.get(cache_key)
+        if classifier_set is None:
+            classifier_set = cls._find_most_recent_classifier_set(rubric, algorithm_id, course_id, item_id)
+            MOST_RECENT_CLASSIFIER_SET_CACHE.set(
+                cache_key, classifier_set if classifier_set is not None else NO_CLASSIFIER_SET
+            )
+        return classifier_set or None
+
+    @classmethod
+    def invalidate_most_recent_classifier_sets(cls, rubric, algorithm_id, course_id, item_id):
+        """
+        Invalidate the cached results of `most_recent_classifier_set` that
+        a new classifier set could change: lookups for the same course, item,
+        and algorithm (with any rubric), and lookups for the same rubric
+        and algorithm (in any course).
+
+        Args:
+            rubric (Rubric): The rubric of the new classifier set.
+            algorithm_id (unicode): The algorithm of the new classifier set.
+            course_id (unicode): The course of the new classifier set.
+            item_id (unicode): The item of the new classifier set.
+
+        Returns:
+            None
+
+        """
+        CLASSIFIER_SET_GENERATION_CACHE.set_many({
+            (algorithm_id, rubric.content_hash): uuid4().hex,
+            (algorithm_id, course_id, item_id): uuid4().hex,
+        })
+
+    @classmethod
+    def _generations(cls, content_hash, algorithm_id, course_id, item_id):
+        """
+        Retrieve the generation tokens that version the cached
+        classifier set lookups, creating any that are missing.
+
+        Args:
+            content_hash (unicode): The content hash of the rubric.
+            algorithm_id (unicode): The algorithm ID.
+            course_id (unicode): The course ID.
+            item_id (unicode): The item ID.
+
+        Returns:
+            tuple of unicode
+
+        """
+        identifiers = [(algorithm_id, content_hash), (algorithm_id, course_id, item_id)]
+        generations = CLASSIFIER_SET_GENERATION_CACHE.get_many(identifiers)
+        for identifier in identifiers:
+            if identifier not in generations:
+                # A missing token gets a new random value, so lookups cached
+                # before the token was evicted can't be mistaken for current ones.
+                CLASSIFIER_SET_GENERATION_CACHE.add(identifier, uuid4().hex)
+                generations[identifier] = CLASSIFIER_SET_GENERATION_CACHE.get(identifier, uuid4().hex)
+        return tuple(generations[identifier] for identifier in identifiers)
+
+    @classmethod
+    def _find_most_recent_classifier_set(cls, rubric, algorithm_id, course_id, item_id):
+        """
+        Query the database for the most relevant classifier set
+        (see `most_recent_classifier_set`).
+
         Args:
             rubric (Rubric): The rubric associated with the classifier set.
             algorithm_id (unicode): The algorithm used to create the classifier set.
@@ -320,24 +461,25 @@ class AIClassifierSet(models.Model):
         # We use an in-memory cache because the classifier data will most often
         # be several megabytes, which exceeds the default memcached size limit.
         # If we find it, we can avoid calls to the database, S3, and json.
-        cache_key = self._cache_key("classifier_data_by_criterion")
-        classifiers_dict = CLASSIFIERS_CACHE_IN_MEM.get(cache_key)
+        classifiers_dict = CLASSIFIER_DATA_MEM_CACHE.get(self.pk)
 
-        # If we can't find the classifier in-memory, check the filesystem cache
+        # If we can't find the classifier in-memory, check the file store
         # We can't always rely on the in-memory cache because worker processes
         # terminate when max retries are exceeded.
         if classifiers_dict is None:
             msg = (
                 u"Could not find classifiers dict in the in-memory "
-                u"cache for key {key}.  Falling back to the file-based cache."
-            ).format(key=cache_key)
+                u"cache for classifier set {pk}.  Falling back to the file store."
+            ).format(pk=self.pk)
             logger.info(msg)
-            classifiers_dict = CLASSIFIERS_CACHE_IN_FILE.get(cache_key)
+            classifiers_dict = CLASSIFIERS_FILE_STORE.get(self.pk)
+            if classifiers_dict is not None:
+                CLASSIFIER_DATA_MEM_CACHE.set(self.pk, classifiers_dict)
         else:
             msg = (
                 u"Found classifiers dict in the in-memory cache "
-                u"(cache key was {key})"
-            ).format(key=cache_key)
+                u"for classifier set {pk}"
+            ).format(pk=self.pk)
             logger.info(msg)
 
         # If we can't find the classifiers dict in the cache,
@@ -348,13 +490,13 @@ class AIClassifierSet(models.Model):
                 classifier.criterion.name: classifier.download_classifier_data()
                 for classifier in self.classifiers.select_related().all()   # pylint: disable=E1101
             }
-            CLASSIFIERS_CACHE_IN_MEM.set(cache_key, classifiers_dict)
-            CLASSIFIERS_CACHE_IN_FILE.set(cache_key, classifiers_dict)
+            CLASSIFIER_DATA_MEM_CACHE.set(self.pk, classifiers_dict)
+            CLASSIFIERS_FILE_STORE.set(self.pk, classifiers_dict)
             msg = (
                 u"Could not find classifiers dict in either the in-memory "
-                u"or file-based cache.  Downloaded the data from S3 and cached "
-                u"it using key {key}"
-            ).format(key=cache_key)
+                u"cache or the file store.  Downloaded the data from S3 and cached "
+                u"it for classifier set {pk}"
+            ).format(pk=self.pk)
             logger.info(msg)
 
         return classifiers_dict
@@ -368,31 +510,15 @@ class AIClassifierSet(models.Model):
             dict: maps rubric criterion names to lists of valid scores.
 
         """
-        cache_key = self._cache_key("valid_scores_by_criterion")
-        valid_scores_by_criterion = cache.get(cache_key)
+        valid_scores_by_criterion = VALID_SCORES_CACHE.get(self.pk)
         if valid_scores_by_criterion is None:
             valid_scores_by_criterion = {
                 classifier.criterion.name: classifier.valid_scores
                 for classifier in self.classifiers.select_related().all()  # pylint: disable=E1101
             }
-            cache.set(cache_key, valid_scores_by_criterion)
+            VALID_SCORES_CACHE.set(self.pk, valid_scores_by_criterion)
         return valid_scores_by_criterion
 
-    def _cache_key(self, data_name):
-        """
-        Return a cache key for this classifier set.
-
-        Args:
-            data_name (unicode): Name for the data associated with this key.
-
-        Returns:
-            unicode
-
-        """
-        return u"openassessment.assessment.ai.classifier_set.{pk}.{data_name}".format(
-            pk=self.pk, data_name=data_name
-        )
-
 
 # Directory in which classifiers will be stored
 # For instance, if we're using the default file system storage backend
@@ -453,8 +579,13 @@ class AIClassifier(models.Model):
         """
         Download and deserialize the classifier data.
 
+        Classifiers stored on the local file system are memory-mapped;
+        classifiers in other storage backends (such as S3) are streamed.
+        Both the binary container format and JSON are supported
+        (see `openassessment.assessment.classifier_format`).
+
         Returns:
-            JSON-serializable
+            JSON-serializable, possibly containing `BinaryData` values.
 
         Raises:
             ValueError
@@ -462,7 +593,19 @@ class AIClassifier(models.Model):
             httplib.HTTPException
 
         """
-        return json.loads(self.classifier_data.read())  # pylint:disable=E1101
+        try:
+            path = self.classifier_data.path  # pylint:disable=E1101
+        except NotImplementedError:
+            path = None
+
+        if path is not None:
+            return classifier_format.read_classifier_file(path)
+
+        self.classifier_data.open('rb')  # pylint:disable=E1101
+        try:
+            return classifier_format.read_classifier(self.classifier_data)
+        finally:
+            self.classifier_data.close()  # pylint:disable=E1101
 
     @property
     def valid_scores(self):
@@ -557,20 +700,53 @@ class AIWorkflow(models.Model):
             DatabaseError
             cls.DoesNotExist
         """
+        # Stream the workflows from a single query instead of loading them all into memory
+        workflows = cls.objects.filter(
+            course_id=course_id, item_id=item_id, completed_at__isnull=True
+        ).order_by('pk')
+        for workflow in workflows.iterator():
+            yield workflow
 
-        # Finds all of the uuid's for workflows contained within the query
-        grade_workflow_uuids = [
-            wflow['uuid'] for wflow in cls.objects.filter(
-                course_id=course_id, item_id=item_id, completed_at__isnull=True
-            ).values('uuid')
-        ]
+    @classmethod
+    def get_incomplete_workflow_pages(cls, course_id, item_id, page_size, after_id=None, **filters):
+        """
+        Gets the primary keys and UUIDs of incomplete workflows
+        for a given course and item, one page at a time, in primary key order.
 
-        # Continues to generate output until all workflows in the queryset have been output
-        for workflow_uuid in grade_workflow_uuids:
+        Each page is a separate query starting after the last workflow
+        in the previous page, so callers can schedule tasks between pages
+        (even tasks that complete the workflows) and resume from a checkpoint.
 
-            # Returns the grading workflow associated with the uuid stored in the initial query
-            workflow = cls.objects.get(uuid=workflow_uuid)
-            yield workflow
+        Args:
+            course_id (unicode): Uniquely identifies the course
+            item_id (unicode): The discriminator for the item we are looking for
+            page_size (int): The maximum number of workflows in each page.
+
+        Keyword Arguments:
+            after_id (int): If provided, include only workflows with a primary key greater than this.
+            **filters: Additional field lookups used to filter the workflows.
+
+        Yields:
+            list of `(pk, uuid)` tuples
+
+        Raises:
+            DatabaseError
+
+        """
+        last_id = after_id
+        while True:
+            workflows = cls.objects.filter(
+                course_id=course_id, item_id=item_id, completed_at__isnull=True, **filters
+            )
+            if last_id is not None:
+                workflows = workflows.filter(pk__gt=last_id)
+            page = list(workflows.order_by('pk').values_list('pk', 'uuid')[:page_size])
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last_id = page[-1][0]
 
     @classmethod
     def is_workflow_complete(cls, workflow_uuid):
@@ -774,6 +950,60 @@ class AIGradingWorkflow(AIWorkflow):
     # this information here from the submissions models.
     student_id = models.CharField(max_length=40, db_index=True)
 
+    @classmethod
+    def get_incomplete_workflow_groups(cls, course_id, item_id):
+        """
+        Find the distinct rubrics and algorithms used by incomplete grading workflows
+        for a given course and item.  Workflows in the same group share a classifier set.
+
+        Args:
+            course_id (unicode): Uniquely identifies the course
+            item_id (unicode): The discriminator for the item we are looking for
+
+        Returns:
+            list of `(rubric_id, algorithm_id)` tuples, sorted
+
+        Raises:
+            DatabaseError
+
+        """
+        return sorted(
+            cls.objects.filter(
+                course_id=course_id, item_id=item_id, completed_at__isnull=True
+            ).order_by().values_list('rubric_id', 'algorithm_id').distinct()
+        )
+
+    @classmethod
+    def assign_most_recent_classifier_set_to_group(cls, course_id, item_id, rubric_id, algorithm_id):
+        """
+        Find the most recent classifier set for a group of incomplete grading workflows
+        and assign it to every workflow in the group using a single UPDATE.
+
+        Args:
+            course_id (unicode): Uniquely identifies the course
+            item_id (unicode): The discriminator for the item we are looking for
+            rubric_id (int): The primary key of the rubric shared by the workflows.
+            algorithm_id (unicode): The algorithm shared by the workflows.
+
+        Returns:
+            tuple of `(classifier_set, num_workflows)`, where `classifier_set`
+            is None if no classifier set is available for the group.
+
+        Raises:
+            DatabaseError
+
+        """
+        workflows = cls.objects.filter(
+            course_id=course_id, item_id=item_id, completed_at__isnull=True,
+            rubric_id=rubric_id, algorithm_id=algorithm_id
+        )
+        classifier_set = AIClassifierSet.most_recent_classifier_set(
+            Rubric.objects.get(pk=rubric_id), algorithm_id, course_id, item_id
+        )
+        if classifier_set is None:
+            return None, workflows.count()
+        return classifier_set, workflows.update(classifier_set=classifier_set)
+
     def assign_most_recent_classifier_set(self):
         """
         Find the most recent classifier set and assign it to this workflow.
@@ -858,3 +1088,38 @@ class AIGradingWorkflow(AIWorkflow):
         )
         AssessmentPart.create_from_option_points(self.assessment, criterion_scores)
         self.mark_complete_and_save()
+
+    @classmethod
+    @transaction.commit_on_success
+    def complete_many(cls, workflows, scores_by_workflow):
+        """
+        Create assessments for several grading workflows and mark them complete.
+        The assessment parts for every workflow are created in a single query.
+
+        Args:
+            workflows (list of AIGradingWorkflow): The workflows to complete.
+            scores_by_workflow (dict): Maps workflow UUIDs to dictionaries
+                mapping criteria names to integer scores.
+
+        Returns:
+            None
+
+        Raises:
+            InvalidRubricSelection
+            DatabaseError
+
+        """
+        parts = []
+        for workflow in workflows:
+            workflow.assessment = Assessment.create(
+                workflow.rubric, workflow.algorithm_id, workflow.submission_uuid, AI_ASSESSMENT_TYPE
+            )
+            parts.extend(
+                AssessmentPart.build_from_option_points(
+                    workflow.assessment, scores_by_workflow[workflow.uuid]
+                )
+            )
+        AssessmentPart.objects.bulk_create(parts)
+
+        for workflow in workflows:
+            workflow.mark_complete_and_save()
@@ -18,15 +18,20 @@ from copy import deepcopy
 from hashlib import sha1
 import json
 
-from django.core.cache import cache
 from django.db import models
 from django.utils.timezone import now
 from lazy import lazy
 
+from openassessment.cache import CacheNamespace
+
 import logging
 logger = logging.getLogger("openassessment.assessment.models")
 
 
+# Scores grouped by criterion for a set of assessments
+SCORES_BY_CRITERION_CACHE = CacheNamespace(u"assessment.scores_by_criterion")
+
+
 class InvalidRubricSelection(Exception):
     """
     The specified criterion/option do not exist in the rubric.
@@ -576,11 +581,10 @@ class Assessment(models.Model):
             return []
 
         # Generate a cache key that represents all the assessments we're being
-        # asked to grab scores from (comma separated list of assessment IDs)
-        cache_key = "assessments.scores_by_criterion.{}".format(
-            ",".join(str(assessment.id) for assessment in assessments)
-        )
-        scores = cache.get(cache_key)
+        # asked to grab scores from (comma separated list of assessment IDs).
+        # Long lists of IDs are hashed by the cache namespace.
+        cache_key = ",".join(str(assessment.id) for assessment in assessments)
+        scores = SCORES_BY_CRITERION_CACHE.get(cache_key)
         if scores:
             return scores
 
@@ -590,7 +594,7 @@ class Assessment(models.Model):
                 criterion_name = part.criterion.name
                 scores[criterion_name].append(part.points_earned)
 
-        cache.set(cache_key, scores)
+        SCORES_BY_CRITERION_CACHE.set(cache_key, scores)
         return scores
 
 
@@ -730,6 +734,27 @@ class AssessmentPart(models.Model):
             InvalidRubricSelection
             DatabaseError
 
+        """
+        return cls.objects.bulk_create(cls.build_from_option_points(assessment, selected))
+
+    @classmethod
+    def build_from_option_points(cls, assessment, selected):
+        """
+        Build (but do not save) assessment parts for an assessment.
+
+        This lets callers that create many assessments at once
+        save the parts for all of them in a single query.
+
+        Args:
+            assessment (Assessment): The assessment we're adding parts to.
+            selected (dict): A dictionary mapping criterion names to option point values.
+
+        Returns:
+            list of unsaved `AssessmentPart`s
+
+        Raises:
+            InvalidRubricSelection
+
         """
         rubric_index = assessment.rubric.index
 
@@ -760,7 +785,7 @@ class AssessmentPart(models.Model):
 
         # Create assessment parts for each criterion and associate them with the assessment
         # Since we're not accepting written feedback, set all feedback to an empty string.
-        return cls.objects.bulk_create([
+        return [
             cls(
                 assessment=assessment,
                 criterion=assessment_part['criterion'],
@@ -768,7 +793,7 @@ class AssessmentPart(models.Model):
                 feedback=u""
             )
             for assessment_part in assessment_parts
-        ])
+        ]
 
     @classmethod
     def _check_has_all_criteria(cls, rubric_index, selected_criteria):
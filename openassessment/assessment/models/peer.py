@@ -10,7 +10,7 @@ need to then generate a matching migration for it using:
 import random
 from datetime import timedelta
 
-from django.db import models, DatabaseError
+from django.db import models, transaction, DatabaseError, IntegrityError
 from django.utils.timezone import now
 
 from openassessment.assessment.models.base import Assessment
@@ -33,12 +33,117 @@ class AssessmentFeedbackOption(models.Model):
     """
     text = models.CharField(max_length=255, unique=True)
 
+    # Process-local maps of option text to primary key and back.
+    # There are only a handful of options, and once an option is created
+    # its text never changes (rewording an option creates a new one),
+    # so we can safely remember them for the life of the process.
+    _ids_by_text = {}
+    _texts_by_id = {}
+
     class Meta:
         app_label = "assessment"
 
     def __unicode__(self):
         return u'"{}"'.format(self.text)
 
+    @classmethod
+    def ids_for_texts(cls, texts):
+        """
+        Retrieve the primary keys of the options with the given texts,
+        creating any options that don't exist yet.
+
+        Args:
+            texts (list of unicode): The option texts.
+
+        Returns:
+            dict mapping option text to primary key
+
+        Raises:
+            DatabaseError
+
+        """
+        missing = set(text for text in texts if text not in cls._ids_by_text)
+        if missing:
+            cls._remember(cls.objects.filter(text__in=missing).values_list('text', 'id'))
+
+        # Create new options in the order they were selected
+        new_texts = []
+        for text in texts:
+            if text not in cls._ids_by_text and text not in new_texts:
+                new_texts.append(text)
+
+        new_ids = dict()
+        if new_texts:
+            sid = transaction.savepoint()
+            try:
+                cls.objects.bulk_create([cls(text=text) for text in new_texts])
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                # Another process created one of the options after we checked,
+                # so fall back to creating them one at a time.
+                transaction.savepoint_rollback(sid)
+                for text in new_texts:
+                    cls.objects.get_or_create(text=text)
+
+            # The new options aren't remembered until a later call finds them,
+            # since the caller's transaction could still roll back.
+            new_ids = dict(cls.objects.filter(text__in=new_texts).values_list('text', 'id'))
+
+        return {text: cls._ids_by_text.get(text, new_ids.get(text)) for text in texts}
+
+    @classmethod
+    def texts_for_ids(cls, option_ids):
+        """
+        Retrieve the text of the options with the given primary keys.
+
+        Args:
+            option_ids (list of int): The option primary keys.
+
+        Returns:
+            dict mapping primary key to option text
+
+        Raises:
+            DatabaseError
+
+        """
+        missing = set(option_id for option_id in option_ids if option_id not in cls._texts_by_id)
+        if missing:
+            cls._remember(cls.objects.filter(pk__in=missing).values_list('text', 'id'))
+
+        return {
+            option_id: cls._texts_by_id[option_id]
+            for option_id in option_ids
+            if option_id in cls._texts_by_id
+        }
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forget the options loaded by this process.
+
+        Returns:
+            None
+
+        """
+        cls._ids_by_text.clear()
+        cls._texts_by_id.clear()
+
+    @classmethod
+    def _remember(cls, text_id_pairs):
+        """
+        Add options to the process-local maps.
+
+        Args:
+            text_id_pairs (iterable of tuples): `(text, id)` for each option.
+
+        Returns:
+            None
+
+        """
+        for text, option_id in text_id_pairs:
+            cls._ids_by_text[text] = option_id
+            cls._texts_by_id[option_id] = text
+
 
 class AssessmentFeedback(models.Model):
     """
@@ -73,18 +178,13 @@ class AssessmentFeedback(models.Model):
         Raises:
             DatabaseError
         """
-        # First, retrieve options that already exist
-        options = list(AssessmentFeedbackOption.objects.filter(text__in=selected_options))
-
-        # If there are additional options that do not yet exist, create them
-        new_options = [text for text in selected_options if text not in [opt.text for opt in options]]
-        for new_option_text in new_options:
-            options.append(AssessmentFeedbackOption.objects.create(text=new_option_text))
+        # Look up (or create) the options by text.  This usually doesn't
+        # touch the database, since the options are cached in-process.
+        option_ids = AssessmentFeedbackOption.ids_for_texts(selected_options)
 
         # Add all options to the feedback model
-        # Note that we've already saved each of the AssessmentFeedbackOption models, so they have primary keys
-        # (required for adding to a many-to-many relationship)
-        self.options.add(*options)  # pylint:disable=E1101
+        # Many-to-many relationships accept primary keys, so we don't need to load the option models.
+        self.options.add(*set(option_ids.values()))  # pylint:disable=E1101
 
 
 class PeerWorkflow(models.Model):
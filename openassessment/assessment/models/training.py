@@ -3,11 +3,18 @@ Django models for training (both student and AI).
 """
 import json
 from hashlib import sha1
-from django.core.cache import cache
 from django.db import models
+from openassessment.cache import CacheNamespace
 from .base import Rubric, CriterionOption
 
 
+# Training examples are immutable, so we can safely cache them
+# (and data derived from them) by content hash.
+TRAINING_EXAMPLE_MODEL_CACHE = CacheNamespace(u"training_example.model")
+TRAINING_EXAMPLE_SERIALIZED_CACHE = CacheNamespace(u"training_example.serialized")
+TRAINING_EXAMPLE_OPTIONS_CACHE = CacheNamespace(u"training_example.options_selected")
+
+
 class TrainingExample(models.Model):
     """
     An example assessment used to train students (before peer assessment) or AI.
@@ -78,40 +85,15 @@ class TrainingExample(models.Model):
 
         """
         # Since training examples are immutable, we can safely cache this
-        cache_key = self.cache_key_serialized(attribute="options_selected_dict")
-        options_selected = cache.get(cache_key)
+        options_selected = TRAINING_EXAMPLE_OPTIONS_CACHE.get(self.content_hash)
         if options_selected is None:
             options_selected = {
                 option.criterion.name: option.name
                 for option in self.options_selected.all()  # pylint:disable=E1101
             }
-            cache.set(cache_key, options_selected)
+            TRAINING_EXAMPLE_OPTIONS_CACHE.set(self.content_hash, options_selected)
         return options_selected
 
-    def cache_key_serialized(self, attribute=None):
-        """
-        Create a cache key based on the content hash
-        for serialized versions of this model.
-
-        Keyword Arguments:
-            attribute: The name of the attribute being serialized.
-                If not specified, assume that we are serializing the entire model.
-
-        Returns:
-            str: The cache key
-
-        """
-        if attribute is None:
-            key_template = u"TrainingExample.json.{content_hash}"
-        else:
-            key_template = u"TrainingExample.{attribute}.json.{content_hash}"
-
-        cache_key = key_template.format(
-            content_hash=self.content_hash,
-            attribute=attribute
-        )
-        return cache_key
-
     @staticmethod
     def calculate_hash(answer, options_selected, rubric):
         """
@@ -132,23 +114,3 @@ class TrainingExample(models.Model):
             'rubric': rubric.id
         })
         return sha1(contents).hexdigest()
-
-    @classmethod
-    def cache_key(cls, answer, options_selected, rubric):
-        """
-        Calculate a cache key based on the content hash.
-
-        Args:
-            answer (JSON-serializable): The answer associated with the training example.
-            options_selected (dict): The options selected from the rubric (mapping of criterion names to option names)
-            rubric (Rubric): The rubric associated with the training example.
-
-        Returns:
-            tuple of `(cache_key, content_hash)`, both bytestrings
-
-        """
-        content_hash = cls.calculate_hash(answer, options_selected, rubric)
-        cache_key = u"TrainingExample.model.{content_hash}".format(
-            content_hash=content_hash
-        )
-        return cache_key, content_hash
@@ -5,16 +5,25 @@ Serializers common to all assessment types.
 from copy import deepcopy
 import logging
 
-from django.core.cache import cache
+from django.utils.datastructures import SortedDict
+from django.utils.encoding import force_unicode
 from rest_framework import serializers
 from openassessment.assessment.models import (
     Assessment, AssessmentPart, Criterion, CriterionOption, Rubric,
 )
+from openassessment.cache import CacheNamespace
 
 
 logger = logging.getLogger(__name__)
 
 
+# Serialized rubrics, keyed by rubric content hash
+RUBRIC_CACHE = CacheNamespace(u"rubric.serialized")
+
+# Serialized assessments (including the rubric and assessment parts)
+ASSESSMENT_CACHE = CacheNamespace(u"assessment.full_dict")
+
+
 class InvalidRubric(Exception):
     """This can be raised during the deserialization process."""
     def __init__(self, errors):
@@ -118,19 +127,11 @@ class RubricSerializer(NestedModelSerializer):
         if rubric.content_hash in local_cache:
             return local_cache[rubric.content_hash]
 
-        # Check the external cache (e.g. memcached)
-        rubric_dict_cache_key = (
-            "RubricSerializer.serialized_from_cache.{}"
-            .format(rubric.content_hash)
+        # Check the external cache (e.g. memcached), falling back to the database.
+        # If another worker is already serializing the rubric, wait for its result.
+        rubric_dict = RUBRIC_CACHE.get_or_compute(
+            rubric.content_hash, lambda: RubricSerializer(rubric).data
         )
-        rubric_dict = cache.get(rubric_dict_cache_key)
-        if rubric_dict:
-            local_cache[rubric.content_hash] = rubric_dict
-            return rubric_dict
-
-        # Grab it from the database
-        rubric_dict = RubricSerializer(rubric).data
-        cache.set(rubric_dict_cache_key, rubric_dict)
         local_cache[rubric.content_hash] = rubric_dict
 
         return rubric_dict
@@ -159,6 +160,60 @@ class AssessmentSerializer(serializers.ModelSerializer):
         )
 
 
+def _native_text(value):
+    """
+    Convert a text field value the same way the DRF `CharField` does.
+    """
+    return None if value is None else force_unicode(value)
+
+
+def serialize_assessment(assessment):
+    """
+    Serialize an `Assessment` model to a dictionary.
+
+    This produces the same output as `AssessmentSerializer(assessment).data`,
+    but it reads the model attributes directly instead of going through
+    DRF field introspection, which is much more expensive than the handful
+    of attribute reads we actually need.
+
+    Args:
+        assessment (Assessment): The assessment to serialize.
+
+    Returns:
+        SortedDict with the fields of `AssessmentSerializer`, in the same order.
+
+    """
+    assessment_dict = SortedDict()
+    assessment_dict['submission_uuid'] = _native_text(assessment.submission_uuid)
+    assessment_dict['rubric'] = assessment.rubric_id
+    assessment_dict['scored_at'] = assessment.scored_at
+    assessment_dict['scorer_id'] = _native_text(assessment.scorer_id)
+    assessment_dict['score_type'] = _native_text(assessment.score_type)
+    assessment_dict['feedback'] = _native_text(assessment.feedback)
+    return assessment_dict
+
+
+def serialize_assessment_part(part):
+    """
+    Serialize an `AssessmentPart` model to a dictionary.
+
+    This produces the same output as `AssessmentPartSerializer(part).data`
+    without the overhead of DRF field introspection.
+
+    Args:
+        part (AssessmentPart): The assessment part to serialize.
+
+    Returns:
+        SortedDict with the fields of `AssessmentPartSerializer`, in the same order.
+
+    """
+    part_dict = SortedDict()
+    part_dict['option'] = part.option_id
+    part_dict['criterion'] = part.criterion_id
+    part_dict['feedback'] = _native_text(part.feedback)
+    return part_dict
+
+
 def serialize_assessments(assessments_qset):
     assessments = list(assessments_qset.select_related("rubric"))
     rubric_cache = {}
@@ -189,14 +244,29 @@ def full_assessment_dict(assessment, rubric_dict=None):
     Returns:
         dict with keys 'rubric' (serialized Rubric model) and 'parts' (serialized assessment parts)
     """
-    assessment_cache_key = "assessment.full_assessment_dict.{}.{}.{}".format(
+    assessment_cache_key = (
         assessment.id, assessment.submission_uuid, assessment.scored_at.isoformat()
     )
-    assessment_dict = cache.get(assessment_cache_key)
-    if assessment_dict:
-        return assessment_dict
+    return ASSESSMENT_CACHE.get_or_compute(
+        assessment_cache_key,
+        lambda: _build_full_assessment_dict(assessment, rubric_dict)
+    )
+
 
-    assessment_dict = AssessmentSerializer(assessment).data
+def _build_full_assessment_dict(assessment, rubric_dict=None):
+    """
+    Serialize an assessment and its parts without checking the cache.
+
+    Args:
+        assessment (Assessment): The Assessment model to serialize
+
+    Keyword Arguments:
+        rubric_dict (dict): The serialized rubric, if the caller already has it.
+
+    Returns:
+        dict (see `full_assessment_dict`)
+    """
+    assessment_dict = serialize_assessment(assessment)
     if not rubric_dict:
         rubric_dict = RubricSerializer.serialized_from_cache(assessment.rubric)
 
@@ -232,8 +302,6 @@ def full_assessment_dict(assessment, rubric_dict=None):
     )
     assessment_dict["points_possible"] = rubric_dict["points_possible"]
 
-    cache.set(assessment_cache_key, assessment_dict)
-
     return assessment_dict
 
 
@@ -1,9 +1,10 @@
 """
 Serializers for the training assessment type.
 """
-from django.core.cache import cache
 from django.db import transaction, IntegrityError
-from openassessment.assessment.models import TrainingExample
+from openassessment.assessment.models import (
+    TrainingExample, TRAINING_EXAMPLE_MODEL_CACHE, TRAINING_EXAMPLE_SERIALIZED_CACHE
+)
 from openassessment.assessment.data_conversion import update_training_example_answer_format
 from .base import rubric_from_dict, RubricSerializer
 
@@ -55,15 +56,14 @@ def serialize_training_example(example):
 
     """
     # Since training examples are immutable, we can safely cache them
-    cache_key = example.cache_key_serialized()
-    example_dict = cache.get(cache_key)
+    example_dict = TRAINING_EXAMPLE_SERIALIZED_CACHE.get(example.content_hash)
     if example_dict is None:
         example_dict = {
             'answer': update_training_example_answer_format(example.answer),
             'options_selected': example.options_selected_dict,
             'rubric': RubricSerializer.serialized_from_cache(example.rubric),
         }
-        cache.set(cache_key, example_dict)
+        TRAINING_EXAMPLE_SERIALIZED_CACHE.set(example.content_hash, example_dict)
     return example_dict
 
 
@@ -166,8 +166,10 @@ def deserialize_training_examples(examples, rubric_dict):
     for example_dict in examples:
 
         # Try to retrieve the example from the cache
-        cache_key, content_hash = TrainingExample.cache_key(example_dict['answer'], example_dict['options_selected'], rubric)
-        example = cache.get(cache_key)
+        content_hash = TrainingExample.calculate_hash(
+            example_dict['answer'], example_dict['options_selected'], rubric
+        )
+        example = TRAINING_EXAMPLE_MODEL_CACHE.get(content_hash)
 
         # If we couldn't retrieve the example from the cache, create it
         if example is None:
@@ -188,7 +190,7 @@ def deserialize_training_examples(examples, rubric_dict):
                     example = TrainingExample.objects.get(content_hash=content_hash)
 
             # Add the example to the cache
-            cache.set(cache_key, example)
+            TRAINING_EXAMPLE_MODEL_CACHE.set(content_hash, example)
 
         created_examples.append(example)
 
@@ -4,4 +4,5 @@ so import the tasks we want the workers to implement.
 """
 # pylint:disable=W0611
 from .worker.training import train_classifiers, reschedule_training_tasks
-from .worker.grading import grade_essay, reschedule_grading_tasks
\ No newline at end of file
+from .worker.grading import grade_essay, grade_essays, flush_grading_batch, reschedule_grading_tasks
+from .worker.warmup import warm_caches_task
@@ -6,7 +6,7 @@ import copy
 import mock
 from nose.tools import raises
 from celery.exceptions import NotConfigured
-from django.db import DatabaseError
+from django.db import DatabaseError, connection
 from django.test.utils import override_settings
 from openassessment.test_utils import CacheResetTest
 from submissions import api as sub_api
@@ -15,7 +15,11 @@ from openassessment.assessment.models import (
     AITrainingWorkflow, AIGradingWorkflow, AIClassifierSet, Assessment
 )
 from openassessment.assessment.worker.algorithm import AIAlgorithm
-from openassessment.assessment.serializers import rubric_from_dict
+from openassessment.assessment.worker.grading import (
+    grade_essays, flush_grading_batch, reschedule_grading_tasks
+)
+from openassessment.assessment.worker.training import reschedule_training_tasks
+from openassessment.assessment.serializers import rubric_from_dict, deserialize_training_examples
 from openassessment.assessment.errors import (
     AITrainingRequestError, AITrainingInternalError, AIGradingRequestError,
     AIReschedulingInternalError, AIGradingInternalError, AIError
@@ -244,6 +248,33 @@ class AIGradingTest(CacheResetTest):
         self.assertEquals(score["points_possible"], 4)
         self.assertEquals(score["points_earned"], 3)
 
+    @override_settings(
+        ORA2_AI_ALGORITHMS=AI_ALGORITHMS,
+        ORA2_AI_GRADING_BATCH_SIZE=10,
+        ORA2_AI_GRADING_BATCH_FLUSH_INTERVAL=1
+    )
+    def test_grade_essay_in_batch(self):
+        # Because Celery is configured in "always eager" mode, the flush task runs
+        # immediately and grades the essay in a batch of one.
+        patched = 'openassessment.assessment.api.ai.grading_tasks.flush_grading_batch.apply_async'
+        with mock.patch(patched) as mock_flush:
+            ai_api.on_init(self.submission_uuid, rubric=RUBRIC, algorithm_id=ALGORITHM_ID)
+
+            # Later submissions within the flush interval don't schedule another flush
+            other_submission = sub_api.create_submission(STUDENT_ITEM, ANSWER)
+            ai_api.on_init(other_submission['uuid'], rubric=RUBRIC, algorithm_id=ALGORITHM_ID)
+
+        classifier_set_id = AIGradingWorkflow.objects.get(submission_uuid=self.submission_uuid).classifier_set_id
+        mock_flush.assert_called_once_with(args=[classifier_set_id], countdown=1, queue=None)
+        self.assertIs(ai_api.get_score(self.submission_uuid, {}), None)
+
+        # Flush the batch, which should grade both essays
+        flush_grading_batch(classifier_set_id)
+        for submission_uuid in [self.submission_uuid, other_submission['uuid']]:
+            score = ai_api.get_score(submission_uuid, {})
+            self.assertEquals(score["points_possible"], 4)
+            self.assertEquals(score["points_earned"], 3)
+
     @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
     def test_grade_essay_feedback_only_criterion(self):
         # Modify the rubric to include a feedback-only criterion
@@ -350,6 +381,15 @@ class AIGradingTest(CacheResetTest):
         with self.assertRaises(AIGradingInternalError):
             ai_api.get_latest_assessment(self.submission_uuid)
 
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_LANE_QUEUES={u"live": u"ƒαѕт"})
+    def test_grade_essay_live_lane(self):
+        patched = 'openassessment.assessment.api.ai.grading_tasks.grade_essay.apply_async'
+        with mock.patch(patched) as mock_grade:
+            ai_api.on_init(self.submission_uuid, rubric=RUBRIC, algorithm_id=ALGORITHM_ID)
+
+        workflow_uuid = AIGradingWorkflow.objects.get(submission_uuid=self.submission_uuid).uuid
+        mock_grade.assert_called_once_with(args=[workflow_uuid], kwargs={'lane': u"live"}, queue=u"ƒαѕт")
+
     @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
     def test_submit_celery_error(self):
         with mock.patch('openassessment.assessment.api.ai.grading_tasks.grade_essay.apply_async') as mock_grade:
@@ -505,6 +545,118 @@ class AIReschedulingTest(CacheResetTest):
         # Both training and grading should be complete.
         self._assert_complete(grading_done=True, training_done=True)
 
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_GRADING_BATCH_SIZE=3)
+    def test_reschedule_grading_in_batches(self):
+        patched = 'openassessment.assessment.worker.grading.grade_essays.apply_async'
+        with mock.patch(patched, wraps=grade_essays.apply_async) as mock_grade:
+            ai_api.reschedule_unfinished_tasks(course_id=COURSE_ID, item_id=ITEM_ID, task_type=None)
+
+        # Completing the training task reschedules all 10 grading workflows,
+        # which should be graded in batches of at most 3.
+        self._assert_complete(grading_done=True, training_done=True)
+        batch_sizes = sorted(len(call[1]['args'][0]) for call in mock_grade.call_args_list)
+        self.assertEqual(batch_sizes, [1, 3, 3, 3])
+
+    @override_settings(
+        ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_GRADING_BATCH_SIZE=3,
+        ORA2_AI_LANE_QUEUES={u"live": u"ƒαѕт", u"backfill": u"ѕℓσω"}
+    )
+    def test_reschedule_grading_backfill_lane(self):
+        self._train_without_grading()
+        patched = 'openassessment.assessment.worker.grading.grade_essays.apply_async'
+        with mock.patch(patched, wraps=grade_essays.apply_async) as mock_grade:
+            with mock.patch('openassessment.assessment.worker.lanes.dog_stats_api') as mock_stats:
+                reschedule_grading_tasks(COURSE_ID, ITEM_ID)
+
+        # Rescheduled grading is routed to the backfill lane's queue
+        self.assertEqual(mock_grade.call_count, 4)
+        for call in mock_grade.call_args_list:
+            self.assertEqual(call[1]['queue'], u"ѕℓσω")
+            self.assertEqual(call[1]['kwargs'], {'lane': u"backfill"})
+        self._assert_complete(grading_done=True)
+
+        # Every workflow's wait is reported in the backfill lane
+        waits = [
+            call for call in mock_stats.histogram.call_args_list
+            if call[0][0] == 'openassessment.assessment.ai.queue_wait.time'
+        ]
+        self.assertEqual(len(waits), 10)
+        for call in waits:
+            self.assertEqual(call[1]['tags'], [u"lane:backfill", u"task:grade_essays"])
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_RESCHEDULE_CHUNK_SIZE=4)
+    def test_reschedule_grading_bulk_update(self):
+        self._train_without_grading()
+
+        connection.use_debug_cursor = True
+        connection.queries = []
+        try:
+            with mock.patch('openassessment.assessment.worker.grading._enqueue_grading') as mock_enqueue:
+                reschedule_grading_tasks(COURSE_ID, ITEM_ID)
+            updates = [
+                query['sql'] for query in connection.queries
+                if query['sql'].startswith('UPDATE') and AIGradingWorkflow._meta.db_table in query['sql']
+            ]
+        finally:
+            connection.use_debug_cursor = False
+
+        # Classifiers are assigned to all 10 workflows with a single UPDATE,
+        # and grading is scheduled in chunks.
+        self.assertEqual(len(updates), 1)
+        chunk_sizes = [len(call[0][0]) for call in mock_enqueue.call_args_list]
+        self.assertEqual(chunk_sizes, [4, 4, 2])
+        classifier_set = AIClassifierSet.objects.get()
+        self.assertEqual(AIGradingWorkflow.objects.filter(classifier_set=classifier_set).count(), 10)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_RESCHEDULE_CHUNK_SIZE=3)
+    def test_reschedule_grading_resumes_from_checkpoint(self):
+        self._train_without_grading()
+
+        # Fail to schedule the second chunk once
+        scheduled = []
+        errors = [NotConfigured(u"Test error")]
+
+        def _enqueue(workflow_uuids):  # pylint: disable=C0111
+            if len(scheduled) == 1 and errors:
+                raise errors.pop()
+            scheduled.append(workflow_uuids)
+
+        with mock.patch('openassessment.assessment.worker.grading._enqueue_grading', side_effect=_enqueue):
+            reschedule_grading_tasks.apply_async(args=[COURSE_ID, ITEM_ID])
+
+        # The retry should resume with the chunk that failed, without scheduling any workflow twice
+        all_uuids = [workflow_uuid for chunk in scheduled for workflow_uuid in chunk]
+        self.assertEqual([len(chunk) for chunk in scheduled], [3, 3, 3, 1])
+        self.assertItemsEqual(
+            all_uuids, AIGradingWorkflow.objects.values_list('uuid', flat=True)
+        )
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_RESCHEDULE_CHUNK_SIZE=2)
+    def test_reschedule_training_resumes_from_checkpoint(self):
+        examples = deserialize_training_examples(EXAMPLES, RUBRIC)
+        for __ in range(2):
+            AITrainingWorkflow.start_workflow(examples, COURSE_ID, ITEM_ID, ALGORITHM_ID)
+        workflow_uuids = list(AITrainingWorkflow.objects.order_by('pk').values_list('uuid', flat=True))
+        self.assertEqual(len(workflow_uuids), 3)
+
+        # Fail to schedule the second workflow once
+        patched = 'openassessment.assessment.worker.training.train_classifiers.apply_async'
+        with mock.patch(patched) as mock_train:
+            mock_train.side_effect = [None, NotConfigured(u"Test error"), None, None]
+            reschedule_training_tasks.apply_async(args=[COURSE_ID, ITEM_ID])
+
+        scheduled = [call[1]['args'][0] for call in mock_train.call_args_list]
+        self.assertEqual(scheduled, [workflow_uuids[0], workflow_uuids[1], workflow_uuids[1], workflow_uuids[2]])
+
+    def _train_without_grading(self):
+        """
+        Train classifiers without automatically rescheduling grading.
+        """
+        patched = 'openassessment.assessment.worker.training.reschedule_grading_tasks.apply_async'
+        with mock.patch(patched):
+            ai_api.train_classifiers(RUBRIC, EXAMPLES, COURSE_ID, ITEM_ID, ALGORITHM_ID)
+        self._assert_complete(grading_done=False)
+
     @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
     def test_reschedule_non_valid_args(self):
         with self.assertRaises(AIError):
@@ -545,14 +697,14 @@ class AIReschedulingTest(CacheResetTest):
             with self.assertRaises(AITrainingInternalError):
                 ai_api.reschedule_unfinished_tasks(course_id=COURSE_ID, item_id=ITEM_ID, task_type=None)
 
-    @mock.patch.object(AIGradingWorkflow, 'get_incomplete_workflows')
+    @mock.patch.object(AIGradingWorkflow, 'get_incomplete_workflow_groups')
     def test_get_incomplete_workflows_error_grading(self, mock_incomplete):
         mock_incomplete.side_effect = DatabaseError
         with self.assertRaises(AIReschedulingInternalError):
             ai_api.reschedule_unfinished_tasks(course_id=COURSE_ID, item_id=ITEM_ID)
 
     def test_get_incomplete_workflows_error_training(self):
-        patched_method =  'openassessment.assessment.models.ai.AIWorkflow.get_incomplete_workflows'
+        patched_method =  'openassessment.assessment.models.ai.AIWorkflow.get_incomplete_workflow_pages'
         with mock.patch(patched_method) as mock_incomplete:
             mock_incomplete.side_effect = DatabaseError
             with self.assertRaises(Exception):
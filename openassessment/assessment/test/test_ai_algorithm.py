@@ -3,9 +3,11 @@
 Tests for AI algorithm implementations.
 """
 import unittest
+import base64
 import json
 import mock
 from openassessment.test_utils import CacheResetTest
+from openassessment.assessment import classifier_format
 from openassessment.assessment.worker.algorithm import (
     AIAlgorithm, FakeAIAlgorithm, EaseAIAlgorithm,
     TrainingError, InvalidClassifier
@@ -60,6 +62,28 @@ class AIAlgorithmTest(CacheResetTest):
             for input_essay in input_essays
         ]
 
+    def _assert_score_many_matches_score(self, classifiers, input_essays):
+        """
+        Check that scoring a batch of essays for several criteria at once
+        gives the same scores as scoring each essay and criterion separately.
+
+        Args:
+            classifiers (dict): Mapping of criterion names to classifiers.
+            input_essays (list of unicode): The essays to score.
+
+        Raises:
+            AssertionError
+
+        """
+        expected = [
+            {
+                criterion_name: self.algorithm.score(input_essay, classifier, {})
+                for criterion_name, classifier in classifiers.iteritems()
+            }
+            for input_essay in input_essays
+        ]
+        self.assertEqual(self.algorithm.score_many(input_essays, classifiers), expected)
+
 
 class FakeAIAlgorithmTest(AIAlgorithmTest):
     """
@@ -73,6 +97,12 @@ class FakeAIAlgorithmTest(AIAlgorithmTest):
         scores = self._scores(classifier, INPUT_ESSAYS)
         self.assertEqual(scores, expected_scores)
 
+    def test_load_classifier(self):
+        classifier = self.algorithm.train_classifier(EXAMPLES)
+        loaded = self.algorithm.load_classifier(classifier)
+        self.assertEqual(loaded, classifier)
+        self.assertEqual(self._scores(loaded, INPUT_ESSAYS), self._scores(classifier, INPUT_ESSAYS))
+
     def test_score_classifier_missing_key(self):
         with self.assertRaises(InvalidClassifier):
             self.algorithm.score(u"Test input", {}, {})
@@ -81,6 +111,49 @@ class FakeAIAlgorithmTest(AIAlgorithmTest):
         with self.assertRaises(InvalidClassifier):
             self.algorithm.score(u"Test input", {'scores': []}, {})
 
+    def test_score_many(self):
+        classifiers = {
+            u"𝓒𝓻𝓲𝓽𝓮𝓻𝓲𝓸𝓷 1": self.algorithm.train_classifier(EXAMPLES),
+            u"𝓒𝓻𝓲𝓽𝓮𝓻𝓲𝓸𝓷 2": self.algorithm.train_classifier(EXAMPLES[:4]),
+        }
+        self._assert_score_many_matches_score(classifiers, INPUT_ESSAYS)
+
+    def test_score_many_no_essays(self):
+        classifiers = {u"𝓒𝓻𝓲𝓽𝓮𝓻𝓲𝓸𝓷": self.algorithm.train_classifier(EXAMPLES)}
+        self.assertEqual(self.algorithm.score_many([], classifiers), [])
+
+    def test_score_many_classifier_no_scores(self):
+        with self.assertRaises(InvalidClassifier):
+            self.algorithm.score_many([u"Test input"], {u"𝓒𝓻𝓲𝓽𝓮𝓻𝓲𝓸𝓷": {'scores': []}})
+
+
+class DefaultScoreManyTest(AIAlgorithmTest):
+    """
+    Test for the default batch scoring implementation, which calls `score()`.
+    """
+
+    class CountingAIAlgorithm(AIAlgorithm):
+        """
+        Algorithm that scores each essay by the number of criteria
+        already scored with the same cache.
+        """
+        def train_classifier(self, examples):
+            return {}
+
+        def score(self, text, classifier, cache):
+            cache['num_scored'] = cache.get('num_scored', 0) + 1
+            return cache['num_scored']
+
+    ALGORITHM_CLASS = CountingAIAlgorithm
+
+    def test_score_many(self):
+        scores = self.algorithm.score_many(INPUT_ESSAYS[:3], {u"a": {}, u"b": {}})
+
+        # Each essay has its own cache, shared across criteria
+        self.assertEqual(len(scores), 3)
+        for essay_scores in scores:
+            self.assertEqual(sorted(essay_scores.values()), [1, 2])
+
 
 # Try to import EASE -- if we can't, then skip the tests that require it
 try:
@@ -110,6 +183,20 @@ class EaseAIAlgorithmTest(AIAlgorithmTest):
         repeat_scores = self._scores(classifier, INPUT_ESSAYS)
         self.assertEqual(scores, repeat_scores)
 
+    def test_score_with_loaded_classifier(self):
+        classifier = self.algorithm.train_classifier(EXAMPLES)
+        loaded = self.algorithm.load_classifier(classifier)
+        self.assertIsInstance(loaded, EaseAIAlgorithm.LoadedClassifier)
+        self.assertEqual(self._scores(loaded, INPUT_ESSAYS), self._scores(classifier, INPUT_ESSAYS))
+
+    def test_score_many(self):
+        classifier = self.algorithm.train_classifier(EXAMPLES)
+        classifiers = {
+            u"𝓒𝓻𝓲𝓽𝓮𝓻𝓲𝓸𝓷 1": classifier,
+            u"𝓒𝓻𝓲𝓽𝓮𝓻𝓲𝓸𝓷 2": self.algorithm.load_classifier(classifier),
+        }
+        self._assert_score_many_matches_score(classifiers, INPUT_ESSAYS)
+
     def test_all_examples_have_same_score(self):
         examples = [
             AIAlgorithm.ExampleEssay(u"Test ëṡṡäÿ", 1),
@@ -138,15 +225,25 @@ class EaseAIAlgorithmTest(AIAlgorithmTest):
         with self.assertRaises(TrainingError):
             self.algorithm.train_classifier([])
 
-    def test_json_serializable(self):
+    def test_classifier_format_serializable(self):
         classifier = self.algorithm.train_classifier(EXAMPLES)
-        serialized = json.dumps(classifier)
-        deserialized = json.loads(serialized)
+        serialized = classifier_format.dumps(classifier)
+        deserialized = classifier_format.loads(serialized)
 
         # This should not raise an exception
         scores = self._scores(deserialized, INPUT_ESSAYS)
         self.assertEqual(len(scores), len(INPUT_ESSAYS))
 
+    def test_score_legacy_json_classifier(self):
+        # Classifiers trained before the binary format existed
+        # store base64-encoded pickles in JSON.
+        classifier = self.algorithm.train_classifier(EXAMPLES)
+        legacy = json.loads(json.dumps({
+            key: base64.b64encode(value)
+            for key, value in classifier.iteritems()
+        }))
+        self.assertEqual(self._scores(legacy, INPUT_ESSAYS), self._scores(classifier, INPUT_ESSAYS))
+
     @mock.patch('openassessment.assessment.worker.algorithm.pickle')
     def test_pickle_serialize_error(self, mock_pickle):
         mock_pickle.dumps.side_effect = Exception("Test error!")
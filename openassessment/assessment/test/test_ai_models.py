@@ -3,17 +3,25 @@
 Test AI Django models.
 """
 import copy
+import json
+from uuid import uuid4
 import ddt
+import mock
+from django.core.files.base import ContentFile
+from django.db.models.fields.files import FieldFile
 from django.test import TestCase
 
 from django.test.utils import override_settings
 from openassessment.test_utils import CacheResetTest
 from openassessment.assessment.models import (
-    AIClassifierSet, AIClassifier, AIGradingWorkflow, AI_CLASSIFIER_STORAGE,
+    AIClassifierSet, AIClassifier, AIGradingWorkflow, AITrainingWorkflow, AI_CLASSIFIER_STORAGE,
     CLASSIFIERS_CACHE_IN_MEM, essay_text_from_submission
 )
-from openassessment.assessment.serializers import rubric_from_dict
-from .constants import RUBRIC
+from openassessment.assessment.models.ai import CLASSIFIER_SET_GENERATION_CACHE
+from openassessment.assessment.serializers import rubric_from_dict, deserialize_training_examples
+from openassessment.assessment import classifier_format
+from openassessment.assessment.classifier_format import BinaryData
+from .constants import RUBRIC, EXAMPLES
 
 
 CLASSIFIERS_DICT = {
@@ -94,6 +102,35 @@ class AIClassifierSetTest(CacheResetTest):
         # Verify that we got the same value both times
         self.assertEqual(first, second)
 
+    def test_binary_classifier_data(self):
+        classifiers = {
+            u"vøȼȺƀᵾłȺɍɏ": {u"pickled": BinaryData("\x80\x02" + "\x00\xff" * 100), u"version": 1},
+            u"ﻭɼค๓๓คɼ": {u"pickled": BinaryData(""), u"version": 1},
+        }
+        classifier_set = AIClassifierSet.create_classifier_set(
+            classifiers, rubric_from_dict(RUBRIC), "test_algorithm", COURSE_ID, ITEM_ID
+        )
+        for classifier in classifier_set.classifiers.all():
+            self.assertTrue(classifier.classifier_data.read().startswith(classifier_format.MAGIC))
+        self.assertEqual(classifier_set.classifier_data_by_criterion, classifiers)
+
+    def test_legacy_json_classifier_data(self):
+        # Classifiers stored before the binary format existed are JSON
+        for classifier in self.classifier_set.classifiers.select_related('criterion'):
+            classifier.classifier_data.save(
+                uuid4().hex, ContentFile(json.dumps(CLASSIFIERS_DICT[classifier.criterion.name]))
+            )
+        self.assertEqual(self.classifier_set.classifier_data_by_criterion, CLASSIFIERS_DICT)
+
+    def test_download_streams_without_local_path(self):
+        # Storage backends such as S3 don't support local paths,
+        # so the classifier data is streamed instead.
+        classifier = self.classifier_set.classifiers.select_related('criterion')[0]
+        with mock.patch.object(FieldFile, 'path', new_callable=mock.PropertyMock) as mock_path:
+            mock_path.side_effect = NotImplementedError
+            data = classifier.download_classifier_data()
+        self.assertEqual(data, CLASSIFIERS_DICT[classifier.criterion.name])
+
     def test_file_cache_downloads(self):
         # Retrieve the classifiers dict, which should be cached
         # both in memory and on the file system
@@ -204,3 +241,56 @@ class AIGradingWorkflowTest(CacheResetTest):
         found = self.workflow.assign_most_recent_classifier_set()
         self.assertTrue(found)
         self.assertEqual(classifier_set.pk, self.workflow.classifier_set.pk)
+
+    def test_most_recent_classifier_set_cached(self):
+        classifier_set = AIClassifierSet.create_classifier_set(
+            self.CLASSIFIERS_DICT, self.rubric, self.ALGORITHM_ID,
+            self.COURSE_ID, self.ITEM_ID
+        )
+        self._most_recent_classifier_set()
+
+        # Once cached, the lookup doesn't query the database
+        with self.assertNumQueries(0):
+            self.assertEqual(self._most_recent_classifier_set().pk, classifier_set.pk)
+
+    def test_no_classifier_set_cached(self):
+        self.assertIs(self._most_recent_classifier_set(), None)
+        with self.assertNumQueries(0):
+            self.assertIs(self._most_recent_classifier_set(), None)
+
+    def test_training_complete_invalidates_cache(self):
+        self.assertIs(self._most_recent_classifier_set(), None)
+
+        examples = deserialize_training_examples(EXAMPLES, RUBRIC)
+        training_workflow = AITrainingWorkflow.start_workflow(
+            examples, self.COURSE_ID, self.ITEM_ID, self.ALGORITHM_ID
+        )
+        training_workflow.complete(self.CLASSIFIERS_DICT)
+
+        self.assertEqual(self._most_recent_classifier_set().pk, training_workflow.classifier_set.pk)
+
+    def test_generation_evicted(self):
+        old_classifier_set = AIClassifierSet.create_classifier_set(
+            self.CLASSIFIERS_DICT, self.rubric, self.ALGORITHM_ID,
+            self.COURSE_ID, self.ITEM_ID
+        )
+        self.assertEqual(self._most_recent_classifier_set().pk, old_classifier_set.pk)
+
+        # If the generation tokens are evicted from the cache before a new classifier set
+        # is created, new tokens are chosen, so the old lookup isn't re-used.
+        CLASSIFIER_SET_GENERATION_CACHE.delete((self.ALGORITHM_ID, self.rubric.content_hash))
+        CLASSIFIER_SET_GENERATION_CACHE.delete((self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID))
+        with mock.patch.object(AIClassifierSet, 'invalidate_most_recent_classifier_sets'):
+            new_classifier_set = AIClassifierSet.create_classifier_set(
+                self.CLASSIFIERS_DICT, self.rubric, self.ALGORITHM_ID,
+                self.COURSE_ID, self.ITEM_ID
+            )
+        self.assertEqual(self._most_recent_classifier_set().pk, new_classifier_set.pk)
+
+    def _most_recent_classifier_set(self):
+        """
+        Look up the most recent classifier set for the workflow's rubric, course, and item.
+        """
+        return AIClassifierSet.most_recent_classifier_set(
+            self.rubric, self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+        )
@@ -97,6 +97,9 @@ class AIWorkerTrainingTest(CacheResetTest):
         ]
         self.assertItemsEqual(params['training_examples'], expected_examples)
         self.assertItemsEqual(params['algorithm_id'], ALGORITHM_ID)
+        self.assertEqual(
+            params['scheduled_at'], AITrainingWorkflow.objects.get(uuid=self.workflow_uuid).scheduled_at
+        )
 
     def test_get_training_task_params_no_workflow(self):
         with self.assertRaises(AITrainingRequestError):
@@ -241,11 +244,13 @@ class AIWorkerGradingTest(CacheResetTest):
         expected_params = {
             'essay_text': ANSWER,
             'classifier_set': CLASSIFIERS,
+            'classifier_set_id': AIGradingWorkflow.objects.get(uuid=self.workflow_uuid).classifier_set_id,
             'algorithm_id': ALGORITHM_ID,
             'valid_scores': {
                 u"vøȼȺƀᵾłȺɍɏ": [0, 1, 2],
                 u"ﻭɼค๓๓คɼ": [0, 1, 2]
-            }
+            },
+            'scheduled_at': AIGradingWorkflow.objects.get(uuid=self.workflow_uuid).scheduled_at,
         }
         self.assertItemsEqual(params, expected_params)
 
@@ -333,3 +338,114 @@ class AIWorkerGradingTest(CacheResetTest):
         mock_call.side_effect = DatabaseError("Oh no!")
         with self.assertRaises(AIGradingInternalError):
             ai_worker_api.is_grading_workflow_complete(self.workflow_uuid)
+
+
+class AIWorkerBatchGradingTest(CacheResetTest):
+    """
+    Tests for the AI API calls a worker would make when
+    grading a batch of essays.
+    """
+
+    NUM_ESSAYS = 3
+
+    SCORES = {
+        u"vøȼȺƀᵾłȺɍɏ": 1,
+        u"ﻭɼค๓๓คɼ": 0
+    }
+
+    def setUp(self):
+        """
+        Create grading workflows that share a classifier set.
+        """
+        rubric = rubric_from_dict(RUBRIC)
+        AIClassifierSet.create_classifier_set(
+            CLASSIFIERS, rubric, ALGORITHM_ID, STUDENT_ITEM.get('course_id'), STUDENT_ITEM.get('item_id')
+        )
+        self.workflow_uuids = []
+        self.submission_uuids = []
+        for __ in range(self.NUM_ESSAYS):
+            submission = sub_api.create_submission(STUDENT_ITEM, ANSWER)
+            workflow = AIGradingWorkflow.start_workflow(submission['uuid'], RUBRIC, ALGORITHM_ID)
+            self.workflow_uuids.append(workflow.uuid)
+            self.submission_uuids.append(submission['uuid'])
+
+    def test_get_grading_batch_params(self):
+        params = ai_worker_api.get_grading_batch_params(self.workflow_uuids)
+        self.assertEqual(params['essays'], {
+            workflow.uuid: workflow.essay_text
+            for workflow in AIGradingWorkflow.objects.filter(uuid__in=self.workflow_uuids)
+        })
+        self.assertEqual(len(params['essays']), self.NUM_ESSAYS)
+        self.assertEqual(params['classifier_set'], CLASSIFIERS)
+        self.assertEqual(params['algorithm_id'], ALGORITHM_ID)
+        self.assertEqual(params['valid_scores'], {
+            u"vøȼȺƀᵾłȺɍɏ": [0, 1, 2],
+            u"ﻭɼค๓๓คɼ": [0, 1, 2]
+        })
+        self.assertEqual(params['scheduled_at'], {
+            workflow.uuid: workflow.scheduled_at
+            for workflow in AIGradingWorkflow.objects.filter(uuid__in=self.workflow_uuids)
+        })
+
+    def test_get_grading_batch_params_num_queries(self):
+        # The number of queries shouldn't depend on the number of essays
+        with self.assertNumQueries(5):
+            ai_worker_api.get_grading_batch_params(self.workflow_uuids)
+
+        # The second time through the classifiers and valid scores are cached
+        with self.assertNumQueries(1):
+            ai_worker_api.get_grading_batch_params(self.workflow_uuids)
+
+    def test_get_grading_batch_params_skips_complete(self):
+        AIGradingWorkflow.objects.get(uuid=self.workflow_uuids[0]).mark_complete_and_save()
+        params = ai_worker_api.get_grading_batch_params(self.workflow_uuids + ['no such workflow'])
+        self.assertItemsEqual(params['essays'].keys(), self.workflow_uuids[1:])
+
+    def test_get_grading_batch_params_all_complete(self):
+        for workflow in AIGradingWorkflow.objects.all():
+            workflow.mark_complete_and_save()
+        params = ai_worker_api.get_grading_batch_params(self.workflow_uuids)
+        self.assertEqual(params['essays'], {})
+        self.assertIs(params['classifier_set'], None)
+
+    def test_get_grading_batch_params_no_classifiers(self):
+        AIGradingWorkflow.objects.filter(uuid=self.workflow_uuids[0]).update(classifier_set=None)
+        with self.assertRaises(AIGradingInternalError):
+            ai_worker_api.get_grading_batch_params(self.workflow_uuids)
+
+    def test_get_grading_batch_params_different_algorithms(self):
+        AIGradingWorkflow.objects.filter(uuid=self.workflow_uuids[0]).update(algorithm_id=u"other")
+        with self.assertRaises(AIGradingRequestError):
+            ai_worker_api.get_grading_batch_params(self.workflow_uuids)
+
+    @mock.patch.object(AIGradingWorkflow.objects, 'filter')
+    def test_get_grading_batch_params_database_error(self, mock_call):
+        mock_call.side_effect = DatabaseError("KABOOM!")
+        with self.assertRaises(AIGradingInternalError):
+            ai_worker_api.get_grading_batch_params(self.workflow_uuids)
+
+    def test_create_assessments(self):
+        ai_worker_api.create_assessments({uuid: self.SCORES for uuid in self.workflow_uuids})
+        for submission_uuid in self.submission_uuids:
+            assessment = Assessment.objects.get(submission_uuid=submission_uuid)
+            self.assertEqual(assessment.points_earned, 1)
+        for workflow in AIGradingWorkflow.objects.filter(uuid__in=self.workflow_uuids):
+            self.assertTrue(workflow.is_complete)
+
+    def test_create_assessments_workflow_already_complete(self):
+        ai_worker_api.create_assessments({self.workflow_uuids[0]: self.SCORES})
+        ai_worker_api.create_assessments({uuid: self.SCORES for uuid in self.workflow_uuids})
+
+        # Expect that only one assessment is created for each submission
+        for submission_uuid in self.submission_uuids:
+            num_assessments = Assessment.objects.filter(submission_uuid=submission_uuid).count()
+            self.assertEqual(num_assessments, 1)
+
+    @mock.patch.object(Assessment.objects, 'create')
+    def test_create_assessments_database_error(self, mock_call):
+        mock_call.side_effect = DatabaseError("KABOOM!")
+        with self.assertRaises(AIGradingInternalError):
+            ai_worker_api.create_assessments({uuid: self.SCORES for uuid in self.workflow_uuids})
+
+        # The assessments are created in a single transaction
+        self.assertEqual(AIGradingWorkflow.objects.filter(completed_at__isnull=False).count(), 0)
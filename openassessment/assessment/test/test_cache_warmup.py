@@ -0,0 +1,121 @@
+# coding=utf-8
+"""
+Tests for warming the ORA2 caches.
+"""
+import datetime
+import ddt
+from django.core.cache import cache
+from openassessment.test_utils import CacheResetTest, TransactionCacheResetTest
+from openassessment.assessment.models import (
+    AIClassifierSet, AITrainingWorkflow, Rubric, TrainingExample
+)
+from openassessment.assessment.serializers import (
+    RubricSerializer, rubric_from_dict, deserialize_training_examples,
+    serialize_training_example
+)
+from openassessment.assessment.worker import warmup
+from openassessment.workflow.models import AssessmentWorkflow
+from openassessment.assessment.test.constants import RUBRIC, EXAMPLES
+
+
+COURSE_ID = u"ՇєรՇ ς๏ยгรє"
+ITEM_ID = u"𝖙𝖊𝖘𝖙 𝖎𝖙𝖊𝖒"
+ALGORITHM_ID = u"test-stub"
+
+
+class CacheWarmupMixin(object):
+    """
+    Create the objects whose cache entries should be warmed.
+    """
+
+    def _create_active_item(self, course_id=COURSE_ID, item_id=ITEM_ID):
+        """
+        Create a workflow, training examples, and a classifier set for a problem.
+        """
+        AssessmentWorkflow.objects.create(
+            submission_uuid=u"{}-{}".format(course_id, item_id)[:36],
+            course_id=course_id, item_id=item_id, status=u"peer"
+        )
+        rubric = rubric_from_dict(RUBRIC)
+        examples = deserialize_training_examples(EXAMPLES, RUBRIC)
+        AITrainingWorkflow.start_workflow(examples, course_id, item_id, ALGORITHM_ID)
+        classifiers = {criterion['name']: {} for criterion in RUBRIC['criteria']}
+        AIClassifierSet.create_classifier_set(classifiers, rubric, ALGORITHM_ID, course_id, item_id)
+
+    def _assert_cached(self):
+        """
+        Check that every cache entry for the problem was warmed.
+        """
+        rubric = Rubric.objects.get()
+        examples = list(TrainingExample.objects.all())
+        classifier_set = AIClassifierSet.objects.get()
+        with self.assertNumQueries(0):
+            RubricSerializer.serialized_from_cache(rubric)
+            for example in examples:
+                serialize_training_example(example)
+            classifier_set.valid_scores_by_criterion  # pylint: disable=W0104
+
+
+@ddt.ddt
+class CacheWarmupTest(CacheWarmupMixin, CacheResetTest):
+    """
+    Tests for warming the caches in the current thread.
+    """
+
+    def test_warm_caches(self):
+        self._create_active_item()
+        cache.clear()
+
+        results = warmup.warm_caches(num_workers=1)
+        self.assertEqual(results['items'], 1)
+        self.assertEqual(results['rubrics'], 1)
+        self.assertEqual(results['training_examples'], len(EXAMPLES))
+        self.assertEqual(results['classifier_sets'], 1)
+        self.assertGreaterEqual(results['seconds'], 0)
+        self._assert_cached()
+
+    @ddt.data(1, 2, 100)
+    def test_batch_sizes(self, batch_size):
+        self._create_active_item()
+        cache.clear()
+        warmup.warm_caches(num_workers=1, batch_size=batch_size)
+        self._assert_cached()
+
+    def test_no_active_items(self):
+        results = warmup.warm_caches(num_workers=1)
+        self.assertEqual(results['items'], 0)
+        self.assertEqual(results['rubrics'], 0)
+        self.assertEqual(results['training_examples'], 0)
+        self.assertEqual(results['classifier_sets'], 0)
+
+    def test_inactive_items_skipped(self):
+        self._create_active_item()
+        long_ago = datetime.datetime(2000, 1, 1)
+        AssessmentWorkflow.objects.update(modified=long_ago)
+        results = warmup.warm_caches(num_workers=1)
+        self.assertEqual(results['items'], 0)
+
+    def test_filter_by_course(self):
+        self._create_active_item()
+        self._create_active_item(course_id=u"other course", item_id=u"other item")
+        self.assertEqual(warmup.warm_caches(num_workers=1, course_id=COURSE_ID)['items'], 1)
+        self.assertEqual(warmup.warm_caches(num_workers=1)['items'], 2)
+
+    def test_task(self):
+        self._create_active_item()
+        cache.clear()
+        warmup.warm_caches_task.apply_async(kwargs={'course_id': COURSE_ID, 'num_workers': 1})
+        self._assert_cached()
+
+
+class ParallelCacheWarmupTest(CacheWarmupMixin, TransactionCacheResetTest):
+    """
+    Tests for warming the caches using a pool of threads.
+    """
+
+    def test_warm_caches_in_parallel(self):
+        self._create_active_item()
+        cache.clear()
+        results = warmup.warm_caches(num_workers=4, batch_size=1)
+        self.assertEqual(results['training_examples'], len(EXAMPLES))
+        self._assert_cached()
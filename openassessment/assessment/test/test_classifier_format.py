@@ -0,0 +1,170 @@
+# coding=utf-8
+"""
+Tests for the binary classifier format.
+"""
+import base64
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from StringIO import StringIO
+import ddt
+import mock
+from django.test import TestCase
+from django.test.utils import override_settings
+from openassessment.assessment import classifier_format
+from openassessment.assessment.classifier_format import BinaryData, InvalidClassifierFormat
+
+
+CLASSIFIER = {
+    u"name": u"𝒕𝒆𝒔𝒕 𝒄𝒍𝒂𝒔𝒔𝒊𝒇𝒊𝒆𝒓",
+    u"scores": [0, 1, 2],
+    u"weights": {u"ƒσσ": 0.5, u"ɓαя": None},
+    u"feature_extractor": BinaryData(pickle.dumps(range(1000), pickle.HIGHEST_PROTOCOL)),
+    u"models": [
+        BinaryData("\x00\xff" * 500),
+        BinaryData(os.urandom(256)),
+        BinaryData(""),
+    ],
+}
+
+
+def _base64_encode(data):
+    """
+    Base64-encode binary data, as classifiers stored as JSON do.
+    """
+    if isinstance(data, BinaryData):
+        return base64.b64encode(data)
+    elif isinstance(data, dict):
+        return {key: _base64_encode(value) for key, value in data.iteritems()}
+    elif isinstance(data, list):
+        return [_base64_encode(value) for value in data]
+    return data
+
+
+@ddt.ddt
+class ClassifierFormatTest(TestCase):
+    """
+    Tests for reading and writing classifiers.
+    """
+
+    @ddt.data(0, 1, 6, 9)
+    def test_round_trip(self, level):
+        serialized = classifier_format.dumps(CLASSIFIER, level=level)
+        self.assertTrue(serialized.startswith(classifier_format.MAGIC))
+
+        deserialized = classifier_format.loads(serialized)
+        self.assertEqual(deserialized, CLASSIFIER)
+        self.assertIsInstance(deserialized[u"feature_extractor"], BinaryData)
+        for model in deserialized[u"models"]:
+            self.assertIsInstance(model, BinaryData)
+        self.assertEqual(pickle.loads(deserialized[u"feature_extractor"]), range(1000))
+
+    def test_no_binary_data(self):
+        classifier = {u"scores": [1, 2, 3], u"ʇǝxʇ": u"ɯoɹǝ ʇǝsʇ pɐʇɐ"}
+        self.assertEqual(classifier_format.loads(classifier_format.dumps(classifier)), classifier)
+
+    def test_smaller_than_base64_json(self):
+        legacy = json.dumps(_base64_encode(CLASSIFIER))
+        self.assertLess(len(classifier_format.dumps(CLASSIFIER, level=0)), len(legacy))
+        self.assertLess(len(classifier_format.dumps(CLASSIFIER)), len(legacy))
+
+    def test_write_returns_size(self):
+        output = StringIO()
+        size = classifier_format.write_classifier(CLASSIFIER, output)
+        self.assertEqual(size, len(output.getvalue()))
+
+    def test_compression_level_setting(self):
+        with override_settings(ORA2_AI_CLASSIFIER_COMPRESSION_LEVEL=0):
+            uncompressed = classifier_format.dumps(CLASSIFIER)
+        compressed = classifier_format.dumps(CLASSIFIER)
+        self.assertLess(len(compressed), len(uncompressed))
+        self.assertEqual(uncompressed, classifier_format.dumps(CLASSIFIER, level=0))
+
+    def test_read_json(self):
+        classifier = {u"name": u"𝒕𝒆𝒔𝒕", u"data": [1, 2, 3]}
+        self.assertEqual(classifier_format.loads(json.dumps(classifier)), classifier)
+
+    @ddt.data("", "{", "\x89ORA2", "\x89ORA2CLF\x01")
+    def test_invalid_data(self, data):
+        with self.assertRaises(ValueError):
+            classifier_format.loads(data)
+
+    def test_unsupported_version(self):
+        serialized = classifier_format.dumps(CLASSIFIER)
+        serialized = serialized[:8] + chr(classifier_format.FORMAT_VERSION + 1) + serialized[9:]
+        with self.assertRaises(InvalidClassifierFormat):
+            classifier_format.loads(serialized)
+
+    @ddt.data(0, 6)
+    def test_truncated(self, level):
+        serialized = classifier_format.dumps(CLASSIFIER, level=level)
+        for length in [classifier_format.HEADER.size + 1, len(serialized) / 2, len(serialized) - 1]:
+            with self.assertRaises(InvalidClassifierFormat):
+                classifier_format.loads(serialized[:length])
+
+    def test_corrupt_blob(self):
+        serialized = classifier_format.dumps({u"data": BinaryData("a" * 1000)})
+        with self.assertRaises(InvalidClassifierFormat):
+            classifier_format.loads(serialized[:-4] + "\xff\xff\xff\xff")
+
+    def test_reserved_key(self):
+        with self.assertRaises(ValueError):
+            classifier_format.dumps({classifier_format.BLOB_KEY: 1})
+
+    def test_not_json_serializable(self):
+        with self.assertRaises(TypeError):
+            classifier_format.dumps({u"data": object()})
+
+    @mock.patch('openassessment.assessment.classifier_format.CHUNK_SIZE', 7)
+    def test_read_in_chunks(self):
+        serialized = classifier_format.dumps(CLASSIFIER)
+        self.assertEqual(classifier_format.loads(serialized), CLASSIFIER)
+
+    @mock.patch('openassessment.assessment.classifier_format.MAX_SPOOL_SIZE', 10)
+    def test_write_spools_to_disk(self):
+        serialized = classifier_format.dumps(CLASSIFIER)
+        self.assertEqual(classifier_format.loads(serialized), CLASSIFIER)
+
+    def test_approximate_size(self):
+        size = classifier_format.approximate_size(CLASSIFIER)
+        self.assertGreater(size, len(CLASSIFIER[u"feature_extractor"]))
+        self.assertLess(size, len(classifier_format.dumps(CLASSIFIER, level=0)) + 1)
+
+
+class ClassifierFileTest(TestCase):
+    """
+    Tests for reading classifiers from memory-mapped local files.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, u"classifier")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, contents):
+        """
+        Write the contents of the classifier file.
+        """
+        with open(self.path, 'wb') as classifier_file:
+            classifier_file.write(contents)
+
+    def test_read_container(self):
+        self._write(classifier_format.dumps(CLASSIFIER))
+        self.assertEqual(classifier_format.read_classifier_file(self.path), CLASSIFIER)
+
+    def test_read_json(self):
+        self._write(json.dumps({u"data": u"𝒕𝒆𝒔𝒕"}))
+        self.assertEqual(classifier_format.read_classifier_file(self.path), {u"data": u"𝒕𝒆𝒔𝒕"})
+
+    def test_empty_file(self):
+        self._write("")
+        with self.assertRaises(ValueError):
+            classifier_format.read_classifier_file(self.path)
+
+    def test_missing_file(self):
+        with self.assertRaises(IOError):
+            classifier_format.read_classifier_file(os.path.join(self.temp_dir, u"missing"))
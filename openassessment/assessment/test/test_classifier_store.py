@@ -0,0 +1,148 @@
+# coding=utf-8
+"""
+Tests for the on-disk classifier store.
+"""
+import os
+import shutil
+import tempfile
+import mock
+from django.test import TestCase
+from django.test.utils import override_settings
+from openassessment.assessment import classifier_format
+from openassessment.assessment.classifier_format import BinaryData
+from openassessment.assessment.classifier_store import ClassifierFileStore, TEMP_PREFIX
+
+
+CLASSIFIERS = {
+    u"vøȼȺƀᵾłȺɍɏ": {u"pickled": BinaryData("\x00\xff" * 100), u"version": 1},
+    u"ﻭɼค๓๓คɼ": {u"pickled": BinaryData("\x80\x02"), u"version": 1},
+}
+
+
+class ClassifierFileStoreTest(TestCase):
+    """
+    Tests for the byte-bounded classifier file store.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.temp_dir, u"ƈąçɦɛ")
+        self.store = ClassifierFileStore(directory=self.directory)
+        self.size = len(classifier_format.dumps(CLASSIFIERS))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_set_delete(self):
+        self.assertIs(self.store.get(1), None)
+        self.assertTrue(self.store.set(1, CLASSIFIERS))
+        self.assertEqual(self.store.get(1), CLASSIFIERS)
+        self.assertIs(self.store.get(2), None)
+        self.assertEqual(self.store.total_bytes(), self.size)
+
+        self.store.delete(1)
+        self.assertIs(self.store.get(1), None)
+        self.store.delete(1)
+
+    def test_clear(self):
+        self.store.set(1, CLASSIFIERS)
+        self.store.set(2, CLASSIFIERS)
+        self.store.clear()
+        self.assertIs(self.store.get(1), None)
+        self.assertIs(self.store.get(2), None)
+        self.assertEqual(self.store.total_bytes(), 0)
+
+    def test_clear_missing_directory(self):
+        self.store.clear()
+        self.assertEqual(self.store.total_bytes(), 0)
+
+    def test_overwrite(self):
+        self.store.set(1, CLASSIFIERS)
+        self.store.set(1, {u"ﻭɼค๓๓คɼ": {}})
+        self.assertEqual(self.store.get(1), {u"ﻭɼค๓๓คɼ": {}})
+
+    def test_evict_least_recently_accessed(self):
+        store = ClassifierFileStore(directory=self.directory, max_bytes=self.size * 2)
+        store.set(1, CLASSIFIERS)
+        store.set(2, CLASSIFIERS)
+        self._set_atime(1, 1000)
+        self._set_atime(2, 500)
+
+        store.set(3, CLASSIFIERS)
+        self.assertIs(store.get(2), None)
+        self.assertEqual(store.get(1), CLASSIFIERS)
+        self.assertEqual(store.get(3), CLASSIFIERS)
+        self.assertLessEqual(store.total_bytes(), self.size * 2)
+
+    def test_get_updates_access_time(self):
+        store = ClassifierFileStore(directory=self.directory, max_bytes=self.size * 2)
+        store.set(1, CLASSIFIERS)
+        store.set(2, CLASSIFIERS)
+        self._set_atime(1, 500)
+        self._set_atime(2, 1000)
+
+        # Reading the first classifier makes the second the least recently used
+        store.get(1)
+        store.set(3, CLASSIFIERS)
+        self.assertEqual(store.get(1), CLASSIFIERS)
+        self.assertIs(store.get(2), None)
+
+    def test_too_large_to_store(self):
+        store = ClassifierFileStore(directory=self.directory, max_bytes=self.size - 1)
+        store.set(1, {u"ﻭɼค๓๓คɼ": {}})
+        self.assertFalse(store.set(2, CLASSIFIERS))
+        self.assertIs(store.get(2), None)
+        self.assertEqual(store.get(1), {u"ﻭɼค๓๓คɼ": {}})
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(store.path(1))])
+
+    def test_settings(self):
+        store = ClassifierFileStore()
+        with override_settings(ORA2_CLASSIFIERS_FILE_STORE_DIR=self.directory):
+            self.assertEqual(store.directory, self.directory)
+            store.set(1, CLASSIFIERS)
+            self.assertEqual(self.store.get(1), CLASSIFIERS)
+
+        with override_settings(ORA2_CLASSIFIERS_FILE_STORE_MAX_BYTES=10):
+            self.assertEqual(store.max_bytes, 10)
+
+    def test_atomic_write(self):
+        self.store.set(1, CLASSIFIERS)
+
+        # Simulate a failure partway through writing new data
+        patched = 'openassessment.assessment.classifier_store.classifier_format.write_classifier'
+        with mock.patch(patched) as mock_write:
+            mock_write.side_effect = IOError(u"Disk full")
+            self.assertFalse(self.store.set(1, {u"ﻭɼค๓๓คɼ": {}}))
+
+        # Readers still see the old data, and the temporary file was removed
+        self.assertEqual(self.store.get(1), CLASSIFIERS)
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(self.store.path(1))])
+
+    def test_eviction_skips_temporary_files(self):
+        store = ClassifierFileStore(directory=self.directory, max_bytes=self.size)
+        store.set(1, CLASSIFIERS)
+        temp_path = os.path.join(self.directory, TEMP_PREFIX + u"in-progress")
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write("\x00" * self.size)
+        store.set(2, CLASSIFIERS)
+        self.assertTrue(os.path.exists(temp_path))
+
+    def test_invalid_file_removed(self):
+        self.store.set(1, CLASSIFIERS)
+        with open(self.store.path(1), 'wb') as classifier_file:
+            classifier_file.write("{ not a classifier")
+        self.assertIs(self.store.get(1), None)
+        self.assertFalse(os.path.exists(self.store.path(1)))
+
+    @mock.patch('openassessment.assessment.classifier_store.os.makedirs')
+    def test_cannot_create_directory(self, mock_makedirs):
+        mock_makedirs.side_effect = OSError(13, u"Permission denied")
+        self.assertFalse(self.store.set(1, CLASSIFIERS))
+        self.assertIs(self.store.get(1), None)
+
+    def _set_atime(self, key, atime):
+        """
+        Set the access time of a classifier file.
+        """
+        path = self.store.path(key)
+        os.utime(path, (atime, os.stat(path).st_mtime))
@@ -0,0 +1,147 @@
+# coding=utf-8
+"""
+Tests for the priority lanes of AI tasks.
+"""
+import datetime
+import mock
+from django.test.utils import override_settings
+from django.utils.timezone import now
+from openassessment.test_utils import CacheResetTest
+from openassessment.assessment.worker import lanes
+from openassessment.assessment.worker.lanes import (
+    LANE_LIVE, LANE_TRAINING, LANE_BACKFILL, LANE_SLOT_CACHE,
+    queue_for_lane, acquire_slot, release_slot, limit_concurrency, record_queue_wait
+)
+
+
+class LaneQueueTest(CacheResetTest):
+    """
+    Tests for routing lanes to queues.
+    """
+
+    @mock.patch.dict(lanes.DEFAULT_LANE_QUEUES, {
+        LANE_LIVE: None, LANE_TRAINING: u"low", LANE_BACKFILL: u"low"
+    })
+    def test_default_queues(self):
+        self.assertIs(queue_for_lane(LANE_LIVE), None)
+        self.assertEqual(queue_for_lane(LANE_TRAINING), u"low")
+        self.assertEqual(queue_for_lane(LANE_BACKFILL), u"low")
+
+    @override_settings(ORA2_AI_LANE_QUEUES={LANE_LIVE: u"ƒαѕт", LANE_BACKFILL: u"ѕℓσω"})
+    def test_queues_setting(self):
+        self.assertEqual(queue_for_lane(LANE_LIVE), u"ƒαѕт")
+        self.assertEqual(queue_for_lane(LANE_BACKFILL), u"ѕℓσω")
+        self.assertEqual(queue_for_lane(LANE_TRAINING), lanes.DEFAULT_LANE_QUEUES[LANE_TRAINING])
+
+
+class LaneSlotTest(CacheResetTest):
+    """
+    Tests for the concurrency budget of each lane.
+    """
+
+    def test_no_budget(self):
+        slots = [acquire_slot(LANE_BACKFILL) for __ in range(10)]
+        self.assertNotIn(None, slots)
+        for slot in slots:
+            release_slot(slot)
+
+    @override_settings(ORA2_AI_LANE_CONCURRENCY={LANE_BACKFILL: 2})
+    def test_budget(self):
+        first = acquire_slot(LANE_BACKFILL)
+        second = acquire_slot(LANE_BACKFILL)
+        self.assertIsNot(first, None)
+        self.assertIsNot(second, None)
+        self.assertIs(acquire_slot(LANE_BACKFILL), None)
+
+        # Other lanes have their own budgets
+        self.assertIsNot(acquire_slot(LANE_LIVE), None)
+
+        # Releasing a slot lets another task run
+        release_slot(first)
+        self.assertIsNot(acquire_slot(LANE_BACKFILL), None)
+        self.assertIs(acquire_slot(LANE_BACKFILL), None)
+
+    @override_settings(ORA2_AI_LANE_CONCURRENCY={LANE_BACKFILL: 1})
+    def test_release_expired_slot(self):
+        slot = acquire_slot(LANE_BACKFILL)
+
+        # Simulate the lease expiring and another task claiming the slot
+        LANE_SLOT_CACHE.delete((LANE_BACKFILL, 0))
+        other_slot = acquire_slot(LANE_BACKFILL)
+        self.assertIsNot(other_slot, None)
+
+        # Releasing the expired slot doesn't release the other task's slot
+        release_slot(slot)
+        self.assertIs(acquire_slot(LANE_BACKFILL), None)
+        release_slot(other_slot)
+        self.assertIsNot(acquire_slot(LANE_BACKFILL), None)
+
+
+class LimitConcurrencyTest(CacheResetTest):
+    """
+    Tests for the decorator that enforces lane budgets in tasks.
+    """
+
+    def setUp(self):
+        self.calls = []
+
+        @limit_concurrency(LANE_LIVE)
+        def _task(workflow_uuid, lane=LANE_LIVE):  # pylint: disable=C0111
+            self.calls.append((workflow_uuid, lane))
+            return workflow_uuid
+
+        self.task = _task
+
+    @override_settings(ORA2_AI_LANE_CONCURRENCY={LANE_LIVE: 1})
+    def test_within_budget(self):
+        self.assertEqual(self.task(u"abcd"), u"abcd")
+        self.assertEqual(self.task(u"efgh"), u"efgh")
+        self.assertEqual(self.calls, [(u"abcd", LANE_LIVE), (u"efgh", LANE_LIVE)])
+
+    @override_settings(
+        ORA2_AI_LANE_CONCURRENCY={LANE_BACKFILL: 1},
+        ORA2_AI_LANE_QUEUES={LANE_BACKFILL: u"ѕℓσω"},
+        ORA2_AI_LANE_DEFER_COUNTDOWN=7
+    )
+    @mock.patch('openassessment.assessment.worker.lanes.current_task')
+    def test_over_budget(self, mock_task):
+        slot = acquire_slot(LANE_BACKFILL)
+        self.assertIs(self.task(u"abcd", lane=LANE_BACKFILL), None)
+
+        # The task is scheduled again on its lane's queue instead of running
+        self.assertEqual(self.calls, [])
+        mock_task.apply_async.assert_called_once_with(
+            args=(u"abcd",), kwargs={'lane': LANE_BACKFILL}, queue=u"ѕℓσω", countdown=7
+        )
+
+        # Once the slot is released, the task runs
+        release_slot(slot)
+        self.task(u"abcd", lane=LANE_BACKFILL)
+        self.assertEqual(self.calls, [(u"abcd", LANE_BACKFILL)])
+
+    @override_settings(ORA2_AI_LANE_CONCURRENCY={LANE_LIVE: 1})
+    def test_slot_released_on_error(self):
+        @limit_concurrency(LANE_LIVE)
+        def _failing_task(lane=LANE_LIVE):  # pylint: disable=C0111,W0613
+            raise ValueError(u"Test error")
+
+        with self.assertRaises(ValueError):
+            _failing_task()
+        self.assertEqual(self.task(u"abcd"), u"abcd")
+
+
+class QueueWaitTest(CacheResetTest):
+    """
+    Tests for the queue wait metric.
+    """
+
+    @mock.patch('openassessment.assessment.worker.lanes.dog_stats_api')
+    def test_record_queue_wait(self, mock_stats):
+        scheduled_at = now() - datetime.timedelta(seconds=30)
+        record_queue_wait(LANE_BACKFILL, u"grade_essays", [scheduled_at, None, scheduled_at])
+
+        self.assertEqual(mock_stats.histogram.call_count, 2)
+        args, kwargs = mock_stats.histogram.call_args
+        self.assertEqual(args[0], 'openassessment.assessment.ai.queue_wait.time')
+        self.assertGreaterEqual(args[1], 30)
+        self.assertEqual(kwargs['tags'], [u"lane:backfill", u"task:grade_essays"])
@@ -3,13 +3,13 @@ import datetime
 import pytz
 import copy
 
-from django.db import DatabaseError, IntegrityError
+from django.db import DatabaseError, IntegrityError, transaction
 from django.utils import timezone
 from ddt import ddt, file_data
 from mock import patch
 from nose.tools import raises
 
-from openassessment.test_utils import CacheResetTest
+from openassessment.test_utils import CacheResetTest, TransactionCacheResetTest
 from openassessment.assessment.api import peer as peer_api
 from openassessment.assessment.models import (
     Assessment, AssessmentPart, AssessmentFeedback, AssessmentFeedbackOption,
@@ -1707,3 +1707,69 @@ class AssessmentFeedbackTest(CacheResetTest):
 
         # There should be two options in the database
         self.assertEqual(AssessmentFeedbackOption.objects.count(), 2)
+
+    def test_add_options_cached(self):
+        # The first time we see the options, we create them
+        self.feedback.add_options(['I liked my assessment', 'I thought my assessment was unfair'])
+
+        # The next time, we load them from the database
+        # (we still check for and add the many-to-many relations)
+        other_feedback = AssessmentFeedback.objects.create(submission_uuid='other_submission')
+        with self.assertNumQueries(3):
+            other_feedback.add_options(['I liked my assessment', 'I thought my assessment was unfair'])
+
+        # Afterwards, we shouldn't need to query the options table
+        third_feedback = AssessmentFeedback.objects.create(submission_uuid='third_submission')
+        with self.assertNumQueries(2):
+            third_feedback.add_options(['I liked my assessment', 'I thought my assessment was unfair'])
+
+        options = other_feedback.options.all()
+        self.assertEqual(len(options), 2)
+        self.assertEqual(options[0].text, 'I liked my assessment')
+        self.assertEqual(options[1].text, 'I thought my assessment was unfair')
+
+    def test_add_options_created_concurrently(self):
+        # Simulate another process creating an option after we checked that it didn't exist,
+        # so the bulk insert really fails
+        AssessmentFeedbackOption.objects.create(text='I liked my assessment')
+        with patch.object(AssessmentFeedbackOption, '_remember'):
+            with patch('openassessment.assessment.models.peer.transaction.savepoint_rollback',
+                       wraps=transaction.savepoint_rollback) as mock_rollback:
+                self.feedback.add_options(['I liked my assessment', 'I thought my assessment was unfair'])
+
+        # The failed insert was rolled back to a savepoint before falling back
+        self.assertEqual(mock_rollback.call_count, 1)
+        self.assertEqual(AssessmentFeedbackOption.objects.count(), 2)
+        self.assertEqual(self.feedback.options.count(), 2)
+
+    def test_option_texts_for_ids(self):
+        option_ids = AssessmentFeedbackOption.ids_for_texts([u'𝓘 𝓵𝓲𝓴𝓮𝓭 𝓶𝔂 𝓪𝓼𝓼𝓮𝓼𝓼𝓶𝓮𝓷𝓽', u'test'])
+
+        # Load the options from the database
+        AssessmentFeedbackOption.clear_cache()
+        texts = AssessmentFeedbackOption.texts_for_ids(option_ids.values() + [1234])
+        self.assertEqual(texts, {option_id: text for text, option_id in option_ids.iteritems()})
+
+        # Load the options from the in-process cache
+        with self.assertNumQueries(0):
+            self.assertEqual(AssessmentFeedbackOption.texts_for_ids(option_ids.values()), texts)
+
+
+class AssessmentFeedbackTransactionTest(TransactionCacheResetTest):
+    """
+    Tests for feedback options that need real transactions.
+    """
+
+    def test_options_created_in_rolled_back_transaction(self):
+        feedback = AssessmentFeedback.objects.create(submission_uuid='test_submission')
+
+        # The caller's transaction rolls back after the option was created
+        with self.assertRaises(DatabaseError):
+            with transaction.commit_on_success():
+                feedback.add_options(['I liked my assessment'])
+                raise DatabaseError("Test error")
+        self.assertFalse(AssessmentFeedbackOption.objects.exists())
+
+        # The option is created again, rather than using the id of the rolled back row
+        feedback.add_options(['I liked my assessment'])
+        self.assertEqual([option.text for option in feedback.options.all()], ['I liked my assessment'])
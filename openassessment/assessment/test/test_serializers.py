@@ -3,19 +3,30 @@
 Tests for assessment serializers.
 """
 
+import datetime
 import json
 import os.path
 import copy
-
-from openassessment.test_utils import CacheResetTest
+from multiprocessing.pool import ThreadPool
+
+import ddt
+import mock
+import pytz
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from openassessment.test_utils import CacheResetTest, TransactionCacheResetTest
 from openassessment.assessment.models import (
     Assessment, AssessmentPart, AssessmentFeedback
 )
 from openassessment.assessment.serializers import (
     rubric_from_dict, full_assessment_dict,
-    AssessmentFeedbackSerializer, InvalidRubric
+    AssessmentFeedbackSerializer, InvalidRubric,
+    AssessmentSerializer, AssessmentPartSerializer,
+    serialize_assessment, serialize_assessment_part,
+    RubricSerializer
 )
 from .constants import RUBRIC
+from .test_peer import RUBRIC_DICT
 
 
 def json_data(filename):
@@ -117,6 +128,7 @@ class AssessmentFeedbackSerializerTest(CacheResetTest):
         })
 
 
+@ddt.ddt
 class AssessmentSerializerTest(CacheResetTest):
 
     def test_full_assessment_dict_criteria_no_options(self):
@@ -153,3 +165,124 @@ class AssessmentSerializerTest(CacheResetTest):
         # Verify that the assessment dict correctly serialized the criterion with no options.
         self.assertIs(serialized['parts'][2]['option'], None)
         self.assertEqual(serialized['parts'][2]['criterion']['name'], u"feedback only")
+
+    @ddt.file_data('data/valid_assessments.json')
+    def test_serialize_assessment_parity(self, data):
+        rubric = rubric_from_dict(RUBRIC_DICT)
+        assessment = Assessment.create(
+            rubric, u"scorer", u"submission UUID", u"PE",
+            feedback=data['overall_feedback'],
+            scored_at=datetime.datetime(2014, 4, 1, tzinfo=pytz.utc)
+        )
+        AssessmentPart.create_from_option_names(
+            assessment, data['options_selected'], feedback=data['criterion_feedback']
+        )
+
+        # Check both the in-memory model and the model as loaded from the database
+        for model in [assessment, Assessment.objects.get(pk=assessment.pk)]:
+            self._assert_same_output(
+                serialize_assessment(model),
+                AssessmentSerializer(model).data
+            )
+            for part in model.parts.all():
+                self._assert_same_output(
+                    serialize_assessment_part(part),
+                    AssessmentPartSerializer(part).data
+                )
+
+    def test_serialize_assessment_part_no_option(self):
+        rubric_dict = copy.deepcopy(RUBRIC)
+        rubric_dict['criteria'].append({
+            'order_num': 2,
+            'name': 'feedback only',
+            'prompt': 'feedback only',
+            'options': []
+        })
+        rubric = rubric_from_dict(rubric_dict)
+        assessment = Assessment.create(rubric, "Bob", "submission UUID", "PE")
+        AssessmentPart.create_from_option_names(
+            assessment,
+            {u"vøȼȺƀᵾłȺɍɏ": u"𝓰𝓸𝓸𝓭", u"ﻭɼค๓๓คɼ": u"єχ¢єℓℓєηт"},
+            feedback={u"feedback only": u"enjoy the feedback!"}
+        )
+
+        for part in assessment.parts.all():
+            self._assert_same_output(
+                serialize_assessment_part(part),
+                AssessmentPartSerializer(part).data
+            )
+
+    def _assert_same_output(self, actual, expected):
+        """
+        Check that the hand-written serializer output matches the DRF output,
+        including field order and the types of the serialized values.
+        """
+        self.assertEqual(actual, expected)
+        self.assertEqual(actual.keys(), expected.keys())
+        for key in expected:
+            self.assertIs(type(actual[key]), type(expected[key]))
+        self.assertEqual(
+            json.dumps(actual, cls=DjangoJSONEncoder),
+            json.dumps(expected, cls=DjangoJSONEncoder)
+        )
+
+
+class ConcurrentCacheFillTest(TransactionCacheResetTest):
+    """
+    Check that concurrent requests for an uncached rubric or assessment
+    serialize it only once.
+    """
+
+    NUM_THREADS = 8
+
+    def _run_concurrently(self, func):
+        """
+        Call `func` from several threads at once and return the results.
+        """
+        def _call(__):  # pylint: disable=C0111
+            try:
+                return func()
+            finally:
+                connection.close()
+
+        pool = ThreadPool(self.NUM_THREADS)
+        try:
+            return pool.map(_call, range(self.NUM_THREADS))
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_rubric_serialized_once(self):
+        rubric = rubric_from_dict(RUBRIC)
+        original = RubricSerializer.to_native
+        with mock.patch.object(RubricSerializer, 'to_native', autospec=True) as mock_to_native:
+            mock_to_native.side_effect = original
+            results = self._run_concurrently(
+                lambda: RubricSerializer.serialized_from_cache(rubric)
+            )
+
+        self.assertEqual(mock_to_native.call_count, 1)
+        self.assertEqual(len(results), self.NUM_THREADS)
+        for rubric_dict in results:
+            self.assertEqual(rubric_dict, results[0])
+
+    def test_assessment_serialized_once(self):
+        rubric = rubric_from_dict(RUBRIC)
+        assessment = Assessment.create(rubric, u"scorer", u"submission UUID", u"PE")
+        AssessmentPart.create_from_option_names(
+            assessment, {u"vøȼȺƀᵾłȺɍɏ": u"𝓰𝓸𝓸𝓭", u"ﻭɼค๓๓คɼ": u"єχ¢єℓℓєηт"}
+        )
+
+        with mock.patch(
+            'openassessment.assessment.serializers.base.serialize_assessment',
+            wraps=serialize_assessment
+        ) as mock_serialize:
+            results = self._run_concurrently(lambda: full_assessment_dict(assessment))
+
+        # The serialized parts refer back to their criteria, so compare
+        # the top-level fields instead of the full (recursive) structure.
+        self.assertEqual(mock_serialize.call_count, 1)
+        for assessment_dict in results:
+            self.assertEqual(assessment_dict['points_earned'], results[0]['points_earned'])
+            self.assertEqual(assessment_dict['points_possible'], results[0]['points_possible'])
+            self.assertEqual(len(assessment_dict['parts']), 2)
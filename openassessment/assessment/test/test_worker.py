@@ -8,12 +8,16 @@ import mock
 from django.test.utils import override_settings
 from submissions import api as sub_api
 from openassessment.test_utils import CacheResetTest
-from openassessment.assessment.worker.training import train_classifiers, InvalidExample
-from openassessment.assessment.worker.grading import grade_essay
+from openassessment.assessment.worker.training import (
+    train_classifiers, InvalidExample, _train_classifier_set, _examples_by_criterion
+)
+from openassessment.assessment.worker.grading import (
+    grade_essay, grade_essays, LoadedClassifierCache, LOADED_CLASSIFIER_CACHE
+)
 from openassessment.assessment.api import ai_worker as ai_worker_api
 from openassessment.assessment.models import AITrainingWorkflow, AIGradingWorkflow, AIClassifierSet
 from openassessment.assessment.worker.algorithm import (
-    AIAlgorithm, UnknownAlgorithm, AlgorithmLoadError, TrainingError, ScoreError
+    AIAlgorithm, FakeAIAlgorithm, UnknownAlgorithm, AlgorithmLoadError, TrainingError, ScoreError
 )
 from openassessment.assessment.serializers import (
     deserialize_training_examples, rubric_from_dict
@@ -66,12 +70,14 @@ ERROR_STUB_ALGORITHM_ID = u"error-stub"
 UNDEFINED_CLASS_ALGORITHM_ID = u"undefined_class"
 UNDEFINED_MODULE_ALGORITHM_ID = u"undefined_module"
 INVALID_SCORE_ALGORITHM_ID = u"invalid_score"
+FAKE_ALGORITHM_ID = u"fake"
 AI_ALGORITHMS = {
     ALGORITHM_ID: '{module}.StubAIAlgorithm'.format(module=__name__),
     ERROR_STUB_ALGORITHM_ID: '{module}.ErrorStubAIAlgorithm'.format(module=__name__),
     UNDEFINED_CLASS_ALGORITHM_ID: '{module}.NotDefinedAIAlgorithm'.format(module=__name__),
     UNDEFINED_MODULE_ALGORITHM_ID: 'openassessment.not.valid.NotDefinedAIAlgorithm',
     INVALID_SCORE_ALGORITHM_ID: '{module}.InvalidScoreAlgorithm'.format(module=__name__),
+    FAKE_ALGORITHM_ID: 'openassessment.assessment.worker.algorithm.FakeAIAlgorithm',
 }
 
 
@@ -249,6 +255,80 @@ class AITrainingTaskTest(CeleryTaskTest):
                 train_classifiers(self.workflow_uuid)
 
 
+@override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+class AIParallelTrainingTest(CeleryTaskTest):
+    """
+    Tests for training criteria concurrently in a process pool.
+    """
+
+    COURSE_ID = u"10923"
+    ITEM_ID = u"12231"
+
+    def setUp(self):
+        """
+        Load the training examples in the format returned by the AI API.
+        """
+        workflow = self._start_workflow()
+        params = ai_worker_api.get_training_task_params(workflow.uuid)
+        self.examples_by_criterion = _examples_by_criterion(params['training_examples'])
+
+    def test_parallel_matches_sequential(self):
+        sequential = _train_classifier_set(
+            FakeAIAlgorithm(), FAKE_ALGORITHM_ID, self.examples_by_criterion, num_processes=1
+        )
+        parallel = _train_classifier_set(
+            FakeAIAlgorithm(), FAKE_ALGORITHM_ID, self.examples_by_criterion, num_processes=4
+        )
+        self.assertEqual(sorted(sequential.keys()), sorted(self.examples_by_criterion.keys()))
+        self.assertEqual(parallel, sequential)
+
+    def test_train_classifiers_in_parallel(self):
+        with override_settings(ORA2_AI_TRAINING_PROCESSES=1):
+            sequential = self._train()
+        with override_settings(ORA2_AI_TRAINING_PROCESSES=2):
+            parallel = self._train()
+        self.assertEqual(parallel, sequential)
+
+    @mock.patch('openassessment.assessment.worker.training.multiprocessing')
+    def test_daemon_process_trains_sequentially(self, mock_multiprocessing):
+        mock_multiprocessing.current_process.return_value.daemon = True
+        classifier_set = _train_classifier_set(
+            FakeAIAlgorithm(), FAKE_ALGORITHM_ID, self.examples_by_criterion, num_processes=4
+        )
+        self.assertEqual(sorted(classifier_set.keys()), sorted(self.examples_by_criterion.keys()))
+        self.assertFalse(mock_multiprocessing.Pool.called)
+
+    @mock.patch('openassessment.assessment.worker.training.dog_stats_api')
+    def test_timing_metric_per_criterion(self, mock_stats):
+        _train_classifier_set(
+            FakeAIAlgorithm(), FAKE_ALGORITHM_ID, self.examples_by_criterion, num_processes=2
+        )
+        self.assertEqual(mock_stats.histogram.call_count, len(self.examples_by_criterion))
+        for args, kwargs in mock_stats.histogram.call_args_list:
+            self.assertEqual(args[0], 'openassessment.assessment.ai.train_classifier.time')
+            self.assertEqual(kwargs['tags'], [u"algorithm_id:fake"])
+
+    def _start_workflow(self):
+        """
+        Start a training workflow that uses the fake algorithm.
+        """
+        examples = deserialize_training_examples(EXAMPLES, RUBRIC)
+        return AITrainingWorkflow.start_workflow(examples, self.COURSE_ID, self.ITEM_ID, FAKE_ALGORITHM_ID)
+
+    def _train(self):
+        """
+        Train classifiers for a new workflow.
+
+        Returns:
+            dict mapping criterion names to classifier data
+
+        """
+        workflow = self._start_workflow()
+        train_classifiers(workflow.uuid)
+        workflow = AITrainingWorkflow.objects.get(uuid=workflow.uuid)
+        return workflow.classifier_set.classifier_data_by_criterion
+
+
 class AIGradingTaskTest(CeleryTaskTest):
     """
     Tests for the grading task executed asynchronously by Celery workers.
@@ -415,3 +495,234 @@ class AIGradingTaskTest(CeleryTaskTest):
         workflow.completed_at = None
         workflow.assessment = None
         workflow.save()
+
+
+class AIBatchGradingTaskTest(CeleryTaskTest):
+    """
+    Tests for the task that grades a batch of essays.
+    """
+
+    NUM_ESSAYS = 5
+
+    def setUp(self):
+        """
+        Create submissions and grading workflows that share a classifier set.
+        """
+        rubric = rubric_from_dict(RUBRIC)
+        self.classifier_set = AIClassifierSet.create_classifier_set(
+            AIGradingTaskTest.CLASSIFIERS, rubric, ALGORITHM_ID,
+            STUDENT_ITEM.get('course_id'), STUDENT_ITEM.get('item_id')
+        )
+
+        self.workflow_uuids = []
+        for __ in range(self.NUM_ESSAYS):
+            submission = sub_api.create_submission(STUDENT_ITEM, ANSWER)
+            workflow = AIGradingWorkflow.start_workflow(submission['uuid'], RUBRIC, ALGORITHM_ID)
+            self.assertEqual(workflow.classifier_set, self.classifier_set)
+            self.workflow_uuids.append(workflow.uuid)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays(self):
+        patched = 'openassessment.assessment.worker.grading.AIAlgorithm.algorithm_for_id'
+        with mock.patch(patched, wraps=AIAlgorithm.algorithm_for_id) as mock_algorithm:
+            grade_essays(self.workflow_uuids)
+
+        # The algorithm should be loaded once for the whole batch
+        self.assertEqual(mock_algorithm.call_count, 1)
+        for workflow in AIGradingWorkflow.objects.filter(uuid__in=self.workflow_uuids):
+            self.assertTrue(workflow.is_complete)
+            self.assertEqual(workflow.assessment.points_earned, 0)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_batch_scored_at_once(self):
+        patched = 'openassessment.assessment.worker.grading.AIAlgorithm.score_many'
+        with mock.patch(patched, autospec=True, side_effect=AIAlgorithm.score_many) as mock_score:
+            grade_essays(self.workflow_uuids)
+
+        # Every essay in the batch is scored for every criterion in a single call
+        self.assertEqual(mock_score.call_count, 1)
+        __, texts, classifiers = mock_score.call_args[0]
+        self.assertEqual(len(texts), self.NUM_ESSAYS)
+        self.assertItemsEqual(classifiers.keys(), AIGradingTaskTest.CLASSIFIERS.keys())
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_classifiers_loaded_once(self):
+        patched = 'openassessment.assessment.worker.grading.AIAlgorithm.load_classifier'
+        with mock.patch(patched, autospec=True, side_effect=lambda self, classifier: classifier) as mock_load:
+            grade_essays(self.workflow_uuids[:2])
+            grade_essay(self.workflow_uuids[2])
+            grade_essays(self.workflow_uuids[3:])
+
+        # Every criterion is loaded the first time the worker sees the classifier set,
+        # then re-used for later essays.
+        self.assertEqual(mock_load.call_count, len(AIGradingTaskTest.CLASSIFIERS))
+        self.assertGreater(LOADED_CLASSIFIER_CACHE.total_bytes, 0)
+        for workflow in AIGradingWorkflow.objects.filter(uuid__in=self.workflow_uuids):
+            self.assertTrue(workflow.is_complete)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_LOADED_CLASSIFIER_CACHE_BYTES=0)
+    def test_classifiers_too_large_to_cache(self):
+        patched = 'openassessment.assessment.worker.grading.AIAlgorithm.load_classifier'
+        with mock.patch(patched, autospec=True, side_effect=lambda self, classifier: classifier) as mock_load:
+            grade_essays(self.workflow_uuids[:2])
+            grade_essays(self.workflow_uuids[2:])
+
+        # Without room in the cache, each batch loads its own classifiers
+        self.assertEqual(mock_load.call_count, 2 * len(AIGradingTaskTest.CLASSIFIERS))
+        self.assertEqual(LOADED_CLASSIFIER_CACHE.total_bytes, 0)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_algorithm_gives_invalid_score(self):
+        # If an algorithm provides a score that isn't in the rubric,
+        # we should choose the closest valid score for every essay in the batch.
+        self._set_algorithm_id(INVALID_SCORE_ALGORITHM_ID)
+        patched = 'openassessment.assessment.worker.grading.ai_worker_api.create_assessments'
+        score_cycle = itertools.cycle([-100, 0.7, 1.2, 100])
+        with mock.patch.object(InvalidScoreAlgorithm, 'SCORE_CYCLE', score_cycle):
+            with mock.patch(patched) as mock_create:
+                grade_essays(self.workflow_uuids)
+
+        scores_by_workflow = mock_create.call_args[0][0]
+        self.assertItemsEqual(scores_by_workflow.keys(), self.workflow_uuids)
+        for scores in scores_by_workflow.values():
+            for score in scores.values():
+                self.assertIn(score, [0, 1, 2])
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_skip_completed_workflows(self):
+        completed = AIGradingWorkflow.objects.get(uuid=self.workflow_uuids[0])
+        completed.mark_complete_and_save()
+
+        patched = 'openassessment.assessment.worker.grading.ai_worker_api.create_assessments'
+        with mock.patch(patched) as mock_create:
+            grade_essays(self.workflow_uuids)
+        self.assertItemsEqual(mock_create.call_args[0][0].keys(), self.workflow_uuids[1:])
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_all_workflows_complete(self):
+        for workflow in AIGradingWorkflow.objects.all():
+            workflow.mark_complete_and_save()
+
+        # The task should finish without loading the algorithm
+        patched = 'openassessment.assessment.worker.grading.AIAlgorithm.algorithm_for_id'
+        with mock.patch(patched) as mock_algorithm:
+            grade_essays(self.workflow_uuids)
+        self.assertFalse(mock_algorithm.called)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_different_classifier_sets(self):
+        workflow = AIGradingWorkflow.objects.get(uuid=self.workflow_uuids[0])
+        workflow.classifier_set = AIClassifierSet.create_classifier_set(
+            AIGradingTaskTest.CLASSIFIERS, workflow.rubric, ALGORITHM_ID,
+            STUDENT_ITEM.get('course_id'), STUDENT_ITEM.get('item_id')
+        )
+        workflow.save()
+
+        with self.assert_retry(grade_essays, AIGradingRequestError):
+            grade_essays(self.workflow_uuids)
+
+    def test_unknown_algorithm_id_error(self):
+        # Since we're not overriding settings, the algorithm ID won't be recognized
+        with self.assert_retry(grade_essays, UnknownAlgorithm):
+            grade_essays(self.workflow_uuids)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_algorithm_score_error(self):
+        self._set_algorithm_id(ERROR_STUB_ALGORITHM_ID)
+        with self.assert_retry(grade_essays, ScoreError):
+            grade_essays(self.workflow_uuids)
+
+    @mock.patch('openassessment.assessment.worker.grading.ai_worker_api.create_assessments')
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_create_assessments_error(self, mock_call):
+        mock_call.side_effect = AIGradingInternalError
+        with self.assert_retry(grade_essays, AIGradingInternalError):
+            grade_essays(self.workflow_uuids)
+
+    @mock.patch('openassessment.assessment.worker.grading.ai_worker_api.get_grading_batch_params')
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_params_valid_scores_empty_list(self, mock_call):
+        mock_call.return_value = {
+            'essays': {self.workflow_uuids[0]: 'test'},
+            'classifier_set': {
+                u"vøȼȺƀᵾłȺɍɏ": {},
+                u"ﻭɼค๓๓คɼ": {}
+            },
+            'algorithm_id': ALGORITHM_ID,
+            'valid_scores': {
+                u"vøȼȺƀᵾłȺɍɏ": [],
+                u"ﻭɼค๓๓คɼ": [0, 1, 2]
+            }
+        }
+        with self.assertRaises(AIGradingInternalError):
+            grade_essays(self.workflow_uuids)
+
+    def _set_algorithm_id(self, algorithm_id):
+        """
+        Override the default algorithm ID for the grading workflows.
+        """
+        AIGradingWorkflow.objects.filter(uuid__in=self.workflow_uuids).update(algorithm_id=algorithm_id)
+
+
+class LoadedClassifierCacheTest(CacheResetTest):
+    """
+    Tests for the process-local cache of loaded classifiers.
+    """
+
+    def setUp(self):
+        super(LoadedClassifierCacheTest, self).setUp()
+        self.cache = LoadedClassifierCache(max_bytes=100)
+
+    def test_get_set_clear(self):
+        self.assertIs(self.cache.get((1, u"ﻭɼค๓๓คɼ")), None)
+        self.assertTrue(self.cache.set((1, u"ﻭɼค๓๓คɼ"), u"loaded", 10))
+        self.assertEqual(self.cache.get((1, u"ﻭɼค๓๓คɼ")), u"loaded")
+        self.assertIs(self.cache.get((2, u"ﻭɼค๓๓คɼ")), None)
+        self.assertEqual(self.cache.total_bytes, 10)
+
+        self.cache.clear()
+        self.assertIs(self.cache.get((1, u"ﻭɼค๓๓คɼ")), None)
+        self.assertEqual(self.cache.total_bytes, 0)
+
+    def test_evict_least_recently_used(self):
+        self.cache.set(1, u"first", 40)
+        self.cache.set(2, u"second", 40)
+
+        # Using the first classifier makes the second the least recently used
+        self.assertEqual(self.cache.get(1), u"first")
+        self.cache.set(3, u"third", 40)
+
+        self.assertEqual(self.cache.get(1), u"first")
+        self.assertIs(self.cache.get(2), None)
+        self.assertEqual(self.cache.get(3), u"third")
+        self.assertEqual(self.cache.total_bytes, 80)
+
+    def test_evict_until_fits(self):
+        for key in range(5):
+            self.cache.set(key, key, 20)
+        self.cache.set(u"large", u"large", 70)
+
+        self.assertEqual(self.cache.get(u"large"), u"large")
+        self.assertEqual(self.cache.get(4), 4)
+        for key in range(4):
+            self.assertIs(self.cache.get(key), None)
+        self.assertEqual(self.cache.total_bytes, 90)
+
+    def test_replace_entry(self):
+        self.cache.set(1, u"old", 60)
+        self.cache.set(1, u"new", 50)
+        self.assertEqual(self.cache.get(1), u"new")
+        self.assertEqual(self.cache.total_bytes, 50)
+
+    def test_oversized_entry_not_cached(self):
+        self.cache.set(1, u"small", 10)
+        self.assertFalse(self.cache.set(2, u"huge", 101))
+        self.assertIs(self.cache.get(2), None)
+        self.assertEqual(self.cache.get(1), u"small")
+        self.assertEqual(self.cache.total_bytes, 10)
+
+    def test_max_bytes_setting(self):
+        cache = LoadedClassifierCache()
+        with override_settings(ORA2_AI_LOADED_CLASSIFIER_CACHE_BYTES=5):
+            self.assertEqual(cache.max_bytes, 5)
+            self.assertFalse(cache.set(1, u"loaded", 10))
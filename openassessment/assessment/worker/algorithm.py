@@ -12,6 +12,7 @@ import importlib
 import traceback
 import base64
 from django.conf import settings
+from openassessment.assessment.classifier_format import BinaryData
 
 
 DEFAULT_AI_ALGORITHMS = {
@@ -91,7 +92,9 @@ class AIAlgorithm(object):
             examples (list of AIAlgorithm.ExampleEssay): Example essays and scores.
 
         Returns:
-            JSON-serializable: The trained classifier.  This MUST be JSON-serializable.
+            JSON-serializable: The trained classifier.  This MUST be JSON-serializable,
+                except that binary data may be wrapped in `BinaryData`
+                (see `openassessment.assessment.classifier_format`).
 
         Raises:
             TrainingError: The classifier could not be trained successfully.
@@ -118,6 +121,61 @@ class AIAlgorithm(object):
         """
         pass
 
+    def score_many(self, texts, classifiers):
+        """
+        Score a batch of essays for every criterion in a rubric.
+
+        Algorithms can override this to share work across essays and criteria,
+        for example by extracting features once per essay and predicting
+        the scores of all essays at once.  The default implementation calls
+        `score()` for each essay and criterion, with one cache per essay.
+
+        Args:
+            texts (list of unicode): The texts to classify.
+            classifiers (dict): Mapping of criterion names to classifiers,
+                in either the serialized form or the form returned by `load_classifier()`.
+
+        Returns:
+            list of dicts, one per text (in the same order), mapping criterion names to scores.
+
+        Raises:
+            InvalidClassifier: A provided classifier cannot be used by this algorithm.
+            ScoreError: An error occurred while scoring.
+
+        """
+        scores = []
+        for text in texts:
+            cache = dict()
+            scores.append({
+                criterion_name: self.score(text, classifier, cache)
+                for criterion_name, classifier in classifiers.iteritems()
+            })
+        return scores
+
+    def load_classifier(self, classifier):
+        """
+        Convert a serialized classifier into the form passed to `score()`.
+
+        Grading workers keep loaded classifiers in memory and re-use them
+        for every essay graded with the same classifier set, so algorithms
+        whose classifiers are expensive to deserialize should do that work here.
+        `score()` must accept both the serialized and the loaded forms.
+
+        The default implementation returns the classifier unchanged.
+
+        Args:
+            classifier (JSON-serializable): A classifier, using the same format
+                as `train_classifier()`.
+
+        Returns:
+            The loaded classifier.
+
+        Raises:
+            InvalidClassifier: The provided classifier cannot be used by this algorithm.
+
+        """
+        return classifier
+
     @classmethod
     def algorithm_for_id(cls, algorithm_id):
         """
@@ -172,6 +230,24 @@ class FakeAIAlgorithm(AIAlgorithm):
             score_index = len(text) % len(classifier['scores'])
             return classifier['scores'][score_index]
 
+    def score_many(self, texts, classifiers):
+        """
+        Choose scores for a batch of essays, computing each essay's length
+        (its only "feature") once and re-using it for every criterion.
+        """
+        for classifier in classifiers.itervalues():
+            if 'scores' not in classifier or len(classifier['scores']) == 0:
+                raise InvalidClassifier("Classifier must provide score labels")
+
+        lengths = [len(text) for text in texts]
+        return [
+            {
+                criterion_name: classifier['scores'][length % len(classifier['scores'])]
+                for criterion_name, classifier in classifiers.iteritems()
+            }
+            for length in lengths
+        ]
+
 
 class EaseAIAlgorithm(AIAlgorithm):
     """
@@ -183,6 +259,9 @@ class EaseAIAlgorithm(AIAlgorithm):
     algorithm implementation instead.
     """
 
+    # Deserialized classifier objects, as returned by `load_classifier()`
+    LoadedClassifier = namedtuple('LoadedClassifier', ['feature_extractor', 'score_classifier'])
+
     def train_classifier(self, examples):
         """
         Train a text classifier using the EASE library.
@@ -190,6 +269,9 @@ class EaseAIAlgorithm(AIAlgorithm):
             * 'feature_extractor': The pickled feature extractor (transforms text into a numeric feature vector).
             * 'score_classifier': The pickled classifier (uses the feature vector to assign scores to essays).
 
+        The pickles are stored as raw binary data; classifiers trained before
+        the binary classifier format existed store them base64-encoded instead.
+
         Because we are using `pickle`, the serialized classifiers are unfortunately
         tied to the particular version of ease/scikit-learn/numpy/scipy/nltk that we
         have installed at the time of training.
@@ -213,7 +295,8 @@ class EaseAIAlgorithm(AIAlgorithm):
 
         Args:
             text (unicode): The essay text to score.
-            classifier (dict): The serialized classifiers created during training.
+            classifier (dict or EaseAIAlgorithm.LoadedClassifier): The serialized classifiers
+                created during training, or the classifiers returned by `load_classifier()`.
             cache (dict): An in-memory cache that persists until all criteria
                 in the rubric have been scored.
 
@@ -231,7 +314,9 @@ class EaseAIAlgorithm(AIAlgorithm):
             msg = u"Could not import EASE to grade essays."
             raise ScoreError(msg)
 
-        feature_extractor, score_classifier = self._deserialize_classifiers(classifier)
+        if not isinstance(classifier, self.LoadedClassifier):
+            classifier = self.load_classifier(classifier)
+        feature_extractor, score_classifier = classifier
 
         # The following is a modified version of `ease.grade.grade()`,
         # skipping things we don't use (cross-validation, feedback)
@@ -263,6 +348,84 @@ class EaseAIAlgorithm(AIAlgorithm):
             ).format(traceback=traceback.format_exc())
             raise ScoreError(msg)
 
+    def score_many(self, texts, classifiers):
+        """
+        Score a batch of essays using EASE.
+
+        All the essays are added to a single essay set, so the expensive
+        NLTK processing (tokenizing, spell-checking and tagging parts of speech)
+        happens once per essay rather than once per essay and criterion.
+        Each criterion's feature extractor then builds one feature matrix
+        for the whole batch, and its classifier predicts every essay's
+        score in a single call.
+
+        Args:
+            texts (list of unicode): The essay texts to score.
+            classifiers (dict): Mapping of criterion names to the serialized classifiers
+                created during training, or the classifiers returned by `load_classifier()`.
+
+        Returns:
+            list of dicts, one per text (in the same order), mapping criterion names to scores.
+
+        Raises:
+            InvalidClassifier
+            ScoreError
+
+        """
+        try:
+            from ease.essay_set import EssaySet    # pylint:disable=F0401
+        except ImportError:
+            msg = u"Could not import EASE to grade essays."
+            raise ScoreError(msg)
+
+        classifiers = {
+            criterion_name: (
+                classifier if isinstance(classifier, self.LoadedClassifier)
+                else self.load_classifier(classifier)
+            )
+            for criterion_name, classifier in classifiers.iteritems()
+        }
+
+        scores = [dict() for __ in texts]
+        if not texts:
+            return scores
+
+        try:
+            # As in `score()`, every essay is assigned a dummy score of "0",
+            # and non-ASCII characters are stripped out for EASE.
+            essay_set = EssaySet(essaytype="test")
+            for text in texts:
+                essay_set.add_essay(text.encode('ascii', 'ignore'), 0)
+
+            for criterion_name, (feature_extractor, score_classifier) in classifiers.iteritems():
+                features = feature_extractor.gen_feats(essay_set)
+                for essay_scores, score in zip(scores, score_classifier.predict(features)):
+                    essay_scores[criterion_name] = int(score)
+        except:
+            msg = (
+                u"An unexpected error occurred while using "
+                u"EASE to score essays: {traceback}"
+            ).format(traceback=traceback.format_exc())
+            raise ScoreError(msg)
+
+        return scores
+
+    def load_classifier(self, classifier):
+        """
+        Unpickle the EASE feature extractor and score classifier.
+
+        Args:
+            classifier (dict): The serialized classifiers created during training.
+
+        Returns:
+            EaseAIAlgorithm.LoadedClassifier
+
+        Raises:
+            InvalidClassifier
+
+        """
+        return self.LoadedClassifier(*self._deserialize_classifiers(classifier))
+
     def _train_classifiers(self, examples):
         """
         Use EASE to train classifiers.
@@ -326,8 +489,8 @@ class EaseAIAlgorithm(AIAlgorithm):
         """
         try:
             return {
-                'feature_extractor': base64.b64encode(pickle.dumps(feature_ext)),
-                'score_classifier': base64.b64encode(pickle.dumps(classifier)),
+                'feature_extractor': BinaryData(pickle.dumps(feature_ext, pickle.HIGHEST_PROTOCOL)),
+                'score_classifier': BinaryData(pickle.dumps(classifier, pickle.HIGHEST_PROTOCOL)),
             }
         except Exception as ex:
             msg = (
@@ -354,8 +517,7 @@ class EaseAIAlgorithm(AIAlgorithm):
             raise InvalidClassifier("Classifier must be a dictionary.")
 
         try:
-            classifier_str = classifier_data.get('feature_extractor').encode('utf-8')
-            feature_extractor = pickle.loads(base64.b64decode(classifier_str))
+            feature_extractor = self._unpickle(classifier_data.get('feature_extractor'))
         except Exception as ex:
             msg = (
                 u"An error occurred while deserializing the "
@@ -364,8 +526,7 @@ class EaseAIAlgorithm(AIAlgorithm):
             raise InvalidClassifier(msg)
 
         try:
-            score_classifier_str = classifier_data.get('score_classifier').encode('utf-8')
-            score_classifier = pickle.loads(base64.b64decode(score_classifier_str))
+            score_classifier = self._unpickle(classifier_data.get('score_classifier'))
         except Exception as ex:
             msg = (
                 u"An error occurred while deserializing the "
@@ -374,3 +535,20 @@ class EaseAIAlgorithm(AIAlgorithm):
             raise InvalidClassifier(msg)
 
         return feature_extractor, score_classifier
+
+    @staticmethod
+    def _unpickle(pickled):
+        """
+        Unpickle a classifier object stored as binary data,
+        or base64-encoded (for classifiers stored as JSON).
+
+        Args:
+            pickled (BinaryData or unicode): The pickled object.
+
+        Returns:
+            The unpickled object.
+
+        """
+        if isinstance(pickled, BinaryData):
+            return pickle.loads(pickled)
+        return pickle.loads(base64.b64decode(pickled.encode('utf-8')))
@@ -3,7 +3,9 @@ Asynchronous tasks for grading essays using text classifiers.
 """
 
 import datetime
-from celery import task
+import threading
+from collections import OrderedDict
+from celery import task, group
 from django.db import DatabaseError
 from django.conf import settings
 from celery.utils.log import get_task_logger
@@ -12,7 +14,12 @@ from openassessment.assessment.api import ai_worker as ai_worker_api
 from openassessment.assessment.errors import (
     AIError, AIGradingInternalError, AIReschedulingInternalError, ANTICIPATED_CELERY_ERRORS
 )
+from openassessment.cache import CacheNamespace
+from openassessment.assessment import classifier_format
 from .algorithm import AIAlgorithm, AIAlgorithmError
+from .lanes import (
+    LANE_LIVE, LANE_BACKFILL, queue_for_lane, limit_concurrency, record_queue_wait
+)
 from openassessment.assessment.models.ai import AIGradingWorkflow
 
 MAX_RETRIES = 2
@@ -23,10 +30,149 @@ logger = get_task_logger(__name__)
 # Otherwise, use the default queue.
 RESCHEDULE_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
 
+# By default, grade each essay in its own task.
+DEFAULT_GRADING_BATCH_SIZE = 1
+
+# By default, wait up to five seconds to collect essays into a batch.
+DEFAULT_GRADING_BATCH_FLUSH_INTERVAL = 5
+
+# Marks classifier sets that have a batch flush scheduled,
+# so that only the first essay in each interval schedules a flush.
+PENDING_FLUSH_CACHE = CacheNamespace(u"ai_grading.pending_flush")
+
+# Marks grading workflows that have been queued as part of a batch,
+# so that later flushes don't queue them again.
+QUEUED_WORKFLOW_CACHE = CacheNamespace(u"ai_grading.queued", timeout=60 * 60)
+
+# Number of workflows to schedule at a time when rescheduling grading
+DEFAULT_RESCHEDULE_CHUNK_SIZE = 100
+
+# By default, keep up to 512MB of loaded classifiers in each worker process.
+DEFAULT_LOADED_CLASSIFIER_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class LoadedClassifierCache(object):
+    """
+    Process-local cache of classifiers loaded by an AI algorithm
+    (for example, unpickled EASE feature extractors and score classifiers),
+    keyed by classifier set primary key and criterion name.
+
+    Loading a classifier can take much longer than scoring an essay with it,
+    so the worker keeps the most recently used classifiers in memory.
+    The cache evicts the least recently used classifiers once their total size
+    exceeds a ceiling (the ``ORA2_AI_LOADED_CLASSIFIER_CACHE_BYTES`` setting).
+    We use the size of the serialized classifier as an estimate of the
+    memory used by the loaded classifier.
+    """
+
+    def __init__(self, max_bytes=None):
+        """
+        Create an empty cache.
+
+        Keyword Arguments:
+            max_bytes (int): The maximum total size of the cached classifiers.
+                If not specified, use the ``ORA2_AI_LOADED_CLASSIFIER_CACHE_BYTES`` setting.
+
+        """
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        """
+        The maximum total size of the cached classifiers.
+
+        Returns:
+            int
+
+        """
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'ORA2_AI_LOADED_CLASSIFIER_CACHE_BYTES', DEFAULT_LOADED_CLASSIFIER_CACHE_BYTES)
+
+    @property
+    def total_bytes(self):
+        """
+        The estimated total size of the cached classifiers.
+
+        Returns:
+            int
+
+        """
+        return self._total_bytes
+
+    def get(self, key):
+        """
+        Retrieve a loaded classifier and mark it as recently used.
+
+        Args:
+            key (tuple): `(classifier_set_id, criterion_name)`
+
+        Returns:
+            The loaded classifier, or None if it isn't cached.
+
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, classifier, size):
+        """
+        Cache a loaded classifier, evicting the least recently used
+        classifiers if necessary to stay under the size ceiling.
+        Classifiers larger than the ceiling are not cached.
+
+        Args:
+            key (tuple): `(classifier_set_id, criterion_name)`
+            classifier: The loaded classifier.
+            size (int): The estimated size of the classifier in bytes.
+
+        Returns:
+            bool: True if the classifier was cached.
+
+        """
+        max_bytes = self.max_bytes
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._total_bytes -= old_entry[1]
+
+            if size > max_bytes:
+                return False
+
+            while self._entries and self._total_bytes + size > max_bytes:
+                __, (__, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+            self._entries[key] = (classifier, size)
+            self._total_bytes += size
+            return True
+
+    def clear(self):
+        """
+        Remove every classifier from the cache.
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+
+LOADED_CLASSIFIER_CACHE = LoadedClassifierCache()
+
 
 @task(max_retries=MAX_RETRIES)  # pylint: disable=E1102
 @dog_stats_api.timed('openassessment.assessment.ai.grade_essay.time')
-def grade_essay(workflow_uuid):
+@limit_concurrency(LANE_LIVE)
+def grade_essay(workflow_uuid, lane=LANE_LIVE):
     """
     Asynchronous task to grade an essay using a text classifier
     (trained using a supervised ML algorithm).
@@ -40,6 +186,9 @@ def grade_essay(workflow_uuid):
         workflow_uuid (str): The UUID of the workflow associated
             with this grading task.
 
+    Keyword Arguments:
+        lane (unicode): The priority lane the task was scheduled in (see `lanes`).
+
     Returns:
         None
 
@@ -68,6 +217,7 @@ def grade_essay(workflow_uuid):
         params = ai_worker_api.get_grading_task_params(workflow_uuid)
         essay_text = params['essay_text']
         classifier_set = params['classifier_set']
+        classifier_set_id = params.get('classifier_set_id')
         algorithm_id = params['algorithm_id']
         valid_scores = params['valid_scores']
     except (AIError, KeyError):
@@ -78,22 +228,10 @@ def grade_essay(workflow_uuid):
         logger.exception(msg)
         raise grade_essay.retry()
 
+    record_queue_wait(lane, u"grade_essay", [params.get('scheduled_at')])
+
     # Validate that the we have valid scores for each criterion
-    for criterion_name in classifier_set.keys():
-        msg = None
-        if criterion_name not in valid_scores:
-            msg = (
-                u"Could not find {criterion} in the list of valid scores "
-                u"for grading workflow with UUID {uuid}"
-            ).format(criterion=criterion_name, uuid=workflow_uuid)
-        elif len(valid_scores[criterion_name]) == 0:
-            msg = (
-                u"Valid scores for {criterion} is empty for "
-                u"grading workflow with UUID {uuid}"
-            ).format(criterion=criterion_name, uuid=workflow_uuid)
-        if msg:
-            logger.exception(msg)
-            raise AIGradingInternalError(msg)
+    _validate_valid_scores(classifier_set, valid_scores, workflow_uuid)
 
     # Retrieve the AI algorithm
     try:
@@ -107,17 +245,11 @@ def grade_essay(workflow_uuid):
         raise grade_essay.retry()
 
     # Use the algorithm to evaluate the essay for each criterion
-    # Provide an in-memory cache so the algorithm can re-use
-    # results for multiple rubric criteria.
     try:
-        cache = dict()
-        scores_by_criterion = {
-            criterion_name: _closest_valid_score(
-                algorithm.score(essay_text, classifier, cache),
-                valid_scores[criterion_name]
-            )
-            for criterion_name, classifier in classifier_set.iteritems()
-        }
+        classifier_set = _load_classifier_set(algorithm, classifier_set_id, classifier_set)
+        scores_by_criterion = _closest_valid_scores(
+            algorithm.score_many([essay_text], classifier_set)[0], valid_scores
+        )
     except AIAlgorithmError:
         msg = (
             u"An error occurred while scoring essays using "
@@ -139,16 +271,267 @@ def grade_essay(workflow_uuid):
         raise grade_essay.retry()
 
 
+@task(max_retries=MAX_RETRIES)  # pylint: disable=E1102
+@dog_stats_api.timed('openassessment.assessment.ai.grade_essays.time')
+@limit_concurrency(LANE_LIVE)
+def grade_essays(workflow_uuids, lane=LANE_LIVE):
+    """
+    Asynchronous task to grade a batch of essays that share a classifier set.
+
+    This does the same work as `grade_essay`, but it loads the classifiers
+    and the algorithm only once for the whole batch, and it creates
+    the assessments for every essay in a single transaction.
+
+    If the task could not be completed successfully,
+    it will be retried a few times; if it continues to fail,
+    it is left incomplete.  Incomplete tasks can be rescheduled
+    manually through the AI API.
+
+    Args:
+        workflow_uuids (list of str): The UUIDs of the grading workflows
+            associated with this task.  All must share the same classifier set.
+
+    Keyword Arguments:
+        lane (unicode): The priority lane the task was scheduled in (see `lanes`).
+
+    Returns:
+        None
+
+    Raises:
+        AIError: An error occurred while making an AI worker API call.
+        AIAlgorithmError: An error occurred while retrieving or using an AI algorithm.
+
+    """
+    # Retrieve the task parameters, skipping workflows that are already complete
+    try:
+        params = ai_worker_api.get_grading_batch_params(workflow_uuids)
+        essays = params['essays']
+        classifier_set = params['classifier_set']
+        classifier_set_id = params.get('classifier_set_id')
+        algorithm_id = params['algorithm_id']
+        valid_scores = params['valid_scores']
+    except (AIError, KeyError):
+        msg = (
+            u"An error occurred while retrieving the AI grading task "
+            u"parameters for the workflows with UUIDs {}"
+        ).format(workflow_uuids)
+        logger.exception(msg)
+        raise grade_essays.retry()
+
+    if not essays:
+        return
+
+    record_queue_wait(lane, u"grade_essays", params.get('scheduled_at', {}).values())
+
+    # Validate that the we have valid scores for each criterion
+    _validate_valid_scores(classifier_set, valid_scores, u", ".join(essays.keys()))
+
+    # Retrieve the AI algorithm
+    try:
+        algorithm = AIAlgorithm.algorithm_for_id(algorithm_id)
+    except AIAlgorithmError:
+        msg = (
+            u"An error occurred while retrieving "
+            u"the algorithm ID (grading workflow UUIDs {})"
+        ).format(workflow_uuids)
+        logger.exception(msg)
+        raise grade_essays.retry()
+
+    # Use the algorithm to evaluate every essay for each criterion at once,
+    # so it can share work across essays and rubric criteria.
+    try:
+        classifier_set = _load_classifier_set(algorithm, classifier_set_id, classifier_set)
+        batch_uuids = essays.keys()
+        batch_scores = algorithm.score_many(
+            [essays[workflow_uuid] for workflow_uuid in batch_uuids], classifier_set
+        )
+        scores_by_workflow = {
+            workflow_uuid: _closest_valid_scores(scores_by_criterion, valid_scores)
+            for workflow_uuid, scores_by_criterion in zip(batch_uuids, batch_scores)
+        }
+    except AIAlgorithmError:
+        msg = (
+            u"An error occurred while scoring essays using "
+            u"an AI algorithm (worker workflow UUIDs {})"
+        ).format(workflow_uuids)
+        logger.exception(msg)
+        raise grade_essays.retry()
+
+    # Create the assessments and mark the workflows complete
+    try:
+        ai_worker_api.create_assessments(scores_by_workflow)
+    except AIError:
+        msg = (
+            u"An error occurred while creating assessments "
+            u"for the AI grading workflows with UUIDs {uuids}. "
+            u"The assessment scores were: {scores}"
+        ).format(uuids=workflow_uuids, scores=scores_by_workflow)
+        logger.exception(msg)
+        raise grade_essays.retry()
+
+
+@task(max_retries=MAX_RETRIES)  # pylint: disable=E1102
+@dog_stats_api.timed('openassessment.assessment.ai.flush_grading_batch.time')
+def flush_grading_batch(classifier_set_id):
+    """
+    Asynchronous task to schedule batches of grading tasks for
+    all incomplete grading workflows that use a classifier set.
+
+    This is scheduled by `schedule_grading` once per flush interval
+    for each classifier set, so essays submitted during the interval
+    are graded together.
+
+    Args:
+        classifier_set_id (int): The primary key of the classifier set.
+
+    Returns:
+        None
+
+    Raises:
+        AIGradingInternalError
+
+    """
+    # Allow the next essay to schedule another flush.
+    # We do this *before* looking for workflows, so any workflow
+    # created after this query will schedule its own flush.
+    PENDING_FLUSH_CACHE.delete(classifier_set_id)
+
+    try:
+        workflow_uuids = list(
+            AIGradingWorkflow.objects.filter(
+                classifier_set_id=classifier_set_id, completed_at__isnull=True
+            ).order_by('scheduled_at').values_list('uuid', flat=True)
+        )
+    except DatabaseError:
+        msg = (
+            u"An unexpected error occurred while retrieving incomplete "
+            u"grading workflows for classifier set {}"
+        ).format(classifier_set_id)
+        logger.exception(msg)
+        raise flush_grading_batch.retry()
+
+    # Skip workflows that an earlier flush already queued
+    already_queued = QUEUED_WORKFLOW_CACHE.get_many(workflow_uuids)
+    workflow_uuids = [uuid for uuid in workflow_uuids if uuid not in already_queued]
+
+    try:
+        enqueue_grading_batches(workflow_uuids)
+    except ANTICIPATED_CELERY_ERRORS:
+        msg = (
+            u"An error occurred while scheduling grading batches for classifier set {}"
+        ).format(classifier_set_id)
+        logger.exception(msg)
+        raise flush_grading_batch.retry()
+
+
+def schedule_grading(workflow):
+    """
+    Schedule an essay to be graded.
+
+    If the ``ORA2_AI_GRADING_BATCH_SIZE`` setting is greater than one,
+    essays that use the same classifier set are collected for up to
+    ``ORA2_AI_GRADING_BATCH_FLUSH_INTERVAL`` seconds, then graded in batches.
+    Otherwise, each essay is graded by its own task.
+
+    Args:
+        workflow (AIGradingWorkflow): The grading workflow, which must have a classifier set.
+
+    Returns:
+        None
+
+    Raises:
+        celery errors (see `ANTICIPATED_CELERY_ERRORS`)
+
+    """
+    if grading_batch_size() <= 1:
+        grade_essay.apply_async(
+            args=[workflow.uuid], kwargs={'lane': LANE_LIVE}, queue=queue_for_lane(LANE_LIVE)
+        )
+        return
+
+    # Only the first essay in each interval schedules a flush;
+    # the flush will pick up every essay submitted until it runs.
+    # If the flush never runs, the marker expires so later essays can schedule another.
+    flush_interval = grading_batch_flush_interval()
+    if PENDING_FLUSH_CACHE.add(workflow.classifier_set_id, True, timeout=flush_interval * 10):
+        flush_grading_batch.apply_async(
+            args=[workflow.classifier_set_id], countdown=flush_interval, queue=queue_for_lane(LANE_LIVE)
+        )
+
+
+def enqueue_grading_batches(workflow_uuids, batch_size=None, lane=LANE_LIVE):
+    """
+    Split grading workflows into batches and schedule a task to grade each batch.
+    The workflows must share a classifier set.
+
+    Args:
+        workflow_uuids (list of str): The UUIDs of the workflows to grade.
+
+    Keyword Arguments:
+        batch_size (int): The maximum number of essays to grade in each task.
+            Defaults to the ``ORA2_AI_GRADING_BATCH_SIZE`` setting.
+        lane (unicode): The priority lane to schedule the tasks in (see `lanes`).
+
+    Returns:
+        int: The number of tasks scheduled.
+
+    Raises:
+        celery errors (see `ANTICIPATED_CELERY_ERRORS`)
+
+    """
+    batch_size = max(batch_size or grading_batch_size(), 1)
+    num_batches = 0
+    for start in range(0, len(workflow_uuids), batch_size):
+        batch = workflow_uuids[start:start + batch_size]
+        grade_essays.apply_async(args=[batch], kwargs={'lane': lane}, queue=queue_for_lane(lane))
+        QUEUED_WORKFLOW_CACHE.set_many({uuid: True for uuid in batch})
+        num_batches += 1
+    return num_batches
+
+
+def grading_batch_size():
+    """
+    The maximum number of essays to grade in each grading task.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_AI_GRADING_BATCH_SIZE', DEFAULT_GRADING_BATCH_SIZE)
+
+
+def grading_batch_flush_interval():
+    """
+    The number of seconds to wait while collecting essays into a batch.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_AI_GRADING_BATCH_FLUSH_INTERVAL', DEFAULT_GRADING_BATCH_FLUSH_INTERVAL)
+
+
 @task(queue=RESCHEDULE_TASK_QUEUE, max_retries=MAX_RETRIES)  # pylint: disable=E1102
 @dog_stats_api.timed('openassessment.assessment.ai.reschedule_grading_tasks.time')
-def reschedule_grading_tasks(course_id, item_id):
+def reschedule_grading_tasks(course_id, item_id, checkpoint=None):
     """
     Reschedules all incomplete grading workflows with the specified parameters.
 
+    Workflows that share a rubric and algorithm are assigned the most recent
+    classifier set with a single UPDATE, then scheduled in chunks,
+    each published as a Celery group (or as batches, if batch grading is enabled).
+    If scheduling fails, the task retries, resuming after the last chunk
+    that was scheduled successfully.
+
     Args:
         course_id (unicode): The course item that we will be rerunning the rescheduling on.
         item_id (unicode): The item that the rescheduling will be running on
 
+    Keyword Arguments:
+        checkpoint (dict): Progress made by a previous attempt, mapping
+            `"<rubric_id>/<algorithm_id>"` group keys to the primary key of the last
+            workflow scheduled in that group.  Set when the task retries.
+
     Raises:
         AIReschedulingInternalError
         AIGradingInternalError
@@ -157,10 +540,11 @@ def reschedule_grading_tasks(course_id, item_id):
     # Logs the start of the rescheduling process and records the start time so that total time can be calculated later.
     _log_start_reschedule_grading(course_id=course_id, item_id=item_id)
     start_time = datetime.datetime.now()
+    checkpoint = dict(checkpoint or {})
 
-    # Finds all incomplete grading workflows
+    # Finds the (rubric, algorithm) groups of incomplete grading workflows
     try:
-        grading_workflows = AIGradingWorkflow.get_incomplete_workflows(course_id, item_id)
+        groups = AIGradingWorkflow.get_incomplete_workflow_groups(course_id, item_id)
     except (DatabaseError, AIGradingWorkflow.DoesNotExist) as ex:
         msg = (
             u"An unexpected error occurred while retrieving all incomplete "
@@ -172,75 +556,69 @@ def reschedule_grading_tasks(course_id, item_id):
     # Notes whether or not one or more operations failed. If they did, the process of rescheduling will be retried.
     failures = 0
 
-    # A dictionary mapping tuples of (rubric, algorithm_id) to completed classifier sets. Used to avoid repeated
-    # queries which will return the same value. This loop implements a memoization of the the query.
-    maintained_classifiers = {}
-
-    # Try to grade all incomplete grading workflows
-    for workflow in grading_workflows:
+    for rubric_id, algorithm_id in groups:
+        group_key = u"{rubric_id}/{algorithm_id}".format(rubric_id=rubric_id, algorithm_id=algorithm_id)
 
-        # We will always go through the process of finding the most recent set of classifiers for an
-        # incomplete grading workflow. The rationale for this is that if we are ever rescheduling
+        # We will always go through the process of finding the most recent set of classifiers for
+        # incomplete grading workflows. The rationale for this is that if we are ever rescheduling
         # grading, we likely had classifiers which were not working. This way, we always take the last
         # completed set.
 
         # Note that this solution will lead to failure if "Train Classifiers" and "Refinish Grading Tasks"
         # are called in rapid succession. This is part of the reason this button is in the admin view.
-
-        # Tries to find a set of classifiers that are already defined in our maintained_classifiers based on a
-        # description of the workflow in the form of a tuple (rubric, course_id, item_id, algorithm_id)
-        workflow_description = (workflow.rubric, course_id, item_id, workflow.algorithm_id)
-        found_classifiers = maintained_classifiers.get(workflow_description)
-
-        # If no set of classifiers is found, we perform the query to try to find them. We take the most recent
-        # and add it to our dictionary of maintained classifiers for future reference.
-        if found_classifiers is None:
-            try:
-                found = workflow.assign_most_recent_classifier_set()
-                if found:
-                    found_classifiers = workflow.classifier_set
-                    maintained_classifiers[workflow_description] = found_classifiers
-                else:
-                    msg = u"No applicable classifiers yet exist for essay with uuid='{}'".format(workflow.uuid)
-                    logger.log(msg)
-            except DatabaseError as ex:
-                msg = (
-                    u"A Database error occurred while trying to assign classifiers to an essay with uuid='{id}'"
-                ).format(id=workflow.uuid)
-                logger.exception(msg)
-
-        # If we found classifiers in our memoized lookup dictionary, we assign them and save.
-        else:
-            workflow.classifier_set = found_classifiers
-            try:
-                workflow.save()
-                logger.info(
-                    u"Classifiers were successfully assigned to grading workflow with uuid={}".format(workflow.uuid)
-                )
-            except DatabaseError as ex:
-                msg = (
-                    u"A Database error occurred while trying to save classifiers to an essay with uuid='{id}'"
-                ).format(id=workflow.uuid)
-                logger.exception(msg)
-
-        if found_classifiers is not None:
-
-            # Now we should (unless we had an exception above) have a classifier set.
-            # Try to schedule the grading
-            try:
-                grade_essay.apply_async(args=[workflow.uuid])
-                logger.info(
-                    u"Rescheduling of grading was successful for grading workflow with uuid='{}'".format(workflow.uuid)
-                )
-            except ANTICIPATED_CELERY_ERRORS as ex:
-                msg = (
-                    u"An error occurred while try to grade essay with uuid='{id}': {ex}"
-                ).format(id=workflow.uuid, ex=ex)
-                logger.exception(msg)
-                failures += 1
+        try:
+            classifier_set, num_workflows = AIGradingWorkflow.assign_most_recent_classifier_set_to_group(
+                course_id, item_id, rubric_id, algorithm_id
+            )
+        except DatabaseError:
+            msg = (
+                u"A Database error occurred while trying to assign classifiers to grading workflows "
+                u"for course_id={cid}, item_id={iid}, rubric_id={rid}, algorithm_id={aid}"
+            ).format(cid=course_id, iid=item_id, rid=rubric_id, aid=algorithm_id)
+            logger.exception(msg)
+            failures += 1
+            continue
 
         # If we couldn't assign classifiers, we failed.
-        else:
+        if classifier_set is None:
+            logger.info(
+                (
+                    u"No applicable classifiers yet exist for {num} grading workflows "
+                    u"with rubric_id={rid} and algorithm_id={aid}"
+                ).format(num=num_workflows, rid=rubric_id, aid=algorithm_id)
+            )
+            failures += num_workflows
+            continue
+
+        logger.info(
+            u"Classifier set {csid} was assigned to {num} grading workflows".format(
+                csid=classifier_set.pk, num=num_workflows
+            )
+        )
+
+        # Now schedule the grading, one chunk at a time
+        try:
+            pages = AIGradingWorkflow.get_incomplete_workflow_pages(
+                course_id, item_id, reschedule_chunk_size(),
+                after_id=checkpoint.get(group_key),
+                rubric_id=rubric_id, algorithm_id=algorithm_id
+            )
+            for page in pages:
+                _enqueue_grading([workflow_uuid for __, workflow_uuid in page])
+                checkpoint[group_key] = page[-1][0]
+        except DatabaseError:
+            msg = (
+                u"A Database error occurred while retrieving grading workflows to reschedule for "
+                u"course_id={cid}, item_id={iid}, rubric_id={rid}, algorithm_id={aid}"
+            ).format(cid=course_id, iid=item_id, rid=rubric_id, aid=algorithm_id)
+            logger.exception(msg)
+            failures += 1
+        except ANTICIPATED_CELERY_ERRORS as ex:
+            msg = (
+                u"An error occurred while trying to reschedule grading for "
+                u"rubric_id={rid} and algorithm_id={aid}: {ex}"
+            ).format(rid=rubric_id, aid=algorithm_id, ex=ex)
+            logger.exception(msg)
             failures += 1
 
     # Logs the data from our rescheduling attempt
@@ -249,16 +627,148 @@ def reschedule_grading_tasks(course_id, item_id):
         course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=(failures == 0)
     )
 
-    # If one or more of these failed, we want to retry rescheduling.  Note that this retry is executed in such a way
-    # that if it fails, an AIGradingInternalError will be raised with the number of failures on the last attempt (i.e.
-    # the total number of workflows matching these critera that still have left to be graded).
+    # If one or more of these failed, we want to retry rescheduling, resuming from the checkpoint.
+    # Note that this retry is executed in such a way that if it fails, an AIGradingInternalError will
+    # be raised with the number of failures on the last attempt.
     if failures > 0:
         try:
             raise AIGradingInternalError(
                 u"In an attempt to reschedule grading workflows, there were {} failures.".format(failures)
             )
         except AIGradingInternalError as ex:
-            raise reschedule_grading_tasks.retry()
+            raise reschedule_grading_tasks.retry(kwargs={'checkpoint': checkpoint})
+
+
+def reschedule_chunk_size():
+    """
+    The number of workflows to schedule at a time when rescheduling.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_AI_RESCHEDULE_CHUNK_SIZE', DEFAULT_RESCHEDULE_CHUNK_SIZE)
+
+
+def _enqueue_grading(workflow_uuids):
+    """
+    Schedule grading for workflows that share a classifier set,
+    either in batches or as a group of single-essay grading tasks.
+    Rescheduled grading runs in the backfill lane, so it can't delay live grading.
+
+    Args:
+        workflow_uuids (list of unicode): The UUIDs of the workflows to grade.
+
+    Returns:
+        None
+
+    Raises:
+        celery errors (see `ANTICIPATED_CELERY_ERRORS`)
+
+    """
+    if grading_batch_size() > 1:
+        num_tasks = enqueue_grading_batches(workflow_uuids, lane=LANE_BACKFILL)
+    else:
+        queue = queue_for_lane(LANE_BACKFILL)
+        group(
+            grade_essay.s(workflow_uuid, lane=LANE_BACKFILL).set(queue=queue)
+            for workflow_uuid in workflow_uuids
+        ).apply_async()
+        num_tasks = len(workflow_uuids)
+    logger.info(
+        u"Rescheduled grading for {num} workflows in {tasks} tasks".format(
+            num=len(workflow_uuids), tasks=num_tasks
+        )
+    )
+
+
+def _load_classifier_set(algorithm, classifier_set_id, classifier_set):
+    """
+    Load the classifiers for every criterion in a classifier set,
+    re-using classifiers this process has already loaded.
+
+    The first time a worker sees a classifier set, it loads the classifiers
+    for all criteria at once, so later essays find every classifier cached.
+
+    Args:
+        algorithm (AIAlgorithm): The algorithm that will use the classifiers.
+        classifier_set_id (int): The primary key of the classifier set.
+            If None, load the classifiers without caching them.
+        classifier_set (dict): Maps criterion names to serialized classifiers.
+
+    Returns:
+        dict mapping criterion names to loaded classifiers
+
+    Raises:
+        AIAlgorithmError
+
+    """
+    loaded_classifiers = {}
+    for criterion_name, classifier in classifier_set.iteritems():
+        key = (classifier_set_id, criterion_name)
+        loaded = LOADED_CLASSIFIER_CACHE.get(key) if classifier_set_id is not None else None
+        if loaded is None:
+            dog_stats_api.increment('openassessment.assessment.ai.loaded_classifier_cache.miss')
+            loaded = algorithm.load_classifier(classifier)
+            if classifier_set_id is not None:
+                LOADED_CLASSIFIER_CACHE.set(key, loaded, classifier_format.approximate_size(classifier))
+        else:
+            dog_stats_api.increment('openassessment.assessment.ai.loaded_classifier_cache.hit')
+        loaded_classifiers[criterion_name] = loaded
+    return loaded_classifiers
+
+
+def _validate_valid_scores(classifier_set, valid_scores, workflow_uuid):
+    """
+    Check that we have valid scores for each criterion in a classifier set.
+
+    Args:
+        classifier_set (dict): Maps criterion names to serialized classifiers.
+        valid_scores (dict): Maps criterion names to lists of valid scores.
+        workflow_uuid (unicode): The UUID(s) of the grading workflows, used in error messages.
+
+    Returns:
+        None
+
+    Raises:
+        AIGradingInternalError
+
+    """
+    for criterion_name in classifier_set.keys():
+        msg = None
+        if criterion_name not in valid_scores:
+            msg = (
+                u"Could not find {criterion} in the list of valid scores "
+                u"for grading workflow with UUID {uuid}"
+            ).format(criterion=criterion_name, uuid=workflow_uuid)
+        elif len(valid_scores[criterion_name]) == 0:
+            msg = (
+                u"Valid scores for {criterion} is empty for "
+                u"grading workflow with UUID {uuid}"
+            ).format(criterion=criterion_name, uuid=workflow_uuid)
+        if msg:
+            logger.exception(msg)
+            raise AIGradingInternalError(msg)
+
+
+def _closest_valid_scores(scores_by_criterion, valid_scores):
+    """
+    Replace each criterion's score with the closest valid score.
+
+    Args:
+        scores_by_criterion (dict): Mapping of criterion names to the scores
+            assigned by the algorithm.
+        valid_scores (dict): Mapping of criterion names to lists of valid scores,
+            each sorted in ascending order.
+
+    Returns:
+        dict mapping criterion names to int scores
+
+    """
+    return {
+        criterion_name: _closest_valid_score(score, valid_scores[criterion_name])
+        for criterion_name, score in scores_by_criterion.iteritems()
+    }
 
 
 def _closest_valid_score(score, valid_scores):
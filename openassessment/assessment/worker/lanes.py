@@ -0,0 +1,221 @@
+"""
+Priority lanes for AI grading and training tasks.
+
+AI tasks are scheduled in one of three lanes:
+
+    * live: grading essays as students submit them.  Students are waiting
+        for these scores, so this lane should never queue behind the others.
+    * training: training classifiers when course staff request it.
+    * backfill: grading and training rescheduled in bulk, either by course staff
+        or automatically once classifiers are trained.
+
+Each lane is routed to its own Celery queue (the ``ORA2_AI_LANE_QUEUES`` setting),
+so workers can be dedicated to each lane, and a backlog of rescheduled essays
+can't delay live grading.
+
+Each lane can also have a concurrency budget (the ``ORA2_AI_LANE_CONCURRENCY`` setting):
+the maximum number of tasks from the lane that may run at once across all workers.
+This lets workers that consume several queues keep capacity for live grading.
+A task that starts when its lane is over budget puts itself back on its queue
+and tries again after a short delay.  Running tasks hold a slot, which is a
+lease in the shared cache; leases expire, so a worker that dies while running
+a task can't hold a slot forever.
+
+Tasks report how long each workflow waited, from when the workflow was scheduled
+to when the task started, tagged by lane.
+"""
+import functools
+from uuid import uuid4
+from celery import current_task
+from django.conf import settings
+from django.utils.timezone import now
+from dogapi import dog_stats_api
+from openassessment.cache import CacheNamespace
+
+
+LANE_LIVE = u"live"
+LANE_TRAINING = u"training"
+LANE_BACKFILL = u"backfill"
+
+# By default, live grading uses the default queue, and training and
+# backfill use the low-priority queue if the Django settings define one.
+DEFAULT_LANE_QUEUES = {
+    LANE_LIVE: None,
+    LANE_TRAINING: getattr(settings, 'LOW_PRIORITY_QUEUE', None),
+    LANE_BACKFILL: getattr(settings, 'LOW_PRIORITY_QUEUE', None),
+}
+
+# By default, a slot is held for at most ten minutes,
+# which is longer than grading or training should take.
+DEFAULT_SLOT_TIMEOUT = 10 * 60
+
+# By default, a task deferred because its lane is over budget
+# tries again after five seconds.
+DEFAULT_DEFER_COUNTDOWN = 5
+
+# Slots held by running tasks, keyed by lane and slot number
+LANE_SLOT_CACHE = CacheNamespace(u"ai_lane.slot")
+
+
+def queue_for_lane(lane):
+    """
+    The Celery queue for tasks in a lane.
+
+    Args:
+        lane (unicode): The lane name.
+
+    Returns:
+        unicode or None (use the default queue)
+
+    """
+    queues = getattr(settings, 'ORA2_AI_LANE_QUEUES', {})
+    return queues.get(lane, DEFAULT_LANE_QUEUES.get(lane))
+
+
+def concurrency_budget(lane):
+    """
+    The maximum number of tasks in a lane that may run at once.
+
+    Args:
+        lane (unicode): The lane name.
+
+    Returns:
+        int or None (no limit)
+
+    """
+    return getattr(settings, 'ORA2_AI_LANE_CONCURRENCY', {}).get(lane)
+
+
+def slot_timeout():
+    """
+    The number of seconds after which a slot held by a task expires.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_AI_LANE_SLOT_TIMEOUT', DEFAULT_SLOT_TIMEOUT)
+
+
+def defer_countdown():
+    """
+    The number of seconds a task waits before trying again
+    when its lane is over budget.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_AI_LANE_DEFER_COUNTDOWN', DEFAULT_DEFER_COUNTDOWN)
+
+
+def acquire_slot(lane):
+    """
+    Try to claim one of a lane's slots.
+
+    Args:
+        lane (unicode): The lane name.
+
+    Returns:
+        The slot (to pass to `release_slot`), True if the lane has no budget,
+        or None if every slot is held.
+
+    """
+    budget = concurrency_budget(lane)
+    if budget is None:
+        return True
+
+    token = uuid4().hex
+    for slot_num in range(budget):
+        # `add` is atomic, so exactly one task claims each slot.
+        if LANE_SLOT_CACHE.add((lane, slot_num), token, timeout=slot_timeout()):
+            return (lane, slot_num, token)
+    return None
+
+
+def release_slot(slot):
+    """
+    Release a slot claimed by `acquire_slot`.
+
+    Args:
+        slot: The value returned by `acquire_slot`.
+
+    Returns:
+        None
+
+    """
+    if slot is True or slot is None:
+        return
+
+    lane, slot_num, token = slot
+
+    # If our lease expired, another task may hold the slot now,
+    # so only release it if we still hold it.
+    if LANE_SLOT_CACHE.get((lane, slot_num)) == token:
+        LANE_SLOT_CACHE.delete((lane, slot_num))
+
+
+def limit_concurrency(default_lane):
+    """
+    Decorator for Celery task functions that enforces the concurrency budget of
+    the task's lane.  The task function must accept a `lane` keyword argument.
+
+    If the lane is over budget, the task is scheduled again (with the same
+    arguments, on the lane's queue) instead of running.  This does not count
+    as a retry.
+
+    Args:
+        default_lane (unicode): The lane of tasks scheduled without a `lane` argument.
+
+    Returns:
+        decorator
+
+    """
+    def _decorator(func):  # pylint: disable=C0111
+        @functools.wraps(func)
+        def _wrapped(*args, **kwargs):  # pylint: disable=C0111
+            lane = kwargs.get('lane', default_lane)
+            slot = acquire_slot(lane)
+            if slot is None:
+                dog_stats_api.increment(
+                    'openassessment.assessment.ai.lane.deferred',
+                    tags=[u"lane:{}".format(lane)]
+                )
+                current_task.apply_async(
+                    args=args, kwargs=kwargs,
+                    queue=queue_for_lane(lane), countdown=defer_countdown()
+                )
+                return None
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                release_slot(slot)
+        return _wrapped
+    return _decorator
+
+
+def record_queue_wait(lane, task_name, scheduled_times):
+    """
+    Report how long workflows waited to be processed, from when each workflow
+    was scheduled until the task processing it started.
+
+    Args:
+        lane (unicode): The lane of the task.
+        task_name (unicode): The name of the task (for example, u"grade_essay").
+        scheduled_times (list of datetime): When each workflow was scheduled.
+
+    Returns:
+        None
+
+    """
+    current_time = now()
+    tags = [u"lane:{}".format(lane), u"task:{}".format(task_name)]
+    for scheduled_at in scheduled_times:
+        if scheduled_at is None:
+            continue
+        dog_stats_api.histogram(
+            'openassessment.assessment.ai.queue_wait.time',
+            (current_time - scheduled_at).total_seconds(),
+            tags=tags
+        )
@@ -2,6 +2,7 @@
 Asynchronous tasks for training classifiers from examples.
 """
 import datetime
+import multiprocessing
 from collections import defaultdict
 from celery import task
 from celery.utils.log import get_task_logger
@@ -11,7 +12,10 @@ from django.db import DatabaseError
 from openassessment.assessment.api import ai_worker as ai_worker_api
 from openassessment.assessment.errors import AIError, ANTICIPATED_CELERY_ERRORS
 from .algorithm import AIAlgorithm, AIAlgorithmError
-from .grading import reschedule_grading_tasks
+from .grading import reschedule_grading_tasks, reschedule_chunk_size
+from .lanes import (
+    LANE_TRAINING, LANE_BACKFILL, queue_for_lane, limit_concurrency, record_queue_wait
+)
 from openassessment.assessment.errors.ai import AIGradingInternalError
 from openassessment.assessment.models.ai import AITrainingWorkflow
 
@@ -19,11 +23,17 @@ MAX_RETRIES = 2
 
 logger = get_task_logger(__name__)
 
+# Training tasks are routed to the queue of their lane when they're scheduled;
+# this is the queue for tasks scheduled without one.
+TRAINING_TASK_QUEUE = queue_for_lane(LANE_TRAINING)
+
 # If the Django settings define a low-priority queue, use that.
 # Otherwise, use the default queue.
-TRAINING_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
 RESCHEDULE_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
 
+# By default, train one criterion at a time.
+DEFAULT_TRAINING_PROCESSES = 1
+
 
 class InvalidExample(Exception):
     """
@@ -39,7 +49,8 @@ class InvalidExample(Exception):
 
 @task(queue=TRAINING_TASK_QUEUE, max_retries=MAX_RETRIES)  # pylint: disable=E1102
 @dog_stats_api.timed('openassessment.assessment.ai.train_classifiers.time')
-def train_classifiers(workflow_uuid):
+@limit_concurrency(LANE_TRAINING)
+def train_classifiers(workflow_uuid, lane=LANE_TRAINING):
     """
     Asynchronous task to train classifiers for AI grading.
     This task uses the AI API to retrieve task parameters
@@ -56,6 +67,9 @@ def train_classifiers(workflow_uuid):
         workflow_uuid (str): The UUID of the workflow associated
             with this training task.
 
+    Keyword Arguments:
+        lane (unicode): The priority lane the task was scheduled in (see `lanes`).
+
     Returns:
         None
 
@@ -95,6 +109,8 @@ def train_classifiers(workflow_uuid):
         logger.exception(msg)
         raise train_classifiers.retry()
 
+    record_queue_wait(lane, u"train_classifiers", [params.get('scheduled_at')])
+
     # Retrieve the ML algorithm to use for training
     # (based on task params and worker configuration)
     try:
@@ -118,11 +134,9 @@ def train_classifiers(workflow_uuid):
     # The AIAlgorithm subclass is responsible for ensuring that
     # the trained classifiers are JSON-serializable.
     try:
-        classifier_set = {
-            criterion_name: algorithm.train_classifier(examples_dict)
-            for criterion_name, examples_dict
-            in _examples_by_criterion(examples).iteritems()
-        }
+        classifier_set = _train_classifier_set(
+            algorithm, algorithm_id, _examples_by_criterion(examples)
+        )
     except InvalidExample:
         msg = (
             u"Training example format was not valid "
@@ -166,14 +180,21 @@ def train_classifiers(workflow_uuid):
 
 @task(queue=RESCHEDULE_TASK_QUEUE, max_retries=MAX_RETRIES) #pylint: disable=E1102
 @dog_stats_api.timed('openassessment.assessment.ai.reschedule_training_tasks.time')
-def reschedule_training_tasks(course_id, item_id):
+def reschedule_training_tasks(course_id, item_id, after_id=None):
     """
     Reschedules all incomplete training tasks
 
+    The workflows are retrieved in chunks, and if scheduling fails,
+    the task retries, resuming after the last workflow that was scheduled.
+
     Args:
         course_id (unicode): The course that we are going to search for unfinished training workflows
         item_id (unicode): The specific item within that course that we will reschedule unfinished workflows for
 
+    Keyword Arguments:
+        after_id (int): The primary key of the last workflow scheduled by a previous attempt.
+            Set when the task retries.
+
     Raises:
         AIReschedulingInternalError
         DatabaseError
@@ -182,35 +203,40 @@ def reschedule_training_tasks(course_id, item_id):
     _log_start_reschedule_training(course_id=course_id, item_id=item_id)
     start_time = datetime.datetime.now()
 
-    # Run a query to find the incomplete training workflows
+    # Tries to train every workflow that has not completed.
     try:
-        training_workflows = AITrainingWorkflow.get_incomplete_workflows(course_id, item_id)
+        pages = AITrainingWorkflow.get_incomplete_workflow_pages(
+            course_id, item_id, reschedule_chunk_size(), after_id=after_id
+        )
+        for page in pages:
+            for workflow_id, workflow_uuid in page:
+                try:
+                    train_classifiers.apply_async(
+                        args=[workflow_uuid], kwargs={'lane': LANE_BACKFILL},
+                        queue=queue_for_lane(LANE_BACKFILL)
+                    )
+                    logger.info(
+                        u"Rescheduling of training was successful for workflow with uuid{}".format(workflow_uuid)
+                    )
+                except ANTICIPATED_CELERY_ERRORS as ex:
+                    msg = (
+                        u"An unexpected error occurred while scheduling the task for training workflow with UUID {id}: {ex}"
+                    ).format(id=workflow_uuid, ex=ex)
+                    logger.exception(msg)
+
+                    time_delta = datetime.datetime.now() - start_time
+                    _log_complete_reschedule_training(
+                        course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=False
+                    )
+                    raise reschedule_training_tasks.retry(kwargs={'after_id': after_id})
+                after_id = workflow_id
     except (DatabaseError, AITrainingWorkflow.DoesNotExist) as ex:
         msg = (
             u"An unexpected error occurred while retrieving all incomplete "
             u"training tasks for course_id: {cid} and item_id: {iid}: {ex}"
         ).format(cid=course_id, iid=item_id, ex=ex)
         logger.exception(msg)
-        raise reschedule_training_tasks.retry()
-
-    # Tries to train every workflow that has not completed.
-    for target_workflow in training_workflows:
-        try:
-            train_classifiers.apply_async(args=[target_workflow.uuid])
-            logger.info(
-                u"Rescheduling of training was successful for workflow with uuid{}".format(target_workflow.uuid)
-            )
-        except ANTICIPATED_CELERY_ERRORS as ex:
-            msg = (
-                u"An unexpected error occurred while scheduling the task for training workflow with UUID {id}: {ex}"
-            ).format(id=target_workflow.uuid, ex=ex)
-            logger.exception(msg)
-
-            time_delta = datetime.datetime.now() - start_time
-            _log_complete_reschedule_training(
-                course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=False
-            )
-            raise reschedule_training_tasks.retry()
+        raise reschedule_training_tasks.retry(kwargs={'after_id': after_id})
 
     # Logs the total time to reschedule all training of classifiers if not logged beforehand by exception.
     time_delta = datetime.datetime.now() - start_time
@@ -218,6 +244,130 @@ def reschedule_training_tasks(course_id, item_id):
         course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=True
     )
 
+
+def training_processes():
+    """
+    The maximum number of criteria to train concurrently, each in its own process.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_AI_TRAINING_PROCESSES', DEFAULT_TRAINING_PROCESSES)
+
+
+def _train_classifier_set(algorithm, algorithm_id, examples_by_criterion, num_processes=None):
+    """
+    Train a classifier for each criterion.
+
+    Training is CPU-bound and independent across criteria, so if more
+    than one process is allowed, criteria are trained concurrently in a pool
+    of processes.  Otherwise (or if the worker is itself a daemon process,
+    which can't have children), criteria are trained one after another.
+
+    Args:
+        algorithm (AIAlgorithm): The algorithm used to train the classifiers.
+        algorithm_id (unicode): The ID of the algorithm, used to load it in each process.
+        examples_by_criterion (dict): Maps criterion names to lists of `AIAlgorithm.ExampleEssay`s.
+
+    Keyword Arguments:
+        num_processes (int): The maximum number of criteria to train concurrently.
+            Defaults to the ``ORA2_AI_TRAINING_PROCESSES`` setting.
+
+    Returns:
+        dict mapping criterion names to trained classifiers
+
+    Raises:
+        AIAlgorithmError
+
+    """
+    if num_processes is None:
+        num_processes = training_processes()
+    num_processes = min(num_processes, len(examples_by_criterion))
+
+    if num_processes > 1 and multiprocessing.current_process().daemon:
+        logger.warning(
+            u"Training criteria sequentially because daemon processes cannot start a process pool."
+        )
+        num_processes = 1
+
+    if num_processes <= 1:
+        results = [
+            _train_criterion(algorithm, criterion_name, examples)
+            for criterion_name, examples in examples_by_criterion.iteritems()
+        ]
+    else:
+        # Examples are sent to the pool as plain tuples,
+        # since the `ExampleEssay` namedtuple can't be pickled.
+        pool = multiprocessing.Pool(num_processes)
+        try:
+            results = pool.map(_train_criterion_in_process, [
+                (algorithm_id, criterion_name, [tuple(example) for example in examples])
+                for criterion_name, examples in examples_by_criterion.iteritems()
+            ])
+        finally:
+            pool.close()
+            pool.join()
+
+    # Record metrics here rather than in the pool processes,
+    # which may exit before the metrics are sent.
+    classifier_set = {}
+    for criterion_name, classifier, seconds in results:
+        dog_stats_api.histogram(
+            'openassessment.assessment.ai.train_classifier.time', seconds,
+            tags=[u"algorithm_id:{}".format(algorithm_id)]
+        )
+        logger.info(
+            u"Trained classifier for criterion \"{name}\" in {seconds} seconds".format(
+                name=criterion_name, seconds=seconds
+            )
+        )
+        classifier_set[criterion_name] = classifier
+    return classifier_set
+
+
+def _train_criterion_in_process(args):
+    """
+    Train a classifier for a criterion in a pool process.
+
+    Args:
+        args (tuple): `(algorithm_id, criterion_name, examples)`,
+            where `examples` is a list of `(text, score)` tuples.
+
+    Returns:
+        tuple of `(criterion_name, classifier, seconds)`
+
+    Raises:
+        AIAlgorithmError
+
+    """
+    algorithm_id, criterion_name, examples = args
+    algorithm = AIAlgorithm.algorithm_for_id(algorithm_id)
+    examples = [AIAlgorithm.ExampleEssay(text, score) for text, score in examples]
+    return _train_criterion(algorithm, criterion_name, examples)
+
+
+def _train_criterion(algorithm, criterion_name, examples):
+    """
+    Train a classifier for a criterion, noting the time taken.
+
+    Args:
+        algorithm (AIAlgorithm): The algorithm used to train the classifier.
+        criterion_name (unicode): The name of the criterion.
+        examples (list of AIAlgorithm.ExampleEssay): The training examples.
+
+    Returns:
+        tuple of `(criterion_name, classifier, seconds)`
+
+    Raises:
+        AIAlgorithmError
+
+    """
+    start_time = datetime.datetime.now()
+    classifier = algorithm.train_classifier(examples)
+    return criterion_name, classifier, (datetime.datetime.now() - start_time).total_seconds()
+
+
 def _examples_by_criterion(examples):
     """
     Transform the examples returned by the AI API into our internal format.
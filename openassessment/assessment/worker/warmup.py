@@ -0,0 +1,269 @@
+"""
+Pre-populate the ORA2 caches for active problems.
+
+After a deploy or a cache flush, the first students to reach each problem
+would otherwise pay for every rubric serialization, training example
+serialization, and classifier set lookup at once.  Warming the caches
+moves that cost to a single background job.
+"""
+import datetime
+from multiprocessing.pool import ThreadPool
+from celery import task
+from celery.utils.log import get_task_logger
+from dogapi import dog_stats_api
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+from openassessment.assessment.models import (
+    Rubric, TrainingExample, AIClassifierSet, AIGradingWorkflow,
+    AITrainingWorkflow, PeerWorkflowItem, StudentTrainingWorkflowItem
+)
+from openassessment.assessment.serializers import (
+    RubricSerializer, serialize_training_example
+)
+from openassessment.workflow.models import AssessmentWorkflow
+
+
+logger = get_task_logger(__name__)
+
+# If the Django settings define a low-priority queue, use that.
+# Otherwise, use the default queue.
+WARM_CACHE_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
+
+# Problems with workflows modified within this many days are considered active.
+DEFAULT_ACTIVE_DAYS = 30
+
+# Number of database objects to load and cache in each batch
+DEFAULT_BATCH_SIZE = 100
+
+# Number of batches to process in parallel
+DEFAULT_NUM_WORKERS = 4
+
+
+@task(queue=WARM_CACHE_TASK_QUEUE)  # pylint: disable=E1102
+@dog_stats_api.timed('openassessment.assessment.warm_caches.time')
+def warm_caches_task(
+    active_days=DEFAULT_ACTIVE_DAYS, course_id=None,
+    batch_size=DEFAULT_BATCH_SIZE, num_workers=DEFAULT_NUM_WORKERS
+):
+    """
+    Asynchronous task to warm the caches after a deploy.
+
+    Keyword Arguments:
+        active_days (int): Warm the caches for problems with activity in the last `active_days` days.
+        course_id (unicode): If provided, warm the caches only for problems in this course.
+        batch_size (int): The number of objects to load and cache in each batch.
+        num_workers (int): The number of batches to process in parallel.
+
+    Returns:
+        dict (see `warm_caches`)
+
+    """
+    return warm_caches(
+        active_days=active_days, course_id=course_id,
+        batch_size=batch_size, num_workers=num_workers
+    )
+
+
+def warm_caches(
+    active_days=DEFAULT_ACTIVE_DAYS, course_id=None,
+    batch_size=DEFAULT_BATCH_SIZE, num_workers=DEFAULT_NUM_WORKERS
+):
+    """
+    Populate the cache with rubrics, training examples, and classifier set metadata
+    for all active (course_id, item_id) pairs.
+
+    Keyword Arguments:
+        active_days (int): Warm the caches for problems with activity in the last `active_days` days.
+        course_id (unicode): If provided, warm the caches only for problems in this course.
+        batch_size (int): The number of objects to load and cache in each batch.
+        num_workers (int): The number of batches to process in parallel.
+            If 1, process every batch in the current thread.
+
+    Returns:
+        dict with keys:
+            'items' (int): The number of (course_id, item_id) pairs visited.
+            'rubrics', 'training_examples', 'classifier_sets' (int):
+                The number of cache entries warmed of each kind.
+            'seconds' (float): The total time taken.
+
+    Raises:
+        DatabaseError
+
+    """
+    start = datetime.datetime.now()
+
+    rubric_ids = set()
+    example_ids = set()
+    classifier_set_ids = set()
+    items = active_items(active_days, course_id=course_id)
+    for item_course_id, item_id in items:
+        item_rubric_ids, item_example_ids, item_classifier_set_ids = _item_cache_targets(item_course_id, item_id)
+        rubric_ids |= item_rubric_ids
+        example_ids |= item_example_ids
+        classifier_set_ids |= item_classifier_set_ids
+
+    batches = (
+        [(_warm_rubrics, batch) for batch in _batches(rubric_ids, batch_size)] +
+        [(_warm_training_examples, batch) for batch in _batches(example_ids, batch_size)] +
+        [(_warm_classifier_sets, batch) for batch in _batches(classifier_set_ids, batch_size)]
+    )
+    if num_workers > 1 and len(batches) > 1:
+        pool = ThreadPool(min(num_workers, len(batches)))
+        try:
+            pool.map(_run_batch, batches)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for batch in batches:
+            batch[0](batch[1])
+
+    results = {
+        'items': len(items),
+        'rubrics': len(rubric_ids),
+        'training_examples': len(example_ids),
+        'classifier_sets': len(classifier_set_ids),
+        'seconds': (datetime.datetime.now() - start).total_seconds(),
+    }
+    logger.info(
+        (
+            u"Warmed caches for {items} active items: {rubrics} rubrics, "
+            u"{training_examples} training examples, and {classifier_sets} "
+            u"classifier sets in {seconds} seconds."
+        ).format(**results)
+    )
+    return results
+
+
+def active_items(active_days, course_id=None):
+    """
+    Find the problems that students have worked on recently.
+
+    Args:
+        active_days (int): Include problems with workflows modified in the last `active_days` days.
+
+    Keyword Arguments:
+        course_id (unicode): If provided, include only problems in this course.
+
+    Returns:
+        list of `(course_id, item_id)` tuples
+
+    Raises:
+        DatabaseError
+
+    """
+    workflows = AssessmentWorkflow.objects.filter(
+        modified__gte=now() - datetime.timedelta(days=active_days)
+    )
+    if course_id is not None:
+        workflows = workflows.filter(course_id=course_id)
+    return list(workflows.order_by().values_list('course_id', 'item_id').distinct())
+
+
+def _item_cache_targets(course_id, item_id):
+    """
+    Find the objects whose cache entries we should warm for a problem.
+
+    Args:
+        course_id (unicode): The course containing the problem.
+        item_id (unicode): The problem.
+
+    Returns:
+        tuple of sets `(rubric_ids, training_example_ids, classifier_set_ids)`
+
+    Raises:
+        DatabaseError
+
+    """
+    classifier_sets = AIClassifierSet.objects.filter(course_id=course_id, item_id=item_id)
+    classifier_set_ids = set()
+    rubric_ids = set()
+    for classifier_set_id, rubric_id in classifier_sets.values_list('id', 'rubric_id'):
+        classifier_set_ids.add(classifier_set_id)
+        rubric_ids.add(rubric_id)
+
+    rubric_ids.update(
+        AIGradingWorkflow.objects.filter(
+            course_id=course_id, item_id=item_id
+        ).order_by().values_list('rubric_id', flat=True).distinct()
+    )
+    rubric_ids.update(
+        PeerWorkflowItem.objects.filter(
+            author__course_id=course_id, author__item_id=item_id, assessment__isnull=False
+        ).order_by().values_list('assessment__rubric_id', flat=True).distinct()
+    )
+
+    example_ids = set(
+        StudentTrainingWorkflowItem.objects.filter(
+            workflow__course_id=course_id, workflow__item_id=item_id
+        ).order_by().values_list('training_example_id', flat=True).distinct()
+    )
+    example_ids.update(
+        AITrainingWorkflow.training_examples.through.objects.filter(
+            aitrainingworkflow__course_id=course_id, aitrainingworkflow__item_id=item_id
+        ).order_by().values_list('trainingexample_id', flat=True).distinct()
+    )
+
+    return rubric_ids, example_ids, classifier_set_ids
+
+
+def _batches(ids, batch_size):
+    """
+    Split a collection of IDs into sorted batches.
+
+    Args:
+        ids (iterable): The IDs to split.
+        batch_size (int): The maximum number of IDs in each batch.
+
+    Returns:
+        list of lists
+
+    """
+    ids = sorted(ids)
+    return [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+
+
+def _run_batch(batch):
+    """
+    Warm a batch of cache entries in a worker thread.
+
+    Each thread opens its own database connection,
+    so close it once the batch is done.
+
+    Args:
+        batch (tuple): `(warm_func, ids)`
+
+    Returns:
+        None
+
+    """
+    warm_func, ids = batch
+    try:
+        warm_func(ids)
+    finally:
+        connection.close()
+
+
+def _warm_rubrics(rubric_ids):
+    """
+    Cache serialized rubrics.
+    """
+    for rubric in Rubric.objects.filter(pk__in=rubric_ids):
+        RubricSerializer.serialized_from_cache(rubric)
+
+
+def _warm_training_examples(example_ids):
+    """
+    Cache serialized training examples.
+    """
+    for example in TrainingExample.objects.filter(pk__in=example_ids).select_related('rubric'):
+        serialize_training_example(example)
+
+
+def _warm_classifier_sets(classifier_set_ids):
+    """
+    Cache the valid scores for classifier sets.
+    """
+    for classifier_set in AIClassifierSet.objects.filter(pk__in=classifier_set_ids):
+        classifier_set.valid_scores_by_criterion  # pylint: disable=W0104
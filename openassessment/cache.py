@@ -0,0 +1,351 @@
+"""
+Cache facade for ORA2.
+
+Every cache entry that ORA2 stores goes through a `CacheNamespace`, which:
+
+* Builds keys of the form ``ora2.<global version>.<namespace>.v<version>.<identifier>``,
+  so that entries for different kinds of data can never collide.
+
+* Versions keys, both per namespace (bump the `version` passed to the namespace
+  whenever the format of the cached data changes) and globally (bump the
+  ``ORA2_CACHE_VERSION`` setting to invalidate every ORA2 cache entry at once).
+
+* Keeps keys safe for memcached, which rejects keys that are too long
+  or that contain whitespace or control characters.  Such identifiers
+  are replaced with a hash of their contents.
+
+* Reads per-namespace timeouts from the ``ORA2_CACHE_TIMEOUTS`` setting,
+  a dictionary mapping namespace names to timeouts in seconds.
+
+* Reports hits, misses and the time spent reading from the cache
+  to datadog, tagged by namespace.
+
+* Coalesces concurrent cache fills (see `CacheNamespace.get_or_compute`).
+  When a popular entry expires, only the worker holding a short-lived
+  lock key regenerates it; the others wait briefly for the new value
+  instead of all hitting the database at once.
+
+Example usage:
+
+    >>> RUBRIC_CACHE = CacheNamespace(u"rubric.serialized")
+    >>> rubric_dict = RUBRIC_CACHE.get_or_compute(
+    >>>     rubric.content_hash, lambda: RubricSerializer(rubric).data
+    >>> )
+
+"""
+import time
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from dogapi import dog_stats_api
+
+
+# Prefix shared by every ORA2 cache key
+KEY_PREFIX = u"ora2"
+
+# Memcached rejects keys longer than 250 characters.
+# Leave room for the prefix and version that Django adds to each key.
+MAX_KEY_LENGTH = 200
+
+# Name used to report cache metrics to datadog
+METRICS_PREFIX = u"openassessment.cache"
+
+# Suffix appended to an entry's key to build the key of its regeneration lock
+LOCK_SUFFIX = ".lock"
+
+# How long (in seconds) a regeneration lock is held before it expires.
+# This bounds how long other workers are blocked if the worker holding
+# the lock dies before releasing it.
+LOCK_TIMEOUT = 10
+
+# How long (in seconds) to wait for another worker to fill the cache
+# before giving up and computing the value ourselves.
+LOCK_WAIT = 2.0
+
+# How often (in seconds) to check whether another worker has filled the cache.
+LOCK_POLL_INTERVAL = 0.05
+
+
+class CacheNamespace(object):
+    """
+    A group of cache entries that hold the same kind of data.
+    """
+
+    def __init__(self, name, version=1, timeout=None, backend=None):
+        """
+        Configure the namespace.
+
+        Args:
+            name (unicode): The name of the namespace, used in cache keys,
+                settings, and metrics (e.g. u"rubric.serialized").
+
+        Keyword Arguments:
+            version (int): The version of the format of the cached data.
+                Increment this to invalidate entries written by older code.
+            timeout (int): The default timeout (in seconds) for entries in this namespace.
+                Can be overridden by the ``ORA2_CACHE_TIMEOUTS`` setting.
+                If not specified, use the timeout configured for the cache backend.
+            backend (django.core.cache.BaseCache): The cache backend to use.
+                If not specified, use the default Django cache.
+
+        """
+        self.name = name
+        self.version = version
+        self._timeout = timeout
+        self._backend = backend
+
+    @property
+    def backend(self):
+        """
+        The Django cache backend that stores entries for this namespace.
+
+        Returns:
+            django.core.cache.BaseCache
+
+        """
+        return self._backend if self._backend is not None else default_cache
+
+    @property
+    def timeout(self):
+        """
+        The timeout (in seconds) for entries in this namespace.
+
+        Returns:
+            int or None (use the backend's default timeout)
+
+        """
+        timeouts = getattr(settings, 'ORA2_CACHE_TIMEOUTS', {})
+        return timeouts.get(self.name, self._timeout)
+
+    def make_key(self, identifier):
+        """
+        Build a cache key for an entry in this namespace.
+
+        Args:
+            identifier (unicode, int, or tuple): Uniquely identifies the entry
+                within the namespace.  Tuples and lists are joined with dots.
+
+        Returns:
+            str
+
+        """
+        if isinstance(identifier, (tuple, list)):
+            identifier = u".".join(unicode(part) for part in identifier)
+
+        prefix = u"{prefix}.{global_version}.{name}.v{version}".format(
+            prefix=KEY_PREFIX,
+            global_version=getattr(settings, 'ORA2_CACHE_VERSION', 1),
+            name=self.name,
+            version=self.version,
+        ).encode('utf-8')
+
+        if not isinstance(identifier, unicode):
+            identifier = unicode(str(identifier), 'utf-8')
+        identifier = identifier.encode('utf-8')
+
+        key = "{prefix}.{identifier}".format(prefix=prefix, identifier=identifier)
+        if len(key) > MAX_KEY_LENGTH or not _is_safe_key(key):
+            key = "{prefix}.sha1-{digest}".format(
+                prefix=prefix, digest=sha1(identifier).hexdigest()
+            )
+        return key
+
+    def get(self, identifier, default=None):
+        """
+        Retrieve an entry from the cache.
+
+        Args:
+            identifier (unicode, int, or tuple): Uniquely identifies the entry.
+
+        Keyword Arguments:
+            default: The value to return if the entry is not in the cache.
+
+        Returns:
+            The cached value, or `default` if the entry was not found.
+
+        """
+        start = time.time()
+        value = self.backend.get(self.make_key(identifier))
+        elapsed = time.time() - start
+
+        tags = [u"namespace:{name}".format(name=self.name)]
+        dog_stats_api.histogram(METRICS_PREFIX + u".get_time", elapsed, tags=tags)
+        if value is None:
+            dog_stats_api.increment(METRICS_PREFIX + u".miss", tags=tags)
+            return default
+        else:
+            dog_stats_api.increment(METRICS_PREFIX + u".hit", tags=tags)
+            return value
+
+    def set(self, identifier, value, timeout=None):
+        """
+        Store an entry in the cache.
+
+        Args:
+            identifier (unicode, int, or tuple): Uniquely identifies the entry.
+            value (picklable): The value to cache.
+
+        Keyword Arguments:
+            timeout (int): Override the namespace timeout for this entry.
+
+        Returns:
+            None
+
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        self.backend.set(self.make_key(identifier), value, timeout)
+
+    def add(self, identifier, value, timeout=None):
+        """
+        Store an entry in the cache only if it isn't already there.
+
+        Args:
+            identifier (unicode, int, or tuple): Uniquely identifies the entry.
+            value (picklable): The value to cache.
+
+        Keyword Arguments:
+            timeout (int): Override the namespace timeout for this entry.
+
+        Returns:
+            bool: True if the entry was stored, False if it already existed.
+
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        return self.backend.add(self.make_key(identifier), value, timeout)
+
+    def get_many(self, identifiers):
+        """
+        Retrieve several entries from the cache in one round trip.
+
+        Args:
+            identifiers (list): Each item uniquely identifies an entry.
+
+        Returns:
+            dict mapping the identifiers of the entries found to their values.
+            Identifiers that were not found are omitted.
+
+        """
+        identifiers_by_key = {
+            self.make_key(identifier): identifier
+            for identifier in identifiers
+        }
+
+        start = time.time()
+        values = self.backend.get_many(identifiers_by_key.keys())
+        elapsed = time.time() - start
+
+        tags = [u"namespace:{name}".format(name=self.name)]
+        dog_stats_api.histogram(METRICS_PREFIX + u".get_time", elapsed, tags=tags)
+        dog_stats_api.increment(METRICS_PREFIX + u".hit", value=len(values), tags=tags)
+        dog_stats_api.increment(
+            METRICS_PREFIX + u".miss", value=len(identifiers_by_key) - len(values), tags=tags
+        )
+        return {
+            identifiers_by_key[key]: value
+            for key, value in values.iteritems()
+        }
+
+    def set_many(self, values, timeout=None):
+        """
+        Store several entries in the cache in one round trip.
+
+        Args:
+            values (dict): Maps identifiers to the values to cache.
+
+        Keyword Arguments:
+            timeout (int): Override the namespace timeout for these entries.
+
+        Returns:
+            None
+
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        self.backend.set_many(
+            {self.make_key(identifier): value for identifier, value in values.iteritems()},
+            timeout
+        )
+
+    def get_or_compute(self, identifier, compute, timeout=None):
+        """
+        Retrieve an entry from the cache, computing and storing it on a miss.
+
+        Only one worker regenerates a missing entry at a time:
+        the first worker to miss adds a lock key to the cache, computes
+        the value, and stores it.  Other workers that miss while the lock
+        is held poll the cache for up to `LOCK_WAIT` seconds; if the value
+        still isn't available, they compute it themselves rather than
+        blocking the request any longer.
+
+        Args:
+            identifier (unicode, int, or tuple): Uniquely identifies the entry.
+            compute (callable): Function with no arguments that returns
+                the value to cache.  Must not return None.
+
+        Keyword Arguments:
+            timeout (int): Override the namespace timeout for this entry.
+
+        Returns:
+            The cached or newly computed value.
+
+        """
+        value = self.get(identifier)
+        if value is not None:
+            return value
+
+        key = self.make_key(identifier)
+        lock_key = key + LOCK_SUFFIX
+        tags = [u"namespace:{name}".format(name=self.name)]
+
+        # `add` is atomic in memcached (and the other Django backends),
+        # so exactly one worker acquires the lock.
+        if self.backend.add(lock_key, True, LOCK_TIMEOUT):
+            try:
+                value = compute()
+                self.set(identifier, value, timeout=timeout)
+            finally:
+                self.backend.delete(lock_key)
+            return value
+
+        # Another worker is regenerating the entry, so wait for it to finish.
+        dog_stats_api.increment(METRICS_PREFIX + u".lock_wait", tags=tags)
+        start = time.time()
+        while time.time() - start < LOCK_WAIT:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = self.backend.get(key)
+            if value is not None:
+                return value
+
+        # The other worker is taking too long (or failed),
+        # so compute the value ourselves.
+        dog_stats_api.increment(METRICS_PREFIX + u".lock_timeout", tags=tags)
+        value = compute()
+        self.set(identifier, value, timeout=timeout)
+        return value
+
+    def delete(self, identifier):
+        """
+        Remove an entry from the cache.
+
+        Args:
+            identifier (unicode, int, or tuple): Uniquely identifies the entry.
+
+        Returns:
+            None
+
+        """
+        self.backend.delete(self.make_key(identifier))
+
+
+def _is_safe_key(key):
+    """
+    Check whether a key contains only characters that memcached accepts.
+
+    Args:
+        key (str): The encoded cache key.
+
+    Returns:
+        bool
+
+    """
+    return all(33 <= ord(char) < 127 for char in key)
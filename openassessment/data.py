@@ -4,9 +4,11 @@ Aggregate data for openassessment.
 import csv
 import json
 from django.conf import settings
+from django.db.models import Q
 from submissions import api as sub_api
+from submissions.models import Submission, Score
 from openassessment.workflow.models import AssessmentWorkflow
-from openassessment.assessment.models import AssessmentPart, AssessmentFeedback
+from openassessment.assessment.models import AssessmentPart, AssessmentFeedback, AssessmentFeedbackOption
 
 
 class CsvWriter(object):
@@ -48,12 +50,13 @@ class CsvWriter(object):
         ]
     }
 
-    # Number of submissions to retrieve at a time
+    # Default number of submissions to retrieve at a time
     # from the database.  We need to do this in order
     # to avoid loading thousands of records into memory at once.
+    # Override with the ORA2_CSV_EXPORT_PAGE_SIZE setting.
     QUERY_INTERVAL = 100
 
-    def __init__(self, output_streams, progress_callback=None):
+    def __init__(self, output_streams, progress_callback=None, chunked=False, page_size=None):
         """
         Configure where the writer will write data.
 
@@ -70,6 +73,11 @@ class CsvWriter(object):
             progress_callback (callable): Callable that accepts
                 no arguments.  Called once per submission loaded
                 from the database.
+            chunked (bool): If True, load the data for each page of
+                submissions with one query per model, instead of
+                several queries per submission (see `write_to_csv`).
+            page_size (int): The number of submissions to retrieve at a time.
+                Defaults to the ORA2_CSV_EXPORT_PAGE_SIZE setting, or `QUERY_INTERVAL`.
 
         Example usage:
             >>> output_streams = {
@@ -86,15 +94,22 @@ class CsvWriter(object):
             if key in self.MODELS
         }
         self._progress_callback = progress_callback
+        self._chunked = chunked
+        if page_size is None:
+            page_size = getattr(settings, 'ORA2_CSV_EXPORT_PAGE_SIZE', self.QUERY_INTERVAL)
+        self.page_size = page_size
 
     def write_to_csv(self, course_id):
         """
         Write assessment and submission data for a course to CSV files.
 
-        NOTE: The current implementation optimizes for memory usage,
-        but not for the number of database queries.  All the queries
-        use indexed fields (the submission uuid), so they should be
-        relatively quick.
+        Submissions are loaded `page_size` at a time, so memory use
+        is bounded however large the course.  By default, the data for each
+        submission is then loaded with its own queries.  In chunked mode,
+        the submissions, scores, assessment parts and feedback of each page
+        are loaded with one query each, which cuts the number of queries
+        by about `page_size` times.  Both modes write the same rows,
+        in the same order.
 
         Args:
             course_id (unicode): The course ID from which to pull data.
@@ -103,78 +118,248 @@ class CsvWriter(object):
             None
 
         """
-        self._write_csv_headers()
+        self.write_csv_headers()
+        feedback_option_ids = self.write_submissions_to_csv(course_id)
 
+        # The set of available options should be relatively small,
+        # since they're not (currently) user-defined.
+        self.write_feedback_options_to_csv(feedback_option_ids)
+
+    def write_submissions_to_csv(self, course_id, start_key=None, end_key=None):
+        """
+        Write the data for the submissions in a range of a course's workflows to CSV,
+        without the headers or the feedback options (see `write_to_csv`).
+
+        Writing each shard of a course (see `shard_keys`) with this method,
+        then concatenating the output, gives the same rows as `write_to_csv`.
+
+        Args:
+            course_id (unicode): The course ID from which to pull data.
+
+        Keyword Arguments:
+            start_key (tuple): The `(created, id)` of the first workflow in the range,
+                or None to start with the first workflow of the course.
+            end_key (tuple): The `(created, id)` of the first workflow after the range,
+                or None to continue to the last workflow of the course.
+
+        Returns:
+            set of the feedback option IDs that were selected
+
+        """
         rubric_points_cache = dict()
-        feedback_option_set = set()
-        for submission_uuid in self._submission_uuids(course_id):
-            self._write_submission_to_csv(submission_uuid)
-
-            # Django 1.4 doesn't follow reverse relations when using select_related,
-            # so we select AssessmentPart and follow the foreign key to the Assessment.
-            parts = self._use_read_replica(
-                AssessmentPart.objects.select_related('assessment', 'option', 'option__criterion')
-                    .filter(assessment__submission_uuid=submission_uuid)
-                    .order_by('assessment__pk')
+        feedback_option_ids = set()
+        for submission_uuids in self._submission_uuid_pages(course_id, start_key, end_key):
+            if self._chunked:
+                feedback_option_ids.update(
+                    self._write_page_to_csv(submission_uuids, rubric_points_cache)
+                )
+            else:
+                for submission_uuid in submission_uuids:
+                    feedback_option_ids.update(
+                        self._write_submission_data_to_csv(submission_uuid, rubric_points_cache)
+                    )
+        return feedback_option_ids
+
+    @classmethod
+    def shard_keys(cls, course_id, num_shards):
+        """
+        Split a course's workflows into contiguous shards of about the same size,
+        in the order the workflows were created.
+
+        Args:
+            course_id (unicode): The course ID from which to pull data.
+            num_shards (int): The number of shards.
+
+        Returns:
+            list of `(start_key, end_key)` tuples for `write_submissions_to_csv`, in order.
+            Courses with fewer workflows than shards have fewer shards.
+
+        """
+        query = cls._use_read_replica(
+            AssessmentWorkflow.objects.filter(course_id=course_id).order_by('created', 'id')
+        )
+        total = query.count()
+        boundaries = [None]
+        for shard in range(1, num_shards):
+            offset = shard * total // num_shards
+            if offset == 0:
+                continue
+            key = tuple(query.values_list('created', 'id')[offset])
+            if key != boundaries[-1]:
+                boundaries.append(key)
+        return zip(boundaries, boundaries[1:] + [None])
+
+    def _write_submission_data_to_csv(self, submission_uuid, rubric_points_cache):
+        """
+        Write the data for a submission to CSV, loading it with several queries.
+
+        Args:
+            submission_uuid (unicode): The UUID of the submission to write.
+            rubric_points_cache (dict): in-memory cache of points possible by rubric ID.
+
+        Returns:
+            set of the feedback option IDs that were selected
+
+        """
+        self._write_submission_to_csv(submission_uuid)
+
+        # Django 1.4 doesn't follow reverse relations when using select_related,
+        # so we select AssessmentPart and follow the foreign key to the Assessment.
+        parts = self._use_read_replica(
+            AssessmentPart.objects.select_related('assessment', 'criterion', 'option')
+                .filter(assessment__submission_uuid=submission_uuid)
+                .order_by('assessment__pk', 'pk')
+        )
+        self._write_assessment_to_csv(parts, rubric_points_cache)
+
+        # Retrieve the feedback together with the IDs of its selected options
+        # (one row per option); we look up the option text only once at the end.
+        feedback_query = self._use_read_replica(
+            AssessmentFeedback.objects
+                .filter(submission_uuid=submission_uuid)
+                .order_by('pk', 'options')
+                .values_list('pk', 'submission_uuid', 'feedback_text', 'options')
+        )
+        feedback_option_ids = self._write_assessment_feedback_to_csv(feedback_query)
+
+        if self._progress_callback is not None:
+            self._progress_callback()
+
+        return feedback_option_ids
+
+    def _write_page_to_csv(self, submission_uuids, rubric_points_cache):
+        """
+        Write the data for a page of submissions to CSV,
+        loading each kind of data for the whole page with a single query.
+
+        Args:
+            submission_uuids (list of unicode): The UUIDs of the submissions to write, in order.
+            rubric_points_cache (dict): in-memory cache of points possible by rubric ID.
+
+        Returns:
+            set of the feedback option IDs that were selected
+
+        Raises:
+            SubmissionNotFoundError
+
+        """
+        submissions = {
+            submission.uuid: submission
+            for submission in self._use_read_replica(
+                Submission.objects.select_related('student_item').filter(uuid__in=submission_uuids)
             )
-            self._write_assessment_to_csv(parts, rubric_points_cache)
+        }
 
-            feedback_query = self._use_read_replica(
-                AssessmentFeedback.objects
-                    .filter(submission_uuid=submission_uuid)
-                    .prefetch_related('options')
+        # The latest score for each submission is the one with the highest ID
+        latest_scores = dict()
+        for score in self._use_read_replica(
+            Score.objects.select_related('submission')
+                .filter(submission__uuid__in=submission_uuids)
+                .order_by('id')
+        ):
+            latest_scores[score.submission.uuid] = score
+
+        parts_by_submission = dict()
+        for part in self._use_read_replica(
+            AssessmentPart.objects.select_related('assessment', 'criterion', 'option')
+                .filter(assessment__submission_uuid__in=submission_uuids)
+                .order_by('assessment__pk', 'pk')
+        ):
+            parts_by_submission.setdefault(part.assessment.submission_uuid, []).append(part)
+
+        feedback_by_submission = dict()
+        for feedback_row in self._use_read_replica(
+            AssessmentFeedback.objects
+                .filter(submission_uuid__in=submission_uuids)
+                .order_by('pk', 'options')
+                .values_list('pk', 'submission_uuid', 'feedback_text', 'options')
+        ):
+            feedback_by_submission.setdefault(feedback_row[1], []).append(feedback_row)
+
+        feedback_option_ids = set()
+        for submission_uuid in submission_uuids:
+            submission = submissions.get(submission_uuid)
+            if submission is None:
+                raise sub_api.SubmissionNotFoundError(
+                    u"No submission matching uuid {}".format(submission_uuid)
+                )
+            score = latest_scores.get(submission_uuid)
+            self._write_submission_row(
+                submission_uuid,
+                submission.student_item.student_id,
+                submission.student_item.item_id,
+                submission.submitted_at,
+                submission.created_at,
+                json.loads(submission.raw_answer),
+            )
+            if score is not None and not score.is_hidden():
+                self._write_score_row(
+                    submission_uuid, score.points_earned, score.points_possible, score.created_at
+                )
+            self._write_assessment_to_csv(parts_by_submission.get(submission_uuid, []), rubric_points_cache)
+            feedback_option_ids.update(
+                self._write_assessment_feedback_to_csv(feedback_by_submission.get(submission_uuid, []))
             )
-            for assessment_feedback in feedback_query:
-                self._write_assessment_feedback_to_csv(assessment_feedback)
-                feedback_option_set.update(set(
-                    option for option in assessment_feedback.options.all()
-                ))
 
             if self._progress_callback is not None:
                 self._progress_callback()
 
-        # The set of available options should be relatively small,
-        # since they're not (currently) user-defined.
-        self._write_feedback_options_to_csv(feedback_option_set)
+        return feedback_option_ids
 
-    def _submission_uuids(self, course_id):
+    def _submission_uuid_pages(self, course_id, start_key=None, end_key=None):
         """
-        Iterate over submission uuids.
-        Makes database calls every N submissions to avoid loading
-        all submission uuids into memory at once.
+        Iterate over pages of submission uuids, `page_size` at a time,
+        in the order the workflows were created.
+
+        Pages are retrieved with keyset pagination: each page starts after the
+        `(created, id)` of the last workflow on the previous page, instead of at
+        an offset.  With the composite index on `(course_id, created, id)`, every
+        page costs the same however far into the course it is, and workflows
+        created during the export are neither skipped nor repeated.
 
         Args:
             course_id (unicode): The ID of the course to retrieve submissions from.
 
+        Keyword Arguments:
+            start_key (tuple): The `(created, id)` of the first workflow to retrieve.
+            end_key (tuple): The `(created, id)` of the first workflow not to retrieve.
+
         Yields:
-            submission_uuid (unicode)
+            list of submission_uuid (unicode)
 
         """
-        num_results = 0
-        start = 0
-        total_results = self._use_read_replica(
-            AssessmentWorkflow.objects.filter(course_id=course_id)
-        ).count()
-
-        while num_results < total_results:
-            # Load a subset of the submission UUIDs
-            # We're assuming that peer workflows are immutable,
-            # so if we counted N at the start of the loop,
-            # there should be >= N for us to process.
-            end = start + self.QUERY_INTERVAL
-            query = self._use_read_replica(
-                AssessmentWorkflow.objects
-                    .filter(course_id=course_id)
-                    .order_by('created')
-            ).values('submission_uuid')[start:end]
-
-            for workflow_dict in query:
-                num_results += 1
-                yield workflow_dict['submission_uuid']
+        workflows = AssessmentWorkflow.objects.filter(course_id=course_id)
+        if start_key is not None:
+            start_created, start_id = start_key
+            workflows = workflows.filter(
+                Q(created__gt=start_created) | Q(created=start_created, id__gte=start_id)
+            )
+        if end_key is not None:
+            end_created, end_id = end_key
+            workflows = workflows.filter(
+                Q(created__lt=end_created) | Q(created=end_created, id__lt=end_id)
+            )
 
-            start += self.QUERY_INTERVAL
+        last_key = None
+        while True:
+            query = workflows
+            if last_key is not None:
+                last_created, last_id = last_key
+                query = query.filter(
+                    Q(created__gt=last_created) | Q(created=last_created, id__gt=last_id)
+                )
+            rows = list(
+                self._use_read_replica(query)
+                    .order_by('created', 'id')
+                    .values_list('created', 'id', 'submission_uuid')[:self.page_size]
+            )
+            if rows:
+                yield [submission_uuid for _, _, submission_uuid in rows]
+            if len(rows) < self.page_size:
+                break
+            last_key = rows[-1][:2]
 
-    def _write_csv_headers(self):
+    def write_csv_headers(self):
         """
         Write the headers (first row) for each output stream.
         """
@@ -193,23 +378,59 @@ class CsvWriter(object):
 
         """
         submission = sub_api.get_submission_and_student(submission_uuid, read_replica=True)
-        self._write_unicode('submission', [
+        self._write_submission_row(
             submission['uuid'],
             submission['student_item']['student_id'],
             submission['student_item']['item_id'],
             submission['submitted_at'],
             submission['created_at'],
-            json.dumps(submission['answer'])
-        ])
+            submission['answer']
+        )
 
         score = sub_api.get_latest_score_for_submission(submission_uuid, read_replica=True)
         if score is not None:
-            self._write_unicode('score', [
+            self._write_score_row(
                 score['submission_uuid'],
                 score['points_earned'],
                 score['points_possible'],
                 score['created_at']
-            ])
+            )
+
+    def _write_submission_row(self, uuid, student_id, item_id, submitted_at, created_at, answer):
+        """
+        Write a row of submission data to CSV.
+
+        Args:
+            uuid (unicode): The UUID of the submission.
+            student_id (unicode): The anonymous ID of the student.
+            item_id (unicode): The ID of the problem.
+            submitted_at (datetime): When the submission was submitted.
+            created_at (datetime): When the submission was created.
+            answer (JSON-serializable): The deserialized answer.
+
+        Returns:
+            None
+
+        """
+        self._write_unicode('submission', [
+            uuid, student_id, item_id, submitted_at, created_at, json.dumps(answer)
+        ])
+
+    def _write_score_row(self, submission_uuid, points_earned, points_possible, created_at):
+        """
+        Write a row of score data to CSV.
+
+        Args:
+            submission_uuid (unicode): The UUID of the scored submission.
+            points_earned (int): The points earned.
+            points_possible (int): The points possible.
+            created_at (datetime): When the score was created.
+
+        Returns:
+            None
+
+        """
+        self._write_unicode('score', [submission_uuid, points_earned, points_possible, created_at])
 
     def _write_assessment_to_csv(self, assessment_parts, rubric_points_cache):
         """
@@ -262,42 +483,56 @@ class CsvWriter(object):
                 ])
                 assessment_id_set.add(assessment.id)
 
-    def _write_assessment_feedback_to_csv(self, assessment_feedback):
+    def _write_assessment_feedback_to_csv(self, feedback_rows):
         """
         Write feedback on assessments to CSV.
 
         Args:
-            assessment_feedback (AssessmentFeedback): The feedback model to write.
+            feedback_rows (iterable of tuples): `(pk, submission_uuid, feedback_text, option_id)`,
+                with one row for each option selected in a feedback model
+                (or a single row with an `option_id` of None if no options were selected),
+                ordered by feedback primary key.
 
         Returns:
-            None
+            set of the option IDs that were selected
 
         """
-        options_string = ",".join([
-            unicode(option.id) for option in assessment_feedback.options.all()
-        ])
+        option_ids = set()
+        feedback_list = []
+        feedback_by_pk = dict()
+        for pk, submission_uuid, feedback_text, option_id in feedback_rows:
+            if pk not in feedback_by_pk:
+                feedback_by_pk[pk] = (submission_uuid, feedback_text, [])
+                feedback_list.append(feedback_by_pk[pk])
+            if option_id is not None:
+                feedback_by_pk[pk][2].append(option_id)
+                option_ids.add(option_id)
+
+        for submission_uuid, feedback_text, feedback_option_ids in feedback_list:
+            self._write_unicode('assessment_feedback', [
+                submission_uuid,
+                feedback_text,
+                ",".join(unicode(option_id) for option_id in feedback_option_ids)
+            ])
 
-        self._write_unicode('assessment_feedback', [
-            assessment_feedback.submission_uuid,
-            assessment_feedback.feedback_text,
-            options_string
-        ])
+        return option_ids
 
-    def _write_feedback_options_to_csv(self, feedback_options):
+    def write_feedback_options_to_csv(self, feedback_option_ids):
         """
         Write feedback on assessment options to CSV.
 
         Args:
-            feedback_options (iterable of AssessmentFeedbackOption)
+            feedback_option_ids (iterable of int): The IDs of the options to write.
 
         Returns:
             None
 
         """
-        for option in feedback_options:
+        option_texts = AssessmentFeedbackOption.texts_for_ids(feedback_option_ids)
+        for option_id in sorted(option_texts):
             self._write_unicode(
                 'assessment_feedback_option',
-                [option.id, option.text]
+                [option_id, option_texts[option_id]]
             )
 
     def _write_unicode(self, output_name, row):
@@ -318,7 +553,8 @@ class CsvWriter(object):
             encoded_row = [unicode(field).encode('utf-8') for field in row]
             writer.writerow(encoded_row)
 
-    def _use_read_replica(self, queryset):
+    @staticmethod
+    def _use_read_replica(queryset):
         """
         Use the read replica if it's available.
 
@@ -4,8 +4,14 @@ associated with submissions. This can be used to upload new files and provide
 URLs to the new location.
 
 """
+import logging
 
 from . import backends
+from . import url_cache
+from .backends.base import Settings
+from .exceptions import FileUploadInternalError
+
+logger = logging.getLogger("openassessment.fileupload.api")
 
 def get_upload_url(key, content_type):
     """
@@ -16,5 +22,58 @@ def get_upload_url(key, content_type):
 def get_download_url(key):
     """
     Returns the url at which the file that corresponds to the key can be downloaded.
+    Signed URLs are cached while they remain valid (see `url_cache`).
+    """
+    return get_download_urls([key])[key]
+
+def get_download_urls(keys):
+    """
+    Returns a dict mapping each key to the url at which the corresponding file can be downloaded.
+    URLs are generated in one pass, so prefer this to calling `get_download_url` for each key.
+    Signed URLs are cached while they remain valid (see `url_cache`).
+    """
+    return url_cache.get_download_urls(backends.get_backend(), keys)
+
+def deduplicate(key):
+    """
+    Moves the file uploaded for the key to the content-addressed store, if the
+    ORA2_FILEUPLOAD_DEDUPLICATE setting is enabled, so identical files are stored once.
+    Returns the content hash of the stored file, or None if nothing was stored.
+
+    If the setting is disabled, a key deduplicated earlier is removed from the store
+    once a new file is uploaded for it.
+    """
+    backend = backends.get_backend()
+    if not Settings.deduplicate():
+        if backend.release_if_replaced(key):
+            url_cache.invalidate(backend, [key])
+        return None
+    content_hash = backend.deduplicate(key)
+    if content_hash is not None:
+        url_cache.invalidate(backend, [key])
+    return content_hash
+
+def deduplicate_async(key):
+    """
+    Schedules a task to move the file uploaded for the key to the content-addressed store
+    (see `deduplicate`), so the file is not downloaded and hashed during the request.
+    Raises FileUploadInternalError if the task could not be scheduled.
+    """
+    # Imported here, since the tasks module imports this module
+    from .tasks import deduplicate_task
+    try:
+        deduplicate_task.apply_async(args=[key])
+    except Exception as ex:
+        logger.exception(u"Unable to schedule deduplication of the file with key {}".format(key))
+        raise FileUploadInternalError(ex)
+
+def release(key):
+    """
+    Removes the key from the content-addressed store; its file is deleted once no other key refers to it.
+    Returns True if the key was in the store.
     """
-    return backends.get_backend().get_download_url(key)
+    backend = backends.get_backend()
+    released = backend.release(key)
+    if released:
+        url_cache.invalidate(backend, [key])
+    return released
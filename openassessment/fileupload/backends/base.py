@@ -1,9 +1,14 @@
 import abc
+import logging
 
 from django.conf import settings
+from django.db import DatabaseError
 
 from ..exceptions import FileUploadInternalError
 from ..exceptions import FileUploadRequestError
+from ..models import AttachmentReference
+
+logger = logging.getLogger("openassessment.fileupload.api")
 
 
 class Settings(object):
@@ -21,6 +26,14 @@ class Settings(object):
     """
     DEFAULT_FILE_UPLOAD_STORAGE_PREFIX = "submissions_attachments"
 
+    @classmethod
+    def deduplicate(cls):
+        """Return True if uploaded files are moved to the content-addressed store.
+
+        Defaults to False (the ORA2_FILEUPLOAD_DEDUPLICATE setting).
+        """
+        return getattr(settings, "ORA2_FILEUPLOAD_DEDUPLICATE", False)
+
     @classmethod
     def get_bucket_name(cls):
         bucket_name = getattr(settings, "FILE_UPLOAD_STORAGE_BUCKET_NAME", None)
@@ -38,6 +51,12 @@ class Settings(object):
 
 
 class BaseBackend(object):
+    """
+    Base class of file upload backends.
+
+    Backends that support the content-addressed store (see `deduplicate`)
+    implement `_hash_content`, `_store_blob`, `_delete_blob` and `_delete_content`.
+    """
 
     __metaclass__ = abc.ABCMeta
 
@@ -90,6 +109,204 @@ class BaseBackend(object):
         """
         raise NotImplementedError
 
+    def get_download_urls(self, keys):
+        """Requests URLs to download the files related to many keys.
+
+        Backends can override this to share connections and cache lookups
+        between the keys.
+
+        Args:
+            keys (list of str): Unique identifiers of the data requested for download.
+
+        Returns:
+            A dict mapping each key to a URL (str) for downloading the related file,
+            or an empty string if no file is found.
+
+        """
+        return {key: self.get_download_url(key) for key in keys}
+
+    def deduplicate(self, key):
+        """Move the file uploaded for a key to the content-addressed store.
+
+        The file is stored once as a blob named by the hash of its content,
+        however many keys refer to it, and downloads of the key are served from the blob.
+        If the key referred to another blob, that reference is released.
+
+        Args:
+            key (str): The unique identifier of the uploaded file.
+
+        Returns:
+            The content hash (str) of the blob, or None if no file was uploaded
+            for the key since it was last deduplicated.
+
+        Raises:
+            FileUploadInternalError
+            FileUploadRequestError
+
+        """
+        _, key_name = self._retrieve_parameters(key)
+        hashed = self._hash_content(key_name)
+        if hashed is None:
+            return None
+        content_hash, size = hashed
+        try:
+            AttachmentReference.link(
+                key, content_hash, size,
+                lambda content_hash: self._store_blob(key_name, content_hash),
+                self._delete_blob
+            )
+        except DatabaseError as ex:
+            logger.exception(u"An internal exception occurred while deduplicating a file.")
+            raise FileUploadInternalError(ex)
+        # The blob is committed, so the uploaded copy is no longer needed.
+        self._delete_content(key_name)
+        return content_hash
+
+    def release(self, key):
+        """Remove a key from the content-addressed store.
+
+        The blob of the key is deleted once no other key refers to it.
+
+        Args:
+            key (str): The unique identifier of the file.
+
+        Returns:
+            True if the key was in the content-addressed store.
+
+        Raises:
+            FileUploadInternalError
+            FileUploadRequestError
+
+        """
+        self._retrieve_parameters(key)
+        try:
+            return AttachmentReference.unlink(key, self._delete_blob)
+        except DatabaseError as ex:
+            logger.exception(u"An internal exception occurred while releasing a file.")
+            raise FileUploadInternalError(ex)
+
+    def release_if_replaced(self, key):
+        """Remove a key from the content-addressed store if a file has been uploaded
+        for it since it was deduplicated, so downloads of the key are served from the new file.
+
+        Used instead of `deduplicate` while deduplication is disabled.
+
+        Args:
+            key (str): The unique identifier of the file.
+
+        Returns:
+            True if the key was removed from the content-addressed store.
+
+        Raises:
+            FileUploadInternalError
+            FileUploadRequestError
+
+        """
+        _, key_name = self._retrieve_parameters(key)
+        try:
+            if not AttachmentReference.content_hashes([key]):
+                return False
+            if self._hash_content(key_name) is None:
+                return False
+            return AttachmentReference.unlink(key, self._delete_blob)
+        except DatabaseError as ex:
+            logger.exception(u"An internal exception occurred while releasing a file.")
+            raise FileUploadInternalError(ex)
+
+    def _hash_content(self, key_name):
+        """Hash the content of a stored file.
+
+        Args:
+            key_name (str): The complete key of the file.
+
+        Returns:
+            A tuple of the SHA-256 hex digest of the content and its size in bytes,
+            or None if there is no file.
+
+        Raises:
+            FileUploadInternalError
+
+        """
+        raise NotImplementedError
+
+    def _store_blob(self, key_name, content_hash):
+        """Copy a stored file to the blob for its content hash, unless the blob exists.
+
+        Args:
+            key_name (str): The complete key of the file.
+            content_hash (str): The hash of its content.
+
+        Raises:
+            FileUploadInternalError
+
+        """
+        raise NotImplementedError
+
+    def _delete_blob(self, content_hash):
+        """Delete the blob with a content hash from storage.
+
+        Args:
+            content_hash (str): The hash of the blob content.
+
+        Raises:
+            FileUploadInternalError
+
+        """
+        raise NotImplementedError
+
+    def _delete_content(self, key_name):
+        """Delete a stored file (but not its blob).
+
+        Args:
+            key_name (str): The complete key of the file.
+
+        Raises:
+            FileUploadInternalError
+
+        """
+        raise NotImplementedError
+
+    def _get_download_key_names(self, keys):
+        """Construct the key names from which the files of many keys are downloaded.
+
+        Keys in the content-addressed store are downloaded from their blob,
+        which is looked up for all the keys with one query.
+
+        Args:
+            keys (list of str): Keys to identify the data.
+
+        Returns:
+            A dict mapping each key to a key name (str).
+
+        Raises:
+            FileUploadInternalError
+        """
+        key_names = {key: self._get_key_name(key) for key in keys}
+        # Deduplicated keys are looked up even if deduplication has since been disabled,
+        # since their uploaded copies were deleted.
+        try:
+            content_hashes = AttachmentReference.content_hashes(keys)
+        except DatabaseError as ex:
+            logger.exception(u"An internal exception occurred while looking up deduplicated files.")
+            raise FileUploadInternalError(ex)
+        for key, content_hash in content_hashes.iteritems():
+            key_names[key] = self._get_blob_key_name(content_hash)
+        return key_names
+
+    def _get_blob_key_name(self, content_hash):
+        """Construct the key name of the blob with a content hash.
+
+        Args:
+            content_hash (str): The hash of the blob content.
+
+        Returns:
+            A key name (str).
+        """
+        return "{prefix}/blobs/{content_hash}".format(
+            prefix=Settings.get_prefix(),
+            content_hash=content_hash
+        )
+
     def _retrieve_parameters(self, key):
         """
         Simple utility function to validate settings and arguments before compiling
@@ -1,10 +1,15 @@
 
+import hashlib
+import json
+import os
+
 from .base import BaseBackend
 from .. import exceptions
 
 from django.conf import settings
 import django.core.cache
 from django.core.urlresolvers import reverse
+from openassessment.cache import CacheNamespace
 
 
 class Backend(BaseBackend):
@@ -38,14 +43,72 @@ class Backend(BaseBackend):
         return self._get_url(key)
 
     def get_download_url(self, key):
-        make_download_url_available(self._get_key_name(key), self.DOWNLOAD_URL_TIMEOUT)
-        return self._get_url(key)
+        return self.get_download_urls([key])[key]
+
+    def get_download_urls(self, keys):
+        key_names = self._get_download_key_names(keys)
+        make_download_urls_available(key_names.values(), self.DOWNLOAD_URL_TIMEOUT)
+        return {key: self._get_url_for_key_name(key_name) for key, key_name in key_names.iteritems()}
 
     def _get_url(self, key):
-        key_name = self._get_key_name(key)
+        return self._get_url_for_key_name(self._get_key_name(key))
+
+    def _get_url_for_key_name(self, key_name):
         url = reverse("openassessment-filesystem-storage", kwargs={'key': key_name})
         return url
 
+    def _hash_content(self, key_name):
+        # Imported here, since views_filesystem imports this module
+        from .. import views_filesystem
+        try:
+            content_file = open(views_filesystem.get_file_path(key_name), 'rb')
+        except IOError:
+            return None
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            with content_file:
+                for chunk in iter(lambda: content_file.read(views_filesystem.CHUNK_SIZE), ''):
+                    sha256.update(chunk)
+                    size += len(chunk)
+        except IOError as ex:
+            raise exceptions.FileUploadInternalError(ex)
+        return sha256.hexdigest(), size
+
+    def _store_blob(self, key_name, content_hash):
+        from .. import views_filesystem
+        blob_key_name = self._get_blob_key_name(content_hash)
+        blob_path = views_filesystem.get_file_path(blob_key_name)
+        if os.path.exists(blob_path):
+            return
+        metadata = views_filesystem.get_metadata(key_name)
+        try:
+            with open(views_filesystem.get_file_path(key_name), 'rb') as content_file:
+                views_filesystem.safe_save(
+                    blob_path, iter(lambda: content_file.read(views_filesystem.CHUNK_SIZE), '')
+                )
+            views_filesystem.safe_save(views_filesystem.get_metadata_path(blob_key_name), json.dumps(metadata))
+        except (IOError, OSError) as ex:
+            raise exceptions.FileUploadInternalError(ex)
+        get_metadata_cache().set(blob_key_name, metadata)
+
+    def _delete_blob(self, content_hash):
+        self._delete_content(self._get_blob_key_name(content_hash))
+
+    def _delete_content(self, key_name):
+        from .. import views_filesystem
+        try:
+            views_filesystem.safe_remove(views_filesystem.get_file_path(key_name))
+            views_filesystem.safe_remove(views_filesystem.get_metadata_path(key_name))
+        except OSError as ex:
+            raise exceptions.FileUploadInternalError(ex)
+        get_metadata_cache().delete(key_name)
+        try:
+            os.rmdir(views_filesystem.get_data_path(key_name))
+        except OSError:
+            # The directory is not empty, or is already gone
+            pass
+
 
 def get_cache():
     """
@@ -63,6 +126,27 @@ def get_cache():
     return django.core.cache.get_cache(cache_name)
 
 
+def get_upload_url_cache():
+    """
+    Returns the cache namespace for authorized upload URLs.
+    """
+    return CacheNamespace(u"fileupload.upload_url", backend=get_cache())
+
+
+def get_download_url_cache():
+    """
+    Returns the cache namespace for authorized download URLs.
+    """
+    return CacheNamespace(u"fileupload.download_url", backend=get_cache())
+
+
+def get_metadata_cache():
+    """
+    Returns the cache namespace for the metadata of stored files.
+    """
+    return CacheNamespace(u"fileupload.metadata", backend=get_cache())
+
+
 def make_upload_url_available(url_key_name, timeout):
     """
     Authorize an upload URL.
@@ -71,10 +155,7 @@ def make_upload_url_available(url_key_name, timeout):
         url_key_name (str): key that uniquely identifies the upload url
         timeout (int): time in seconds before the url expires
     """
-    return get_cache().set(
-        get_upload_cache_key(url_key_name),
-        1, timeout
-    )
+    return get_upload_url_cache().set(url_key_name, 1, timeout)
 
 def make_download_url_available(url_key_name, timeout):
     """
@@ -84,25 +165,26 @@ def make_download_url_available(url_key_name, timeout):
         url_key_name (str): key that uniquely identifies the url
         timeout (int): time in seconds before the url expires
     """
-    return get_cache().set(
-        get_download_cache_key(url_key_name),
-        1, timeout
-    )
+    return get_download_url_cache().set(url_key_name, 1, timeout)
+
+def make_download_urls_available(url_key_names, timeout):
+    """
+    Authorize several download URLs in one cache round trip.
+
+    Arguments:
+        url_key_names (list of str): keys that uniquely identify the urls
+        timeout (int): time in seconds before the urls expire
+    """
+    return get_download_url_cache().set_many({url_key_name: 1 for url_key_name in url_key_names}, timeout)
 
 def is_upload_url_available(url_key_name):
     """
     Return True if the corresponding upload URL is available.
     """
-    return get_cache().get(get_upload_cache_key(url_key_name)) is not None
+    return get_upload_url_cache().get(url_key_name) is not None
 
 def is_download_url_available(url_key_name):
     """
     Return True if the corresponding download URL is available.
     """
-    return get_cache().get(get_download_cache_key(url_key_name)) is not None
-
-def get_upload_cache_key(url_key_name):
-    return "upload/" + url_key_name
-
-def get_download_cache_key(url_key_name):
-    return "download/" + url_key_name
+    return get_download_url_cache().get(url_key_name) is not None
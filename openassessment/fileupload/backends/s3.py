@@ -1,13 +1,27 @@
 import boto
+import hashlib
 import logging
+import os
+import threading
 from django.conf import settings
 
 logger = logging.getLogger("openassessment.fileupload.api")
 
-from .base import BaseBackend
+from openassessment.cache import CacheNamespace
+from .base import BaseBackend, Settings
 from ..exceptions import FileUploadInternalError
 
 
+# Keys known to exist in S3, so each key is checked at most once.
+# Keys that don't exist yet are not cached, since the file may be uploaded at any time.
+KEY_EXISTS_CACHE = CacheNamespace(u"fileupload.s3.key_exists", timeout=24 * 60 * 60)
+
+# S3 connections shared by every request in the process, keyed by process ID and credentials.
+# Reusing a connection lets boto reuse its pooled HTTP connections to S3.
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
+
 class Backend(BaseBackend):
 
     def get_upload_url(self, key, content_type):
@@ -30,23 +44,149 @@ class Backend(BaseBackend):
 
 
     def get_download_url(self, key):
-        bucket_name, key_name = self._retrieve_parameters(key)
+        """
+        Sign a download URL locally, without requests to S3.
+
+        If the `ORA2_FILEUPLOAD_S3_CHECK_EXISTS` setting is true (the default),
+        first check that the key exists, returning an empty string if it doesn't.
+        Keys that exist are cached, so the check costs one request per key.
+        """
+        return self.get_download_urls([key])[key]
+
+    def get_download_urls(self, keys):
+        """
+        Sign download URLs for many keys with one connection,
+        checking the cache for all the keys at once (see `get_download_url`).
+        """
+        bucket_names = {key: self._retrieve_parameters(key)[0] for key in keys}
+        key_names = {
+            key: (bucket_names[key], key_name)
+            for key, key_name in self._get_download_key_names(keys).iteritems()
+        }
         try:
             conn = _connect_to_s3()
-            bucket = conn.get_bucket(bucket_name)
-            s3_key = bucket.get_key(key_name)
-            return s3_key.generate_url(expires_in=self.DOWNLOAD_URL_TIMEOUT) if s3_key else ""
+            if _check_exists():
+                existing = _existing_keys(conn, key_names.values())
+            else:
+                existing = set(key_names.values())
+            return {
+                key: conn.generate_url(
+                    expires_in=self.DOWNLOAD_URL_TIMEOUT,
+                    method='GET',
+                    bucket=bucket_name,
+                    key=key_name
+                ) if (bucket_name, key_name) in existing else ""
+                for key, (bucket_name, key_name) in key_names.iteritems()
+            }
         except Exception as ex:
             logger.exception(
                 u"An internal exception occurred while generating a download URL."
             )
             raise FileUploadInternalError(ex)
 
+    def _hash_content(self, key_name):
+        """
+        Hash the content of a key by streaming it from S3.
+
+        The ETag of a key is not used, since it is only the MD5 of simple uploads.
+        """
+        try:
+            key = _get_bucket(_connect_to_s3()).get_key(key_name)
+            if key is None:
+                return None
+            sha256 = hashlib.sha256()
+            size = 0
+            try:
+                for chunk in key:
+                    sha256.update(chunk)
+                    size += len(chunk)
+            finally:
+                key.close()
+            return sha256.hexdigest(), size
+        except Exception as ex:
+            logger.exception(
+                u"An internal exception occurred while hashing an uploaded file."
+            )
+            raise FileUploadInternalError(ex)
+
+    def _store_blob(self, key_name, content_hash):
+        """
+        Copy a key to its blob within S3 (the content is not downloaded).
+        Copying to an existing blob replaces it with the same content.
+        """
+        try:
+            bucket = _get_bucket(_connect_to_s3())
+            bucket.copy_key(self._get_blob_key_name(content_hash), bucket.name, key_name)
+        except Exception as ex:
+            logger.exception(
+                u"An internal exception occurred while storing a blob."
+            )
+            raise FileUploadInternalError(ex)
+
+    def _delete_blob(self, content_hash):
+        self._delete_content(self._get_blob_key_name(content_hash))
+
+    def _delete_content(self, key_name):
+        try:
+            bucket = _get_bucket(_connect_to_s3())
+            bucket.delete_key(key_name)
+        except Exception as ex:
+            logger.exception(
+                u"An internal exception occurred while deleting a file."
+            )
+            raise FileUploadInternalError(ex)
+        KEY_EXISTS_CACHE.delete((bucket.name, key_name.decode('utf-8') if isinstance(key_name, str) else key_name))
+
+def _get_bucket(conn):
+    """Returns the configured bucket, without validating it."""
+    return conn.get_bucket(Settings.get_bucket_name(), validate=False)
+
+
+def _check_exists():
+    """Whether to check that keys exist before signing download URLs."""
+    return getattr(settings, 'ORA2_FILEUPLOAD_S3_CHECK_EXISTS', True)
+
+
+def _existing_keys(conn, bucket_and_key_names):
+    """Check which keys exist in S3.
+
+    Keys that exist are cached.  Each key missing from the cache costs a single
+    HEAD request (buckets are not validated).
+
+    Args:
+        conn (S3Connection): The connection to S3.
+        bucket_and_key_names (list of tuple): `(bucket name, key name)` tuples.
+
+    Returns:
+        set of the `(bucket name, key name)` tuples that exist.
+
+    """
+    cache_keys = {
+        (bucket_name, key_name.decode('utf-8') if isinstance(key_name, str) else key_name): (bucket_name, key_name)
+        for bucket_name, key_name in bucket_and_key_names
+    }
+    cached = KEY_EXISTS_CACHE.get_many(cache_keys.keys())
+    existing = set(cache_keys[cache_key] for cache_key in cached)
+
+    found = {}
+    for cache_key, (bucket_name, key_name) in cache_keys.iteritems():
+        if cache_key in cached:
+            continue
+        bucket = conn.get_bucket(bucket_name, validate=False)
+        if bucket.get_key(key_name) is not None:
+            existing.add((bucket_name, key_name))
+            found[cache_key] = True
+
+    if found:
+        KEY_EXISTS_CACHE.set_many(found)
+    return existing
+
 
 def _connect_to_s3():
     """Connect to s3
 
-    Creates a connection to s3 for file URLs.
+    Returns the process's connection to s3 for file URLs, creating it if necessary.
+    Connections are not shared with forked processes.
 
     """
     # Try to get the AWS credentials from settings if they are available
@@ -55,9 +195,23 @@ def _connect_to_s3():
     aws_access_key_id = getattr(settings, 'AWS_ACCESS_KEY_ID', None)
     aws_secret_access_key = getattr(settings, 'AWS_SECRET_ACCESS_KEY', None)
 
-    return boto.connect_s3(
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key
-    )
+    pid = os.getpid()
+    connection_key = (pid, aws_access_key_id, aws_secret_access_key)
+    with _CONNECTIONS_LOCK:
+        conn = _CONNECTIONS.get(connection_key)
+        if conn is None:
+            # Drop connections inherited from a parent process
+            for inherited_key in [other for other in _CONNECTIONS if other[0] != pid]:
+                del _CONNECTIONS[inherited_key]
+            conn = boto.connect_s3(
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key
+            )
+            _CONNECTIONS[connection_key] = conn
+        return conn
 
 
+def reset_connections():
+    """Forget the shared s3 connections, so the next request creates a new connection."""
+    with _CONNECTIONS_LOCK:
+        _CONNECTIONS.clear()
@@ -25,3 +25,8 @@ class FileUploadRequestError(FileUploadError):
 
     """
     pass
+
+
+class FileTooLargeError(FileUploadRequestError):
+    """This error is raised when an uploaded file exceeds the maximum upload size."""
+    pass
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'AttachmentBlob'
+        db.create_table('fileupload_attachmentblob', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('content_hash', self.gf('django.db.models.fields.CharField')(unique=True, max_length=64)),
+            ('size', self.gf('django.db.models.fields.BigIntegerField')(default=0)),
+            ('reference_count', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, db_index=True)),
+        ))
+        db.send_create_signal('fileupload', ['AttachmentBlob'])
+
+        # Adding model 'AttachmentReference'
+        db.create_table('fileupload_attachmentreference', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('key_hash', self.gf('django.db.models.fields.CharField')(unique=True, max_length=40)),
+            ('key', self.gf('django.db.models.fields.TextField')()),
+            ('blob', self.gf('django.db.models.fields.related.ForeignKey')(related_name='references', to=orm['fileupload.AttachmentBlob'])),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, db_index=True)),
+        ))
+        db.send_create_signal('fileupload', ['AttachmentReference'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'AttachmentBlob'
+        db.delete_table('fileupload_attachmentblob')
+
+        # Deleting model 'AttachmentReference'
+        db.delete_table('fileupload_attachmentreference')
+
+
+    models = {
+        'fileupload.attachmentblob': {
+            'Meta': {'object_name': 'AttachmentBlob'},
+            'content_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '64'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'reference_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'size': ('django.db.models.fields.BigIntegerField', [], {'default': '0'})
+        },
+        'fileupload.attachmentreference': {
+            'Meta': {'object_name': 'AttachmentReference'},
+            'blob': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'references'", 'to': "orm['fileupload.AttachmentBlob']"}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'key': ('django.db.models.fields.TextField', [], {}),
+            'key_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        }
+    }
+
+    complete_apps = ['fileupload']
\ No newline at end of file
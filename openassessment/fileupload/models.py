@@ -0,0 +1,210 @@
+"""
+Index of the content-addressed attachment store.
+
+When deduplication is enabled (the ``ORA2_FILEUPLOAD_DEDUPLICATE`` setting),
+each uploaded file is moved to a blob named by the hash of its content,
+so identical files uploaded for different student items are stored once.
+These models map file keys to blobs and count the references to each blob,
+so a blob is deleted once no key refers to it.
+
+NOTE: We've switched to migrations, so if you make any edits to this file, you
+need to then generate a matching migration for it using:
+
+    ./manage.py schemamigration openassessment.fileupload --auto
+
+"""
+from hashlib import sha1
+from django.db import models, transaction, IntegrityError
+from django.utils.timezone import now
+
+
+class AttachmentBlob(models.Model):
+    """
+    A file in the content-addressed store, and the number of keys that refer to it.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField(default=0)
+    reference_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=now, db_index=True)
+
+    class Meta:
+        app_label = "fileupload"
+
+    @classmethod
+    def lock_or_create(cls, content_hash, size):
+        """
+        Retrieve and lock the blob with a content hash, creating it if necessary.
+        Must be called in a transaction.
+
+        Args:
+            content_hash (str): The hash of the file content.
+            size (int): The size of the file content in bytes.
+
+        Returns:
+            AttachmentBlob
+
+        """
+        try:
+            return cls.objects.select_for_update().get(content_hash=content_hash)
+        except cls.DoesNotExist:
+            pass
+
+        sid = transaction.savepoint()
+        try:
+            blob = cls.objects.create(content_hash=content_hash, size=size)
+            transaction.savepoint_commit(sid)
+            return blob
+        except IntegrityError:
+            # Another request created the blob first
+            transaction.savepoint_rollback(sid)
+            return cls.objects.select_for_update().get(content_hash=content_hash)
+
+
+class AttachmentReference(models.Model):
+    """
+    Maps a file key to the blob that holds its content.
+
+    Keys can be longer than an indexed column allows, so they are
+    looked up by their hash.
+    """
+    key_hash = models.CharField(max_length=40, unique=True)
+    key = models.TextField()
+    blob = models.ForeignKey(AttachmentBlob, related_name="references")
+    created_at = models.DateTimeField(default=now, db_index=True)
+
+    class Meta:
+        app_label = "fileupload"
+
+    @staticmethod
+    def hash_key(key):
+        """
+        The hash used to look up a key.
+
+        Args:
+            key (unicode or str): The file key.
+
+        Returns:
+            str
+
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return sha1(key).hexdigest()
+
+    @classmethod
+    def content_hashes(cls, keys):
+        """
+        Look up the blobs of many keys with one query.
+
+        Args:
+            keys (list): The file keys.
+
+        Returns:
+            dict mapping the keys that have a blob to the blob's content hash.
+
+        """
+        keys_by_hash = {cls.hash_key(key): key for key in keys}
+        if not keys_by_hash:
+            return {}
+        references = cls.objects.filter(
+            key_hash__in=keys_by_hash.keys()
+        ).values_list('key_hash', 'blob__content_hash')
+        return {keys_by_hash[key_hash]: content_hash for key_hash, content_hash in references}
+
+    @classmethod
+    @transaction.commit_on_success
+    def link(cls, key, content_hash, size, store_blob, delete_blob):
+        """
+        Point a key at the blob with a content hash, creating the blob record if necessary.
+        If the key referred to another blob, that reference is released (see `unlink`).
+
+        The blob is stored while its row is locked, so a concurrent `unlink`
+        cannot delete it from storage between the store and the commit.
+
+        To avoid deadlocks, rows are always locked in the same order:
+        the key's reference first, then its blobs, sorted by content hash.
+
+        Args:
+            key (unicode or str): The file key.
+            content_hash (str): The hash of the file content.
+            size (int): The size of the file content in bytes.
+            store_blob (callable): Called with the content hash to store the blob
+                (storing a blob that already exists must do nothing).
+            delete_blob (callable): Called with a content hash to delete a blob
+                from storage once no key refers to it.
+
+        Returns:
+            AttachmentBlob
+
+        """
+        key_hash = cls.hash_key(key)
+        try:
+            reference = cls.objects.select_for_update().get(key_hash=key_hash)
+        except cls.DoesNotExist:
+            reference = None
+
+        # The old blob can't be deleted while the reference is locked,
+        # and content hashes never change, so its hash can be read without a lock.
+        old_content_hash = None
+        if reference is not None:
+            old_content_hash = AttachmentBlob.objects.filter(
+                pk=reference.blob_id
+            ).values_list('content_hash', flat=True)[0]
+
+        blobs = {
+            locked_hash: AttachmentBlob.lock_or_create(locked_hash, size)
+            for locked_hash in sorted(set([content_hash, old_content_hash]) - set([None]))
+        }
+        blob = blobs[content_hash]
+        old_blob = blobs.get(old_content_hash)
+
+        store_blob(content_hash)
+        if reference is not None:
+            if reference.blob_id == blob.pk:
+                return blob
+            cls._release(reference, old_blob, delete_blob)
+
+        cls.objects.create(key_hash=key_hash, key=key, blob=blob)
+        AttachmentBlob.objects.filter(pk=blob.pk).update(reference_count=models.F('reference_count') + 1)
+        return blob
+
+    @classmethod
+    @transaction.commit_on_success
+    def unlink(cls, key, delete_blob):
+        """
+        Remove a key from the index.  If no other key refers to its blob,
+        delete the blob, from storage and then from the index.
+
+        The blob's row stays locked until the transaction commits,
+        so a concurrent `link` to the same content waits, and creates a new blob
+        (whose content it stores) only after the old blob is gone.
+        As in `link`, the reference is locked before the blob.
+
+        Args:
+            key (unicode or str): The file key.
+            delete_blob (callable): Called with a content hash to delete a blob from storage.
+
+        Returns:
+            bool: True if the key was in the index.
+
+        """
+        try:
+            reference = cls.objects.select_for_update().get(key_hash=cls.hash_key(key))
+        except cls.DoesNotExist:
+            return False
+        blob = AttachmentBlob.objects.select_for_update().get(pk=reference.blob_id)
+        cls._release(reference, blob, delete_blob)
+        return True
+
+    @classmethod
+    def _release(cls, reference, blob, delete_blob):
+        """
+        Delete a reference, and its blob if no other key refers to it.
+        Must be called in a transaction, with the reference and blob locked.
+        """
+        reference.delete()
+        if blob.reference_count <= 1:
+            delete_blob(blob.content_hash)
+            blob.delete()
+        else:
+            AttachmentBlob.objects.filter(pk=blob.pk).update(reference_count=models.F('reference_count') - 1)
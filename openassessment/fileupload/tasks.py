@@ -0,0 +1,43 @@
+"""
+Asynchronous tasks for the content-addressed attachment store.
+
+Deduplicating a file downloads and hashes its whole content, then copies
+and deletes it (see `BaseBackend.deduplicate`), which can take seconds
+for a large file in S3.  Running it in a task keeps that latency out of
+the request that submits the response.
+"""
+from celery import task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+from . import api
+from .exceptions import FileUploadError
+
+
+logger = get_task_logger(__name__)
+
+# If the Django settings define a low-priority queue, use that.
+# Otherwise, use the default queue.
+DEDUPLICATE_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
+
+
+@task(queue=DEDUPLICATE_TASK_QUEUE)  # pylint: disable=E1102
+def deduplicate_task(key):
+    """
+    Asynchronous task to move the file uploaded for a key to the content-addressed store.
+
+    If the file could not be deduplicated, it remains under its key,
+    so the error is logged rather than retried.
+
+    Args:
+        key (str): The unique identifier of the uploaded file.
+
+    Returns:
+        The content hash (str) of the stored file, or None if nothing was stored.
+
+    """
+    try:
+        return api.deduplicate(key)
+    except FileUploadError:
+        logger.exception(u"Unable to deduplicate the file with key {}".format(key))
+        return None
@@ -4,10 +4,12 @@ import boto
 from boto.s3.key import Key
 import ddt
 
+import hashlib
 import json
 import os
 import shutil
 import tempfile
+from StringIO import StringIO
 
 from django.conf import settings
 from django.test import TestCase
@@ -21,11 +23,17 @@ from nose.tools import raises
 from openassessment.fileupload import api
 from openassessment.fileupload import exceptions
 from openassessment.fileupload import views_filesystem as views
+from openassessment.fileupload.backends import s3 as s3_backend
 from openassessment.fileupload.backends.base import Settings as FileUploadSettings
 from openassessment.fileupload.backends.filesystem import get_cache as get_filesystem_cache
+from openassessment.test_utils import CacheResetTest
 
 @ddt.ddt
-class TestFileUploadService(TestCase):
+class TestFileUploadService(CacheResetTest):
+
+    def setUp(self):
+        super(TestFileUploadService, self).setUp()
+        s3_backend.reset_connections()
 
     @mock_s3
     @override_settings(
@@ -86,6 +94,115 @@ class TestFileUploadService(TestCase):
         mock_s3.side_effect = Exception("Oh noes")
         api.get_download_url("foo")
 
+    @mock_s3
+    @override_settings(
+        AWS_ACCESS_KEY_ID='foobar',
+        AWS_SECRET_ACCESS_KEY='bizbaz',
+        FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket"
+    )
+    def test_get_download_url_no_key(self):
+        conn = boto.connect_s3()
+        conn.create_bucket('mybucket')
+        self.assertEqual(api.get_download_url("foo"), "")
+
+    @mock_s3
+    @override_settings(
+        AWS_ACCESS_KEY_ID='foobar',
+        AWS_SECRET_ACCESS_KEY='bizbaz',
+        FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket"
+    )
+    def test_connection_reused(self):
+        with patch.object(boto, 'connect_s3', wraps=boto.connect_s3) as mock_connect:
+            api.get_upload_url("foo", "bar")
+            api.get_upload_url("baz", "bar")
+            api.get_download_url("foo")
+            self.assertEqual(mock_connect.call_count, 1)
+
+            # Different credentials use a different connection
+            with override_settings(AWS_ACCESS_KEY_ID='other'):
+                api.get_upload_url("foo", "bar")
+            self.assertEqual(mock_connect.call_count, 2)
+
+            # Forked processes create their own connections
+            with patch('openassessment.fileupload.backends.s3.os.getpid') as mock_getpid:
+                mock_getpid.return_value = -1
+                api.get_upload_url("foo", "bar")
+            self.assertEqual(mock_connect.call_count, 3)
+
+    @override_settings(
+        AWS_ACCESS_KEY_ID='foobar',
+        AWS_SECRET_ACCESS_KEY='bizbaz',
+        FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket",
+        ORA2_FILEUPLOAD_S3_CHECK_EXISTS=False
+    )
+    @patch('boto.s3.connection.S3Connection.make_request')
+    def test_get_download_url_signed_locally(self, mock_request):
+        mock_request.side_effect = Exception("No requests to S3!")
+        download_url = api.get_download_url("foo")
+        self.assertIn("https://mybucket.s3.amazonaws.com/submissions_attachments/foo", download_url)
+        self.assertIn("Signature=", download_url)
+
+    @mock_s3
+    @override_settings(
+        AWS_ACCESS_KEY_ID='foobar',
+        AWS_SECRET_ACCESS_KEY='bizbaz',
+        FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket"
+    )
+    def test_key_exists_cached(self):
+        conn = boto.connect_s3()
+        bucket = conn.create_bucket('mybucket')
+
+        # Keys that don't exist yet are checked again
+        self.assertEqual(api.get_download_url("foo"), "")
+        key = Key(bucket)
+        key.key = "submissions_attachments/foo"
+        key.set_contents_from_string("How d'ya do?")
+        self.assertIn("submissions_attachments/foo", api.get_download_url("foo"))
+
+        # Once a key is known to exist, URLs are signed without requests to S3
+        with patch('boto.s3.connection.S3Connection.make_request') as mock_request:
+            mock_request.side_effect = Exception("No requests to S3!")
+            download_url = s3_backend.Backend().get_download_url("foo")
+        self.assertIn("https://mybucket.s3.amazonaws.com/submissions_attachments/foo", download_url)
+
+    @mock_s3
+    @override_settings(
+        AWS_ACCESS_KEY_ID='foobar',
+        AWS_SECRET_ACCESS_KEY='bizbaz',
+        FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket"
+    )
+    def test_get_download_urls(self):
+        conn = boto.connect_s3()
+        bucket = conn.create_bucket('mybucket')
+        for key_name in ["foo", "bar"]:
+            key = Key(bucket)
+            key.key = "submissions_attachments/" + key_name
+            key.set_contents_from_string("How d'ya do?")
+
+        with patch.object(boto, 'connect_s3', wraps=boto.connect_s3) as mock_connect:
+            download_urls = api.get_download_urls(["foo", "bar", "baz"])
+            self.assertEqual(mock_connect.call_count, 1)
+
+        self.assertEqual(set(download_urls.keys()), set(["foo", "bar", "baz"]))
+        self.assertIn("https://mybucket.s3.amazonaws.com/submissions_attachments/foo", download_urls["foo"])
+        self.assertIn("https://mybucket.s3.amazonaws.com/submissions_attachments/bar", download_urls["bar"])
+        self.assertEqual(download_urls["baz"], "")
+
+        # Keys known to exist are signed without requests to S3
+        with patch('boto.s3.connection.S3Connection.make_request') as mock_request:
+            mock_request.side_effect = Exception("No requests to S3!")
+            download_urls = s3_backend.Backend().get_download_urls(["foo", "bar"])
+        self.assertIn("submissions_attachments/foo", download_urls["foo"])
+        self.assertIn("submissions_attachments/bar", download_urls["bar"])
+
+    def test_get_download_urls_no_keys(self):
+        self.assertEqual(api.get_download_urls([]), {})
+
+    @override_settings(FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket")
+    @raises(exceptions.FileUploadRequestError)
+    def test_get_download_urls_empty_key(self):
+        api.get_download_urls(["foo", ""])
+
 
 @override_settings(
     ORA2_FILEUPLOAD_BACKEND="filesystem",
@@ -93,6 +210,7 @@ class TestFileUploadService(TestCase):
     ORA2_FILEUPLOAD_CACHE_NAME='default',
     FILE_UPLOAD_STORAGE_BUCKET_NAME="testbucket",
 )
+@ddt.ddt
 class TestFileUploadServiceWithFilesystemBackend(TestCase):
     """
     Test open assessment file upload to local file storage.
@@ -242,6 +360,157 @@ class TestFileUploadServiceWithFilesystemBackend(TestCase):
         with open(file_path) as f:
             self.assertEqual(self.content.read(), f.read())
 
+    def test_get_download_urls(self):
+        views.save_to_file(self.key_name, "uploaded content")
+        download_urls = self.backend.get_download_urls([self.key, "other.jpg"])
+
+        self.assertEqual(download_urls[self.key], self.backend.get_download_url(self.key))
+        self.assertEqual(200, self.client.get(download_urls[self.key]).status_code)
+        self.assertIn("/other.jpg", download_urls["other.jpg"])
+
+    def _upload(self):
+        """Upload the test content, returning its download URL."""
+        upload_url = self.backend.get_upload_url(self.key, self.content_type)
+        self.client.put(upload_url, data=self.content.read(), content_type=self.content_type)
+        self.content.seek(0)
+        return self.backend.get_download_url(self.key)
+
+    def test_download_headers(self):
+        download_response = self.client.get(self._upload())
+        metadata = json.load(open(views.get_metadata_path(self.key_name)))
+
+        self.assertEqual(200, download_response.status_code)
+        self.assertEqual(str(len("foobar content")), download_response['Content-Length'])
+        self.assertEqual('"%s"' % metadata["Content-MD5"], download_response['ETag'])
+        self.assertEqual('bytes', download_response['Accept-Ranges'])
+
+    def test_download_streamed(self):
+        self._upload()
+        with patch('openassessment.fileupload.views_filesystem.CHUNK_SIZE', 4):
+            response = views.download_file(self.key_name)
+            chunks = list(response)
+        self.assertEqual(chunks, ["foob", "ar c", "onte", "nt"])
+
+    @ddt.data(
+        ("bytes=0-5", "foobar", "bytes 0-5/14"),
+        ("bytes=7-", "content", "bytes 7-13/14"),
+        ("bytes=7-100", "content", "bytes 7-13/14"),
+        ("bytes=-4", "tent", "bytes 10-13/14"),
+        ("bytes=-100", "foobar content", "bytes 0-13/14"),
+    )
+    @ddt.unpack
+    def test_download_range(self, range_header, expected_content, expected_content_range):
+        download_response = self.client.get(self._upload(), HTTP_RANGE=range_header)
+        self.assertEqual(206, download_response.status_code)
+        self.assertEqual(expected_content, download_response.content)
+        self.assertEqual(expected_content_range, download_response['Content-Range'])
+        self.assertEqual(str(len(expected_content)), download_response['Content-Length'])
+
+    @ddt.data("bytes=14-", "bytes=100-200", "bytes=-0")
+    def test_download_range_not_satisfiable(self, range_header):
+        download_response = self.client.get(self._upload(), HTTP_RANGE=range_header)
+        self.assertEqual(416, download_response.status_code)
+        self.assertEqual("bytes */14", download_response['Content-Range'])
+
+    @ddt.data("bytes=0-1,4-5", "bytes=5-1", "lines=1-2", "bytes=-")
+    def test_download_range_ignored(self, range_header):
+        download_response = self.client.get(self._upload(), HTTP_RANGE=range_header)
+        self.assertEqual(200, download_response.status_code)
+        self.assertEqual("foobar content", download_response.content)
+
+    def test_download_if_range(self):
+        download_url = self._upload()
+        etag = self.client.get(download_url)['ETag']
+
+        download_response = self.client.get(download_url, HTTP_RANGE="bytes=0-5", HTTP_IF_RANGE=etag)
+        self.assertEqual(206, download_response.status_code)
+
+        # The file changed, so send all of it
+        download_response = self.client.get(download_url, HTTP_RANGE="bytes=0-5", HTTP_IF_RANGE='"other"')
+        self.assertEqual(200, download_response.status_code)
+        self.assertEqual("foobar content", download_response.content)
+
+    def test_download_not_modified(self):
+        download_url = self._upload()
+        etag = self.client.get(download_url)['ETag']
+
+        download_response = self.client.get(download_url, HTTP_IF_NONE_MATCH='"other", ' + etag)
+        self.assertEqual(304, download_response.status_code)
+        self.assertEqual("", download_response.content)
+        self.assertEqual(etag, download_response['ETag'])
+
+    def test_download_metadata_cached(self):
+        download_url = self._upload()
+        os.remove(views.get_metadata_path(self.key_name))
+        download_response = self.client.get(download_url)
+        self.assertEqual(self.content_type, download_response['Content-Type'])
+
+    @override_settings(ORA2_FILEUPLOAD_SENDFILE="x-sendfile")
+    def test_download_x_sendfile(self):
+        download_response = self.client.get(self._upload())
+        self.assertEqual(200, download_response.status_code)
+        self.assertEqual("", download_response.content)
+        self.assertEqual(views.get_file_path(self.key_name), download_response['X-Sendfile'])
+        self.assertEqual(self.content_type, download_response['Content-Type'])
+        self.assertIn('ETag', download_response)
+
+    @override_settings(
+        ORA2_FILEUPLOAD_SENDFILE="x-accel-redirect",
+        ORA2_FILEUPLOAD_ACCEL_REDIRECT_PREFIX="/protected/"
+    )
+    def test_download_x_accel_redirect(self):
+        self.set_key("noël.jpg")
+        download_response = self.client.get(self._upload())
+        self.assertEqual(200, download_response.status_code)
+        self.assertEqual("", download_response.content)
+        self.assertEqual(
+            "/protected/testbucket/submissions_attachments/no%C3%ABl.jpg/content",
+            download_response['X-Accel-Redirect']
+        )
+
+    @override_settings(ORA2_FILEUPLOAD_SENDFILE="x-accel-redirect")
+    def test_x_accel_redirect_no_prefix(self):
+        self.assertRaises(exceptions.FileUploadInternalError, views.sendfile_header, views.get_file_path(self.key_name))
+
+    @override_settings(ORA2_FILEUPLOAD_SENDFILE="carrier-pigeon")
+    def test_invalid_sendfile_setting(self):
+        self.assertRaises(exceptions.FileUploadInternalError, views.sendfile_header, views.get_file_path(self.key_name))
+
+    def test_upload_streamed(self):
+        content = "".join(chr(num % 256) for num in range(1000))
+        with patch('openassessment.fileupload.views_filesystem.CHUNK_SIZE', 64):
+            views.save_stream_to_file(self.key_name, StringIO(content), {"Content-Type": "image/png"})
+
+        with open(views.get_file_path(self.key_name), 'rb') as f:
+            self.assertEqual(content, f.read())
+        metadata = json.load(open(views.get_metadata_path(self.key_name)))
+        self.assertEqual(hashlib.md5(content).hexdigest(), metadata["Content-MD5"])
+        self.assertEqual("1000", metadata["Content-Length"])
+        self.assertEqual("image/png", metadata["Content-Type"])
+
+    @override_settings(ORA2_FILEUPLOAD_MAX_SIZE=10)
+    def test_upload_too_large(self):
+        upload_url = self.backend.get_upload_url(self.key, self.content_type)
+        upload_response = self.client.put(upload_url, data=self.content.read(), content_type=self.content_type)
+        self.assertEqual(413, upload_response.status_code)
+        self.assertFalse(os.path.exists(views.get_file_path(self.key_name)))
+
+    def test_upload_too_large_while_streaming(self):
+        views.save_to_file(self.key_name, "old content")
+
+        # The stream doesn't declare its length, so the limit is enforced while reading
+        with patch('openassessment.fileupload.views_filesystem.CHUNK_SIZE', 4):
+            with self.assertRaises(exceptions.FileTooLargeError):
+                views.save_stream_to_file(self.key_name, StringIO("new, much longer content"), max_size=10)
+
+        # The previous file is untouched, and the temporary file was removed
+        with open(views.get_file_path(self.key_name)) as f:
+            self.assertEqual("old content", f.read())
+        self.assertEqual(
+            sorted(os.listdir(views.get_data_path(self.key_name))),
+            ["content", "metadata.json"]
+        )
+
     def test_download_content_with_no_content_type(self):
         views.save_to_file(self.key_name, "uploaded content", metadata=None)
         download_url = self.backend.get_download_url(self.key)
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the content-addressed attachment store.
+"""
+import hashlib
+import shutil
+import tempfile
+
+import boto
+from boto.exception import S3ResponseError
+from boto.s3.key import Key
+from django.db import DatabaseError
+from django.test.utils import override_settings
+from mock import patch
+from moto import mock_s3
+
+from openassessment.fileupload import api
+from openassessment.fileupload import views_filesystem as views
+from openassessment.fileupload.backends import s3 as s3_backend
+from openassessment.fileupload.backends.filesystem import get_cache as get_filesystem_cache
+from openassessment.fileupload.exceptions import FileUploadInternalError
+from openassessment.fileupload.models import AttachmentBlob, AttachmentReference
+from openassessment.test_utils import CacheResetTest, TransactionCacheResetTest
+
+
+CONTENT = "How d'ya do?"
+CONTENT_HASH = hashlib.sha256(CONTENT).hexdigest()
+OTHER_CONTENT = "Fine, thanks."
+OTHER_CONTENT_HASH = hashlib.sha256(OTHER_CONTENT).hexdigest()
+
+
+class AttachmentReferenceTest(CacheResetTest):
+    """
+    Tests for the reference counts of blobs.
+    """
+
+    def setUp(self):
+        super(AttachmentReferenceTest, self).setUp()
+        self.stored = []
+        self.deleted = []
+
+    def link(self, key, content_hash):
+        return AttachmentReference.link(key, content_hash, 10, self.stored.append, self.deleted.append)
+
+    def test_shared_blob(self):
+        self.link("foo", CONTENT_HASH)
+        blob = self.link(u"ƒσσ", CONTENT_HASH)
+        self.assertEqual(AttachmentBlob.objects.get(pk=blob.pk).reference_count, 2)
+        self.assertEqual(
+            AttachmentReference.content_hashes(["foo", u"ƒσσ", "bar"]),
+            {"foo": CONTENT_HASH, u"ƒσσ": CONTENT_HASH}
+        )
+
+        # The blob is deleted once no key refers to it
+        self.assertTrue(AttachmentReference.unlink("foo", self.deleted.append))
+        self.assertEqual(self.deleted, [])
+        self.assertTrue(AttachmentReference.unlink(u"ƒσσ", self.deleted.append))
+        self.assertEqual(self.deleted, [CONTENT_HASH])
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertFalse(AttachmentReference.unlink("foo", self.deleted.append))
+
+    def test_link_twice(self):
+        self.link("foo", CONTENT_HASH)
+        blob = self.link("foo", CONTENT_HASH)
+        self.assertEqual(AttachmentBlob.objects.get(pk=blob.pk).reference_count, 1)
+        self.assertEqual(self.stored, [CONTENT_HASH, CONTENT_HASH])
+
+    def test_relink(self):
+        self.link("foo", CONTENT_HASH)
+        self.link("bar", CONTENT_HASH)
+        self.link("foo", OTHER_CONTENT_HASH)
+        self.assertEqual(
+            AttachmentReference.content_hashes(["foo", "bar"]),
+            {"foo": OTHER_CONTENT_HASH, "bar": CONTENT_HASH}
+        )
+        self.assertEqual(self.deleted, [])
+
+        # The last reference to the old content is released
+        self.link("bar", OTHER_CONTENT_HASH)
+        self.assertEqual(self.deleted, [CONTENT_HASH])
+        self.assertEqual(AttachmentBlob.objects.get().reference_count, 2)
+
+
+    def test_lock_order(self):
+        # Whichever way a key is relinked, the reference is locked first,
+        # then the blobs in order of content hash
+        first_hash, second_hash = sorted([CONTENT_HASH, OTHER_CONTENT_HASH])
+        for old_hash, new_hash in [(first_hash, second_hash), (second_hash, first_hash)]:
+            self.link("foo", old_hash)
+            self.link("bar", old_hash)
+
+            locks = []
+            select_for_update = AttachmentReference.objects.select_for_update
+            lock_or_create = AttachmentBlob.lock_or_create
+
+            def _lock_reference():  # pylint: disable=C0111
+                locks.append("reference")
+                return select_for_update()
+
+            def _lock_blob(content_hash, size):  # pylint: disable=C0111
+                locks.append(content_hash)
+                return lock_or_create(content_hash, size)
+
+            with patch.object(AttachmentReference.objects, 'select_for_update', side_effect=_lock_reference):
+                with patch.object(AttachmentBlob, 'lock_or_create', side_effect=_lock_blob):
+                    self.link("foo", new_hash)
+
+            self.assertEqual(locks, ["reference", first_hash, second_hash])
+            AttachmentReference.objects.all().delete()
+            AttachmentBlob.objects.all().delete()
+
+
+class AttachmentReferenceTransactionTest(TransactionCacheResetTest):
+    """
+    Tests for linking keys that need real transactions.
+    """
+
+    def test_store_failure_rolls_back(self):
+        def _fail(content_hash):  # pylint: disable=W0613
+            raise IOError("Disk full")
+
+        with self.assertRaises(IOError):
+            AttachmentReference.link("foo", CONTENT_HASH, 10, _fail, lambda content_hash: None)
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertFalse(AttachmentReference.objects.exists())
+
+
+@override_settings(
+    ORA2_FILEUPLOAD_BACKEND="filesystem",
+    ORA2_FILEUPLOAD_CACHE_NAME='default',
+    ORA2_FILEUPLOAD_DEDUPLICATE=True,
+    FILE_UPLOAD_STORAGE_BUCKET_NAME="testbucket",
+)
+class FilesystemDeduplicateTest(CacheResetTest):
+    """
+    Tests for deduplicating files stored by the filesystem backend.
+    """
+
+    def setUp(self):
+        super(FilesystemDeduplicateTest, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.settings = override_settings(ORA2_FILEUPLOAD_ROOT=self.root)
+        self.settings.enable()
+        get_filesystem_cache().clear()
+        self.backend = api.backends.get_backend()
+
+    def tearDown(self):
+        super(FilesystemDeduplicateTest, self).tearDown()
+        self.settings.disable()
+        shutil.rmtree(self.root)
+
+    def upload(self, key, content):
+        views.save_to_file(self.backend._get_key_name(key), content, {"Content-Type": "text/plain"})
+
+    def download(self, key):
+        url = api.get_download_url(key)
+        return url, self.client.get(url).content
+
+    def test_identical_files_stored_once(self):
+        self.upload("foo", CONTENT)
+        self.upload("bar", CONTENT)
+        self.assertEqual(api.deduplicate("foo"), CONTENT_HASH)
+        self.assertEqual(api.deduplicate("bar"), CONTENT_HASH)
+
+        # The uploaded copies are gone, and both keys are downloaded from the blob
+        blob_key_name = self.backend._get_blob_key_name(CONTENT_HASH)
+        for key in ["foo", "bar"]:
+            with self.assertRaises(IOError):
+                open(views.get_file_path(self.backend._get_key_name(key)))
+            url, content = self.download(key)
+            self.assertIn(blob_key_name, url)
+            self.assertEqual(content, CONTENT)
+        self.assertEqual(views.get_metadata(blob_key_name)["Content-Type"], "text/plain")
+        self.assertEqual(AttachmentBlob.objects.get().reference_count, 2)
+
+    def test_release(self):
+        self.upload("foo", CONTENT)
+        self.upload("bar", CONTENT)
+        api.deduplicate("foo")
+        api.deduplicate("bar")
+        blob_path = views.get_file_path(self.backend._get_blob_key_name(CONTENT_HASH))
+
+        self.assertTrue(api.release("foo"))
+        self.assertEqual(self.download("bar")[1], CONTENT)
+        self.assertTrue(api.release("bar"))
+        with self.assertRaises(IOError):
+            open(blob_path)
+        self.assertFalse(api.release("bar"))
+
+    def test_reupload(self):
+        self.upload("foo", CONTENT)
+        api.deduplicate("foo")
+        self.download("foo")
+
+        # Nothing new was uploaded
+        self.assertIs(api.deduplicate("foo"), None)
+
+        # The cached URL of the old blob is not used after a new file is deduplicated
+        self.upload("foo", OTHER_CONTENT)
+        self.assertEqual(api.deduplicate("foo"), OTHER_CONTENT_HASH)
+        self.assertEqual(self.download("foo")[1], OTHER_CONTENT)
+        with self.assertRaises(IOError):
+            open(views.get_file_path(self.backend._get_blob_key_name(CONTENT_HASH)))
+
+    def test_not_uploaded(self):
+        self.assertIs(api.deduplicate("foo"), None)
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    @override_settings(ORA2_FILEUPLOAD_DEDUPLICATE=False)
+    def test_disabled(self):
+        self.upload("foo", CONTENT)
+        self.assertIs(api.deduplicate("foo"), None)
+        self.assertEqual(self.download("foo")[1], CONTENT)
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_disabled_after_deduplicating(self):
+        self.upload("foo", CONTENT)
+        api.deduplicate("foo")
+
+        # Keys deduplicated earlier are still downloaded from their blob
+        blob_key_name = self.backend._get_blob_key_name(CONTENT_HASH)
+        with override_settings(ORA2_FILEUPLOAD_DEDUPLICATE=False):
+            url, content = self.download("foo")
+            self.assertIn(blob_key_name, url)
+            self.assertEqual(content, CONTENT)
+            self.assertIn(blob_key_name, self.backend.get_download_url("foo"))
+
+            # Until a new file is uploaded for the key
+            self.assertIs(api.deduplicate("foo"), None)
+            self.upload("foo", OTHER_CONTENT)
+            self.assertIs(api.deduplicate("foo"), None)
+            self.assertEqual(self.download("foo")[1], OTHER_CONTENT)
+            self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_deduplicate_async(self):
+        self.upload("foo", CONTENT)
+        self.upload("bar", CONTENT)
+
+        # Tasks run eagerly in the tests
+        api.deduplicate_async("foo")
+        api.deduplicate_async("bar")
+        self.assertEqual(AttachmentBlob.objects.get().reference_count, 2)
+        self.assertEqual(self.download("foo")[1], CONTENT)
+
+    @patch.object(AttachmentReference, 'link')
+    def test_deduplicate_async_failure(self, mock_link):
+        # The error is logged by the task, and the file remains under its key
+        mock_link.side_effect = DatabaseError("Test error")
+        self.upload("foo", CONTENT)
+        api.deduplicate_async("foo")
+        self.assertEqual(self.download("foo")[1], CONTENT)
+
+    @patch('openassessment.fileupload.tasks.deduplicate_task.apply_async')
+    def test_deduplicate_async_schedule_failure(self, mock_apply_async):
+        mock_apply_async.side_effect = IOError("Broker unavailable")
+        with self.assertRaises(FileUploadInternalError):
+            api.deduplicate_async("foo")
+
+    @patch.object(AttachmentReference, 'link')
+    def test_database_error(self, mock_link):
+        mock_link.side_effect = DatabaseError("Test error")
+        self.upload("foo", CONTENT)
+        with self.assertRaises(FileUploadInternalError):
+            api.deduplicate("foo")
+        self.assertEqual(self.download("foo")[1], CONTENT)
+
+    def test_backend_download_url(self):
+        self.upload("foo", CONTENT)
+        api.deduplicate("foo")
+        url = self.backend.get_download_url("foo")
+        self.assertIn(self.backend._get_blob_key_name(CONTENT_HASH), url)
+        self.assertEqual(self.client.get(url).content, CONTENT)
+
+
+@override_settings(
+    AWS_ACCESS_KEY_ID='foobar',
+    AWS_SECRET_ACCESS_KEY='bizbaz',
+    FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket",
+    ORA2_FILEUPLOAD_DEDUPLICATE=True,
+)
+class S3DeduplicateTest(CacheResetTest):
+    """
+    Tests for deduplicating files stored in S3.
+    """
+
+    def setUp(self):
+        super(S3DeduplicateTest, self).setUp()
+        s3_backend.reset_connections()
+        self.mock_s3 = mock_s3()
+        self.mock_s3.start()
+        self.bucket = boto.connect_s3().create_bucket('mybucket')
+
+    def tearDown(self):
+        super(S3DeduplicateTest, self).tearDown()
+        self.mock_s3.stop()
+
+    def upload(self, key, content):
+        s3_key = Key(self.bucket)
+        s3_key.key = "submissions_attachments/{}".format(key)
+        s3_key.set_contents_from_string(content)
+
+    def test_identical_files_stored_once(self):
+        self.upload("foo", CONTENT)
+        self.upload("bar", CONTENT)
+        self.assertEqual(api.deduplicate("foo"), CONTENT_HASH)
+        self.assertEqual(api.deduplicate("bar"), CONTENT_HASH)
+
+        blob_key_name = "submissions_attachments/blobs/{}".format(CONTENT_HASH)
+        self.assertEqual([key.name for key in self.bucket.list()], [blob_key_name])
+        self.assertEqual(self.bucket.get_key(blob_key_name).get_contents_as_string(), CONTENT)
+        urls = api.get_download_urls(["foo", "bar", "baz"])
+        self.assertIn(blob_key_name, urls["foo"])
+        self.assertIn(blob_key_name, urls["bar"])
+        self.assertEqual(urls["baz"], "")
+
+    def test_disabled_after_deduplicating(self):
+        self.upload("foo", CONTENT)
+        api.deduplicate("foo")
+        with override_settings(ORA2_FILEUPLOAD_DEDUPLICATE=False):
+            url = api.get_download_url("foo")
+        self.assertIn("submissions_attachments/blobs/{}".format(CONTENT_HASH), url)
+
+    def test_release(self):
+        self.upload("foo", CONTENT)
+        api.deduplicate("foo")
+        api.get_download_url("foo")
+        self.assertTrue(api.release("foo"))
+        self.assertEqual(list(self.bucket.list()), [])
+        self.assertEqual(api.get_download_url("foo"), "")
+
+    def test_s3_error(self):
+        self.upload("foo", CONTENT)
+        with patch.object(boto.s3.bucket.Bucket, 'copy_key') as mock_copy_key:
+            mock_copy_key.side_effect = S3ResponseError(500, "Internal Error")
+            with self.assertRaises(FileUploadInternalError):
+                api.deduplicate("foo")
+
+        # The upload was kept
+        self.assertEqual(
+            self.bucket.get_key("submissions_attachments/foo").get_contents_as_string(), CONTENT
+        )
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the cache of signed download URLs.
+"""
+from django.test.utils import override_settings
+from mock import patch
+
+from openassessment.fileupload import url_cache
+from openassessment.fileupload.backends.base import BaseBackend
+from openassessment.test_utils import CacheResetTest
+
+
+class CountingBackend(BaseBackend):
+    """
+    Backend that signs URLs with a counter, so we can tell when URLs are signed again.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.signed_keys = []
+
+    def get_upload_url(self, key, content_type):
+        raise NotImplementedError
+
+    def get_download_url(self, key):
+        self.signed_keys.append(key)
+        if key not in self.files:
+            return ""
+        return "/{key}?signature={num}".format(key=key, num=len(self.signed_keys))
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BUCKET_NAME="mybucket")
+class DownloadURLCacheTest(CacheResetTest):
+    """
+    Tests for the cache of signed download URLs.
+    """
+
+    def setUp(self):
+        super(DownloadURLCacheTest, self).setUp()
+        self.backend = CountingBackend(["foo", "bar", "ƒσσ"])
+
+    def test_cached(self):
+        urls = url_cache.get_download_urls(self.backend, ["foo", "bar"])
+        self.assertEqual(url_cache.get_download_urls(self.backend, ["foo", "bar"]), urls)
+        self.assertEqual(sorted(self.backend.signed_keys), ["bar", "foo"])
+
+        # Only keys that aren't cached are signed
+        url_cache.get_download_urls(self.backend, ["foo", "baz"])
+        self.assertEqual(sorted(self.backend.signed_keys), ["bar", "baz", "foo"])
+
+    def test_non_ascii_key(self):
+        url = url_cache.get_download_urls(self.backend, ["ƒσσ"])["ƒσσ"]
+        self.assertEqual(url_cache.get_download_urls(self.backend, ["ƒσσ"])["ƒσσ"], url)
+        self.assertEqual(self.backend.signed_keys, ["ƒσσ"])
+
+    def test_empty_urls_not_cached(self):
+        self.assertEqual(url_cache.get_download_urls(self.backend, ["baz"]), {"baz": ""})
+        self.backend.files.append("baz")
+        self.assertNotEqual(url_cache.get_download_urls(self.backend, ["baz"]), {"baz": ""})
+        self.assertEqual(self.backend.signed_keys, ["baz", "baz"])
+
+    def test_shared_cache(self):
+        urls = url_cache.get_download_urls(self.backend, ["foo"])
+
+        # Another process (with an empty local cache) re-uses the signed URL
+        url_cache.DOWNLOAD_URLS_CACHE_IN_MEM.clear()
+        self.assertEqual(url_cache.get_download_urls(self.backend, ["foo"]), urls)
+        self.assertEqual(self.backend.signed_keys, ["foo"])
+
+        # The URL is now in the local cache too
+        url_cache.SHARED_DOWNLOAD_URL_CACHE.backend.clear()
+        self.assertEqual(url_cache.get_download_urls(self.backend, ["foo"]), urls)
+        self.assertEqual(self.backend.signed_keys, ["foo"])
+
+    @override_settings(ORA2_FILEUPLOAD_URL_CACHE_MARGIN=100)
+    @patch('openassessment.fileupload.url_cache.time')
+    def test_safety_margin(self, mock_time):
+        mock_time.time.return_value = 1000
+        urls = url_cache.get_download_urls(self.backend, ["foo"])
+
+        # Still valid for more than the margin
+        mock_time.time.return_value = 1000 + BaseBackend.DOWNLOAD_URL_TIMEOUT - 101
+        self.assertEqual(url_cache.get_download_urls(self.backend, ["foo"]), urls)
+        self.assertEqual(self.backend.signed_keys, ["foo"])
+
+        # Within the margin of expiring, so the URL is signed again
+        mock_time.time.return_value = 1000 + BaseBackend.DOWNLOAD_URL_TIMEOUT - 99
+        self.assertNotEqual(url_cache.get_download_urls(self.backend, ["foo"]), urls)
+        self.assertEqual(self.backend.signed_keys, ["foo", "foo"])
+
+    @override_settings(ORA2_FILEUPLOAD_URL_CACHE_MARGIN=BaseBackend.DOWNLOAD_URL_TIMEOUT)
+    def test_disabled(self):
+        url_cache.get_download_urls(self.backend, ["foo"])
+        url_cache.get_download_urls(self.backend, ["foo"])
+        self.assertEqual(self.backend.signed_keys, ["foo", "foo"])
+
+    def test_different_buckets(self):
+        url_cache.get_download_urls(self.backend, ["foo"])
+        with override_settings(FILE_UPLOAD_STORAGE_BUCKET_NAME="otherbucket"):
+            url_cache.get_download_urls(self.backend, ["foo"])
+        self.assertEqual(self.backend.signed_keys, ["foo", "foo"])
+
+    @patch('openassessment.fileupload.url_cache.dog_stats_api')
+    def test_metrics(self, mock_stats):
+        url_cache.get_download_urls(self.backend, ["foo"])
+        url_cache.get_download_urls(self.backend, ["foo", "bar"])
+
+        tags = [u"backend:test_url_cache"]
+        mock_stats.increment.assert_any_call(
+            'openassessment.fileupload.download_url_cache.hit', value=1, tags=tags
+        )
+        mock_stats.increment.assert_any_call(
+            'openassessment.fileupload.download_url_cache.miss', value=1, tags=tags
+        )
+        self.assertEqual(mock_stats.histogram.call_count, 2)
+        args, kwargs = mock_stats.histogram.call_args
+        self.assertEqual(args[0], 'openassessment.fileupload.download_url.sign.time')
+        self.assertEqual(kwargs['tags'], tags)
@@ -0,0 +1,155 @@
+"""
+Cache of signed download URLs, keyed by file key.
+
+The same file is often displayed many times while its signed URL is still valid
+(to every peer assessing a submission, and on every render of a leaderboard),
+so we re-use signed URLs instead of signing them again on every request.
+
+URLs are cached in two tiers: in memory in each process, and in the shared
+Django cache, so a URL signed by one process can be re-used by the others.
+A cached URL is only returned while it remains valid for at least a safety
+margin (the ``ORA2_FILEUPLOAD_URL_CACHE_MARGIN`` setting), so users have time to
+load the file.  If the margin is at least as long as the validity of signed URLs,
+URLs are not cached.
+
+Empty URLs (for keys without a file) are never cached, since the file may be
+uploaded at any time.
+"""
+import time
+from django.conf import settings
+from django.core.cache import get_cache
+from dogapi import dog_stats_api
+from openassessment.cache import CacheNamespace
+
+
+# By default, stop using a cached URL five minutes before it expires.
+DEFAULT_MARGIN = 5 * 60
+
+# Process-local cache of signed URLs
+DOWNLOAD_URLS_CACHE_IN_MEM = get_cache(
+    'django.core.cache.backends.locmem.LocMemCache',
+    LOCATION='openassessment.fileupload.download_urls'
+)
+
+# Signed URLs and the time they expire, keyed by backend, bucket, and key name.
+LOCAL_DOWNLOAD_URL_CACHE = CacheNamespace(
+    u"fileupload.signed_download_url.memory", backend=DOWNLOAD_URLS_CACHE_IN_MEM
+)
+SHARED_DOWNLOAD_URL_CACHE = CacheNamespace(u"fileupload.signed_download_url")
+
+
+def margin():
+    """
+    The minimum number of seconds a cached URL must remain valid to be re-used.
+
+    Returns:
+        int
+
+    """
+    return getattr(settings, 'ORA2_FILEUPLOAD_URL_CACHE_MARGIN', DEFAULT_MARGIN)
+
+
+def get_download_urls(backend, keys):
+    """
+    Retrieve download URLs for keys, re-using cached signed URLs
+    and signing URLs for the other keys with the backend.
+
+    Args:
+        backend (BaseBackend): The file upload backend.
+        keys (list of str): The file keys.
+
+    Returns:
+        dict mapping each key to its download URL (or an empty string if there is no file)
+
+    Raises:
+        FileUploadInternalError
+        FileUploadRequestError
+
+    """
+    backend_name = type(backend).__module__.rsplit('.', 1)[-1]
+    tags = [u"backend:{}".format(backend_name)]
+    if margin() >= backend.DOWNLOAD_URL_TIMEOUT:
+        return _sign(backend, keys, tags)
+
+    bucket_name = getattr(settings, "FILE_UPLOAD_STORAGE_BUCKET_NAME", None)
+    identifiers = {key: _identifier(backend, backend_name, bucket_name, key) for key in keys}
+    current_time = time.time()
+
+    # Check the process-local cache, then the shared cache for the rest
+    urls = {}
+    for cache in [LOCAL_DOWNLOAD_URL_CACHE, SHARED_DOWNLOAD_URL_CACHE]:
+        remaining = [key for key in identifiers if key not in urls]
+        if not remaining:
+            break
+        cached = cache.get_many([identifiers[key] for key in remaining])
+        local_values = {}
+        for key in remaining:
+            entry = cached.get(identifiers[key])
+            if entry is None:
+                continue
+            url, expires_at = entry
+            time_left = expires_at - current_time - margin()
+            if time_left > 0:
+                urls[key] = url
+                if cache is SHARED_DOWNLOAD_URL_CACHE:
+                    local_values[identifiers[key]] = (entry, int(time_left))
+        for identifier, (entry, timeout) in local_values.iteritems():
+            LOCAL_DOWNLOAD_URL_CACHE.set(identifier, entry, timeout=timeout)
+
+    dog_stats_api.increment('openassessment.fileupload.download_url_cache.hit', value=len(urls), tags=tags)
+    dog_stats_api.increment(
+        'openassessment.fileupload.download_url_cache.miss', value=len(identifiers) - len(urls), tags=tags
+    )
+
+    missing = [key for key in identifiers if key not in urls]
+    if missing:
+        # URLs expire `DOWNLOAD_URL_TIMEOUT` seconds after signing,
+        # so measure from before we start signing.
+        expires_at = time.time() + backend.DOWNLOAD_URL_TIMEOUT
+        signed = _sign(backend, missing, tags)
+        entries = {identifiers[key]: (url, expires_at) for key, url in signed.iteritems() if url}
+        timeout = backend.DOWNLOAD_URL_TIMEOUT - margin()
+        LOCAL_DOWNLOAD_URL_CACHE.set_many(entries, timeout=timeout)
+        SHARED_DOWNLOAD_URL_CACHE.set_many(entries, timeout=timeout)
+        urls.update(signed)
+
+    return urls
+
+
+def invalidate(backend, keys):
+    """
+    Forget the cached download URLs of keys whose files have moved.
+
+    Args:
+        backend (BaseBackend): The file upload backend.
+        keys (list of str): The file keys.
+
+    """
+    backend_name = type(backend).__module__.rsplit('.', 1)[-1]
+    bucket_name = getattr(settings, "FILE_UPLOAD_STORAGE_BUCKET_NAME", None)
+    for key in keys:
+        identifier = _identifier(backend, backend_name, bucket_name, key)
+        LOCAL_DOWNLOAD_URL_CACHE.delete(identifier)
+        SHARED_DOWNLOAD_URL_CACHE.delete(identifier)
+
+
+def _sign(backend, keys, tags):
+    """
+    Sign download URLs with the backend, reporting the time taken.
+    """
+    start = time.time()
+    urls = backend.get_download_urls(keys)
+    dog_stats_api.histogram(
+        'openassessment.fileupload.download_url.sign.time', time.time() - start, tags=tags
+    )
+    return urls
+
+
+def _identifier(backend, backend_name, bucket_name, key):
+    """
+    The cache identifier of the signed URL for a key.
+    """
+    key_name = backend._get_key_name(key)  # pylint: disable=W0212
+    if isinstance(key_name, str):
+        key_name = key_name.decode('utf-8')
+    return (backend_name, bucket_name, key_name)
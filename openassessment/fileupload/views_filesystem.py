@@ -1,17 +1,36 @@
 import hashlib
 import json
 import os
+import re
+import tempfile
+import urllib
+from StringIO import StringIO
 
 from django.conf import settings
+from django.http import HttpResponseNotModified
 from django.shortcuts import HttpResponse, Http404
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 
 from . import exceptions
-from .backends.filesystem import is_upload_url_available, is_download_url_available
+from .backends.filesystem import is_upload_url_available, is_download_url_available, get_metadata_cache
 from .backends.base import Settings
 
 
+# Size of the chunks read from disk when streaming a file
+CHUNK_SIZE = 64 * 1024
+
+# Prefix of files being written, before they are renamed into place
+TEMP_PREFIX = ".tmp-"
+
+# By default, uploaded files are limited to 5MB
+# (the same limit as the file upload client).
+DEFAULT_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+
+# A single byte range, such as "bytes=0-499", "bytes=500-" or "bytes=-500"
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
 @require_http_methods(["PUT", "GET"])
 def filesystem_storage(request, key):
     """
@@ -22,48 +41,217 @@ def filesystem_storage(request, key):
     if request.method == "PUT":
         if not is_upload_url_available(key):
             raise Http404()
-        content, metadata = get_content_metadata(request)
-        save_to_file(key, content, metadata)
+        try:
+            save_stream_to_file(key, request, get_request_metadata(request), get_max_upload_size())
+        except exceptions.FileTooLargeError:
+            return HttpResponse(status=413)
         return HttpResponse()
     elif request.method == "GET":
         if not is_download_url_available(key):
             raise Http404()
-        return download_file(key)
+        return download_file(key, request)
 
 
-def download_file(key):
-    """Returns an HttpResponse to download the corresponding file"""
+def download_file(key, request=None):
+    """
+    Returns an HttpResponse that streams the corresponding file from disk.
 
+    The response supports a single byte range (the Range and If-Range headers)
+    and conditional requests (If-None-Match), using the MD5 stored with the file
+    as its ETag.  If the ORA2_FILEUPLOAD_SENDFILE setting is defined, the file
+    is not read at all: the response tells the front-end web server to send it
+    (see `sendfile_header`).
+    """
     file_path = get_file_path(key)
-    metadata_path = get_metadata_path(key)
-    if not os.path.exists(file_path):
+    try:
+        size = os.stat(file_path).st_size
+    except OSError:
         raise Http404()
-    with open(metadata_path) as f:
-        metadata = json.load(f)
-        content_type = metadata.get("Content-Type", 'application/octet-stream')
-    with open(file_path, 'r') as f:
-        response = HttpResponse(f.read(), content_type=content_type)
-        file_name = os.path.basename(os.path.dirname(file_path))
-        response['Content-Disposition'] = 'attachment; filename=' + file_name
+
+    metadata = get_metadata(key)
+    content_type = metadata.get("Content-Type", 'application/octet-stream')
+    etag = '"%s"' % metadata["Content-MD5"] if metadata.get("Content-MD5") else None
+    request_headers = request.META if request is not None else {}
+
+    if etag is not None and etag in _split_etags(request_headers.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    sendfile = sendfile_header(file_path)
+    if sendfile is not None:
+        # The web server handles ranges itself.
+        response = HttpResponse(content_type=content_type)
+        response[sendfile[0]] = sendfile[1]
+    else:
+        byte_range = None
+        if_range = request_headers.get('HTTP_IF_RANGE')
+        if if_range is None or (etag is not None and if_range == etag):
+            try:
+                byte_range = parse_range(request_headers.get('HTTP_RANGE'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % size
+                return response
+
+        start, end = byte_range if byte_range is not None else (0, size - 1)
+        try:
+            content_file = open(file_path, 'rb')
+        except IOError:
+            raise Http404()
+        response = HttpResponse(stream_file(content_file, start, end - start + 1), content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+        if byte_range is not None:
+            response.status_code = 206
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+
+    if etag is not None:
+        response['ETag'] = etag
+    file_name = os.path.basename(os.path.dirname(file_path))
+    response['Content-Disposition'] = 'attachment; filename=' + file_name
     return response
 
 
-def get_content_metadata(request):
+def stream_file(content_file, start, length):
+    """
+    Read part of an open file in chunks, closing the file when done.
+
+    Arguments:
+        content_file (file): the file to read
+        start (int): the offset of the first byte to read
+        length (int): the number of bytes to read
+
+    Yields:
+        str
+    """
+    try:
+        content_file.seek(start)
+        while length > 0:
+            chunk = content_file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        content_file.close()
+
+
+def parse_range(header, size):
     """
-    Read the content and metadata associated to an HttpRequest.
+    Parse the value of a Range header for a file.
+
+    Only single byte ranges are supported; other ranges are ignored,
+    so the whole file is sent.
+
+    Arguments:
+        header (str): the value of the Range header (may be None)
+        size (int): the size of the file in bytes
 
     Returns:
-        request body (str)
-        request metadata (dict)
+        (start, end) tuple of the first and last byte offsets (inclusive),
+        or None to send the whole file.
+
+    Raises:
+        ValueError if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            raise ValueError("Range starts after the end of the file")
+    elif last:
+        suffix_length = int(last)
+        if suffix_length == 0 or size == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(size - suffix_length, 0), size - 1
+    else:
+        return None
+    return start, end
+
+
+def sendfile_header(file_path):
+    """
+    The header that hands off sending a file to the front-end web server,
+    according to the ORA2_FILEUPLOAD_SENDFILE setting:
+
+        None (the default): files are streamed by Django.
+        "x-sendfile": the X-Sendfile header (Apache mod_xsendfile, lighttpd),
+            with the absolute path of the file.
+        "x-accel-redirect": the X-Accel-Redirect header (nginx), with the path of the file
+            relative to ORA2_FILEUPLOAD_ROOT, under the ORA2_FILEUPLOAD_ACCEL_REDIRECT_PREFIX
+            internal location.
+
+    Returns:
+        (header name, header value) tuple, or None
+
+    Raises:
+        FileUploadInternalError if the settings are invalid.
+    """
+    mode = getattr(settings, "ORA2_FILEUPLOAD_SENDFILE", None)
+    if not mode:
+        return None
+    elif mode == "x-sendfile":
+        return 'X-Sendfile', os.path.abspath(file_path)
+    elif mode == "x-accel-redirect":
+        prefix = getattr(settings, "ORA2_FILEUPLOAD_ACCEL_REDIRECT_PREFIX", None)
+        if not prefix:
+            raise exceptions.FileUploadInternalError("Undefined X-Accel-Redirect location prefix setting")
+        relative_path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(get_root_directory_path()))
+        return 'X-Accel-Redirect', prefix.rstrip('/') + '/' + urllib.quote(relative_path)
+    else:
+        raise exceptions.FileUploadInternalError("Invalid ORA2_FILEUPLOAD_SENDFILE setting value: %s" % mode)
+
+
+def _split_etags(header):
+    """Returns the entity tags listed in an If-None-Match header."""
+    return [etag.strip() for etag in header.split(',')] if header else []
+
+
+def get_metadata(key):
+    """
+    Returns the metadata saved with a file (an empty dict if there is none).
+    Metadata is cached, so most downloads don't read the metadata file.
     """
+    cache = get_metadata_cache()
+    metadata = cache.get(key)
+    if metadata is None:
+        try:
+            with open(get_metadata_path(key)) as f:
+                metadata = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        cache.set(key, metadata)
+    return metadata
 
-    metadata = {
+
+def get_request_metadata(request):
+    """
+    Read the metadata associated to an HttpRequest.
+    The Content-MD5 and Content-Length of the content are added while it is saved
+    (see `save_stream_to_file`).
+
+    Returns:
+        request metadata (dict)
+    """
+    return {
         "Content-Type": request.META["CONTENT_TYPE"],
         "Date": str(timezone.now()),
-        "Content-MD5": hashlib.md5(request.body).hexdigest(),
-        "Content-Length": request.META["CONTENT_LENGTH"],
     }
-    return request.body, metadata
+
+
+def get_max_upload_size():
+    """
+    Returns the maximum size (in bytes) of an uploaded file.
+    """
+    return getattr(settings, "ORA2_FILEUPLOAD_MAX_SIZE", DEFAULT_MAX_UPLOAD_SIZE)
 
 
 def save_to_file(key, content, metadata=None):
@@ -75,22 +263,75 @@ def save_to_file(key, content, metadata=None):
         content (str): uploaded file content
         metadata (dict): json-dumpable data
     """
+    save_stream_to_file(key, StringIO(content), metadata)
+
+
+def save_stream_to_file(key, stream, metadata=None, max_size=None):
+    """
+    Save content read from a stream, and its metadata, to a local file determined
+    by the given key.
+
+    The content is read and written in chunks, so uploads are never held in memory,
+    and its MD5 is computed as it is written.  Files are written to a temporary file
+    and renamed into place, so downloads never see partial files.
+
+    Arguments:
+        key (str): unique file identifier
+        stream (file-like): uploaded file content, such as an HttpRequest
+        metadata (dict): json-dumpable data.  The Content-MD5 and Content-Length
+            of the content are added to dict metadata.
+        max_size (int): the maximum size of the content in bytes, or None for no limit
+
+    Raises:
+        FileTooLargeError if the content is larger than the maximum size.
+        FileUploadRequestError if we try to save in an unauthorized directory.
+        FileUploadInternalError if the root directory does not exist.
+    """
     file_path = get_file_path(key)
     metadata_path = get_metadata_path(key)
     if metadata is None:
         metadata = {}
 
-    safe_save(file_path, content)
+    content_length = getattr(stream, 'META', {}).get('CONTENT_LENGTH')
+    if max_size is not None and content_length and int(content_length) > max_size:
+        raise exceptions.FileTooLargeError("Uploaded file is larger than %d bytes" % max_size)
+
+    md5 = hashlib.md5()
+    size = [0]
+
+    def _chunks():  # pylint: disable=C0111
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size[0] += len(chunk)
+            if max_size is not None and size[0] > max_size:
+                raise exceptions.FileTooLargeError("Uploaded file is larger than %d bytes" % max_size)
+            md5.update(chunk)
+            yield chunk
+
+    safe_save(file_path, _chunks())
+    if isinstance(metadata, dict):
+        metadata["Content-MD5"] = md5.hexdigest()
+        metadata["Content-Length"] = str(size[0])
     try:
         safe_save(metadata_path, json.dumps(metadata))
     except:
         safe_remove(file_path)
         safe_remove(metadata_path)
         raise
+    get_metadata_cache().set(key, metadata)
+
 
 def safe_save(path, content):
     """
     Save content to path. Creates the appropriate directories, if required.
+    The content is written to a temporary file in the same directory, then
+    renamed into place, so readers never see a partially written file.
+
+    Arguments:
+        path (str): the path of the file
+        content (str or iterable of str): the content, or chunks of the content
 
     Raises:
         FileUploadInternalError if the root directory does not exist or if we
@@ -104,8 +345,18 @@ def safe_save(path, content):
         raise exceptions.FileUploadInternalError("File upload root directory does not exist: %s" % root_directory)
     if not os.path.exists(dir_path):
         os.makedirs(dir_path)
-    with open(path, 'w') as f:
-        f.write(content)
+
+    if isinstance(content, basestring):
+        content = [content]
+    temp_file = tempfile.NamedTemporaryFile(dir=dir_path, prefix=TEMP_PREFIX, delete=False)
+    try:
+        with temp_file:
+            for chunk in content:
+                temp_file.write(chunk)
+        os.rename(temp_file.name, path)
+    except:
+        safe_remove(temp_file.name)
+        raise
 
 def safe_remove(path):
     """Remove a file if it exists.
@@ -0,0 +1,459 @@
+"""
+Measure the throughput of the AI grading pipeline, end to end, using
+the fake AI algorithm and eager Celery tasks (no workers or EASE required):
+
+    submit an essay
+        -> AI workflow on_init
+        -> grade_essay / grade_essays task
+        -> create the assessment
+        -> update the submission workflow
+
+Essays are graded in two modes:
+    single: each essay is graded by its own task.
+    batch: essays are collected and graded in batches of BATCH_SIZE.
+
+For each mode, the command reports essays per second, database queries per essay,
+and the median and 95th percentile latency from submission until the essay is graded.
+
+By default, the command runs against a new, temporary test database,
+so it doesn't leave benchmark data behind.  The results can be saved
+as a baseline and compared with later runs to catch regressions.
+"""
+import datetime
+import json
+import math
+import os
+from optparse import make_option
+
+from celery import current_app
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries
+from django.test.simple import DjangoTestSuiteRunner
+from django.test.utils import override_settings
+
+from submissions import api as sub_api
+from openassessment.assessment.api import ai as ai_api
+from openassessment.assessment.models import AITrainingWorkflow, AIGradingWorkflow
+from openassessment.assessment.worker.grading import PENDING_FLUSH_CACHE, flush_grading_batch
+from openassessment.workflow import api as workflow_api
+
+
+ALGORITHM_ID = u"fake"
+
+AI_ALGORITHMS = {
+    ALGORITHM_ID: u"openassessment.assessment.worker.algorithm.FakeAIAlgorithm"
+}
+
+RUBRIC_OPTIONS = [
+    {
+        "order_num": 0,
+        "name": u"poor",
+        "explanation": u"Poor job!",
+        "points": 0,
+    },
+    {
+        "order_num": 1,
+        "name": u"good",
+        "explanation": u"Good job!",
+        "points": 1,
+    }
+]
+
+RUBRIC = {
+    'prompts': [{"description": u"Test prompt"}],
+    'criteria': [
+        {
+            "order_num": 0,
+            "name": u"vocabulary",
+            "prompt": u"Vocabulary",
+            "options": RUBRIC_OPTIONS
+        },
+        {
+            "order_num": 1,
+            "name": u"grammar",
+            "prompt": u"Grammar",
+            "options": RUBRIC_OPTIONS
+        }
+    ]
+}
+
+EXAMPLES = [
+    {
+        'answer': (
+            u"World Food Day is celebrated every year around the world on 16 October in honor "
+            u"of the date of the founding of the Food and Agriculture "
+            u"Organization of the United Nations in 1945."
+        ),
+        'options_selected': {u"vocabulary": u"poor", u"grammar": u"good"}
+    },
+    {
+        'answer': (
+            u"In spite of the importance of agriculture as the driving force "
+            u"in the economies of many developing countries, this "
+            u"vital sector is frequently starved of investment."
+        ),
+        'options_selected': {u"vocabulary": u"good", u"grammar": u"poor"}
+    },
+]
+
+STEPS = ['ai']
+
+ON_INIT_PARAMS = {
+    'ai': {'rubric': RUBRIC, 'algorithm_id': ALGORITHM_ID}
+}
+
+MODES = ['single', 'batch']
+
+# Baseline results, recorded with the default arguments.
+DEFAULT_BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'baselines', 'performance_test_for_ai_grading.json'
+)
+
+# By default, a run fails the baseline check if its throughput is
+# less than half of the baseline's.
+DEFAULT_TOLERANCE = 0.5
+
+# Query counts don't depend on the host, but vary slightly between runs
+# (for example, when cached values expire), so allow a small increase.
+QUERY_TOLERANCE = 0.05
+
+
+def _percentile(values, percent):
+    """
+    The nearest-rank percentile of a list of values.
+
+    Args:
+        values (list of float): The values (must not be empty).
+        percent (int): The percentile, from 0 to 100.
+
+    Returns:
+        float
+
+    """
+    ordered = sorted(values)
+    index = int(math.ceil(percent / 100.0 * len(ordered))) - 1
+    return ordered[min(max(index, 0), len(ordered) - 1)]
+
+
+def _num_queries():
+    """
+    The number of queries executed on every database connection since the last reset.
+
+    Returns:
+        int
+
+    """
+    return sum(len(connection.queries) for connection in connections.all())
+
+
+class Command(BaseCommand):
+    """
+    Note the throughput, queries, and latency of the AI grading pipeline.
+    """
+
+    help = ("Measure the throughput of the AI grading pipeline "
+            "with the fake AI algorithm and eager Celery tasks.")
+
+    args = '[NUM_ESSAYS] [BATCH_SIZE]'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--use-current-db', action='store_true', dest='use_current_db', default=False,
+            help="Seed and grade essays in the configured database instead of a temporary test database."
+        ),
+        make_option(
+            '--baseline', dest='baseline', default=DEFAULT_BASELINE_PATH,
+            help="Path of the baseline results (JSON)."
+        ),
+        make_option(
+            '--check', action='store_true', dest='check', default=False,
+            help="Fail if the results regress from the baseline."
+        ),
+        make_option(
+            '--tolerance', dest='tolerance', type='float', default=DEFAULT_TOLERANCE,
+            help="Fraction of the baseline throughput a run may lose before the check fails."
+        ),
+        make_option(
+            '--write-baseline', action='store_true', dest='write_baseline', default=False,
+            help="Save the results as the new baseline."
+        ),
+    )
+
+    DEFAULT_NUM_ESSAYS = 200
+    DEFAULT_BATCH_SIZE = 20
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            num_essays (int): The number of essays to grade in each mode.
+            batch_size (int): The number of essays in each batch, in batch mode.
+
+        Raises:
+            CommandError
+
+        """
+        try:
+            num_essays = int(args[0]) if len(args) > 0 else self.DEFAULT_NUM_ESSAYS
+            batch_size = int(args[1]) if len(args) > 1 else self.DEFAULT_BATCH_SIZE
+        except ValueError:
+            raise CommandError(u"Usage: performance_test_for_ai_grading {}".format(self.args))
+
+        if num_essays < 1 or batch_size < 2:
+            raise CommandError(u"Grade at least one essay, in batches of at least two essays.")
+
+        runner = None
+        old_config = None
+        if not options.get('use_current_db'):
+            runner, old_config = self._setup_database()
+
+        try:
+            results = self._run(num_essays, batch_size)
+        finally:
+            if runner is not None:
+                runner.teardown_databases(old_config)
+
+        self._report(results)
+
+        baseline_path = options.get('baseline', DEFAULT_BASELINE_PATH)
+        if options.get('write_baseline'):
+            with open(baseline_path, 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=4, sort_keys=True, separators=(',', ': '))
+                baseline_file.write('\n')
+            print "Saved the baseline to %s" % baseline_path
+        elif options.get('check'):
+            self._check(results, baseline_path, options.get('tolerance', DEFAULT_TOLERANCE))
+
+    @staticmethod
+    def _setup_database():
+        """
+        Create temporary test databases for the benchmark data.
+
+        Returns:
+            tuple of `(runner, old_config)`, to tear the databases down.
+
+        """
+        try:
+            # Create the tables of apps with South migrations too
+            from south.management.commands import patch_for_test_db_setup
+            patch_for_test_db_setup()
+        except ImportError:
+            pass
+
+        runner = DjangoTestSuiteRunner(verbosity=0, interactive=False)
+        return runner, runner.setup_databases()
+
+    def _run(self, num_essays, batch_size):
+        """
+        Seed the data, then grade essays in each mode.
+
+        Args:
+            num_essays (int): The number of essays to grade in each mode.
+            batch_size (int): The number of essays in each batch, in batch mode.
+
+        Returns:
+            dict of results
+
+        """
+        celery_conf = current_app.conf
+        old_celery_conf = (celery_conf.CELERY_ALWAYS_EAGER, celery_conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS)
+        celery_conf.CELERY_ALWAYS_EAGER = True
+        celery_conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
+
+        old_debug_cursors = [connection.use_debug_cursor for connection in connections.all()]
+        for connection in connections.all():
+            connection.use_debug_cursor = True
+
+        try:
+            results = {
+                'num_essays': num_essays,
+                'batch_size': batch_size,
+                'modes': {}
+            }
+            for mode in MODES:
+                mode_batch_size = batch_size if mode == 'batch' else 1
+                with override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_GRADING_BATCH_SIZE=mode_batch_size):
+                    results['modes'][mode] = self._grade(mode, num_essays, batch_size)
+            return results
+        finally:
+            celery_conf.CELERY_ALWAYS_EAGER, celery_conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS = old_celery_conf
+            for connection, use_debug_cursor in zip(connections.all(), old_debug_cursors):
+                connection.use_debug_cursor = use_debug_cursor
+            reset_queries()
+
+    @staticmethod
+    def _grade(mode, num_essays, batch_size):
+        """
+        Train classifiers and create submissions (untimed), then grade every submission.
+
+        Args:
+            mode (str): Either "single" or "batch".
+            num_essays (int): The number of essays to grade.
+            batch_size (int): The number of essays in each batch, in batch mode.
+
+        Returns:
+            dict of results for the mode
+
+        Raises:
+            CommandError
+
+        """
+        # Each mode uses its own problem, so its classifiers and workflows are independent.
+        course_id = u"performance_test_for_ai_grading"
+        item_id = u"item_{}".format(mode)
+
+        training_uuid = ai_api.train_classifiers(RUBRIC, EXAMPLES, course_id, item_id, ALGORITHM_ID)
+        classifier_set = AITrainingWorkflow.objects.get(uuid=training_uuid).classifier_set
+        if classifier_set is None:
+            raise CommandError(u"Could not train classifiers with the fake AI algorithm.")
+
+        # One extra essay warms up the caches (rubric, classifiers) before the timed run.
+        submission_uuids = []
+        for num in range(num_essays + 1):
+            student_item = {
+                'student_id': u"student_{}".format(num),
+                'course_id': course_id,
+                'item_id': item_id,
+                'item_type': 'openassessment',
+            }
+            answer = {'text': u"Essay {num} {padding}".format(num=num, padding=u"x" * (num % 7))}
+            submission_uuids.append(sub_api.create_submission(student_item, answer)['uuid'])
+        workflow_api.create_workflow(submission_uuids.pop(), STEPS, ON_INIT_PARAMS)
+
+        if mode == 'batch':
+            latencies, seconds = Command._grade_batches(submission_uuids, classifier_set.pk, batch_size)
+        else:
+            latencies, seconds = Command._grade_single(submission_uuids)
+        num_queries = _num_queries()
+
+        num_graded = AIGradingWorkflow.objects.filter(
+            course_id=course_id, item_id=item_id, completed_at__isnull=False
+        ).count()
+        if num_graded != num_essays + 1:
+            raise CommandError(
+                u"Only {graded} of {total} essays were graded in {mode} mode.".format(
+                    graded=num_graded, total=num_essays + 1, mode=mode
+                )
+            )
+
+        return {
+            'essays_per_second': round(num_essays / max(seconds, 1e-9), 1),
+            'queries_per_essay': round(float(num_queries) / num_essays, 2),
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(_percentile(latencies, 95) * 1000, 2),
+        }
+
+    @staticmethod
+    def _grade_single(submission_uuids):
+        """
+        Submit each essay, grading it with its own task.
+
+        Args:
+            submission_uuids (list of str): The submissions to grade.
+
+        Returns:
+            tuple of `(list of latencies in seconds, total seconds)`
+
+        """
+        latencies = []
+        reset_queries()
+        start = datetime.datetime.now()
+        for submission_uuid in submission_uuids:
+            submitted_at = datetime.datetime.now()
+            workflow_api.create_workflow(submission_uuid, STEPS, ON_INIT_PARAMS)
+            latencies.append((datetime.datetime.now() - submitted_at).total_seconds())
+        return latencies, (datetime.datetime.now() - start).total_seconds()
+
+    @staticmethod
+    def _grade_batches(submission_uuids, classifier_set_id, batch_size):
+        """
+        Submit the essays, grading them in batches.
+
+        With eager Celery tasks, the flush that `schedule_grading` schedules for the
+        first essay in a batch would run immediately (ignoring its countdown).
+        Instead, we mark a flush as pending, so essays are collected,
+        and run the flush ourselves once a batch is full.
+
+        Args:
+            submission_uuids (list of str): The submissions to grade.
+            classifier_set_id (int): The primary key of the classifier set grading the essays.
+            batch_size (int): The number of essays in each batch.
+
+        Returns:
+            tuple of `(list of latencies in seconds, total seconds)`
+
+        """
+        latencies = []
+        reset_queries()
+        start = datetime.datetime.now()
+        for batch_start in range(0, len(submission_uuids), batch_size):
+            PENDING_FLUSH_CACHE.set(classifier_set_id, True)
+            submitted_times = []
+            for submission_uuid in submission_uuids[batch_start:batch_start + batch_size]:
+                submitted_times.append(datetime.datetime.now())
+                workflow_api.create_workflow(submission_uuid, STEPS, ON_INIT_PARAMS)
+            flush_grading_batch(classifier_set_id)
+            graded_at = datetime.datetime.now()
+            latencies.extend((graded_at - submitted_at).total_seconds() for submitted_at in submitted_times)
+        return latencies, (datetime.datetime.now() - start).total_seconds()
+
+    @staticmethod
+    def _report(results):
+        """
+        Print the results of each mode.
+        """
+        print "Graded %d essays in each mode (batches of %d)" % (results['num_essays'], results['batch_size'])
+        print "%-8s %14s %14s %12s %12s" % ("Mode", "Essays/sec", "Queries/essay", "p50 (ms)", "p95 (ms)")
+        for mode in MODES:
+            mode_results = results['modes'][mode]
+            print "%-8s %14.1f %14.2f %12.2f %12.2f" % (
+                mode, mode_results['essays_per_second'], mode_results['queries_per_essay'],
+                mode_results['p50_ms'], mode_results['p95_ms']
+            )
+
+    @staticmethod
+    def _check(results, baseline_path, tolerance):
+        """
+        Compare results with the baseline.
+
+        Args:
+            results (dict): The results of this run.
+            baseline_path (unicode): Path of the baseline results.
+            tolerance (float): Fraction of the baseline throughput a run may lose.
+
+        Raises:
+            CommandError: The results regressed, or the baseline can't be compared.
+
+        """
+        try:
+            with open(baseline_path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (IOError, ValueError) as ex:
+            raise CommandError(u"Could not read the baseline {path}: {ex}".format(path=baseline_path, ex=ex))
+
+        if (baseline.get('num_essays'), baseline.get('batch_size')) != (results['num_essays'], results['batch_size']):
+            raise CommandError(
+                u"The baseline was recorded with {num} essays in batches of {size}; "
+                u"run the benchmark with the same arguments to compare.".format(
+                    num=baseline.get('num_essays'), size=baseline.get('batch_size')
+                )
+            )
+
+        regressions = []
+        for mode in MODES:
+            expected = baseline['modes'][mode]
+            actual = results['modes'][mode]
+            if actual['queries_per_essay'] > expected['queries_per_essay'] * (1 + QUERY_TOLERANCE):
+                regressions.append(u"{mode}: {actual} queries per essay (baseline {expected})".format(
+                    mode=mode, actual=actual['queries_per_essay'], expected=expected['queries_per_essay']
+                ))
+            if actual['essays_per_second'] < expected['essays_per_second'] * (1 - tolerance):
+                regressions.append(u"{mode}: {actual} essays per second (baseline {expected})".format(
+                    mode=mode, actual=actual['essays_per_second'], expected=expected['essays_per_second']
+                ))
+
+        if regressions:
+            raise CommandError(u"Regressed from the baseline: {}".format(u"; ".join(regressions)))
+        print "No regressions from the baseline %s" % baseline_path
@@ -0,0 +1,83 @@
+"""
+Compare the time taken to serialize assessments using
+    AssessmentSerializer (Django REST Framework)
+    serialize_assessment (hand-written)
+for assessments already in the database.
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openassessment.assessment.models import Assessment
+from openassessment.assessment.serializers import (
+    AssessmentSerializer, serialize_assessment
+)
+
+
+class Command(BaseCommand):
+    """
+    Note the time taken to serialize assessments.
+    """
+
+    help = ("Compare the performance of the DRF AssessmentSerializer "
+            "with the hand-written serialize_assessment function.")
+
+    args = '[NUM_ASSESSMENTS] [NUM_ITERATIONS]'
+
+    DEFAULT_NUM_ASSESSMENTS = 100
+    DEFAULT_NUM_ITERATIONS = 100
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            num_assessments (int): The maximum number of assessments to serialize.
+            num_iterations (int): The number of times to serialize each assessment.
+
+        Raises:
+            CommandError
+
+        """
+        try:
+            num_assessments = int(args[0]) if len(args) > 0 else self.DEFAULT_NUM_ASSESSMENTS
+            num_iterations = int(args[1]) if len(args) > 1 else self.DEFAULT_NUM_ITERATIONS
+        except ValueError:
+            raise CommandError(u"Usage: performance_test_for_assessment_serializer {}".format(self.args))
+
+        assessments = list(Assessment.objects.all()[:num_assessments])
+        if not assessments:
+            raise CommandError(u"No assessments found; create some assessments first.")
+
+        drf_time = self._time(lambda assessment: AssessmentSerializer(assessment).data, assessments, num_iterations)
+        fast_time = self._time(serialize_assessment, assessments, num_iterations)
+
+        num_calls = len(assessments) * num_iterations
+        print "Serialized %d assessments %d times each" % (len(assessments), num_iterations)
+        print "Time taken by (AssessmentSerializer) Is:  %s " % drf_time
+        print "Time taken by (serialize_assessment) Is:  %s " % fast_time
+        print "Speedup:  %.1fx (%.1f us vs %.1f us per assessment)" % (
+            drf_time.total_seconds() / max(fast_time.total_seconds(), 1e-9),
+            drf_time.total_seconds() * 1e6 / num_calls,
+            fast_time.total_seconds() * 1e6 / num_calls,
+        )
+
+    @staticmethod
+    def _time(serialize, assessments, num_iterations):
+        """
+        Time serializing every assessment `num_iterations` times.
+
+        Args:
+            serialize (callable): Function that serializes an assessment.
+            assessments (list of Assessment): The assessments to serialize.
+            num_iterations (int): The number of times to serialize each assessment.
+
+        Returns:
+            datetime.timedelta
+
+        """
+        before = datetime.datetime.now()
+        for __ in range(num_iterations):
+            for assessment in assessments:
+                serialize(assessment)
+        return datetime.datetime.now() - before
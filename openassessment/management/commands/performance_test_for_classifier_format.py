@@ -0,0 +1,194 @@
+"""
+Compare the size, load time, and peak memory of classifiers stored as
+    JSON with base64-encoded pickles (the original format)
+    the binary classifier format (compressed and uncompressed)
+using synthetic classifiers of a given size.
+"""
+import base64
+import datetime
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+from multiprocessing import Pool
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openassessment.assessment import classifier_format
+from openassessment.assessment.classifier_format import BinaryData
+
+
+def _load_json(path):
+    """
+    Load a classifier stored as JSON with base64-encoded pickles.
+    """
+    with open(path, 'rb') as classifier_file:
+        classifier = json.loads(classifier_file.read())
+    return {key: pickle.loads(base64.b64decode(value)) for key, value in classifier.iteritems()}
+
+
+def _load_binary(path):
+    """
+    Load a classifier stored in the binary format, memory-mapping the file.
+    """
+    classifier = classifier_format.read_classifier_file(path)
+    return {key: pickle.loads(value) for key, value in classifier.iteritems()}
+
+
+def _load_binary_stream(path):
+    """
+    Load a classifier stored in the binary format, streaming the file
+    (as we do for storage backends such as S3).
+    """
+    with open(path, 'rb') as classifier_file:
+        classifier = classifier_format.read_classifier(classifier_file)
+    return {key: pickle.loads(value) for key, value in classifier.iteritems()}
+
+
+LOADERS = {
+    'json': _load_json,
+    'binary': _load_binary,
+    'binary-stream': _load_binary_stream,
+}
+
+
+def _time_load(args):
+    """
+    Load a classifier repeatedly in a separate process,
+    so that the peak memory usage of each format can be measured independently.
+
+    Args:
+        args (tuple): `(loader name, path, number of iterations)`
+
+    Returns:
+        tuple of `(seconds, peak RSS in kilobytes)`
+
+    """
+    loader_name, path, num_iterations = args
+    load = LOADERS[loader_name]
+    before = datetime.datetime.now()
+    for __ in range(num_iterations):
+        load(path)
+    seconds = (datetime.datetime.now() - before).total_seconds()
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    """
+    Note the size, load time and peak memory of each classifier format.
+    """
+
+    help = ("Compare JSON/base64 classifier storage with "
+            "the binary classifier format.")
+
+    args = '[SIZE_MB] [NUM_ITERATIONS]'
+
+    DEFAULT_SIZE_MB = 10
+    DEFAULT_NUM_ITERATIONS = 5
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            size_mb (int): The approximate size of the pickled classifier objects, in megabytes.
+            num_iterations (int): The number of times to load each classifier.
+
+        Raises:
+            CommandError
+
+        """
+        try:
+            size_mb = int(args[0]) if len(args) > 0 else self.DEFAULT_SIZE_MB
+            num_iterations = int(args[1]) if len(args) > 1 else self.DEFAULT_NUM_ITERATIONS
+        except ValueError:
+            raise CommandError(u"Usage: performance_test_for_classifier_format {}".format(self.args))
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            paths = self._write_classifiers(temp_dir, self._classifier(size_mb))
+            print "Loaded each classifier %d times (%d MB of pickled objects)" % (num_iterations, size_mb)
+            print "%-24s %14s %14s %14s" % ("Format", "Bytes", "Load (s)", "Peak RSS (KB)")
+            for label, loader_name, path in [
+                ('json', 'json', paths['json']),
+                ('binary', 'binary', paths['binary']),
+                ('binary (uncompressed)', 'binary', paths['binary-uncompressed']),
+                ('binary (streamed)', 'binary-stream', paths['binary']),
+            ]:
+                pool = Pool(1)
+                try:
+                    seconds, peak_rss = pool.apply(_time_load, [(loader_name, path, num_iterations)])
+                finally:
+                    pool.close()
+                    pool.join()
+                print "%-24s %14d %14.3f %14d" % (label, os.path.getsize(path), seconds, peak_rss)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @staticmethod
+    def _classifier(size_mb):
+        """
+        Create a synthetic classifier resembling the EASE classifiers:
+        a feature extractor and a score classifier, pickled.
+
+        Args:
+            size_mb (int): The approximate size of the pickled objects, in megabytes.
+
+        Returns:
+            dict mapping names to `BinaryData`
+
+        """
+        rand = random.Random(0)
+        num_floats = size_mb * 1024 * 1024 / 9 / 2
+        return {
+            'feature_extractor': BinaryData(pickle.dumps(
+                [rand.random() for __ in xrange(num_floats)], pickle.HIGHEST_PROTOCOL
+            )),
+            'score_classifier': BinaryData(pickle.dumps(
+                [rand.randint(0, 4) * 0.25 for __ in xrange(num_floats)], pickle.HIGHEST_PROTOCOL
+            )),
+        }
+
+    @staticmethod
+    def _write_classifiers(temp_dir, classifier):
+        """
+        Write the classifier in each format, noting the time taken.
+
+        Args:
+            temp_dir (unicode): The directory to write to.
+            classifier (dict): The classifier.
+
+        Returns:
+            dict mapping format names to file paths
+
+        """
+        paths = {
+            name: os.path.join(temp_dir, name)
+            for name in ['json', 'binary', 'binary-uncompressed']
+        }
+
+        before = datetime.datetime.now()
+        with open(paths['json'], 'wb') as output:
+            output.write(json.dumps({
+                key: base64.b64encode(value) for key, value in classifier.iteritems()
+            }))
+        print "Time taken by (json) Is:  %s " % (datetime.datetime.now() - before)
+
+        before = datetime.datetime.now()
+        with open(paths['binary'], 'wb') as output:
+            classifier_format.write_classifier(classifier, output)
+        print "Time taken by (binary) Is:  %s " % (datetime.datetime.now() - before)
+
+        before = datetime.datetime.now()
+        with open(paths['binary-uncompressed'], 'wb') as output:
+            classifier_format.write_classifier(classifier, output, level=0)
+        print "Time taken by (binary, uncompressed) Is:  %s " % (datetime.datetime.now() - before)
+
+        return paths
@@ -0,0 +1,265 @@
+"""
+Compare the time taken and the database queries made by the two modes of `CsvWriter`:
+    serial: the data for each submission is loaded with its own queries (the original approach)
+    chunked: the data for each page of submissions is loaded with one query per model
+
+The command seeds a course with synthetic submissions, each with a score,
+a peer assessment and (for one in ten) feedback on the assessments,
+then exports the course in each mode.  For example, to compare the modes
+on 100,000 submissions:
+
+    ./manage.py performance_test_for_csv_export 100000
+
+By default, the command runs against a new, temporary test database,
+so it doesn't leave benchmark data behind.
+"""
+import datetime
+import json
+import os
+import uuid
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries
+from django.utils.timezone import now
+
+from submissions.models import StudentItem, Submission, Score
+from openassessment.assessment.models import (
+    Assessment, AssessmentPart, AssessmentFeedback, AssessmentFeedbackOption
+)
+from openassessment.assessment.serializers import rubric_from_dict
+from openassessment.data import CsvWriter
+from openassessment.workflow.models import AssessmentWorkflow
+from .performance_test_for_ai_grading import Command as AIGradingCommand, RUBRIC, _num_queries
+
+
+ITEM_ID = u"item"
+
+MODES = ['serial', 'chunked']
+
+# Number of rows inserted by each query while seeding
+# (SQLite limits the number of variables in a query).
+SEED_BATCH_SIZE = 100
+
+
+def _bulk_create(model, objects):
+    """
+    Insert model instances in batches.
+
+    Args:
+        model (Model class): The model of the instances.
+        objects (list): The instances to insert.
+
+    """
+    for start in range(0, len(objects), SEED_BATCH_SIZE):
+        model.objects.bulk_create(objects[start:start + SEED_BATCH_SIZE])
+
+
+def _ids_by(model, field_name, values):
+    """
+    Look up the primary keys of the instances created by `_bulk_create`.
+
+    Args:
+        model (Model class): The model of the instances.
+        field_name (str): A unique field of the model.
+        values (list): The values of the field.
+
+    Returns:
+        dict mapping each value to the primary key of its instance
+
+    """
+    ids = dict()
+    for start in range(0, len(values), SEED_BATCH_SIZE):
+        ids.update(
+            (value, pk) for pk, value in model.objects.filter(
+                **{"{}__in".format(field_name): values[start:start + SEED_BATCH_SIZE]}
+            ).values_list('pk', field_name)
+        )
+    return ids
+
+
+class Command(BaseCommand):
+    """
+    Note the time taken and queries made to export a course in each mode.
+    """
+
+    help = ("Compare the time taken and queries made by serial and chunked "
+            "exports of submission and assessment data to CSV.")
+
+    args = '[NUM_SUBMISSIONS] [PAGE_SIZE]'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--use-current-db', action='store_true', dest='use_current_db', default=False,
+            help="Seed and export submissions in the configured database instead of a temporary test database."
+        ),
+    )
+
+    DEFAULT_NUM_SUBMISSIONS = 1000
+    DEFAULT_PAGE_SIZE = CsvWriter.QUERY_INTERVAL
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self.results = dict()
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            num_submissions (int): The number of submissions to export.
+            page_size (int): The number of submissions loaded at a time.
+
+        Raises:
+            CommandError
+
+        """
+        try:
+            num_submissions = int(args[0]) if len(args) > 0 else self.DEFAULT_NUM_SUBMISSIONS
+            page_size = int(args[1]) if len(args) > 1 else self.DEFAULT_PAGE_SIZE
+        except ValueError:
+            raise CommandError(u"Usage: performance_test_for_csv_export {}".format(self.args))
+
+        if num_submissions < 1 or page_size < 1:
+            raise CommandError(u"Export at least one submission, at least one at a time.")
+
+        runner = None
+        old_config = None
+        if not options.get('use_current_db'):
+            runner, old_config = AIGradingCommand._setup_database()  # pylint: disable=W0212
+
+        # Each run uses its own course, so runs in the current database are independent.
+        course_id = u"performance_test_for_csv_export_{}".format(uuid.uuid4().hex)
+        old_debug_cursors = [connection.use_debug_cursor for connection in connections.all()]
+        try:
+            print "Seeding %d submissions" % num_submissions
+            self._seed(course_id, num_submissions)
+
+            for connection in connections.all():
+                connection.use_debug_cursor = True
+            for mode in MODES:
+                self.results[mode] = self._export(course_id, mode, page_size)
+        finally:
+            for connection, use_debug_cursor in zip(connections.all(), old_debug_cursors):
+                connection.use_debug_cursor = use_debug_cursor
+            reset_queries()
+            if runner is not None:
+                runner.teardown_databases(old_config)
+
+        print "Exported %d submissions, %d at a time" % (num_submissions, page_size)
+        print "%-10s %12s %12s %18s" % ("Mode", "Time (s)", "Queries", "Submissions/s")
+        for mode in MODES:
+            result = self.results[mode]
+            print "%-10s %12.3f %12d %18.1f" % (
+                mode, result['seconds'], result['queries'],
+                num_submissions / max(result['seconds'], 1e-9)
+            )
+
+    @staticmethod
+    def _export(course_id, mode, page_size):
+        """
+        Export the course, discarding the CSV data.
+
+        Args:
+            course_id (unicode): The course to export.
+            mode (str): Either "serial" or "chunked".
+            page_size (int): The number of submissions loaded at a time.
+
+        Returns:
+            dict with the number of seconds taken, queries made,
+            and submission rows written.
+
+        """
+        num_rows = [0]
+
+        def _count():  # pylint: disable=C0111
+            num_rows[0] += 1
+
+        with open(os.devnull, 'w') as devnull:
+            writer = CsvWriter(
+                {name: devnull for name in CsvWriter.MODELS}, _count,
+                chunked=(mode == 'chunked'), page_size=page_size
+            )
+            reset_queries()
+            start = datetime.datetime.now()
+            writer.write_to_csv(course_id)
+            seconds = (datetime.datetime.now() - start).total_seconds()
+            return {'seconds': seconds, 'queries': _num_queries(), 'rows': num_rows[0]}
+
+    @staticmethod
+    def _seed(course_id, num_submissions):
+        """
+        Create the submissions, with bulk inserts rather than the APIs,
+        so large courses can be seeded quickly.
+
+        Args:
+            course_id (unicode): The course of the submissions.
+            num_submissions (int): The number of submissions to create.
+
+        """
+        rubric = rubric_from_dict(RUBRIC)
+        criteria = list(rubric.criteria.all())
+        options = {criterion.pk: list(criterion.options.all()) for criterion in criteria}
+        feedback_option = AssessmentFeedbackOption.objects.get_or_create(text=u"Useful")[0]
+
+        student_ids = [u"{}_student_{}".format(course_id, num) for num in range(num_submissions)]
+        _bulk_create(StudentItem, [
+            StudentItem(student_id=student_id, course_id=course_id, item_id=ITEM_ID, item_type=u"openassessment")
+            for student_id in student_ids
+        ])
+        student_item_ids = _ids_by(StudentItem, 'student_id', student_ids)
+
+        submission_uuids = [unicode(uuid.uuid4()) for _ in student_ids]
+        _bulk_create(Submission, [
+            Submission(
+                uuid=submission_uuid,
+                student_item_id=student_item_ids[student_id],
+                attempt_number=1,
+                raw_answer=json.dumps({'text': u"Essay by {}".format(student_id)}),
+            )
+            for student_id, submission_uuid in zip(student_ids, submission_uuids)
+        ])
+        submission_ids = _ids_by(Submission, 'uuid', submission_uuids)
+
+        _bulk_create(Score, [
+            Score(
+                student_item_id=student_item_ids[student_id],
+                submission_id=submission_ids[submission_uuid],
+                points_earned=num % 3, points_possible=2,
+            )
+            for num, (student_id, submission_uuid) in enumerate(zip(student_ids, submission_uuids))
+        ])
+        _bulk_create(AssessmentWorkflow, [
+            AssessmentWorkflow(
+                submission_uuid=submission_uuid, uuid=unicode(uuid.uuid4()),
+                course_id=course_id, item_id=ITEM_ID, status=AssessmentWorkflow.STATUS.done,
+            )
+            for submission_uuid in submission_uuids
+        ])
+
+        _bulk_create(Assessment, [
+            Assessment(
+                submission_uuid=submission_uuid, rubric=rubric, scored_at=now(),
+                scorer_id=u"scorer", score_type=u"PE", feedback=u"Well done",
+            )
+            for submission_uuid in submission_uuids
+        ])
+        assessment_ids = _ids_by(Assessment, 'submission_uuid', submission_uuids)
+        _bulk_create(AssessmentPart, [
+            AssessmentPart(
+                assessment_id=assessment_ids[submission_uuid],
+                criterion=criterion,
+                option=options[criterion.pk][num % len(options[criterion.pk])],
+            )
+            for num, submission_uuid in enumerate(submission_uuids)
+            for criterion in criteria
+        ])
+
+        feedback_uuids = submission_uuids[::10]
+        _bulk_create(AssessmentFeedback, [
+            AssessmentFeedback(submission_uuid=submission_uuid, feedback_text=u"Thanks")
+            for submission_uuid in feedback_uuids
+        ])
+        # Options are added one feedback at a time, so only some feedback selects one.
+        for feedback in AssessmentFeedback.objects.filter(submission_uuid__in=feedback_uuids[:SEED_BATCH_SIZE]):
+            feedback.options.add(feedback_option)
@@ -0,0 +1,143 @@
+"""
+Compare the peak memory and time taken by concurrent uploads to the filesystem storage backend:
+    buffered: the whole request body is read, hashed, and written at once (the original approach)
+    streamed: the body is read, hashed, and written in chunks (`save_stream_to_file`)
+using synthetic uploads of a given size.
+"""
+import datetime
+import hashlib
+import resource
+import shutil
+import tempfile
+import threading
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from openassessment.fileupload import views_filesystem
+
+
+class SyntheticUpload(object):
+    """
+    File-like request body of a given size, generated as it is read
+    (like the WSGI input stream of an upload).
+    """
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, size=-1):
+        """
+        Read up to `size` bytes (or all remaining bytes if `size` is negative).
+        """
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        self.remaining -= size
+        return "x" * size
+
+
+def _save_buffered(key, upload):
+    """
+    Save an upload by reading the whole body into memory.
+    """
+    content = upload.read()
+    metadata = {"Content-MD5": hashlib.md5(content).hexdigest()}
+    views_filesystem.save_to_file(key, content, metadata)
+
+
+def _save_streamed(key, upload):
+    """
+    Save an upload by streaming the body in chunks.
+    """
+    views_filesystem.save_stream_to_file(key, upload, {})
+
+
+SAVERS = {
+    'buffered': _save_buffered,
+    'streamed': _save_streamed,
+}
+
+
+def _time_uploads(args):
+    """
+    Run concurrent uploads in threads of a separate process,
+    so that the peak memory usage of each approach can be measured independently.
+
+    Args:
+        args (tuple): `(saver name, storage root, upload size in bytes, number of concurrent uploads)`
+
+    Returns:
+        tuple of `(seconds, RSS before in kilobytes, peak RSS in kilobytes)`
+
+    """
+    saver_name, root, size, num_concurrent = args
+    save = SAVERS[saver_name]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with override_settings(
+        ORA2_FILEUPLOAD_ROOT=root,
+        FILE_UPLOAD_STORAGE_BUCKET_NAME="performance_test",
+        ORA2_FILEUPLOAD_CACHE_NAME="default",
+    ):
+        threads = [
+            threading.Thread(target=save, args=(u"{}/{}".format(saver_name, num), SyntheticUpload(size)))
+            for num in range(num_concurrent)
+        ]
+        before = datetime.datetime.now()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = (datetime.datetime.now() - before).total_seconds()
+
+    return seconds, rss_before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    """
+    Note the time taken and peak memory of concurrent uploads.
+    """
+
+    help = ("Compare the peak memory of buffered and streamed uploads "
+            "to the filesystem storage backend.")
+
+    args = '[SIZE_MB] [NUM_CONCURRENT]'
+
+    DEFAULT_SIZE_MB = 5
+    DEFAULT_NUM_CONCURRENT = 10
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            size_mb (int): The size of each upload, in megabytes.
+            num_concurrent (int): The number of concurrent uploads.
+
+        Raises:
+            CommandError
+
+        """
+        try:
+            size_mb = int(args[0]) if len(args) > 0 else self.DEFAULT_SIZE_MB
+            num_concurrent = int(args[1]) if len(args) > 1 else self.DEFAULT_NUM_CONCURRENT
+        except ValueError:
+            raise CommandError(u"Usage: performance_test_for_file_upload {}".format(self.args))
+
+        root = tempfile.mkdtemp()
+        try:
+            print "Uploaded %d files of %d MB concurrently" % (num_concurrent, size_mb)
+            print "%-12s %12s %18s %18s" % ("Mode", "Time (s)", "RSS before (KB)", "Peak RSS (KB)")
+            for saver_name in ['buffered', 'streamed']:
+                pool = Pool(1)
+                try:
+                    seconds, rss_before, peak_rss = pool.apply(
+                        _time_uploads, [(saver_name, root, size_mb * 1024 * 1024, num_concurrent)]
+                    )
+                finally:
+                    pool.close()
+                    pool.join()
+                print "%-12s %12.3f %18d %18d" % (saver_name, seconds, rss_before, peak_rss)
+        finally:
+            shutil.rmtree(root)
@@ -0,0 +1,299 @@
+"""
+Compare the time taken, peak disk usage and peak memory of the two ways `upload_oa_data` uploads an archive:
+    archive: the CSV files are written to disk, archived to a tarball on disk,
+        and the tarball is uploaded (the original approach)
+    stream: the CSV files are spooled (in memory until they're large), and the archive
+        is compressed as it is uploaded in parts with a multipart upload (`--stream`)
+
+The command seeds a course with synthetic submissions (see `performance_test_for_csv_export`),
+then exports it in each mode to a local stub of S3, which stores keys in a temporary directory.
+For example, to compare the modes on 100,000 submissions, with 5 MB parts:
+
+    ./manage.py performance_test_for_upload_oa_data 100000 5
+
+By default, the command runs against a new, temporary test database,
+so it doesn't leave benchmark data behind.
+"""
+import datetime
+import os
+import resource
+import shutil
+import tempfile
+import uuid
+from multiprocessing import Pool
+from optparse import make_option
+
+from boto.provider import Provider
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from . import upload_oa_data
+from .performance_test_for_ai_grading import Command as AIGradingCommand
+from .performance_test_for_csv_export import Command as CsvExportCommand
+
+
+MODES = ['archive', 'stream']
+
+
+class StubConnection(object):
+    """
+    Stub of the S3 connection of a `StubBucket`, used by `Key.generate_url`.
+    """
+    # With credentials, the provider doesn't look them up (from the network, on EC2).
+    provider = Provider('aws', access_key='stub', secret_key='stub')
+
+    def generate_url(self, expires_in, method, bucket, key, *args):  # pylint: disable=W0613
+        """
+        The URL of a key in a stub bucket.
+        """
+        return u"stub://{}/{}?expires_in={}".format(bucket, key, expires_in)
+
+
+class StubMultipartUpload(object):
+    """
+    Stub of a multipart upload to a `StubBucket`, which appends each part to the key's file.
+    """
+
+    def __init__(self, bucket, key_name):
+        self.bucket = bucket
+        self.key_name = key_name
+        self.part_sizes = []
+        self._file = open(bucket.path(key_name), 'wb')
+
+    def upload_part_from_file(self, fp, part_num):
+        """
+        Upload a part (in order; S3 would also allow parts out of order).
+        """
+        if part_num != len(self.part_sizes) + 1:
+            raise ValueError(u"Part {} uploaded out of order".format(part_num))
+        data = fp.read()
+        self._file.write(data)
+        self.part_sizes.append(len(data))
+
+    def complete_upload(self):
+        """
+        Complete the upload, so the key exists.
+        """
+        self._file.close()
+        self.bucket.num_parts[self.key_name] = len(self.part_sizes)
+
+    def cancel_upload(self):
+        """
+        Abort the upload, deleting the parts uploaded.
+        """
+        self._file.close()
+        os.remove(self.bucket.path(self.key_name))
+
+
+class StubBucket(object):
+    """
+    Local stub of an S3 bucket, which stores each key as a file in a directory.
+    """
+
+    def __init__(self, name, root):
+        self.name = name
+        self.root = root
+        self.connection = StubConnection()
+        self.num_parts = dict()
+
+    def path(self, key_name):
+        """
+        The path of the file that holds a key.
+        """
+        return os.path.join(self.root, key_name.replace(u"/", u"_"))
+
+    def initiate_multipart_upload(self, key_name):
+        """
+        Start a multipart upload to a key.
+        """
+        return StubMultipartUpload(self, key_name)
+
+    def upload_from_filename(self, key_name, file_path):
+        """
+        Upload a file to a key in one request.
+        """
+        shutil.copyfile(file_path, self.path(key_name))
+        self.num_parts[key_name] = 1
+
+
+class StubUploadCommand(upload_oa_data.Command):
+    """
+    The `upload_oa_data` command, uploading to a `StubBucket`,
+    and noting the time taken to archive and upload the CSV files,
+    and the peak disk usage.
+    """
+
+    def __init__(self, bucket_root, *args, **kwargs):
+        super(StubUploadCommand, self).__init__(*args, **kwargs)
+        self.bucket_root = bucket_root
+        self.bucket = None
+        self.csv_size = 0
+        self.peak_disk = 0
+        self.upload_seconds = 0
+        self._archive_start = None
+
+    def _get_bucket(self, s3_bucket):
+        self.bucket = StubBucket(s3_bucket, self.bucket_root)
+        return self.bucket
+
+    def _create_archive(self, dir_path):
+        self._archive_start = datetime.datetime.now()
+        return super(StubUploadCommand, self)._create_archive(dir_path)
+
+    def _upload(self, course_id, file_path, s3_bucket):
+        # The CSV files and the archive are all on disk while the archive is uploaded.
+        csv_dir = os.path.dirname(file_path)
+        self.peak_disk = sum(
+            os.path.getsize(os.path.join(csv_dir, file_name)) for file_name in os.listdir(csv_dir)
+        )
+        self.csv_size = self.peak_disk - os.path.getsize(file_path)
+
+        bucket = self._get_bucket(s3_bucket)
+        key_name = os.path.join(course_id, os.path.split(file_path)[1])
+        bucket.upload_from_filename(key_name, file_path)
+        url = bucket.connection.generate_url(self.URL_EXPIRATION_HOURS * 3600, 'GET', bucket.name, key_name)
+        self._history.append({'key': key_name, 'url': url})
+        self.upload_seconds = (datetime.datetime.now() - self._archive_start).total_seconds()
+        return url
+
+    def _stream_archive(self, course_id, output_streams, s3_bucket, part_size):
+        # Only the CSV files that grew larger than the spool size are on disk.
+        self.csv_size = sum(output_stream.tell() for output_stream in output_streams.values())
+        self.peak_disk = sum(
+            output_stream.tell() for output_stream in output_streams.values()
+            if output_stream._rolled  # pylint: disable=W0212
+        )
+        start = datetime.datetime.now()
+        url = super(StubUploadCommand, self)._stream_archive(course_id, output_streams, s3_bucket, part_size)
+        self.upload_seconds = (datetime.datetime.now() - start).total_seconds()
+        return url
+
+    def _progress_callback(self):
+        pass
+
+
+def _time_upload(args):
+    """
+    Export and upload a course in a separate process,
+    so that the peak memory usage of each mode can be measured independently.
+
+    Args:
+        args (tuple): `(mode, course ID, bucket root, part size in MB)`
+
+    Returns:
+        dict with the number of seconds taken (in all, and to archive and upload the CSV files),
+        size of the CSV files and the archive in bytes,
+        number of parts uploaded, peak disk usage in bytes, and RSS before
+        and peak RSS in kilobytes.
+
+    """
+    mode, course_id, bucket_root, part_size_mb = args
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    cmd = StubUploadCommand(bucket_root)
+    start = datetime.datetime.now()
+    cmd.handle(
+        course_id.encode('utf-8'), mode.encode('utf-8'),
+        stream=(mode == 'stream'), part_size=part_size_mb
+    )
+    seconds = (datetime.datetime.now() - start).total_seconds()
+
+    key_name = cmd.history[-1]['key']
+    return {
+        'seconds': seconds,
+        'upload_seconds': cmd.upload_seconds,
+        'csv_size': cmd.csv_size,
+        'size': os.path.getsize(cmd.bucket.path(key_name)),
+        'parts': cmd.bucket.num_parts[key_name],
+        'peak_disk': cmd.peak_disk,
+        'rss_before': rss_before,
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+class Command(BaseCommand):
+    """
+    Note the time taken, peak disk usage and peak memory to upload a course in each mode.
+    """
+
+    help = ("Compare the time taken, peak disk usage and peak memory of uploading "
+            "a course's data archive from disk and streaming it with a multipart upload.")
+
+    args = '[NUM_SUBMISSIONS] [PART_SIZE_MB]'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--use-current-db', action='store_true', dest='use_current_db', default=False,
+            help="Seed and export submissions in the configured database instead of a temporary test database."
+        ),
+    )
+
+    DEFAULT_NUM_SUBMISSIONS = 1000
+    DEFAULT_PART_SIZE_MB = 5
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self.results = dict()
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            num_submissions (int): The number of submissions to export.
+            part_size_mb (int): The size of each part of a streamed upload, in megabytes.
+
+        Raises:
+            CommandError
+
+        """
+        try:
+            num_submissions = int(args[0]) if len(args) > 0 else self.DEFAULT_NUM_SUBMISSIONS
+            part_size_mb = int(args[1]) if len(args) > 1 else self.DEFAULT_PART_SIZE_MB
+        except ValueError:
+            raise CommandError(u"Usage: performance_test_for_upload_oa_data {}".format(self.args))
+
+        if num_submissions < 1 or part_size_mb < 1:
+            raise CommandError(u"Upload at least one submission, in parts of at least one megabyte.")
+
+        runner = None
+        old_config = None
+        if not options.get('use_current_db'):
+            runner, old_config = AIGradingCommand._setup_database()  # pylint: disable=W0212
+
+        # Each run uses its own course, so runs in the current database are independent.
+        course_id = u"performance_test_for_upload_oa_data_{}".format(uuid.uuid4().hex)
+        bucket_root = tempfile.mkdtemp()
+        try:
+            print "Seeding %d submissions" % num_submissions
+            CsvExportCommand._seed(course_id, num_submissions)  # pylint: disable=W0212
+
+            for mode in MODES:
+                # Each mode runs in a new process, which opens its own database connections.
+                for connection in connections.all():
+                    connection.close()
+                pool = Pool(1)
+                try:
+                    self.results[mode] = pool.apply(_time_upload, [(mode, course_id, bucket_root, part_size_mb)])
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            shutil.rmtree(bucket_root)
+            if runner is not None:
+                runner.teardown_databases(old_config)
+
+        print "Uploaded %d submissions, in parts of %d MB when streamed" % (num_submissions, part_size_mb)
+        print "Throughput is of CSV data archived and uploaded, after the export."
+        print "%-10s %10s %12s %10s %14s %8s %10s %16s %16s" % (
+            "Mode", "Time (s)", "Upload (s)", "CSV (KB)", "Archive (KB)", "Parts", "MB/s",
+            "Peak disk (KB)", "Peak RSS (KB)"
+        )
+        for mode in MODES:
+            result = self.results[mode]
+            print "%-10s %10.3f %12.3f %10d %14d %8d %10.2f %16d %16d" % (
+                mode, result['seconds'], result['upload_seconds'],
+                result['csv_size'] / 1024, result['size'] / 1024, result['parts'],
+                result['csv_size'] / (1024.0 * 1024.0) / max(result['upload_seconds'], 1e-9),
+                result['peak_disk'] / 1024, result['peak_rss']
+            )
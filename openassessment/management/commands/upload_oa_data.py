@@ -8,13 +8,105 @@ import datetime
 import shutil
 import tempfile
 import tarfile
+import time
+from StringIO import StringIO
+from multiprocessing import Pool
+from optparse import make_option
 import boto
 from boto.s3.key import Key
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connections
 from openassessment.data import CsvWriter
 
 
+def _dump_shard_to_csv(args):
+    """
+    Write the CSV rows for a shard of a course to part files, in a worker process.
+
+    Args:
+        args (tuple): `(course_id, start_key, end_key, shard_dir)`, where the keys
+            delimit the shard (see `CsvWriter.shard_keys`) and `shard_dir` is the
+            directory of the part files.
+
+    Returns:
+        set of the feedback option IDs selected in the shard
+
+    """
+    course_id, start_key, end_key, shard_dir = args
+    output_streams = {
+        name: open(os.path.join(shard_dir, rel_path), 'w')
+        for name, rel_path in Command.OUTPUT_CSV_PATHS.iteritems()
+    }
+    try:
+        csv_writer = CsvWriter(output_streams, chunked=True)
+        return csv_writer.write_submissions_to_csv(course_id, start_key, end_key)
+    finally:
+        for output_stream in output_streams.values():
+            output_stream.close()
+
+
+class MultipartUploadStream(object):
+    """
+    Write-only file-like object that uploads what is written to an S3 key,
+    with a multipart upload.  Data is buffered until a part is full,
+    so at most one part is held in memory.
+    """
+
+    # S3 rejects parts smaller than 5 MB (except the last part).
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, bucket, key_name, part_size):
+        """
+        Start the multipart upload.
+
+        Args:
+            bucket (Bucket): The S3 bucket to upload to.
+            key_name (unicode): The name of the key to create.
+            part_size (int): The size of each part in bytes (except the last).
+
+        """
+        self.part_size = max(part_size, self.MIN_PART_SIZE)
+        self.size = 0
+        self.num_parts = 0
+        self._buffer = StringIO()
+        self._upload = bucket.initiate_multipart_upload(key_name)
+
+    def write(self, data):
+        """
+        Buffer data, uploading a part whenever the buffer is full.
+        """
+        self._buffer.write(data)
+        self.size += len(data)
+        if self._buffer.tell() >= self.part_size:
+            self._upload_part()
+
+    def close(self):
+        """
+        Upload the last part and complete the upload.
+        """
+        self._upload_part()
+        self._upload.complete_upload()
+
+    def cancel(self):
+        """
+        Abort the upload, so S3 frees the parts already uploaded.
+        """
+        self._upload.cancel_upload()
+
+    def _upload_part(self):
+        """
+        Upload the buffered data as the next part.
+        """
+        # Every upload needs at least one part, even if it's empty.
+        if self._buffer.tell() == 0 and self.num_parts > 0:
+            return
+        self._buffer.seek(0)
+        self.num_parts += 1
+        self._upload.upload_part_from_file(self._buffer, self.num_parts)
+        self._buffer = StringIO()
+
+
 class Command(BaseCommand):
     """
     Create and upload CSV files for submission and assessment data.
@@ -23,6 +115,27 @@ class Command(BaseCommand):
     help = 'Create and upload CSV files for submission and assessment data.'
     args = '<COURSE_ID> <S3_BUCKET_NAME>'
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--shards', dest='shards', type='int', default=1,
+            help=(
+                "Split the course into this many shards, exported in parallel by a pool of processes. "
+                "The output is the same as a serial export."
+            )
+        ),
+        make_option(
+            '--stream', action='store_true', dest='stream', default=False,
+            help=(
+                "Stream the archive to S3 with a multipart upload as it is compressed, "
+                "instead of creating it on disk first."
+            )
+        ),
+        make_option(
+            '--part-size', dest='part_size', type='int', default=8,
+            help="The size of each part of a streamed upload, in MB (at least 5)."
+        ),
+    )
+
     OUTPUT_CSV_PATHS = {
         output_name: "{}.csv".format(output_name)
         for output_name in CsvWriter.MODELS
@@ -31,6 +144,10 @@ class Command(BaseCommand):
     URL_EXPIRATION_HOURS = 24
     PROGRESS_INTERVAL = 10
 
+    # When streaming, each CSV file is held in memory up to this size,
+    # then spooled to disk.
+    SPOOL_SIZE = 1024 * 1024
+
     def __init__(self, *args, **kwargs):
         super(Command, self).__init__(*args, **kwargs)
         self._history = list()
@@ -62,41 +179,122 @@ class Command(BaseCommand):
         if len(args) < 2:
             raise CommandError(u'Usage: upload_oa_data {}'.format(self.args))
 
+        num_shards = options.get('shards', 1)
+        if num_shards < 1:
+            raise CommandError(u'The number of shards must be at least 1.')
+
         course_id, s3_bucket = args[0].decode('utf-8'), args[1].decode('utf-8')
         csv_dir = tempfile.mkdtemp()
+        stream = options.get('stream', False)
+        part_size = options.get('part_size', 8) * 1024 * 1024
+
+        if stream:
+            # The size of each CSV file must be known before it is added to the archive,
+            # so the files are spooled (in memory while they're small) until the export completes.
+            output_streams = {
+                name: tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE, dir=csv_dir)
+                for name in self.OUTPUT_CSV_PATHS
+            }
+        else:
+            output_streams = {
+                name: open(os.path.join(csv_dir, rel_path), 'w')
+                for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems()
+            }
 
         try:
             print u"Generating CSV files for course '{}'".format(course_id)
-            self._dump_to_csv(course_id, csv_dir)
-            print u"Creating archive of CSV files in {}".format(csv_dir)
-            archive_path = self._create_archive(csv_dir)
-            print u"Uploading {} to {}/{}".format(archive_path, s3_bucket, course_id)
-            url = self._upload(course_id, archive_path, s3_bucket)
+            if num_shards > 1:
+                self._dump_shards_to_csv(course_id, output_streams, csv_dir, num_shards)
+            else:
+                self._dump_to_csv(course_id, output_streams)
+
+            if stream:
+                print u"Streaming archive of CSV files to {}/{}".format(s3_bucket, course_id)
+                url = self._stream_archive(course_id, output_streams, s3_bucket, part_size)
+            else:
+                for output_stream in output_streams.values():
+                    output_stream.close()
+                print u"Creating archive of CSV files in {}".format(csv_dir)
+                archive_path = self._create_archive(csv_dir)
+                print u"Uploading {} to {}/{}".format(archive_path, s3_bucket, course_id)
+                url = self._upload(course_id, archive_path, s3_bucket)
             print "== Upload successful =="
             print u"Download URL (expires in {} hours):\n{}".format(self.URL_EXPIRATION_HOURS, url)
         finally:
+            for output_stream in output_streams.values():
+                output_stream.close()
             # Assume that the archive was created in the directory,
             # so to clean up we just need to delete the directory.
             shutil.rmtree(csv_dir)
 
-    def _dump_to_csv(self, course_id, csv_dir):
+    def _dump_to_csv(self, course_id, output_streams):
         """
-        Create CSV files for submission/assessment data in a directory.
+        Write CSV data for submission/assessment data.
 
         Args:
             course_id (unicode): The ID of the course to dump data from.
-            csv_dir (unicode): The absolute path to the directory in which to create CSV files.
+            output_streams (dict): The file to write for each output name.
 
         Returns:
             None
         """
-        output_streams = {
-            name: open(os.path.join(csv_dir, rel_path), 'w')
-            for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems()
-        }
-        csv_writer = CsvWriter(output_streams, self._progress_callback)
+        csv_writer = CsvWriter(output_streams, self._progress_callback, chunked=True)
         csv_writer.write_to_csv(course_id)
 
+    def _dump_shards_to_csv(self, course_id, output_streams, csv_dir, num_shards):
+        """
+        Write CSV data for submission/assessment data,
+        exporting shards of the course in parallel.
+
+        Each worker process writes the rows for its shard to its own part files.
+        The parts are then concatenated in shard order, which is the order of
+        a serial export, and the feedback options selected in any shard are
+        written last.
+
+        Args:
+            course_id (unicode): The ID of the course to dump data from.
+            output_streams (dict): The file to write for each output name.
+            csv_dir (unicode): The absolute path to the directory in which to create part files.
+            num_shards (int): The number of shards (and worker processes).
+
+        Returns:
+            None
+        """
+        shards = CsvWriter.shard_keys(course_id, num_shards)
+        shard_dirs = []
+        for shard_num in range(len(shards)):
+            shard_dir = os.path.join(csv_dir, "shard_{}".format(shard_num))
+            os.mkdir(shard_dir)
+            shard_dirs.append(shard_dir)
+
+        # Worker processes must open their own database connections
+        for connection in connections.all():
+            connection.close()
+
+        feedback_option_ids = set()
+        pool = Pool(len(shards))
+        try:
+            shard_args = [
+                (course_id, start_key, end_key, part_dir)
+                for (start_key, end_key), part_dir in zip(shards, shard_dirs)
+            ]
+            for shard_option_ids in pool.imap(_dump_shard_to_csv, shard_args):
+                feedback_option_ids.update(shard_option_ids)
+                sys.stdout.write('.')
+                sys.stdout.flush()
+        finally:
+            pool.close()
+            pool.join()
+
+        csv_writer = CsvWriter(output_streams)
+        csv_writer.write_csv_headers()
+        for shard_dir in shard_dirs:
+            for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems():
+                with open(os.path.join(shard_dir, rel_path)) as part_file:
+                    shutil.copyfileobj(part_file, output_streams[name])
+            shutil.rmtree(shard_dir)
+        csv_writer.write_feedback_options_to_csv(feedback_option_ids)
+
     def _create_archive(self, dir_path):
         """
         Create an archive of a directory.
@@ -108,27 +306,71 @@ class Command(BaseCommand):
             unicode: Absolute path to the archive.
 
         """
-        tarball_name = u"{}.tar.gz".format(
-            datetime.datetime.utcnow().strftime("%Y-%m-%dT%H_%M")
-        )
-        tarball_path = os.path.join(dir_path, tarball_name)
+        tarball_path = os.path.join(dir_path, self._archive_name())
         with tarfile.open(tarball_path, "w:gz") as tar:
             for rel_path in self.OUTPUT_CSV_PATHS.values():
                 tar.add(os.path.join(dir_path, rel_path), arcname=rel_path)
         return tarball_path
 
-    def _upload(self, course_id, file_path, s3_bucket):
+    def _archive_name(self):
         """
-        Upload a file.
+        The name of the archive, from the current time.
+
+        Returns:
+            unicode
+
+        """
+        return u"{}.tar.gz".format(
+            datetime.datetime.utcnow().strftime("%Y-%m-%dT%H_%M")
+        )
+
+    def _stream_archive(self, course_id, output_streams, s3_bucket, part_size):
+        """
+        Compress the CSV files into an archive as it is uploaded,
+        so the archive is never written to disk.
 
         Args:
             course_id (unicode): The ID of the course.
-            file_path (unicode): Absolute path to the file to upload.
-            s3_bucket (unicode): Name of the S3 bucket where the file will be uploaded.
+            output_streams (dict): The spooled CSV file for each output name.
+            s3_bucket (unicode): Name of the S3 bucket where the archive will be uploaded.
+            part_size (int): The size of each part of the upload, in bytes.
 
         Returns:
             str: URL to access the uploaded archive.
 
+        """
+        bucket = self._get_bucket(s3_bucket)
+        key_name = os.path.join(course_id, self._archive_name())
+        upload_stream = MultipartUploadStream(bucket, key_name, part_size)
+        try:
+            with tarfile.open(fileobj=upload_stream, mode="w|gz") as tar:
+                for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems():
+                    csv_file = output_streams[name]
+                    tarinfo = tarfile.TarInfo(rel_path)
+                    tarinfo.size = csv_file.tell()
+                    tarinfo.mtime = time.time()
+                    tarinfo.mode = 0644
+                    csv_file.seek(0)
+                    tar.addfile(tarinfo, csv_file)
+            upload_stream.close()
+        except:
+            upload_stream.cancel()
+            raise
+
+        url = Key(bucket=bucket, name=key_name).generate_url(self.URL_EXPIRATION_HOURS * 3600)
+        self._history.append({'key': key_name, 'url': url})
+        return url
+
+    def _get_bucket(self, s3_bucket):
+        """
+        Connect to an S3 bucket.
+
+        Args:
+            s3_bucket (unicode): Name of the S3 bucket.
+
+        Returns:
+            Bucket
+
         """
         # Try to get the AWS credentials from settings if they are available
         # If not, these will default to `None`, and boto will try to use
@@ -139,8 +381,22 @@ class Command(BaseCommand):
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key
         )
+        return conn.get_bucket(s3_bucket)
+
+    def _upload(self, course_id, file_path, s3_bucket):
+        """
+        Upload a file.
 
-        bucket = conn.get_bucket(s3_bucket)
+        Args:
+            course_id (unicode): The ID of the course.
+            file_path (unicode): Absolute path to the file to upload.
+            s3_bucket (unicode): Name of the S3 bucket where the file will be uploaded.
+
+        Returns:
+            str: URL to access the uploaded archive.
+
+        """
+        bucket = self._get_bucket(s3_bucket)
         key_name = os.path.join(course_id, os.path.split(file_path)[1])
         key = Key(bucket=bucket, name=key_name)
         key.set_contents_from_filename(file_path)
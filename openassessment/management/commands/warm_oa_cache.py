@@ -0,0 +1,80 @@
+"""
+Warm the ORA2 caches for active problems (for example, after a deploy or a cache flush).
+"""
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from openassessment.assessment.worker import warmup
+
+
+class Command(BaseCommand):
+    """
+    Pre-populate cached rubrics, training examples, and classifier set metadata.
+    """
+
+    help = (
+        u"Pre-populate the cache with serialized rubrics, training examples "
+        u"and classifier set metadata for problems with recent activity."
+    )
+
+    args = '[COURSE_ID]'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--days', type='int', dest='active_days', default=warmup.DEFAULT_ACTIVE_DAYS,
+            help=u"Warm the caches for problems with activity in the last DAYS days."
+        ),
+        make_option(
+            '--batch-size', type='int', dest='batch_size', default=warmup.DEFAULT_BATCH_SIZE,
+            help=u"Number of objects to load and cache in each batch."
+        ),
+        make_option(
+            '--workers', type='int', dest='num_workers', default=warmup.DEFAULT_NUM_WORKERS,
+            help=u"Number of batches to process in parallel."
+        ),
+        make_option(
+            '--async', action='store_true', dest='async', default=False,
+            help=u"Schedule a Celery task to warm the caches instead of warming them in this process."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            course_id (unicode): If provided, warm the caches only for problems in this course.
+
+        Raises:
+            CommandError
+
+        """
+        if len(args) > 1:
+            raise CommandError(u'Usage: warm_oa_cache {}'.format(self.args))
+        course_id = args[0].decode('utf-8') if args else None
+
+        active_days = options.get('active_days', warmup.DEFAULT_ACTIVE_DAYS)
+        batch_size = options.get('batch_size', warmup.DEFAULT_BATCH_SIZE)
+        num_workers = options.get('num_workers', warmup.DEFAULT_NUM_WORKERS)
+        if active_days < 1 or batch_size < 1 or num_workers < 1:
+            raise CommandError(u"--days, --batch-size and --workers must be positive integers")
+
+        if options.get('async'):
+            warmup.warm_caches_task.apply_async(kwargs={
+                'active_days': active_days, 'course_id': course_id,
+                'batch_size': batch_size, 'num_workers': num_workers,
+            })
+            print u"Scheduled a task to warm the caches."
+            return
+
+        results = warmup.warm_caches(
+            active_days=active_days, course_id=course_id,
+            batch_size=batch_size, num_workers=num_workers
+        )
+        print u"Warmed caches for {items} active items".format(**results)
+        print u"Rubrics:  {rubrics}".format(**results)
+        print u"Training examples:  {training_examples}".format(**results)
+        print u"Classifier sets:  {classifier_sets}".format(**results)
+        print u"Total entries warmed:  {}".format(
+            results['rubrics'] + results['training_examples'] + results['classifier_sets']
+        )
+        print u"Time taken:  {seconds} seconds".format(**results)
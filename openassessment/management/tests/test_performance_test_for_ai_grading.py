@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the AI grading pipeline benchmark management command.
+"""
+import json
+import os
+import shutil
+import tempfile
+from django.core.management.base import CommandError
+from openassessment.test_utils import CacheResetTest
+from openassessment.management.commands import performance_test_for_ai_grading
+from openassessment.assessment.models import AIGradingWorkflow
+
+
+class PerformanceTestForAIGradingTest(CacheResetTest):
+    """
+    Tests for the AI grading pipeline benchmark management command.
+    """
+
+    def setUp(self):
+        super(PerformanceTestForAIGradingTest, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.baseline_path = os.path.join(self.temp_dir, u"baseline.json")
+
+    def tearDown(self):
+        super(PerformanceTestForAIGradingTest, self).tearDown()
+        shutil.rmtree(self.temp_dir)
+
+    def test_benchmark(self):
+        self._handle("5", "2", write_baseline=True)
+
+        # Each mode grades the essays plus one to warm up the caches
+        self.assertEqual(AIGradingWorkflow.objects.filter(completed_at__isnull=False).count(), 12)
+
+        with open(self.baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.assertEqual(baseline['num_essays'], 5)
+        self.assertEqual(baseline['batch_size'], 2)
+        for mode in ['single', 'batch']:
+            self.assertGreater(baseline['modes'][mode]['essays_per_second'], 0)
+            self.assertGreater(baseline['modes'][mode]['queries_per_essay'], 0)
+            self.assertLessEqual(baseline['modes'][mode]['p50_ms'], baseline['modes'][mode]['p95_ms'])
+
+        # Batching reduces the number of queries per essay
+        self.assertLess(
+            baseline['modes']['batch']['queries_per_essay'],
+            baseline['modes']['single']['queries_per_essay']
+        )
+
+    def test_check_baseline(self):
+        self._write_baseline(essays_per_second=0.1, queries_per_essay=1000)
+        self._handle("5", "2", check=True)
+
+    def test_check_query_regression(self):
+        self._write_baseline(essays_per_second=0.1, queries_per_essay=1)
+        with self.assertRaises(CommandError):
+            self._handle("5", "2", check=True)
+
+    def test_check_throughput_regression(self):
+        self._write_baseline(essays_per_second=1000000, queries_per_essay=1000)
+        with self.assertRaises(CommandError):
+            self._handle("5", "2", check=True)
+
+    def test_check_different_arguments(self):
+        self._write_baseline(essays_per_second=0.1, queries_per_essay=1000)
+        with self.assertRaises(CommandError):
+            self._handle("6", "2", check=True)
+
+    def test_check_missing_baseline(self):
+        with self.assertRaises(CommandError):
+            self._handle("5", "2", check=True)
+
+    def test_invalid_args(self):
+        cmd = performance_test_for_ai_grading.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle("not a number")
+        with self.assertRaises(CommandError):
+            cmd.handle("5", "1")
+
+    def test_percentile(self):
+        values = [float(num) for num in range(1, 101)]
+        self.assertEqual(performance_test_for_ai_grading._percentile(values, 50), 50)
+        self.assertEqual(performance_test_for_ai_grading._percentile(values, 95), 95)
+        self.assertEqual(performance_test_for_ai_grading._percentile([3.0], 95), 3.0)
+
+    def _handle(self, *args, **options):
+        """
+        Run the benchmark in the test database.
+        """
+        options.update({'use_current_db': True, 'baseline': self.baseline_path})
+        performance_test_for_ai_grading.Command().handle(*args, **options)
+
+    def _write_baseline(self, essays_per_second, queries_per_essay):
+        """
+        Write baseline results for five essays in batches of two.
+        """
+        mode_results = {
+            'essays_per_second': essays_per_second,
+            'queries_per_essay': queries_per_essay,
+            'p50_ms': 1.0,
+            'p95_ms': 2.0,
+        }
+        with open(self.baseline_path, 'w') as baseline_file:
+            json.dump({
+                'num_essays': 5,
+                'batch_size': 2,
+                'modes': {'single': mode_results, 'batch': mode_results},
+            }, baseline_file)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the assessment serializer benchmark management command.
+"""
+from django.core.management.base import CommandError
+from openassessment.test_utils import CacheResetTest
+from openassessment.management.commands import performance_test_for_assessment_serializer
+from openassessment.assessment.models import Assessment
+from openassessment.assessment.serializers import rubric_from_dict
+from openassessment.assessment.test.constants import RUBRIC
+
+
+class PerformanceTestForAssessmentSerializerTest(CacheResetTest):
+    """
+    Tests for the assessment serializer benchmark management command.
+    """
+
+    def test_benchmark(self):
+        rubric = rubric_from_dict(RUBRIC)
+        for num in range(5):
+            Assessment.create(rubric, u"scorer", u"submission {}".format(num), u"PE")
+
+        cmd = performance_test_for_assessment_serializer.Command()
+        cmd.handle("5", "2")
+
+    def test_no_assessments(self):
+        cmd = performance_test_for_assessment_serializer.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle()
+
+    def test_invalid_args(self):
+        cmd = performance_test_for_assessment_serializer.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle("not a number")
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the CSV export benchmark management command.
+"""
+from django.core.management.base import CommandError
+from openassessment.test_utils import TransactionCacheResetTest
+from openassessment.management.commands import performance_test_for_csv_export
+
+
+class PerformanceTestForCsvExportTest(TransactionCacheResetTest):
+    """
+    Tests for the CSV export benchmark management command.
+    """
+
+    def test_benchmark(self):
+        cmd = performance_test_for_csv_export.Command()
+        cmd.handle("25", "10", use_current_db=True)
+
+        for mode in performance_test_for_csv_export.MODES:
+            self.assertEqual(cmd.results[mode]['rows'], 25)
+            self.assertGreaterEqual(cmd.results[mode]['seconds'], 0)
+
+        # Chunked mode makes a few queries per page, instead of per submission
+        self.assertLess(cmd.results['chunked']['queries'] * 5, cmd.results['serial']['queries'])
+
+    def test_invalid_args(self):
+        cmd = performance_test_for_csv_export.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle("not a number")
+        with self.assertRaises(CommandError):
+            cmd.handle("0")
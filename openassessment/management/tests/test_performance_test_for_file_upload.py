@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the file upload benchmark management command.
+"""
+from django.core.management.base import CommandError
+from django.test import TestCase
+from openassessment.management.commands import performance_test_for_file_upload
+
+
+class PerformanceTestForFileUploadTest(TestCase):
+    """
+    Tests for the file upload benchmark management command.
+    """
+
+    def test_benchmark(self):
+        cmd = performance_test_for_file_upload.Command()
+        cmd.handle("1", "2")
+
+    def test_invalid_args(self):
+        cmd = performance_test_for_file_upload.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle("not a number")
+
+    def test_synthetic_upload(self):
+        upload = performance_test_for_file_upload.SyntheticUpload(10)
+        self.assertEqual(upload.read(4), "xxxx")
+        self.assertEqual(upload.read(), "xxxxxx")
+        self.assertEqual(upload.read(4), "")
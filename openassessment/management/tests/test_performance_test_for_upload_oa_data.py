@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the upload_oa_data benchmark management command.
+"""
+from django.core.management.base import CommandError
+from openassessment.test_utils import TransactionCacheResetTest
+from openassessment.management.commands import performance_test_for_upload_oa_data
+
+
+class PerformanceTestForUploadOaDataTest(TransactionCacheResetTest):
+    """
+    Tests for the upload_oa_data benchmark management command.
+    """
+
+    def test_benchmark(self):
+        cmd = performance_test_for_upload_oa_data.Command()
+        cmd.handle("25", "5", use_current_db=True)
+
+        for mode in performance_test_for_upload_oa_data.MODES:
+            self.assertGreater(cmd.results[mode]['size'], 0)
+            self.assertGreater(cmd.results[mode]['csv_size'], 0)
+            self.assertEqual(cmd.results[mode]['parts'], 1)
+            self.assertGreater(cmd.results[mode]['peak_rss'], 0)
+            self.assertGreater(cmd.results[mode]['upload_seconds'], 0)
+
+        # The same CSV files are exported, but when streamed, small files never touch the disk
+        self.assertEqual(cmd.results['archive']['csv_size'], cmd.results['stream']['csv_size'])
+        self.assertGreater(cmd.results['archive']['peak_disk'], cmd.results['archive']['csv_size'])
+        self.assertEqual(cmd.results['stream']['peak_disk'], 0)
+
+    def test_invalid_args(self):
+        cmd = performance_test_for_upload_oa_data.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle("not a number")
+        with self.assertRaises(CommandError):
+            cmd.handle("25", "0")
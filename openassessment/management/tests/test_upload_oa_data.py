@@ -2,11 +2,15 @@
 """
 Tests for management command that uploads submission/assessment data.
 """
+import os.path
 from StringIO import StringIO
 import tarfile
 import boto
+import mock
 import moto
-from openassessment.test_utils import CacheResetTest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from openassessment.test_utils import CacheResetTest, TransactionCacheResetTest
 from openassessment.management.commands import upload_oa_data
 from openassessment.workflow import api as workflow_api
 from submissions import api as sub_api
@@ -70,3 +74,124 @@ class UploadDataTest(CacheResetTest):
         # Expect that we generated a URL for the bucket
         url = cmd.history[0]['url']
         self.assertIn("https://{}".format(self.BUCKET_NAME), url)
+
+    @moto.mock_s3
+    def test_stream(self):
+        # The fake S3 implementation can't complete multipart uploads to keys
+        # with non-ASCII names, so use another course.
+        self.COURSE_ID = u"edX/Streaming_101/2014"
+        conn = boto.connect_s3()
+        conn.create_bucket(self.BUCKET_NAME)
+        for index in range(10):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': self.COURSE_ID,
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+
+        # Spool the CSV files to disk, to cover both spooled cases
+        archived = self._export()
+        with mock.patch.object(upload_oa_data.Command, 'SPOOL_SIZE', 100):
+            streamed = self._export(stream=True)
+
+        self.assertItemsEqual(streamed.keys(), self.CSV_NAMES)
+        self.assertEqual(streamed, archived)
+
+    @moto.mock_s3
+    def test_multipart_upload(self):
+        bucket = boto.connect_s3().create_bucket(self.BUCKET_NAME)
+        with mock.patch.object(upload_oa_data.MultipartUploadStream, 'MIN_PART_SIZE', 10):
+            with mock.patch('moto.s3.models.UPLOAD_PART_MIN_SIZE', 10):
+                stream = upload_oa_data.MultipartUploadStream(bucket, "foo", 10)
+                for _ in range(5):
+                    stream.write("abcdef")
+                stream.close()
+
+        self.assertEqual(stream.num_parts, 3)
+        self.assertEqual(stream.size, 30)
+        self.assertEqual(bucket.get_key("foo").get_contents_as_string(), "abcdef" * 5)
+
+    @moto.mock_s3
+    def test_empty_multipart_upload(self):
+        bucket = boto.connect_s3().create_bucket(self.BUCKET_NAME)
+        stream = upload_oa_data.MultipartUploadStream(bucket, "foo", 10)
+        stream.close()
+        self.assertEqual(stream.num_parts, 1)
+        self.assertEqual(bucket.get_key("foo").get_contents_as_string(), "")
+
+    @moto.mock_s3
+    def test_stream_error_cancels_upload(self):
+        bucket = boto.connect_s3().create_bucket(self.BUCKET_NAME)
+        with mock.patch('tarfile.TarFile.addfile') as mock_addfile:
+            mock_addfile.side_effect = IOError("Disk full")
+            with self.assertRaises(IOError):
+                upload_oa_data.Command().handle(self.COURSE_ID.encode('utf-8'), self.BUCKET_NAME, stream=True)
+
+        self.assertEqual(list(bucket.list()), [])
+        self.assertEqual(list(bucket.list_multipart_uploads()), [])
+
+    def _export(self, **options):
+        """
+        Export the course, then return the contents of each uploaded CSV file.
+        """
+        cmd = upload_oa_data.Command()
+        cmd.handle(self.COURSE_ID.encode('utf-8'), self.BUCKET_NAME, **options)
+        key = boto.connect_s3().get_bucket(self.BUCKET_NAME).get_key(cmd.history[0]['key'])
+        with tarfile.open(mode="r:gz", fileobj=StringIO(key.get_contents_as_string())) as tar:
+            return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+
+
+class ShardedUploadDataTest(TransactionCacheResetTest):
+    """
+    Test exporting shards of a course in parallel.
+    Worker processes use their own database connections,
+    so the test data must be committed.
+    """
+
+    COURSE_ID = u"edX/Enchantment_101/April_1"
+    BUCKET_NAME = u"com.example.data"
+
+    @moto.mock_s3
+    def test_sharded_export_matches_serial(self):
+        conn = boto.connect_s3()
+        conn.create_bucket(self.BUCKET_NAME)
+
+        # Submissions with assessments and feedback, followed by more submissions
+        fixture_path = os.path.join(
+            os.path.dirname(__file__), '..', '..', 'tests', 'data', 'db_fixtures', 'feedback_on_assessment.json'
+        )
+        call_command('loaddata', fixture_path)
+        for index in range(20):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': self.COURSE_ID,
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            sub_api.set_score(submission['uuid'], index % 5, 4)
+
+        serial = self._export()
+        self.assertGreater(len(serial['submission.csv'].splitlines()), 20)
+        self.assertGreater(len(serial['assessment_feedback_option.csv'].splitlines()), 1)
+        for num_shards in [2, 3, 50]:
+            self.assertEqual(self._export(shards=num_shards), serial, msg="Shards: {}".format(num_shards))
+        self.assertEqual(self._export(shards=3, stream=True), serial)
+
+    def test_invalid_shards(self):
+        with self.assertRaises(CommandError):
+            upload_oa_data.Command().handle(self.COURSE_ID.encode('utf-8'), self.BUCKET_NAME, shards=0)
+
+    def _export(self, **options):
+        """
+        Export the course, then return the contents of each uploaded CSV file.
+        """
+        cmd = upload_oa_data.Command()
+        cmd.handle(self.COURSE_ID.encode('utf-8'), self.BUCKET_NAME, **options)
+        key = boto.connect_s3().get_bucket(self.BUCKET_NAME).get_key(cmd.history[0]['key'])
+        with tarfile.open(mode="r:gz", fileobj=StringIO(key.get_contents_as_string())) as tar:
+            return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
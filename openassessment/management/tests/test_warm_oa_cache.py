@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the warm_oa_cache management command.
+"""
+import mock
+from django.core.management.base import CommandError
+from openassessment.test_utils import CacheResetTest
+from openassessment.management.commands import warm_oa_cache
+
+
+class WarmCacheTest(CacheResetTest):
+    """
+    Tests for the warm_oa_cache management command.
+    """
+
+    @mock.patch('openassessment.management.commands.warm_oa_cache.warmup.warm_caches')
+    def test_warm_cache(self, mock_warm_caches):
+        mock_warm_caches.return_value = {
+            'items': 1, 'rubrics': 2, 'training_examples': 3,
+            'classifier_sets': 4, 'seconds': 0.5
+        }
+        cmd = warm_oa_cache.Command()
+        cmd.handle(u"𝓽𝓮𝓼𝓽 𝓬𝓸𝓾𝓻𝓼𝓮".encode('utf-8'), active_days=7, batch_size=10, num_workers=2)
+        mock_warm_caches.assert_called_once_with(
+            active_days=7, course_id=u"𝓽𝓮𝓼𝓽 𝓬𝓸𝓾𝓻𝓼𝓮", batch_size=10, num_workers=2
+        )
+
+    @mock.patch('openassessment.management.commands.warm_oa_cache.warmup.warm_caches_task')
+    def test_warm_cache_async(self, mock_task):
+        cmd = warm_oa_cache.Command()
+        cmd.handle(active_days=7, async=True)
+        mock_task.apply_async.assert_called_once_with(kwargs={
+            'active_days': 7, 'course_id': None, 'batch_size': 100, 'num_workers': 4,
+        })
+
+    def test_invalid_options(self):
+        cmd = warm_oa_cache.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle(num_workers=0)
+        with self.assertRaises(CommandError):
+            cmd.handle("course", "extra arg")
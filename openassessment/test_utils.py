@@ -4,15 +4,21 @@ Test utilities
 from django.core.cache import cache
 from django.test import TestCase, TransactionTestCase
 from openassessment.assessment.models.ai import (
-    CLASSIFIERS_CACHE_IN_MEM, CLASSIFIERS_CACHE_IN_FILE
+    CLASSIFIERS_CACHE_IN_MEM, CLASSIFIERS_FILE_STORE
 )
+from openassessment.assessment.models.peer import AssessmentFeedbackOption
+from openassessment.assessment.worker.grading import LOADED_CLASSIFIER_CACHE
+from openassessment.fileupload.url_cache import DOWNLOAD_URLS_CACHE_IN_MEM
 
 
 def _clear_all_caches():
     """Clear the default cache and any custom caches."""
     cache.clear()
     CLASSIFIERS_CACHE_IN_MEM.clear()
-    CLASSIFIERS_CACHE_IN_FILE.clear()
+    CLASSIFIERS_FILE_STORE.clear()
+    AssessmentFeedbackOption.clear_cache()
+    LOADED_CLASSIFIER_CACHE.clear()
+    DOWNLOAD_URLS_CACHE_IN_MEM.clear()
 
 
 class CacheResetTest(TestCase):
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the ORA2 cache facade.
+"""
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+import mock
+from django.core.cache import get_cache
+from django.test.utils import override_settings
+from openassessment.test_utils import CacheResetTest
+from openassessment.cache import CacheNamespace, MAX_KEY_LENGTH, LOCK_SUFFIX
+
+
+class CacheNamespaceTest(CacheResetTest):
+    """
+    Tests for cache namespaces.
+    """
+
+    def setUp(self):
+        super(CacheNamespaceTest, self).setUp()
+        self.namespace = CacheNamespace(u"test.namespace")
+
+    def test_get_set_delete(self):
+        self.assertIs(self.namespace.get(u"foo"), None)
+        self.assertEqual(self.namespace.get(u"foo", default=u"default"), u"default")
+
+        self.namespace.set(u"foo", {u"bar": 1})
+        self.assertEqual(self.namespace.get(u"foo"), {u"bar": 1})
+
+        self.namespace.delete(u"foo")
+        self.assertIs(self.namespace.get(u"foo"), None)
+
+    def test_add(self):
+        self.assertTrue(self.namespace.add(u"foo", u"first"))
+        self.assertFalse(self.namespace.add(u"foo", u"second"))
+        self.assertEqual(self.namespace.get(u"foo"), u"first")
+
+    def test_get_set_many(self):
+        self.assertEqual(self.namespace.get_many([u"foo", u"bar"]), {})
+
+        self.namespace.set_many({u"foo": 1, (u"bar", 2): 2})
+        self.assertEqual(
+            self.namespace.get_many([u"foo", (u"bar", 2), u"baz"]),
+            {u"foo": 1, (u"bar", 2): 2}
+        )
+        self.assertEqual(self.namespace.get(u"foo"), 1)
+
+    def test_namespaces_do_not_collide(self):
+        other = CacheNamespace(u"test.other")
+        self.namespace.set(u"foo", u"first")
+        other.set(u"foo", u"second")
+        self.assertEqual(self.namespace.get(u"foo"), u"first")
+        self.assertEqual(other.get(u"foo"), u"second")
+
+    def test_namespace_version_invalidates(self):
+        self.namespace.set(u"foo", u"bar")
+        upgraded = CacheNamespace(u"test.namespace", version=2)
+        self.assertIs(upgraded.get(u"foo"), None)
+
+    def test_global_version_invalidates(self):
+        self.namespace.set(u"foo", u"bar")
+        with override_settings(ORA2_CACHE_VERSION=2):
+            self.assertIs(self.namespace.get(u"foo"), None)
+        self.assertEqual(self.namespace.get(u"foo"), u"bar")
+
+    def test_tuple_identifier(self):
+        self.namespace.set((1, u"abc", u"2014-01-01"), u"bar")
+        self.assertEqual(self.namespace.get((1, u"abc", u"2014-01-01")), u"bar")
+        self.assertIs(self.namespace.get((1, u"abc")), None)
+        self.assertEqual(
+            self.namespace.make_key((1, u"abc")),
+            self.namespace.make_key(u"1.abc")
+        )
+
+    def test_long_key_is_hashed(self):
+        first = self.namespace.make_key(u"a" * 1000)
+        second = self.namespace.make_key(u"a" * 999 + u"b")
+        self.assertLessEqual(len(first), MAX_KEY_LENGTH)
+        self.assertNotEqual(first, second)
+
+    def test_unsafe_characters_are_hashed(self):
+        key = self.namespace.make_key(u"ƒσσ ɓαя\n")
+        self.assertIsInstance(key, str)
+        self.assertTrue(all(33 <= ord(char) < 127 for char in key))
+
+        self.namespace.set(u"ƒσσ ɓαя\n", u"bar")
+        self.assertEqual(self.namespace.get(u"ƒσσ ɓαя\n"), u"bar")
+
+    def test_timeout_setting(self):
+        backend = mock.Mock()
+        namespace = CacheNamespace(u"test.timeout", timeout=10, backend=backend)
+
+        namespace.set(u"foo", u"bar")
+        backend.set.assert_called_with(namespace.make_key(u"foo"), u"bar", 10)
+
+        with override_settings(ORA2_CACHE_TIMEOUTS={u"test.timeout": 20}):
+            namespace.set(u"foo", u"bar")
+            backend.set.assert_called_with(namespace.make_key(u"foo"), u"bar", 20)
+
+        namespace.set(u"foo", u"bar", timeout=30)
+        backend.set.assert_called_with(namespace.make_key(u"foo"), u"bar", 30)
+
+    def test_custom_backend(self):
+        backend = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            LOCATION='openassessment.tests.test_cache'
+        )
+        namespace = CacheNamespace(u"test.namespace", backend=backend)
+        namespace.set(u"foo", u"bar")
+        self.assertEqual(backend.get(namespace.make_key(u"foo")), u"bar")
+        self.assertIs(self.namespace.get(u"foo"), None)
+        backend.clear()
+
+    @mock.patch('openassessment.cache.dog_stats_api')
+    def test_metrics(self, mock_stats):
+        self.namespace.get(u"foo")
+        mock_stats.increment.assert_called_with(
+            u"openassessment.cache.miss", tags=[u"namespace:test.namespace"]
+        )
+
+        self.namespace.set(u"foo", u"bar")
+        self.namespace.get(u"foo")
+        mock_stats.increment.assert_called_with(
+            u"openassessment.cache.hit", tags=[u"namespace:test.namespace"]
+        )
+        self.assertEqual(mock_stats.histogram.call_count, 2)
+
+
+class GetOrComputeTest(CacheResetTest):
+    """
+    Tests for filling the cache without stampedes.
+    """
+
+    NUM_THREADS = 10
+
+    def setUp(self):
+        super(GetOrComputeTest, self).setUp()
+        self.namespace = CacheNamespace(u"test.stampede")
+        self.num_computes = 0
+        self.lock = threading.Lock()
+
+    def _slow_compute(self, delay=0.2, value=u"computed"):
+        """
+        Return a function that counts its calls and takes `delay` seconds.
+        """
+        def _compute():  # pylint: disable=C0111
+            with self.lock:
+                self.num_computes += 1
+            time.sleep(delay)
+            return value
+        return _compute
+
+    def test_miss_then_hit(self):
+        compute = self._slow_compute(delay=0)
+        self.assertEqual(self.namespace.get_or_compute(u"foo", compute), u"computed")
+        self.assertEqual(self.namespace.get_or_compute(u"foo", compute), u"computed")
+        self.assertEqual(self.num_computes, 1)
+        self.assertEqual(self.namespace.get(u"foo"), u"computed")
+
+    def test_concurrent_misses_compute_once(self):
+        compute = self._slow_compute()
+        pool = ThreadPool(self.NUM_THREADS)
+        try:
+            results = pool.map(
+                lambda __: self.namespace.get_or_compute(u"foo", compute),
+                range(self.NUM_THREADS)
+            )
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(results, [u"computed"] * self.NUM_THREADS)
+        self.assertEqual(self.num_computes, 1)
+
+    @mock.patch('openassessment.cache.LOCK_WAIT', 0.1)
+    def test_lock_wait_timeout(self):
+        # Simulate another worker that holds the lock but never fills the cache
+        lock_key = self.namespace.make_key(u"foo") + LOCK_SUFFIX
+        self.namespace.backend.add(lock_key, True, 10)
+
+        compute = self._slow_compute(delay=0)
+        self.assertEqual(self.namespace.get_or_compute(u"foo", compute), u"computed")
+        self.assertEqual(self.num_computes, 1)
+        self.assertEqual(self.namespace.get(u"foo"), u"computed")
+
+    def test_lock_released_on_error(self):
+        def _fail():  # pylint: disable=C0111
+            raise ValueError(u"Test error")
+
+        with self.assertRaises(ValueError):
+            self.namespace.get_or_compute(u"foo", _fail)
+
+        lock_key = self.namespace.make_key(u"foo") + LOCK_SUFFIX
+        self.assertIs(self.namespace.backend.get(lock_key), None)
+        self.assertEqual(self.namespace.get_or_compute(u"foo", self._slow_compute(delay=0)), u"computed")
+
+    def test_timeout(self):
+        backend = mock.Mock()
+        backend.get.return_value = None
+        backend.add.return_value = True
+        namespace = CacheNamespace(u"test.timeout", timeout=10, backend=backend)
+
+        namespace.get_or_compute(u"foo", lambda: u"bar")
+        backend.set.assert_called_with(namespace.make_key(u"foo"), u"bar", 10)
+
+        namespace.get_or_compute(u"foo", lambda: u"bar", timeout=30)
+        backend.set.assert_called_with(namespace.make_key(u"foo"), u"bar", 30)
@@ -6,11 +6,16 @@ Tests for openassessment data aggregation.
 import os.path
 from StringIO import StringIO
 import csv
+import datetime
+import pytz
+from django.core.cache import cache
 from django.core.management import call_command
+from django.test.utils import override_settings
 import ddt
 from submissions import api as sub_api
 from openassessment.test_utils import TransactionCacheResetTest
 from openassessment.workflow import api as workflow_api
+from openassessment.workflow.models import AssessmentWorkflow
 from openassessment.data import CsvWriter
 
 
@@ -22,44 +27,51 @@ class CsvWriterTest(TransactionCacheResetTest):
     longMessage = True
     maxDiff = None
 
+    # Queries to export 25 submissions, 10 at a time: load three pages of UUIDs,
+    # then load the data for each submission (serial) or for each page (chunked).
+    SERIAL_QUERIES = 3 + 25 * 5
+    CHUNKED_QUERIES = 3 + 3 * 4
+
     @ddt.file_data('data/write_to_csv.json')
     def test_write_to_csv(self, data):
-        # Create in-memory buffers for the CSV file data
-        output_streams = self._output_streams(data['expected_csv'].keys())
-
         # Load the database fixture
         # We use the database fixture to ensure that this test will
         # catch backwards-compatibility issues even if the Django model
         # implementation or API calls change.
         self._load_fixture(data['fixture'])
 
-        # Write the data to CSV
-        writer = CsvWriter(output_streams)
-        writer.write_to_csv(data['course_id'])
-
-        # Check that the CSV matches what we expected
-        for output_name, expected_csv in data['expected_csv'].iteritems():
-            output_buffer = output_streams[output_name]
-            output_buffer.seek(0)
-            actual_csv = csv.reader(output_buffer)
-            for expected_row in expected_csv:
+        # Both modes write the same rows
+        for chunked in [False, True]:
+            # Create in-memory buffers for the CSV file data
+            output_streams = self._output_streams(data['expected_csv'].keys())
+
+            # Write the data to CSV
+            writer = CsvWriter(output_streams, chunked=chunked)
+            writer.write_to_csv(data['course_id'])
+
+            # Check that the CSV matches what we expected
+            for output_name, expected_csv in data['expected_csv'].iteritems():
+                output_buffer = output_streams[output_name]
+                output_buffer.seek(0)
+                actual_csv = csv.reader(output_buffer)
+                for expected_row in expected_csv:
+                    try:
+                        actual_row = actual_csv.next()
+                    except StopIteration:
+                        actual_row = None
+                    self.assertEqual(
+                        actual_row, expected_row,
+                        msg="Output name: {}, chunked: {}".format(output_name, chunked)
+                    )
+
+                # Check for extra rows
                 try:
-                    actual_row = actual_csv.next()
+                    extra_row = actual_csv.next()
                 except StopIteration:
-                    actual_row = None
-                self.assertEqual(
-                    actual_row, expected_row,
-                    msg="Output name: {}".format(output_name)
-                )
+                    extra_row = None
 
-            # Check for extra rows
-            try:
-                extra_row = actual_csv.next()
-            except StopIteration:
-                extra_row = None
-
-            if extra_row is not None:
-                self.fail(u"CSV contains extra row: {}".format(extra_row))
+                if extra_row is not None:
+                    self.fail(u"CSV contains extra row: {}".format(extra_row))
 
     def test_many_submissions(self):
         # Create a lot of submissions
@@ -90,6 +102,64 @@ class CsvWriterTest(TransactionCacheResetTest):
         # Check that we have the right number of rows
         self.assertEqual(len(rows), num_submissions)
 
+    def test_chunked_queries(self):
+        num_submissions = 25
+        for index in range(num_submissions):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': 'test_course',
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            if index % 2 == 0:
+                sub_api.set_score(submission['uuid'], index, num_submissions)
+
+        outputs = dict()
+        for chunked in [False, True]:
+            # Serial mode reads submissions through the (cached) submissions API
+            cache.clear()
+            output_streams = self._output_streams(CsvWriter.MODELS)
+            writer = CsvWriter(output_streams, chunked=chunked, page_size=10)
+            num_queries = self.CHUNKED_QUERIES if chunked else self.SERIAL_QUERIES
+            with self.assertNumQueries(num_queries, using='read_replica'):
+                writer.write_to_csv('test_course')
+            outputs[chunked] = {name: output.getvalue() for name, output in output_streams.iteritems()}
+
+        self.assertEqual(outputs[True], outputs[False])
+
+    def test_submission_uuid_pages_same_created(self):
+        submission_uuids = self._create_submissions(7)
+
+        # Workflows created at the same time are ordered by ID, so none are skipped or repeated
+        AssessmentWorkflow.objects.update(created=datetime.datetime(2014, 1, 1, tzinfo=pytz.utc))
+        pages = list(CsvWriter({}, page_size=3)._submission_uuid_pages('test_course'))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self._uuids_by_id(submission_uuids))
+
+    def test_submission_uuid_pages_concurrent_inserts(self):
+        submission_uuids = self._create_submissions(4)
+        pages = CsvWriter({}, page_size=2)._submission_uuid_pages('test_course')
+        exported = pages.next()
+
+        # Submissions created during the export are included once, at the end
+        submission_uuids.extend(self._create_submissions(3, start=4))
+        for page in pages:
+            exported.extend(page)
+        self.assertEqual(exported, self._uuids_by_id(submission_uuids))
+
+    @override_settings(ORA2_CSV_EXPORT_PAGE_SIZE=4)
+    def test_page_size_setting(self):
+        self._create_submissions(8)
+        writer = CsvWriter({})
+        self.assertEqual(writer.page_size, 4)
+
+        # Two full pages, then an empty page
+        with self.assertNumQueries(3, using='read_replica'):
+            pages = list(writer._submission_uuid_pages('test_course'))
+        self.assertEqual([len(page) for page in pages], [4, 4])
+
     def test_other_course_id(self):
         # Try a course ID with no submissions
         self._load_fixture('db_fixtures/scored.json')
@@ -116,6 +186,49 @@ class CsvWriterTest(TransactionCacheResetTest):
             rows = content.split('\n')
             self.assertGreater(len(rows), 2)
 
+        # Chunked mode writes the same data
+        chunked_streams = self._output_streams(CsvWriter.MODELS)
+        CsvWriter(chunked_streams, chunked=True).write_to_csv(u"𝓽𝓮𝓼𝓽_𝓬𝓸𝓾𝓻𝓼𝓮")
+        for name, output in output_streams.iteritems():
+            self.assertEqual(chunked_streams[name].getvalue(), output.getvalue())
+
+    def _create_submissions(self, num_submissions, start=0):
+        """
+        Create submissions with workflows in the test course.
+
+        Args:
+            num_submissions (int): The number of submissions to create.
+
+        Keyword Arguments:
+            start (int): The index of the first student.
+
+        Returns:
+            list of submission UUIDs, in the order they were created.
+
+        """
+        submission_uuids = []
+        for index in range(start, start + num_submissions):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': 'test_course',
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            submission_uuids.append(submission['uuid'])
+        return submission_uuids
+
+    def _uuids_by_id(self, submission_uuids):
+        """
+        Sort submission UUIDs by the ID of their workflow.
+        """
+        workflow_ids = dict(
+            AssessmentWorkflow.objects.filter(submission_uuid__in=submission_uuids)
+            .values_list('submission_uuid', 'id')
+        )
+        return sorted(submission_uuids, key=workflow_ids.get)
+
     def _output_streams(self, names):
         """
         Create in-memory buffers.
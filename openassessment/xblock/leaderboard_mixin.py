@@ -72,9 +72,12 @@ class LeaderboardMixin(object):
             student_item_dict['item_type'],
             self.leaderboard_show
         )
+        file_urls = file_upload_api.get_download_urls([
+            score['content']['file_key'] for score in scores if 'file_key' in score['content']
+        ])
         for score in scores:
             if 'file_key' in score['content']:
-                score['file'] = file_upload_api.get_download_url(score['content']['file_key'])
+                score['file'] = file_urls[score['content']['file_key']]
             if 'text' in score['content'] or 'parts' in score['content']:
                 submission = {'answer': score.pop('content')}
                 score['submission'] = create_submission_dict(submission, self.prompts)
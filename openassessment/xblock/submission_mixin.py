@@ -178,6 +178,17 @@ class SubmissionMixin(object):
         self.create_workflow(submission["uuid"])
         self.submission_uuid = submission["uuid"]
 
+        if self.allow_file_upload:
+            # Store the submitted file once, however many students upload it.
+            # This downloads and hashes the whole file, so it runs in a task, after the request.
+            # The submission is kept even if this fails, since its file remains under its key.
+            try:
+                file_upload_api.deduplicate_async(student_sub_dict['file_key'])
+            except FileUploadError:
+                logger.exception(
+                    u"Unable to deduplicate the file for submission {}".format(submission["uuid"])
+                )
+
         # Emit analytics event...
         self.runtime.publish(
             self,
@@ -182,6 +182,20 @@ class TestLeaderboardRender(XBlockHandlerTransactionTestCase):
             )}
         ])
 
+    @scenario('data/leaderboard_show_allowfiles.xml')
+    def test_download_urls_generated_together(self, xblock):
+        self._create_submissions_and_scores(xblock, [
+            ({"text": "test answer 1", "file_key": "foo"}, 2),
+            ({"text": "test answer 2", "file_key": "bar"}, 1),
+        ])
+
+        with mock.patch('openassessment.xblock.leaderboard_mixin.file_upload_api') as mock_file_api:
+            mock_file_api.get_download_urls.return_value = {"foo": "/foo-url", "bar": "/bar-url"}
+            __, context = xblock.render_leaderboard_complete(xblock.get_student_item_dict())
+
+        mock_file_api.get_download_urls.assert_called_once_with(["foo", "bar"])
+        self.assertEqual([score['file'] for score in context['topscores']], ["/foo-url", "/bar-url"])
+
     def _create_submissions_and_scores(
         self, xblock, submissions_and_scores,
         submission_key=None, points_possible=10
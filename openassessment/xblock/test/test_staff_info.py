@@ -330,11 +330,11 @@ class TestCourseStaff(XBlockHandlerTestCase):
 
         # Mock the file upload API to avoid hitting S3
         with patch("openassessment.xblock.staff_info_mixin.file_api") as file_api:
-            file_api.get_download_url.return_value = "http://www.example.com/image.jpeg"
+            file_api.get_download_urls.return_value = {"test_key": "http://www.example.com/image.jpeg"}
             __, context = xblock.get_student_info_path_and_context("Bob")
 
             # Check that the right file key was passed to generate the download url
-            file_api.get_download_url.assert_called_with("test_key")
+            file_api.get_download_urls.assert_called_with(["test_key"])
 
             # Check the context passed to the template
             self.assertEquals('http://www.example.com/image.jpeg', context['submission']['image_url'])
@@ -362,7 +362,7 @@ class TestCourseStaff(XBlockHandlerTestCase):
         })
 
         # Mock the file upload API to simulate an error
-        with patch("openassessment.xblock.staff_info_mixin.file_api.get_download_url") as file_api_call:
+        with patch("openassessment.xblock.staff_info_mixin.file_api.get_download_urls") as file_api_call:
             file_api_call.side_effect = FileUploadInternalError("Error!")
             __, context = xblock.get_student_info_path_and_context("Bob")
 
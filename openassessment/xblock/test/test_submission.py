@@ -11,6 +11,7 @@ import pytz
 from submissions import api as sub_api
 from submissions.api import SubmissionRequestError, SubmissionInternalError
 
+from openassessment.fileupload.exceptions import FileUploadInternalError
 from openassessment.workflow import api as workflow_api
 from openassessment.xblock.openassessmentblock import OpenAssessmentBlock
 from openassessment.xblock.data_conversion import create_submission_dict, prepare_submission_for_serialization
@@ -24,6 +25,11 @@ class SubmissionTest(XBlockHandlerTestCase):
         "submission": ["This is my answer to the first question!", "This is my answer to the second question!"]
     })
 
+    # The file upload scenario has four prompts
+    FILE_UPLOAD_SUBMISSION = json.dumps({
+        "submission": ["First answer", "Second answer", "Third answer", "Fourth answer"]
+    })
+
     @scenario('data/basic_scenario.xml', user_id='Bob')
     def test_submit_submission(self, xblock):
         resp = self.request(xblock, 'submit', self.SUBMISSION, response_format='json')
@@ -69,6 +75,20 @@ class SubmissionTest(XBlockHandlerTestCase):
         self.assertEqual(resp[1], "EBADFORM")
         self.assertIsNotNone(resp[2])
 
+    @scenario('data/leaderboard_show_allowfiles.xml', user_id='Bob')
+    @patch('openassessment.xblock.submission_mixin.file_upload_api')
+    def test_submission_deduplicates_file(self, xblock, mock_file_upload_api):
+        resp = self.request(xblock, 'submit', self.FILE_UPLOAD_SUBMISSION, response_format='json')
+        self.assertTrue(resp[0])
+        mock_file_upload_api.deduplicate_async.assert_called_once_with(xblock._get_student_item_key())
+
+    @scenario('data/leaderboard_show_allowfiles.xml', user_id='Bob')
+    @patch('openassessment.xblock.submission_mixin.file_upload_api')
+    def test_submission_deduplicate_failure(self, xblock, mock_file_upload_api):
+        mock_file_upload_api.deduplicate_async.side_effect = FileUploadInternalError("Cat on fire.")
+        resp = self.request(xblock, 'submit', self.FILE_UPLOAD_SUBMISSION, response_format='json')
+        self.assertTrue(resp[0])
+
     # In Studio preview mode, the runtime sets the user ID to None
     @scenario('data/basic_scenario.xml', user_id=None)
     def test_cannot_submit_in_preview_mode(self, xblock):
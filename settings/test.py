@@ -41,6 +41,9 @@ INSTALLED_APPS += ('django_nose',)
 # Store uploaded files in a test-specific directory
 MEDIA_ROOT = os.path.join(BASE_DIR, 'storage/test')
 
+# Store downloaded classifiers in a test-specific directory
+ORA2_CLASSIFIERS_FILE_STORE_DIR = os.path.join(BASE_DIR, 'storage/test/classifier_store')
+
 
 # Silence cache key warnings
 # https://docs.djangoproject.com/en/1.4/topics/cache/#cache-key-warnings